@@ -0,0 +1,88 @@
+"""Bytes transferred, requests and latency per NextTrain board lookup with
+fixed two-hour, ten-row boards against adaptive windows (see
+rail_uk/board_window.py), against a stand-in serving synthetic boards for
+stations of different frequencies.
+
+Each lookup refreshes the board from the stand-in, so that every one is
+measured; the adaptive policy learns each route's gaps between services as
+it goes, and only its first lookups on a sparse route need widening.
+
+    python -m benchmarks.board_window_bench
+    python -m benchmarks.board_window_bench --services 150 12 2 --latency fixed:30 --bandwidth 250000
+"""
+from os import environ
+from unittest.mock import patch
+import argparse
+import statistics
+import sys
+import time
+
+from benchmarks.standin import StandInServer, UpstreamBehaviour
+
+POLICIES = ('fixed', 'adaptive')
+# Services every two hours at a busy junction, a typical station and a
+# branch line
+DEFAULT_SERVICES = (150, 12, 2)
+DEFAULT_LATENCY = 'fixed:30'
+DEFAULT_BANDWIDTH = 500000
+DEFAULT_LOOKUPS = 50
+
+
+def measure(policy, services, latency=DEFAULT_LATENCY, bandwidth=DEFAULT_BANDWIDTH, lookups=DEFAULT_LOOKUPS):
+    from rail_uk import board_window, data
+    from rail_uk.dtos import APIParameters, Station
+
+    params = APIParameters(Station('Clapham Junction', 'CLJ'), Station('London Waterloo', 'WAT'), 0)
+    server = StandInServer(behaviour=UpstreamBehaviour(latency), board_rows=services,
+                           bandwidth=bandwidth or None).start()
+    timings = []
+    try:
+        with patch('rail_uk.data.OPEN_LDBWS_URL', server.open_ldbws_url), \
+                patch('rail_uk.board_window.POLICY', policy):
+            for _ in range(lookups):
+                start = time.perf_counter()
+                data.get_departure_board(params, refresh=True)
+                timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        board_window.reset()
+        server.stop()
+
+    timings.sort()
+    return {
+        'bytes': server.bytes_sent // lookups,
+        'requests': round(server.calls['GetDepartureBoard'] / lookups, 2),
+        'p50_ms': round(statistics.median(timings), 1),
+        'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 1)
+    }
+
+
+def run_benchmarks(services=DEFAULT_SERVICES, latency=DEFAULT_LATENCY, bandwidth=DEFAULT_BANDWIDTH,
+                   lookups=DEFAULT_LOOKUPS):
+    environ.setdefault('OPEN_LDBWS_ACCESS_TOKEN', 'BENCHMARK')
+    return {(count, policy): measure(policy, count, latency, bandwidth, lookups)
+            for count in services for policy in POLICIES}
+
+
+def print_report(results):
+    print('{:<10}{:<10}{:>10}{:>10}{:>10}{:>10}'.format('services', 'policy', 'bytes', 'requests', 'p50_ms',
+                                                        'p95_ms'))
+    for (services, policy), result in results.items():
+        print('{:<10}{:<10}{:>10}{:>10}{:>10}{:>10}'.format(services, policy, result['bytes'], result['requests'],
+                                                            result['p50_ms'], result['p95_ms']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--services', type=int, nargs='+', default=DEFAULT_SERVICES,
+                        help='Services every two hours at each station measured')
+    parser.add_argument('--latency', default=DEFAULT_LATENCY, help='Stand-in latency per request')
+    parser.add_argument('--bandwidth', type=float, default=DEFAULT_BANDWIDTH, help='Bytes a second, 0 for unlimited')
+    parser.add_argument('--lookups', type=int, default=DEFAULT_LOOKUPS)
+    args = parser.parse_args(argv)
+
+    print_report(run_benchmarks(args.services, args.latency, args.bandwidth, args.lookups))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
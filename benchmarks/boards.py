@@ -0,0 +1,226 @@
+"""Synthetic OpenLDBWS responses of any size.
+
+The fixtures in tests/mock_responses hold a handful of services; real boards
+at the busiest stations hold up to OpenLDBWS' limit of 150. BoardGenerator
+builds valid GetDepartureBoard, GetDepBoardWithDetails and
+GetFastestDepartures responses with a chosen number of services, calling
+points, delays and cancellations. Output depends only on the seed:
+
+    boards = BoardGenerator(seed=1)
+    xml = boards.departure_board('CLJ', 'WAT', **BOARD_SIZES['clapham_junction'])
+"""
+from xml.sax.saxutils import escape, quoteattr
+import base64
+import random
+
+from rail_uk import stations
+
+# Busy-hour shapes of real boards, for scale tests
+BOARD_SIZES = {
+    'typical': {'rows': 12, 'calling_points': 6},
+    'clapham_junction': {'rows': 150, 'calling_points': 12},
+    'london_waterloo': {'rows': 150, 'calling_points': 20}
+}
+
+OPERATORS = (
+    ('South Western Railway', 'SW'),
+    ('Southern', 'SN'),
+    ('London Overground', 'LO'),
+    ('Great Western Railway', 'GW'),
+    ('West Midlands Trains', 'LM'),
+    ('Avanti West Coast', 'VT')
+)
+DELAY_REASONS = (
+    'This train has been delayed by a signalling fault',
+    'This train has been delayed by overcrowding',
+    'This train has been delayed by a member of staff being taken ill'
+)
+CANCEL_REASONS = (
+    'This train has been cancelled because of a shortage of train crew',
+    'This train has been cancelled because of a fault on this train'
+)
+
+ENVELOPE = '''<?xml version="1.0" encoding="utf-8"?>
+<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope"
+               xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+               xmlns:xsd="http://www.w3.org/2001/XMLSchema">
+<soap:Body>
+<{operation}Response xmlns="http://thalesgroup.com/RTTI/{version}/ldb/">
+<{result} xmlns:lt="http://thalesgroup.com/RTTI/2012-01-13/ldb/types"
+ xmlns:lt6="http://thalesgroup.com/RTTI/2017-02-02/ldb/types"
+ xmlns:lt7="http://thalesgroup.com/RTTI/2017-10-01/ldb/types"
+ xmlns:lt4="http://thalesgroup.com/RTTI/2015-11-27/ldb/types"
+ xmlns:lt5="http://thalesgroup.com/RTTI/2016-02-16/ldb/types"
+ xmlns:lt2="http://thalesgroup.com/RTTI/2014-02-20/ldb/types"
+ xmlns:lt3="http://thalesgroup.com/RTTI/2015-05-14/ldb/types">
+<lt4:generatedAt>2019-03-01T19:45:00.0000000+00:00</lt4:generatedAt>
+<lt4:locationName>{origin_name}</lt4:locationName>
+<lt4:crs>{origin_crs}</lt4:crs>
+{header}<lt4:platformAvailable>true</lt4:platformAvailable>
+{body}
+</{result}>
+</{operation}Response>
+</soap:Body>
+</soap:Envelope>'''
+
+
+class BoardGenerator:
+
+    def __init__(self, seed=0, delay_rate=0.1, cancel_rate=0.02, max_delay=30):
+        self.seed = seed
+        self.delay_rate = delay_rate
+        self.cancel_rate = cancel_rate
+        self.max_delay = max_delay
+        self._stations = sorted(stations.get_station_registry().values(), key=lambda station: station.crs)
+
+    def departure_board(self, origin_crs, destination_crs=None, rows=10, start='19:45', window=120,
+                        calling_points=None):
+        """A GetDepartureBoard response, as parse_departures_soap_response
+        expects. These boards carry no calling points; the argument is only
+        accepted so that BOARD_SIZES can be passed straight through.
+        """
+        rng = self._random('board', origin_crs, destination_crs, rows, start, window)
+        services = ''.join(self._service(rng, time, 'lt5', destination_crs)
+                           for time in _departure_times(rng, rows, start, window))
+        return self._envelope('GetDepartureBoard', '2016-02-16', 'GetStationBoardResult', origin_crs,
+                              _filter_header(destination_crs), _services('lt5', services))
+
+    def details_board(self, origin_crs, destination_crs=None, rows=10, calling_points=6, start='19:45',
+                      window=120):
+        """A GetDepBoardWithDetails response, where every service also lists
+        its subsequent calling points.
+        """
+        rng = self._random('details', origin_crs, destination_crs, rows, calling_points, start, window)
+        services = ''.join(self._service(rng, time, 'lt7', destination_crs, calling_points)
+                           for time in _departure_times(rng, rows, start, window))
+        return self._envelope('GetDepBoardWithDetails', '2017-10-01', 'GetStationBoardResult', origin_crs,
+                              _filter_header(destination_crs), _services('lt7', services))
+
+    def fastest_departures(self, origin_crs, destination_crs, start='19:45', window=120, empty=False):
+        """A GetFastestDepartures response for a single destination, as
+        parse_fastest_departure_soap_response expects.
+        """
+        rng = self._random('fastest', origin_crs, destination_crs, start, window)
+        if empty:
+            service = '<lt5:service xsi:nil="true" />'
+        else:
+            service = self._service(rng, _departure_times(rng, 1, start, window)[0], 'lt5', destination_crs,
+                                    arrival=True)
+        body = '<lt5:departures><lt5:destination crs={}>{}</lt5:destination></lt5:departures>'.format(
+            quoteattr(destination_crs), service)
+        return self._envelope('GetFastestDepartures', '2016-02-16', 'DeparturesBoard', origin_crs, '', body)
+
+    # ----------------------------- Helpers -----------------------------
+
+    def _random(self, *key):
+        # Each call is seeded from its own arguments, so boards don't depend
+        # on what else was generated before them
+        return random.Random('{}:{}'.format(self.seed, key))
+
+    def _station(self, rng):
+        return rng.choice(self._stations)
+
+    def _envelope(self, operation, version, result, origin_crs, header, body):
+        origin = stations.get_station(origin_crs)
+        return ENVELOPE.format(operation=operation, version=version, result=result,
+                               origin_name=escape(origin.name if origin else origin_crs),
+                               origin_crs=escape(origin_crs), header=header, body=body)
+
+    def _service(self, rng, std, prefix, destination_crs=None, calling_points=0, arrival=False):
+        operator, operator_code = rng.choice(OPERATORS)
+        origin = self._station(rng)
+        destination = stations.get_station(destination_crs) if destination_crs else None
+        # With a filter, some services carry on beyond the filter station
+        if destination is None or rng.random() < 0.5:
+            destination = self._station(rng)
+        etd, reason = self._estimate(rng, std)
+
+        parts = ['<{}:service>'.format(prefix)]
+        if arrival:
+            sta = _add_minutes(std, rng.randint(10, 90))
+            parts.append('<lt4:sta>{0}</lt4:sta><lt4:eta>{0}</lt4:eta>'.format(sta))
+        parts.append('<lt4:std>{}</lt4:std><lt4:etd>{}</lt4:etd>'.format(std, etd))
+        if etd != 'Cancelled':
+            parts.append('<lt4:platform>{}</lt4:platform>'.format(rng.randint(1, 17)))
+        parts.append('<lt4:operator>{}</lt4:operator><lt4:operatorCode>{}</lt4:operatorCode>'
+                     '<lt4:serviceType>train</lt4:serviceType>'.format(escape(operator), operator_code))
+        if etd == 'Cancelled':
+            parts.append('<lt4:isCancelled>true</lt4:isCancelled>')
+            parts.append('<lt4:cancelReason>{}</lt4:cancelReason>'.format(reason))
+        elif reason:
+            parts.append('<lt4:delayReason>{}</lt4:delayReason>'.format(reason))
+        parts.append('<lt4:serviceID>{}</lt4:serviceID><lt5:rsid>{}{:06d}</lt5:rsid>'.format(
+            base64.b64encode(bytes(rng.getrandbits(8) for _ in range(16))).decode('ascii'),
+            operator_code, rng.randint(0, 999999)))
+        parts.append(_location('lt5:origin', origin))
+        parts.append(_location('lt5:destination', destination))
+        if calling_points:
+            parts.append(self._calling_points(rng, std, etd, calling_points, destination))
+        parts.append('</{}:service>'.format(prefix))
+        return ''.join(parts)
+
+    def _estimate(self, rng, std):
+        roll = rng.random()
+        if roll < self.cancel_rate:
+            return 'Cancelled', rng.choice(CANCEL_REASONS)
+        if roll < self.cancel_rate + self.delay_rate:
+            if rng.random() < 0.1:
+                return 'Delayed', rng.choice(DELAY_REASONS)
+            return _add_minutes(std, rng.randint(1, self.max_delay)), rng.choice(DELAY_REASONS)
+        return 'On time', None
+
+    def _calling_points(self, rng, std, etd, count, destination):
+        delay = _minutes(etd) - _minutes(std) if ':' in etd else 0
+        time = std
+        points = []
+        for index in range(count):
+            station = destination if index == count - 1 else self._station(rng)
+            time = _add_minutes(time, rng.randint(2, 15))
+            if etd == 'Cancelled':
+                estimate = 'Cancelled'
+            else:
+                estimate = _add_minutes(time, delay) if delay > 0 else 'On time'
+            points.append('<lt7:callingPoint><lt7:locationName>{}</lt7:locationName><lt7:crs>{}</lt7:crs>'
+                          '<lt7:st>{}</lt7:st><lt7:et>{}</lt7:et></lt7:callingPoint>'.format(
+                              escape(station.name), station.crs, time, estimate))
+        return '<lt7:subsequentCallingPoints><lt7:callingPointList>{}</lt7:callingPointList>' \
+               '</lt7:subsequentCallingPoints>'.format(''.join(points))
+
+
+def _departure_times(rng, rows, start, window):
+    start_minutes = _minutes(start)
+    offsets = sorted(rng.randint(0, window) for _ in range(rows))
+    return [_format_minutes(start_minutes + offset) for offset in offsets]
+
+
+def _filter_header(destination_crs):
+    if destination_crs is None:
+        return ''
+    destination = stations.get_station(destination_crs)
+    return '<lt4:filterLocationName>{}</lt4:filterLocationName><lt4:filtercrs>{}</lt4:filtercrs>\n'.format(
+        escape(destination.name if destination else destination_crs), escape(destination_crs))
+
+
+def _services(prefix, services):
+    if not services:
+        return ''
+    return '<{0}:trainServices>{1}</{0}:trainServices>'.format(prefix, services)
+
+
+def _location(tag, station):
+    return '<{0}><lt4:location><lt4:locationName>{1}</lt4:locationName><lt4:crs>{2}</lt4:crs></lt4:location>' \
+           '</{0}>'.format(tag, escape(station.name), station.crs)
+
+
+def _minutes(time):
+    hours, minutes = time.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def _format_minutes(minutes):
+    minutes %= 24 * 60
+    return '{:02d}:{:02d}'.format(minutes // 60, minutes % 60)
+
+
+def _add_minutes(time, minutes):
+    return _format_minutes(_minutes(time) + minutes)
@@ -0,0 +1,94 @@
+"""Bytes transferred and time to first departure of the upstream clients,
+with and without compression, against a compressing stand-in on a link of
+limited bandwidth.
+
+Time to first departure runs from sending the request to the parser
+returning its departures. Decompression is streamed into the parser, so it
+overlaps the transfer rather than following it.
+
+    python -m benchmarks.compression_bench
+    python -m benchmarks.compression_bench --rows 10 150 --bandwidth 250000
+"""
+from os import environ
+import argparse
+import statistics
+import sys
+import time
+
+from benchmarks.standin import StandInServer
+
+ENCODINGS = ('identity', 'gzip', 'deflate')
+DEFAULT_ROWS = (10, 50, 150)
+DEFAULT_BANDWIDTH = 500000
+DEFAULT_ITERATIONS = 10
+
+
+def fetch_board(data):
+    request_vars = {'access_token': 'BENCHMARK', 'origin': 'CLJ', 'destination': 'WAT', 'time_offset': 0,
+                    'time_window': 120, 'num_rows': 150}
+    return data.parse_departures_soap_response(data.make_soap_request(request_vars, 'departure_board.xml'), 'last')
+
+
+def fetch_timetable(data):
+    from rail_uk.dtos import APIParameters, Station
+
+    return data.get_timetable(APIParameters(Station('Clapham Junction', 'CLJ'), Station('London Waterloo', 'WAT'),
+                                            offset=0), '21:59')
+
+
+def measure(fetch, encoding, board_rows=None, bandwidth=DEFAULT_BANDWIDTH, iterations=DEFAULT_ITERATIONS):
+    from rail_uk import data
+
+    server = StandInServer(board_rows=board_rows, compress=True, bandwidth=bandwidth or None).start()
+    original = (data.OPEN_LDBWS_URL, data.TRANSPORT_API_URL, data.ACCEPT_ENCODING)
+    data.OPEN_LDBWS_URL, data.TRANSPORT_API_URL, data.ACCEPT_ENCODING = \
+        server.open_ldbws_url, server.base_url, encoding
+    try:
+        fetch(data)
+        sent = server.bytes_sent
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            departures = fetch(data)
+            timings.append((time.perf_counter() - start) * 1000)
+            assert departures, 'No departures parsed'
+        response_bytes = (server.bytes_sent - sent) // iterations
+    finally:
+        data.OPEN_LDBWS_URL, data.TRANSPORT_API_URL, data.ACCEPT_ENCODING = original
+        server.stop()
+    return {'response_bytes': response_bytes, 'first_departure_ms': round(statistics.median(timings), 2)}
+
+
+def run_benchmarks(rows=DEFAULT_ROWS, bandwidth=DEFAULT_BANDWIDTH, iterations=DEFAULT_ITERATIONS):
+    environ.setdefault('TRANSPORT_API_APP_ID', 'BENCHMARK')
+    environ.setdefault('TRANSPORT_API_KEY', 'BENCHMARK')
+    payloads = [('board_{}'.format(count), fetch_board, count) for count in rows]
+    payloads.append(('timetable', fetch_timetable, None))
+
+    results = {}
+    for name, fetch, board_rows in payloads:
+        for encoding in ENCODINGS:
+            results[(name, encoding)] = measure(fetch, encoding, board_rows, bandwidth, iterations)
+    return results
+
+
+def print_report(results):
+    print('{:<16}{:<12}{:>16}{:>20}'.format('payload', 'encoding', 'response_bytes', 'first_departure_ms'))
+    for (name, encoding), result in results.items():
+        print('{:<16}{:<12}{response_bytes:>16}{first_departure_ms:>20}'.format(name, encoding, **result))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS, help='Board sizes to fetch')
+    parser.add_argument('--bandwidth', type=float, default=DEFAULT_BANDWIDTH,
+                        help='Bytes a second the stand-in sends at (0 for unlimited)')
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    args = parser.parse_args(argv)
+
+    print_report(run_benchmarks(args.rows, args.bandwidth, args.iterations))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""Realistic Alexa request envelopes for every intent the skill handles."""
+from os import environ
+
+BENCHMARK_USER = 'amzn1.ask.account.BENCHMARK'
+HOME_USER = 'amzn1.ask.account.BENCHMARK_HOME'
+
+ORIGIN = {'name': 'Birmingham New Street', 'id': 'BHM'}
+DESTINATION = {'name': 'London Euston', 'id': 'EUS'}
+
+
+def make_event(request_type, intent_name=None, slots=None, user_id=BENCHMARK_USER, new=True):
+    skill_id = environ['SKILL_ID']
+    request = {
+        'type': request_type,
+        'requestId': 'amzn1.echo-api.request.xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx',
+        'timestamp': '2019-03-01T19:45:00Z',
+        'locale': 'en-GB'
+    }
+    if intent_name is not None:
+        request['intent'] = {
+            'name': intent_name,
+            'confirmationStatus': 'NONE',
+            'slots': _expand_slots(slots or {})
+        }
+    return {
+        'version': '1.0',
+        'session': {
+            'new': new,
+            'sessionId': 'amzn1.echo-api.session.xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx',
+            'application': {
+                'applicationId': skill_id
+            },
+            'user': {
+                'userId': user_id
+            }
+        },
+        'context': {
+            'System': {
+                'application': {
+                    'applicationId': skill_id
+                },
+                'user': {
+                    'userId': user_id
+                },
+                'apiAccessToken': 'xxxxxxxx'
+            }
+        },
+        'request': request
+    }
+
+
+def get_benchmark_events():
+    """Map a benchmark name to the event it replays."""
+    route = {'origin': ORIGIN, 'destination': DESTINATION}
+    return {
+        'LaunchRequest': make_event('LaunchRequest'),
+        'HelpIntent': make_event('IntentRequest', 'AMAZON.HelpIntent'),
+        'StopIntent': make_event('IntentRequest', 'AMAZON.StopIntent'),
+        'NextTrain': make_event('IntentRequest', 'NextTrain', route),
+        'NextTrainFromHome': make_event('IntentRequest', 'NextTrain', {'destination': DESTINATION},
+                                        user_id=HOME_USER),
+        'FastestTrain': make_event('IntentRequest', 'FastestTrain', route),
+        'LastTrain': make_event('IntentRequest', 'LastTrain', route),
+        'SetHomeStation': make_event('IntentRequest', 'SetHomeStation', {
+            'home': ORIGIN,
+            'distance': 10
+        }),
+        'SessionEnded': make_event('SessionEndedRequest', new=False)
+    }
+
+
+def _expand_slots(slots):
+    expanded = {}
+    for slot_name, value in slots.items():
+        if isinstance(value, dict):
+            expanded[slot_name] = {
+                'name': slot_name,
+                'value': value['name'],
+                'resolutions': {
+                    'resolutionsPerAuthority': [{
+                        'status': {'code': 'ER_SUCCESS_MATCH'},
+                        'values': [{'value': value}]
+                    }]
+                }
+            }
+        else:
+            expanded[slot_name] = {'name': slot_name, 'value': value}
+    return expanded
@@ -0,0 +1,41 @@
+"""In-memory stand-in for the skill's DynamoDB table."""
+from collections import Counter
+import threading
+
+
+class FakeTable:
+    """In-memory stand-in for the RailUK DynamoDB table."""
+
+    def __init__(self):
+        self.items = {}
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def get_item(self, Key):
+        with self._lock:
+            self.calls['GetItem'] += 1
+            response = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+            item = self.items.get(Key['UserID'])
+            if item is not None:
+                response['Item'] = dict(item)
+            return response
+
+    def put_item(self, Item):
+        with self._lock:
+            self.calls['PutItem'] += 1
+            self.items[Item['UserID']] = dict(Item)
+            return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    def update_item(self, Key, ExpressionAttributeValues, **_):
+        with self._lock:
+            self.calls['UpdateItem'] += 1
+            item = self.items.setdefault(Key['UserID'], {'UserID': Key['UserID']})
+            for placeholder, value in ExpressionAttributeValues.items():
+                item[placeholder.lstrip(':')] = value
+            return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    def scan(self, **_):
+        with self._lock:
+            self.calls['Scan'] += 1
+            return {'Items': [dict(item) for item in self.items.values()],
+                    'ResponseMetadata': {'HTTPStatusCode': 200}}
@@ -0,0 +1,131 @@
+"""Synthetic GTFS extracts for the offline timetable engine.
+
+Lines run between real stations from res/stations.csv, with weekday,
+Saturday and Sunday timetables and a few bank-holiday exceptions. Output
+depends only on the seed:
+
+    python -m benchmarks.gtfs /tmp/timetable.zip --lines 400 --trips-per-line 80
+"""
+from datetime import date, timedelta
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import zipfile
+
+from rail_uk import stations
+
+OPERATORS = ('South Western Railway', 'Southern', 'Great Western Railway', 'West Midlands Trains', 'Northern')
+CALENDAR = (
+    # service_id, days run (Monday first), trips as a share of the weekday service
+    ('WEEKDAY', '1111100', 1.0),
+    ('SATURDAY', '0000010', 0.8),
+    ('SUNDAY', '0000001', 0.5)
+)
+FEED_START = date(2019, 1, 1)
+FEED_DAYS = 365
+# Weekdays run the Sunday timetable on bank holidays
+BANK_HOLIDAYS = ('20190419', '20190422', '20190506', '20190527', '20190826', '20191225', '20191226')
+
+
+def generate_feed(lines=100, stops_per_line=12, trips_per_line=60, seed=0):
+    """Return the feed's files as a dict of file name to CSV text."""
+    rng = random.Random(seed)
+    all_stations = sorted(stations.get_station_registry().values(), key=lambda station: station.crs)
+    used = {}
+    routes, trips, stop_times = [], [], []
+
+    for line in range(lines):
+        calling_points = rng.sample(all_stations, stops_per_line)
+        for station in calling_points:
+            used[station.crs] = station
+        route_id = 'R{}'.format(line)
+        routes.append([route_id, 'A{}'.format(line % len(OPERATORS)), '', '{} - {}'.format(
+            calling_points[0].name, calling_points[-1].name), '2'])
+        run_times = [rng.randint(3, 15) for _ in calling_points[1:]]
+
+        for service_id, _, share in CALENDAR:
+            count = max(1, int(trips_per_line * share))
+            # Services run from 05:00 until just after midnight
+            headway = (19 * 60 + 30) // count
+            for trip in range(count):
+                trip_id = '{}-{}-{}'.format(route_id, service_id, trip)
+                direction = calling_points if trip % 2 == 0 else calling_points[::-1]
+                trips.append([route_id, service_id, trip_id, direction[-1].name])
+                minutes = 5 * 60 + trip * headway + rng.randint(0, 4)
+                for sequence, station in enumerate(direction):
+                    time = _format_time(minutes)
+                    stop_times.append([trip_id, time, time, station.crs, sequence + 1, '0', '0'])
+                    if sequence < len(run_times):
+                        minutes += run_times[sequence if trip % 2 == 0 else -sequence - 1]
+
+    end = FEED_START + timedelta(days=FEED_DAYS - 1)
+    calendar = [[service_id] + list(days) + [FEED_START.strftime('%Y%m%d'), end.strftime('%Y%m%d')]
+                for service_id, days, _ in CALENDAR]
+    exceptions = []
+    for holiday in BANK_HOLIDAYS:
+        exceptions.append(['WEEKDAY', holiday, '2'])
+        exceptions.append(['SUNDAY', holiday, '1'])
+
+    return {
+        'agency.txt': _csv(['agency_id', 'agency_name', 'agency_url', 'agency_timezone'],
+                           [['A{}'.format(index), name, 'https://example.com', 'Europe/London']
+                            for index, name in enumerate(OPERATORS)]),
+        'routes.txt': _csv(['route_id', 'agency_id', 'route_short_name', 'route_long_name', 'route_type'], routes),
+        'stops.txt': _csv(['stop_id', 'stop_code', 'stop_name'],
+                          [[crs, crs, station.name] for crs, station in sorted(used.items())]),
+        'calendar.txt': _csv(['service_id', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday',
+                              'sunday', 'start_date', 'end_date'], calendar),
+        'calendar_dates.txt': _csv(['service_id', 'date', 'exception_type'], exceptions),
+        'trips.txt': _csv(['route_id', 'service_id', 'trip_id', 'trip_headsign'], trips),
+        'stop_times.txt': _csv(['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence',
+                                'pickup_type', 'drop_off_type'], stop_times)
+    }
+
+
+def write_feed(path, **kwargs):
+    """Write a generated feed to `path` - a .zip, or otherwise a directory."""
+    files = generate_feed(**kwargs)
+    if path.endswith('.zip'):
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as feed:
+            for name, content in files.items():
+                feed.writestr(name, content)
+    else:
+        os.makedirs(path, exist_ok=True)
+        for name, content in files.items():
+            with open(os.path.join(path, name), 'w') as file:
+                file.write(content)
+    return path
+
+
+def _csv(header, rows):
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\n')
+    writer.writerow(header)
+    writer.writerows(rows)
+    return output.getvalue()
+
+
+def _format_time(minutes):
+    return '{:02d}:{:02d}:00'.format(minutes // 60, minutes % 60)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='A .zip file or directory to write')
+    parser.add_argument('--lines', type=int, default=100)
+    parser.add_argument('--stops-per-line', type=int, default=12)
+    parser.add_argument('--trips-per-line', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    write_feed(args.path, lines=args.lines, stops_per_line=args.stops_per_line,
+               trips_per_line=args.trips_per_line, seed=args.seed)
+    print('GTFS extract written to ' + args.path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""Query latency of the journey planner over random station pairs, on a
+synthetic GTFS extract (or a real one with --feed), both in memory and
+from a mapped timetable file:
+
+    python -m benchmarks.journey_bench
+    python -m benchmarks.journey_bench --lines 1000 --trips-per-line 100 --max-changes 3
+    python -m benchmarks.journey_bench --feed gtfs.zip
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks import gtfs
+from benchmarks.timetable_bench import QUERY_DAY
+
+DEFAULT_QUERIES = 500
+# Morning peak, when the network is busiest
+DEFAULT_AFTER = 8 * 60
+
+
+def measure_build(engine):
+    from rail_uk import journey
+
+    start = time.perf_counter()
+    planner = journey.Planner(engine)
+    return planner, {'build_ms': round((time.perf_counter() - start) * 1000, 1),
+                     'connections': len(planner.connections.departure_times)}
+
+
+def random_pairs(planner, queries=DEFAULT_QUERIES, seed=0):
+    rng = random.Random(seed)
+    stations = sorted(planner.connections.stations)
+    return [tuple(rng.sample(stations, 2)) for _ in range(queries)]
+
+
+def measure_queries(planner, pairs, max_changes=2, day=QUERY_DAY, after=DEFAULT_AFTER):
+    # Selecting the day's connections is done once per day, not per query
+    start = time.perf_counter()
+    planner.day_connections(day)
+    results = {'day': {'select_ms': round((time.perf_counter() - start) * 1000, 1)}}
+    for changes in range(max_changes + 1):
+        timings, found = [], 0
+        for origin, destination in pairs:
+            start = time.perf_counter()
+            legs = planner.earliest_arrival(origin, destination, day, after, max_changes=changes)
+            timings.append((time.perf_counter() - start) * 1000)
+            found += legs is not None
+        timings.sort()
+        results['max_changes_{}'.format(changes)] = {
+            'found_pct': round(found * 100 / len(pairs), 1),
+            'p50_ms': round(statistics.median(timings), 3),
+            'p99_ms': round(timings[int(len(timings) * 0.99)], 3)
+        }
+    return results
+
+
+def main(argv=None):
+    from rail_uk import mapped_timetable, timetable
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--feed', help='A GTFS extract to load instead of a synthetic one')
+    parser.add_argument('--lines', type=int, default=400)
+    parser.add_argument('--stops-per-line', type=int, default=12)
+    parser.add_argument('--trips-per-line', type=int, default=80)
+    parser.add_argument('--queries', type=int, default=DEFAULT_QUERIES)
+    parser.add_argument('--max-changes', type=int, default=2)
+    parser.add_argument('--after', default='08:00', help='Departure time of the queries (HH:MM)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    hours, minutes = args.after.split(':')
+    after = int(hours) * 60 + int(minutes)
+    with tempfile.TemporaryDirectory() as directory:
+        feed_path = args.feed or gtfs.write_feed(os.path.join(directory, 'timetable.zip'), lines=args.lines,
+                                                 stops_per_line=args.stops_per_line,
+                                                 trips_per_line=args.trips_per_line, seed=args.seed)
+        engine = timetable.load(feed_path)
+        planner, build = measure_build(engine)
+        mapped_path = mapped_timetable.write(engine, os.path.join(directory, 'timetable.bin'))
+        mapped = mapped_timetable.open_timetable(mapped_path)
+        mapped_planner, mapped_build = measure_build(mapped)
+
+        pairs = random_pairs(planner, args.queries, args.seed)
+        queries = {'memory': measure_queries(planner, pairs, args.max_changes, after=after),
+                   'mapped': measure_queries(mapped_planner, pairs, args.max_changes, after=after)}
+        del mapped_planner
+        mapped.close()
+
+    print('Connections: {connections}, built in {build_ms}ms ({mapped}ms mapped)'.format(
+        mapped=mapped_build['build_ms'], **build))
+    print('Day selected in {}ms ({}ms mapped)'.format(queries['memory'].pop('day')['select_ms'],
+                                                      queries['mapped'].pop('day')['select_ms']))
+    print()
+    print('{:<20}{:>10}{:>10}{:>10}{:>12}{:>12}'.format('query', 'found_pct', 'p50_ms', 'p99_ms', 'mapped_p50',
+                                                          'mapped_p99'))
+    for name, result in queries['memory'].items():
+        print('{:<20}{found_pct:>10}{p50_ms:>10}{p99_ms:>10}'.format(name, **result) +
+              '{p50_ms:>12}{p99_ms:>12}'.format(**queries['mapped'][name]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
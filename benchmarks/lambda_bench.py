@@ -0,0 +1,272 @@
+"""End-to-end benchmarks of lambda_entry against local upstream stand-ins.
+
+Reports warm and cold latency, peak allocations and upstream call counts for
+every intent, and compares them against stored baselines:
+
+    python -m benchmarks.lambda_bench                     # report only
+    python -m benchmarks.lambda_bench --check             # fail on allocation or call regressions
+    python -m benchmarks.lambda_bench --check --check-latency  # and on latency regressions
+    python -m benchmarks.lambda_bench --update-baselines  # accept new numbers
+"""
+from datetime import datetime
+from os import environ
+from unittest.mock import patch
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from benchmarks.events import get_benchmark_events, HOME_USER, ORIGIN
+from benchmarks.fake_dynamodb import FakeTable
+
+BASELINE_FILE = 'benchmarks/baselines.json'
+DEFAULT_ITERATIONS = 50
+# Latency is only comparable on the machine that recorded the baselines, and
+# even there varies run to run, so only a doubling counts as a regression,
+# and --check only fails on it with --check-latency. Allocations are steady
+# run to run, but depend on the Python and library versions that recorded
+# the baselines, so --check only fails on them with --check-allocations.
+# Upstream calls are the same anywhere, so are always gated.
+DEFAULT_THRESHOLD = 1.0
+ALLOCATION_THRESHOLD = 0.1
+GATED_METRICS = ('upstream_calls',)
+ALLOCATION_METRICS = ('alloc_peak_kb',)
+
+# Differences smaller than these are treated as noise, whatever the ratio
+ABSOLUTE_TOLERANCE = {
+    'warm_p50_ms': 1.0,
+    'warm_p95_ms': 2.0,
+    'cold_ms': 25.0,
+    'alloc_peak_kb': 8.0
+}
+
+# LastTrain's upstream calls depend on the time of day, so the clock is fixed
+# at a point where the last service is close enough to need a live time.
+FROZEN_TIME = datetime(2019, 3, 1, 20, 30)
+
+TEST_ENV = {
+    'LOG_LEVEL': 'ERROR',
+    'SKILL_ID': 'amzn1.ask.skill.xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx',
+    'OPEN_LDBWS_ACCESS_TOKEN': 'BENCHMARK_DARWIN_TOKEN',
+    'TRANSPORT_API_APP_ID': 'BENCHMARK_APP_ID',
+    'TRANSPORT_API_KEY': 'BENCHMARK_API_KEY'
+}
+
+
+def configure_environment(server):
+    for key, value in TEST_ENV.items():
+        environ.setdefault(key, value)
+    environ['OPEN_LDBWS_URL'] = server.open_ldbws_url
+    environ['TRANSPORT_API_URL'] = server.base_url
+
+
+class FrozenDatetime(datetime):
+
+    @classmethod
+    def now(cls, tz=None):
+        return FROZEN_TIME
+
+
+def freeze_clock():
+    return patch('rail_uk.data.datetime', FrozenDatetime)
+
+
+def install_table():
+    from rail_uk import dynamodb
+
+    table = FakeTable()
+    table.items[HOME_USER] = {
+        'UserID': HOME_USER,
+        'station_name': ORIGIN['name'],
+        'station_crs': ORIGIN['id'],
+        'distance': 10
+    }
+    dynamodb._table = table
+    return table
+
+
+def point_at_server(server):
+    from rail_uk import data
+
+    data.OPEN_LDBWS_URL = server.open_ldbws_url
+    data.TRANSPORT_API_URL = server.base_url
+
+
+def count_upstream_calls(server, table):
+    return sum(server.calls.values()) + sum(table.calls.values())
+
+
+def measure_warm(event, iterations, server, table):
+    from lambda_entry import lambda_entry
+    from rail_uk import cache
+
+    # Every invocation is measured as a cache miss, so that each one takes
+    # the full path through the upstream APIs
+    cache.clear()
+    # The first call pays for lazy imports and connection setup
+    lambda_entry(event, None)
+
+    cache.clear()
+    before = count_upstream_calls(server, table)
+    lambda_entry(event, None)
+    upstream_calls = count_upstream_calls(server, table) - before
+
+    cache.clear()
+    tracemalloc.start()
+    lambda_entry(event, None)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings = []
+    for _ in range(iterations):
+        cache.clear()
+        start = time.perf_counter()
+        lambda_entry(event, None)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+
+    return {
+        'warm_p50_ms': round(statistics.median(timings), 3),
+        'warm_p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        'alloc_peak_kb': round(peak / 1024, 1),
+        'upstream_calls': upstream_calls
+    }
+
+
+def measure_cold(name):
+    """Time the import of lambda_entry plus a first invocation in a fresh
+    interpreter, as a new Lambda container would.
+    """
+    output = subprocess.check_output([sys.executable, '-m', 'benchmarks.lambda_bench', '--cold-run', name],
+                                     env=dict(environ), universal_newlines=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def cold_run(name):
+    start = time.perf_counter()
+    from lambda_entry import lambda_entry
+    import_ms = (time.perf_counter() - start) * 1000
+
+    install_table()
+    with freeze_clock():
+        lambda_entry(get_benchmark_events()[name], None)
+    cold_ms = (time.perf_counter() - start) * 1000
+    print(json.dumps({'cold_ms': round(cold_ms, 3), 'import_ms': round(import_ms, 3)}))
+
+
+def run_benchmarks(iterations=DEFAULT_ITERATIONS, cold=True, names=None):
+    # Imported here so that cold runs measure jinja2's import, not ours
+    from benchmarks.standin import StandInServer
+
+    from rail_uk import data, dynamodb
+
+    original_clients = (data.OPEN_LDBWS_URL, data.TRANSPORT_API_URL, dynamodb._table)
+    server = StandInServer().start()
+    try:
+        configure_environment(server)
+        point_at_server(server)
+        table = install_table()
+
+        results = {}
+        for name, event in get_benchmark_events().items():
+            if names and name not in names:
+                continue
+            with freeze_clock():
+                results[name] = measure_warm(event, iterations, server, table)
+            if cold:
+                results[name].update(measure_cold(name))
+        return results
+    finally:
+        server.stop()
+        data.OPEN_LDBWS_URL, data.TRANSPORT_API_URL, dynamodb._table = original_clients
+
+
+def find_regressions(results, baselines, threshold=DEFAULT_THRESHOLD, metrics=None):
+    """Return the regressions against `baselines`, of only `metrics` if given."""
+    regressions = []
+    for name, measured in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            continue
+        for metric, value in measured.items():
+            base_value = baseline.get(metric)
+            if base_value is None or (metrics is not None and metric not in metrics):
+                continue
+            if metric == 'upstream_calls':
+                regressed = value > base_value
+            else:
+                allowed = ALLOCATION_THRESHOLD if metric == 'alloc_peak_kb' else threshold
+                tolerance = ABSOLUTE_TOLERANCE.get(metric, 0)
+                regressed = value > base_value * (1 + allowed) and value - base_value > tolerance
+            if regressed:
+                regressions.append('{} {}: {} (baseline {})'.format(name, metric, value, base_value))
+    return regressions
+
+
+def load_baselines(baseline_file=BASELINE_FILE):
+    try:
+        with open(baseline_file) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baselines(results, baseline_file=BASELINE_FILE):
+    with open(baseline_file, 'w') as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+        file.write('\n')
+
+
+def print_report(results):
+    columns = ['warm_p50_ms', 'warm_p95_ms', 'cold_ms', 'import_ms', 'alloc_peak_kb', 'upstream_calls']
+    print('{:<20}'.format('benchmark') + ''.join('{:>16}'.format(column) for column in columns))
+    for name, metrics in results.items():
+        row = ''.join('{:>16}'.format(str(metrics.get(column, '-'))) for column in columns)
+        print('{:<20}'.format(name) + row)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Allowed fractional slowdown before a latency counts as a regression')
+    parser.add_argument('--no-cold', action='store_true', help='Skip the cold-start measurements')
+    parser.add_argument('--check', action='store_true',
+                        help='Exit non-zero if upstream calls regressed')
+    parser.add_argument('--check-allocations', action='store_true',
+                        help='With --check, also exit non-zero if allocations regressed')
+    parser.add_argument('--check-latency', action='store_true',
+                        help='With --check, also exit non-zero if latency or allocations regressed')
+    parser.add_argument('--update-baselines', action='store_true')
+    parser.add_argument('--cold-run', help=argparse.SUPPRESS)
+    parser.add_argument('benchmarks', nargs='*', help='Only run these benchmarks')
+    args = parser.parse_args(argv)
+
+    if args.cold_run:
+        cold_run(args.cold_run)
+        return 0
+
+    results = run_benchmarks(args.iterations, cold=not args.no_cold, names=args.benchmarks)
+    print_report(results)
+
+    if args.update_baselines:
+        save_baselines(results)
+        print('Baselines written to ' + BASELINE_FILE)
+        return 0
+
+    baselines = load_baselines()
+    if args.check_latency:
+        gated = None
+    else:
+        gated = GATED_METRICS + (ALLOCATION_METRICS if args.check_allocations else ())
+    regressions = find_regressions(results, baselines, args.threshold, gated)
+    for regression in find_regressions(results, baselines, args.threshold):
+        print(('REGRESSION: ' if regression in regressions else 'WORSE (not gated): ') + regression)
+    return 1 if args.check and regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
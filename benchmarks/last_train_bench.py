@@ -0,0 +1,96 @@
+"""Latency of an evening LastTrain lookup with the live board fetched after
+the timetable, and speculatively alongside it, against a stand-in with
+injected latency.
+
+Each lookup starts from empty caches, so that it pays for both the timetable
+and the board. The clock is fixed in the evening, with the last service in
+the fixture close enough to need a live time.
+
+    python -m benchmarks.last_train_bench
+    python -m benchmarks.last_train_bench --latency lognormal:80:0.5 --lookups 100
+"""
+from datetime import datetime
+from os import environ
+from unittest.mock import patch
+import argparse
+import statistics
+import sys
+import time
+
+from benchmarks.standin import StandInServer, UpstreamBehaviour
+
+DEFAULT_LATENCY = 'fixed:80'
+DEFAULT_LOOKUPS = 50
+EVENING = datetime(2019, 3, 1, 21, 45)
+# Speculation starts from LAST_TRAIN_SPECULATE_FROM, so these turn it on and
+# off whatever the time
+MODES = {'sequential': '24:00', 'speculative': '00:00'}
+
+
+class EveningDatetime(datetime):
+
+    @classmethod
+    def now(cls, tz=None):
+        return EVENING
+
+
+def measure(speculate_from, server, lookups=DEFAULT_LOOKUPS):
+    from rail_uk import cache, data, timetable_providers
+    from rail_uk.dtos import APIParameters, Station
+
+    params = APIParameters(Station('Clapham Junction', 'CLJ'), Station('London Waterloo', 'WAT'), 0)
+    timings = []
+    calls_before = sum(server.calls.values())
+    live = 0
+    with patch('rail_uk.data.SPECULATE_FROM', speculate_from), patch('rail_uk.data.datetime', EveningDatetime):
+        for _ in range(lookups):
+            cache.clear()
+            start = time.perf_counter()
+            departure = data.get_last_departure(params)
+            timings.append((time.perf_counter() - start) * 1000)
+            live += departure.live
+    timetable_providers.reset()
+
+    timings.sort()
+    return {
+        'p50_ms': round(statistics.median(timings), 1),
+        'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 1),
+        'upstream_calls': round((sum(server.calls.values()) - calls_before) / lookups, 2),
+        'live': live
+    }
+
+
+def run_benchmarks(latency=DEFAULT_LATENCY, lookups=DEFAULT_LOOKUPS):
+    for key, value in (('OPEN_LDBWS_ACCESS_TOKEN', 'BENCHMARK'), ('TRANSPORT_API_APP_ID', 'BENCHMARK'),
+                       ('TRANSPORT_API_KEY', 'BENCHMARK')):
+        environ.setdefault(key, value)
+    server = StandInServer(behaviour=UpstreamBehaviour(latency)).start()
+    try:
+        with patch('rail_uk.data.OPEN_LDBWS_URL', server.open_ldbws_url), \
+                patch('rail_uk.data.TRANSPORT_API_URL', server.base_url):
+            # The first lookup pays for lazy imports and connection setup
+            measure(MODES['sequential'], server, 1)
+            return {mode: measure(speculate_from, server, lookups) for mode, speculate_from in MODES.items()}
+    finally:
+        server.stop()
+
+
+def print_report(results):
+    print('{:<14}{:>10}{:>10}{:>16}{:>8}'.format('mode', 'p50_ms', 'p95_ms', 'upstream_calls', 'live'))
+    for mode, result in results.items():
+        print('{:<14}{:>10}{:>10}{:>16}{:>8}'.format(mode, result['p50_ms'], result['p95_ms'],
+                                                     result['upstream_calls'], result['live']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', default=DEFAULT_LATENCY, help='Stand-in latency per request')
+    parser.add_argument('--lookups', type=int, default=DEFAULT_LOOKUPS)
+    args = parser.parse_args(argv)
+
+    print_report(run_benchmarks(args.latency, args.lookups))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""Ingestion throughput and query latency of rail_uk.live_state, on a
+synthetic push stream from benchmarks/push_stream.py.
+
+Darwin's Push Port averages a few hundred messages a second and peaks at
+a few thousand, so the stream is also served over TCP at those rates to
+check that the consumer keeps up:
+
+    python -m benchmarks.live_state_bench
+    python -m benchmarks.live_state_bench --services 20000 --rates 200 1000 5000
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+from benchmarks.push_stream import StreamServer, generate_messages
+
+DEFAULT_RATES = (200, 1000, 3000)
+DEFAULT_QUERIES = 2000
+
+
+def measure_ingestion(messages, memory=True):
+    from rail_uk.live_state import LiveState
+
+    lines = [(json.dumps(message) + '\n').encode() for message in messages]
+    state = LiveState()
+    start = time.perf_counter()
+    state.ingest(lines)
+    elapsed = time.perf_counter() - start
+    results = {
+        'messages': len(lines),
+        'services': len(state),
+        'messages_per_s': round(len(lines) / elapsed),
+        'us_per_message': round(elapsed * 1e6 / len(lines), 1)
+    }
+    if memory:
+        tracemalloc.start()
+        LiveState().ingest(lines)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results['peak_kb'] = round(peak / 1024, 1)
+    return state, results
+
+
+def measure_queries(messages, queries=DEFAULT_QUERIES, seed=0):
+    """Query the state of the stream before any service is deactivated."""
+    from rail_uk.live_state import LiveState
+
+    state = LiveState()
+    for message in messages:
+        if message['type'] != 'deactivated':
+            state.apply(message)
+    rng = random.Random(seed)
+    origins = sorted(crs for crs, board in state.boards.items() if board)
+    results = {}
+    for name in ('departures', 'fastest_departure'):
+        timings = []
+        for _ in range(queries):
+            origin = rng.choice(origins)
+            _, call = rng.choice(state.boards[origin])
+            later = state.call_services[call]
+            end = state.first_calls[later] + state.call_counts[later]
+            destination = state.call_stations[rng.randrange(call + 1, end)]
+            start = time.perf_counter()
+            getattr(state, name)(origin, destination, after=rng.randint(5 * 60, 22 * 60))
+            timings.append((time.perf_counter() - start) * 1e6)
+        timings.sort()
+        results[name] = {'p50_us': round(statistics.median(timings), 1),
+                         'p99_us': round(timings[int(len(timings) * 0.99)], 1)}
+    return results
+
+
+def measure_stream(messages, rate):
+    """Serve `messages` over TCP at `rate` a second into a fresh LiveState,
+    returning how far behind the stream the consumer finished.
+    """
+    from rail_uk import live_state
+
+    server = StreamServer(messages, rate).start()
+    state = live_state.LiveState()
+    try:
+        start = time.perf_counter()
+        consumer = threading.Thread(target=state.ingest, args=(live_state.open_stream(server.source),))
+        consumer.start()
+        consumer.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        server.stop()
+    return {
+        'offered_per_s': rate,
+        'achieved_per_s': round(state.messages / elapsed),
+        'lag_ms': round(max(0.0, elapsed - len(messages) / rate) * 1000, 1)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--services', type=int, default=5000)
+    parser.add_argument('--calls-per-service', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=DEFAULT_QUERIES)
+    parser.add_argument('--rates', type=int, nargs='*', default=DEFAULT_RATES)
+    parser.add_argument('--stream-seconds', type=float, default=2.0, help='Length of each rate-limited stream')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the (slow) allocation measurement')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    messages = generate_messages(args.services, args.calls_per_service, seed=args.seed)
+    _, ingestion = measure_ingestion(messages, memory=not args.no_memory)
+    queries = measure_queries(messages, args.queries, args.seed)
+    streams = [measure_stream(messages[:int(rate * args.stream_seconds)], rate) for rate in args.rates]
+
+    print('Ingestion: ' + ', '.join('{}={}'.format(key, value) for key, value in ingestion.items()))
+    print()
+    print('{:<20}{:>10}{:>10}'.format('query', 'p50_us', 'p99_us'))
+    for name, result in queries.items():
+        print('{:<20}{p50_us:>10}{p99_us:>10}'.format(name, **result))
+    print()
+    print('{:<16}{:>16}{:>10}'.format('offered_per_s', 'achieved_per_s', 'lag_ms'))
+    for result in streams:
+        print('{offered_per_s:<16}{achieved_per_s:>16}{lag_ms:>10}'.format(**result))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
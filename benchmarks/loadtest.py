@@ -0,0 +1,249 @@
+"""Load test lambda_handler against a misbehaving local upstream.
+
+Replays a corpus of Alexa events at a target arrival rate and concurrency
+through lambda_handler, while the stand-in upstream injects latency, errors
+and slow-loris responses, then reports throughput and latency percentiles:
+
+    python -m benchmarks.loadtest --rate 50 --concurrency 16 --duration 30 \\
+        --latency lognormal:120:0.6 --error-rate 0.01 --slow-loris-rate 0.002
+
+Latency is measured from each request's scheduled arrival, so time spent
+queueing for a free worker counts against it, as it would for a user.
+
+Given a cassette recorded in production (see rail_uk/cassette.py), the events
+and upstream responses it holds are replayed instead, with their original
+timings:
+
+    python -m benchmarks.loadtest --cassette prod.cassette --rate 50
+"""
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+
+from benchmarks.events import get_benchmark_events
+from benchmarks.lambda_bench import TEST_ENV, configure_environment, install_table, point_at_server
+
+# Share of traffic per benchmark event when no corpus file is given
+DEFAULT_MIX = {
+    'NextTrain': 35,
+    'NextTrainFromHome': 20,
+    'FastestTrain': 20,
+    'LastTrain': 15,
+    'LaunchRequest': 5,
+    'StopIntent': 3,
+    'HelpIntent': 2
+}
+
+
+def load_corpus(corpus_file=None, size=1000, seed=0):
+    """Load events from a JSON-lines file, or sample the default mix."""
+    if corpus_file is not None:
+        with open(corpus_file) as file:
+            return [json.loads(line) for line in file if line.strip()]
+
+    events = get_benchmark_events()
+    rng = random.Random(seed)
+    names = list(DEFAULT_MIX)
+    return [events[name] for name in rng.choices(names, weights=[DEFAULT_MIX[n] for n in names], k=size)]
+
+
+def classify(response):
+    """Map a skill response to 'ok', 'api_error', 'db_error' or 'error'."""
+    from rail_uk import intents
+
+    if response is None:
+        return 'ok'
+    speech = response['response']['outputSpeech']['text']
+    outcomes = {
+        intents.get_api_error_response()['response']['outputSpeech']['text']: 'api_error',
+        intents.get_db_error_response()['response']['outputSpeech']['text']: 'db_error',
+        intents.get_error_response()['response']['outputSpeech']['text']: 'error'
+    }
+    return outcomes.get(speech, 'ok')
+
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(percent / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_load(corpus, rate, concurrency, duration, handler=None):
+    """Offer `rate` events per second for `duration` seconds to `handler`,
+    with at most `concurrency` in flight. Returns one sample per request.
+    """
+    if handler is None:
+        from rail_uk.lambda_handler import lambda_handler
+        handler = lambda_handler
+
+    samples = []
+    samples_lock = threading.Lock()
+    start = time.perf_counter()
+
+    def invoke(event, scheduled):
+        started = time.perf_counter()
+        try:
+            outcome = classify(handler(event, None))
+        except Exception:
+            outcome = 'exception'
+        finished = time.perf_counter()
+        intent = event['request'].get('intent', {}).get('name', event['request']['type'])
+        with samples_lock:
+            samples.append({
+                'intent': intent,
+                'outcome': outcome,
+                'latency_ms': (finished - scheduled) * 1000,
+                'service_ms': (finished - started) * 1000,
+                'finished_s': finished - start
+            })
+
+    total = int(rate * duration)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for index in range(total):
+            scheduled = start + index / rate
+            wait = scheduled - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            pool.submit(invoke, corpus[index % len(corpus)], scheduled)
+    elapsed = time.perf_counter() - start
+
+    return samples, elapsed
+
+
+def build_report(samples, elapsed, offered_rate=None, duration=None):
+    duration = duration or elapsed
+    completed_in_window = sum(1 for sample in samples if sample['finished_s'] <= duration)
+    latencies = sorted(sample['latency_ms'] for sample in samples)
+    service_times = sorted(sample['service_ms'] for sample in samples)
+    by_intent = defaultdict(list)
+    for sample in samples:
+        by_intent[sample['intent']].append(sample['latency_ms'])
+
+    def summarise(values):
+        values = sorted(values)
+        return {
+            'count': len(values),
+            'p50_ms': _round(percentile(values, 50)),
+            'p95_ms': _round(percentile(values, 95)),
+            'p99_ms': _round(percentile(values, 99))
+        }
+
+    report = {
+        'requests': len(samples),
+        'elapsed_s': round(elapsed, 3),
+        # Completions while load was being offered, ignoring the drain of
+        # stragglers (e.g. slow-loris responses) afterwards
+        'throughput_rps': round(completed_in_window / duration, 2) if duration else None,
+        'offered_rps': offered_rate,
+        'outcomes': dict(Counter(sample['outcome'] for sample in samples)),
+        'latency': summarise(latencies),
+        'service_time': summarise(service_times),
+        'intents': {intent: summarise(values) for intent, values in sorted(by_intent.items())}
+    }
+    report['latency']['max_ms'] = _round(latencies[-1] if latencies else None)
+    return report
+
+
+def print_report(report):
+    print('Requests:   {requests} in {elapsed_s}s'.format(**report))
+    print('Throughput: {throughput_rps} req/s (offered {offered_rps})'.format(**report))
+    print('Outcomes:   ' + ', '.join('{}={}'.format(k, v) for k, v in sorted(report['outcomes'].items())))
+    for label in ('latency', 'service_time'):
+        print('{:<14}p50={p50_ms}ms p95={p95_ms}ms p99={p99_ms}ms'.format(label + ':', **report[label]))
+    print('{:<14}{}ms'.format('max latency:', report['latency']['max_ms']))
+    if report.get('upstream_faults'):
+        print('Injected:   ' + ', '.join('{}={}'.format(k, v) for k, v in sorted(report['upstream_faults'].items())))
+    print()
+    print('{:<20}{:>8}{:>12}{:>12}{:>12}'.format('intent', 'count', 'p50_ms', 'p95_ms', 'p99_ms'))
+    for intent, summary in report['intents'].items():
+        print('{:<20}{count:>8}{p50_ms:>12}{p95_ms:>12}{p99_ms:>12}'.format(intent, **summary))
+
+
+def _round(value):
+    return None if value is None else round(value, 3)
+
+
+def main(argv=None):
+    from benchmarks.standin import StandInServer, UpstreamBehaviour
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rate', type=float, default=20, help='Arrivals per second')
+    parser.add_argument('--concurrency', type=int, default=8, help='Maximum invocations in flight')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds of load to offer')
+    parser.add_argument('--corpus', help='JSON-lines file of Alexa events to replay')
+    parser.add_argument('--cassette', help='Replay the events and upstream traffic recorded in this cassette')
+    parser.add_argument('--latency', help='Upstream latency, e.g. lognormal:80:0.5')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--slow-loris-rate', type=float, default=0.0)
+    parser.add_argument('--slow-loris-delay', type=float, default=0.2)
+    parser.add_argument('--board-rows', type=int,
+                        help='Serve synthetic departure boards of this many services every two hours')
+    parser.add_argument('--timeout', type=float, help='Override UPSTREAM_TIMEOUT (seconds)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='Also write the report to this file')
+    parser.add_argument('--log-level', default='CRITICAL', help="The skill's LOG_LEVEL during the run")
+    args = parser.parse_args(argv)
+    environ['LOG_LEVEL'] = args.log_level
+
+    if args.cassette:
+        return replay_cassette(args)
+
+    behaviour = UpstreamBehaviour(args.latency, args.error_rate, args.slow_loris_rate,
+                                  slow_loris_delay=args.slow_loris_delay, seed=args.seed)
+    server = StandInServer(behaviour=behaviour, board_rows=args.board_rows).start()
+    try:
+        configure_environment(server)
+        point_at_server(server)
+        install_table()
+        if args.timeout is not None:
+            from rail_uk import data
+            data.UPSTREAM_TIMEOUT = args.timeout
+
+        corpus = load_corpus(args.corpus, seed=args.seed)
+        samples, elapsed = run_load(corpus, args.rate, args.concurrency, args.duration)
+    finally:
+        server.stop()
+
+    report = build_report(samples, elapsed, args.rate, args.duration)
+    report['upstream_calls'] = dict(server.calls)
+    report['upstream_faults'] = dict(server.faults)
+    return _output(report, args)
+
+
+def replay_cassette(args):
+    from rail_uk import cassette
+
+    recording = cassette.Cassette(args.cassette, cassette.REPLAY)
+    corpus = recording.events()
+    if not corpus:
+        print('No events recorded in ' + args.cassette)
+        return 1
+
+    for key, value in TEST_ENV.items():
+        environ.setdefault(key, value)
+    cassette.activate(recording)
+    try:
+        samples, elapsed = run_load(corpus, args.rate, args.concurrency, args.duration)
+    finally:
+        cassette.deactivate()
+
+    return _output(build_report(samples, elapsed, args.rate, args.duration), args)
+
+
+def _output(report, args):
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""Throughput and memory of the OpenLDBWS parsers on synthetic boards.
+
+    python -m benchmarks.parser_bench
+    python -m benchmarks.parser_bench --rows 10 50 150 --seed 3
+"""
+import argparse
+import statistics
+import sys
+import time
+import tracemalloc
+
+from benchmarks.boards import BoardGenerator
+
+ORIGIN = 'CLJ'
+DESTINATION = 'WAT'
+DEFAULT_ROWS = (1, 10, 50, 150)
+DEFAULT_ITERATIONS = 50
+
+
+def measure(parse, response, iterations=DEFAULT_ITERATIONS):
+    parse(response)
+
+    tracemalloc.start()
+    parse(response)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        parse(response)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    median_ms = statistics.median(timings)
+    return {
+        'kb': round(len(response) / 1024, 1),
+        'p50_ms': round(median_ms, 3),
+        'boards_per_s': round(1000 / median_ms, 1),
+        'alloc_peak_kb': round(peak / 1024, 1)
+    }
+
+
+def run_benchmarks(rows=DEFAULT_ROWS, iterations=DEFAULT_ITERATIONS, seed=0):
+    from rail_uk import data
+
+    boards = BoardGenerator(seed=seed)
+    results = {}
+    for row_count in rows:
+        board = boards.departure_board(ORIGIN, DESTINATION, rows=row_count)
+        for request_type in ('next', 'last'):
+            name = 'departures_{}_{}'.format(request_type, row_count)
+            results[name] = measure(lambda response: data.parse_departures_soap_response(response, request_type),
+                                    board, iterations)
+    results['fastest'] = measure(data.parse_fastest_departure_soap_response,
+                                 boards.fastest_departures(ORIGIN, DESTINATION), iterations)
+    return results
+
+
+def print_report(results):
+    columns = ['kb', 'p50_ms', 'boards_per_s', 'alloc_peak_kb']
+    print('{:<24}'.format('benchmark') + ''.join('{:>16}'.format(column) for column in columns))
+    for name, metrics in results.items():
+        print('{:<24}'.format(name) + ''.join('{:>16}'.format(metrics[column]) for column in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS, help='Board sizes to parse')
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print_report(run_benchmarks(args.rows, args.iterations, args.seed))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""Synthetic Darwin Push Port-style streams for rail_uk.live_state, and a TCP
+stand-in that serves one at a steady message rate.
+
+A day's stream schedules every service up front, then sends forecasts as
+each service runs (some delayed, some cancelled) and deactivates it once it
+has arrived. Output depends only on the seed:
+
+    python -m benchmarks.push_stream /tmp/push.jsonl --services 2000
+    python -m benchmarks.push_stream --serve --port 8090 --rate 500
+"""
+from socketserver import StreamRequestHandler, TCPServer, ThreadingMixIn
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+
+from rail_uk import stations
+
+OPERATORS = ('South Western Railway', 'Southern', 'Great Western Railway', 'West Midlands Trains', 'Northern')
+
+
+def generate_messages(services=1000, calls_per_service=10, forecasts_per_service=4, delay_rate=0.2,
+                      cancel_rate=0.02, seed=0):
+    """Return a day's stream as a list of message dicts, in the order Darwin
+    would send them.
+    """
+    rng = random.Random(seed)
+    all_stations = sorted(stations.get_station_registry())
+    schedules, events = [], []
+
+    for index in range(services):
+        rid = '2019022800{:06d}'.format(index)
+        calls = rng.sample(all_stations, calls_per_service)
+        minutes = rng.randint(5 * 60, 23 * 60)
+        locations = []
+        for position, crs in enumerate(calls):
+            location = {'crs': crs}
+            if position > 0:
+                location['pta'] = _format_time(minutes)
+                minutes += 1
+            if position < len(calls) - 1:
+                location['ptd'] = _format_time(minutes)
+                minutes += rng.randint(3, 15)
+            locations.append(location)
+        schedules.append({'type': 'schedule', 'rid': rid, 'toc': rng.choice(OPERATORS), 'locations': locations})
+
+        start = _parse_time(locations[0]['ptd'])
+        delay = rng.randint(1, 30) if rng.random() < delay_rate else 0
+        cancelled = rng.random() < cancel_rate
+        if cancelled:
+            events.append((start - 30, {'type': 'cancellation', 'rid': rid}))
+        for _ in range(0 if cancelled else forecasts_per_service):
+            position = rng.randrange(len(locations))
+            location = locations[position]
+            scheduled = location.get('ptd') or location['pta']
+            forecast = {'crs': location['crs'], 'etd' if 'ptd' in location else 'eta':
+                        _format_time(_parse_time(scheduled) + delay)}
+            events.append((_parse_time(scheduled) - 15, {'type': 'forecast', 'rid': rid, 'locations': [forecast]}))
+        events.append((minutes + delay + 5, {'type': 'deactivated', 'rid': rid}))
+
+    events.sort(key=lambda event: event[0])
+    return schedules + [message for _, message in events]
+
+
+def write_stream(path, **kwargs):
+    with open(path, 'w') as file:
+        for message in generate_messages(**kwargs):
+            file.write(json.dumps(message) + '\n')
+    return path
+
+
+class StreamHandler(StreamRequestHandler):
+
+    def handle(self):
+        interval = 1 / self.server.rate if self.server.rate else 0
+        next_send = time.perf_counter()
+        for line in self.server.lines:
+            if interval:
+                next_send += interval
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            try:
+                self.wfile.write(line)
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            self.server.sent += 1
+
+
+class StreamServer(ThreadingMixIn, TCPServer):
+    """Serves `messages` to each connection at `rate` messages a second
+    (or as fast as possible if no rate is given), then hangs up.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, messages, rate=None, port=0, host='127.0.0.1'):
+        super().__init__((host, port), StreamHandler)
+        self.lines = [(json.dumps(message) + '\n').encode() for message in messages]
+        self.rate = rate
+        self.sent = 0
+        self._thread = None
+
+    @property
+    def source(self):
+        host, port = self.server_address
+        return 'tcp://{}:{}'.format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='push-stream', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def _parse_time(value):
+    hours, minutes = value.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def _format_time(minutes):
+    minutes %= 24 * 60
+    return '{:02d}:{:02d}'.format(minutes // 60, minutes % 60)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', nargs='?', help='A JSON-lines file to write')
+    parser.add_argument('--serve', action='store_true', help='Serve the stream over TCP instead')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--rate', type=float, default=None, help='Messages a second when serving')
+    parser.add_argument('--services', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        server = StreamServer(generate_messages(args.services, seed=args.seed), args.rate, args.port)
+        print('Serving push stream on ' + server.source)
+        server.serve_forever()
+    elif args.path:
+        write_stream(args.path, services=args.services, seed=args.seed)
+        print('Push stream written to ' + args.path)
+    else:
+        parser.error('Give a path to write, or --serve')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""Throughput of the self-hosted server (rail_uk/server.py) against the
+Lambda-style invocation path, on the load test's mix of intents against the
+local stand-in upstream.
+
+A Lambda container answers one invocation at a time, so its throughput is
+that of a single sequential caller, with the runtime's JSON (de)serialising
+of each event. The server is driven over HTTP by as many concurrent clients
+as it has threads. Upstream latency is what threads overlap, so it is
+injected by default:
+
+    python -m benchmarks.server_bench
+    python -m benchmarks.server_bench --threads 1 8 32 --latency fixed:50 --duration 5
+"""
+from http.client import HTTPConnection
+import argparse
+import json
+import sys
+import threading
+import time
+
+from benchmarks.lambda_bench import configure_environment, freeze_clock, install_table, point_at_server
+from benchmarks.loadtest import classify, load_corpus, percentile
+
+DEFAULT_THREADS = (1, 8, 32)
+DEFAULT_LATENCY = 'fixed:20'
+DEFAULT_DURATION = 3.0
+
+
+def lambda_style():
+    from lambda_entry import lambda_entry
+
+    def invoke(event, context):
+        return json.loads(json.dumps(lambda_entry(json.loads(json.dumps(event)), context)))
+    return invoke
+
+
+def over_http(port):
+    """Return a handler POSTing events to the server, one connection per
+    client thread at a time.
+    """
+    def invoke(event, _):
+        connection = HTTPConnection('127.0.0.1', port, timeout=30)
+        try:
+            connection.request('POST', '/', body=json.dumps(event), headers={'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            body = response.read()
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise IOError('Server responded {}'.format(response.status))
+        return json.loads(body) or None
+    return invoke
+
+
+def measure(handler, concurrency, duration, corpus):
+    """Run `concurrency` callers back to back through `handler` for
+    `duration` seconds.
+    """
+    samples = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def caller(offset):
+        index = offset
+        while time.perf_counter() < deadline:
+            event = corpus[index % len(corpus)]
+            index += concurrency
+            start = time.perf_counter()
+            try:
+                outcome = classify(handler(event, None))
+            except Exception:
+                outcome = 'exception'
+            with lock:
+                samples.append((outcome, (time.perf_counter() - start) * 1000))
+
+    start = time.perf_counter()
+    callers = [threading.Thread(target=caller, args=(offset,)) for offset in range(concurrency)]
+    for thread in callers:
+        thread.start()
+    for thread in callers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    timings = sorted(timing for _, timing in samples)
+    return {
+        'requests': len(samples),
+        'throughput_rps': round(len(samples) / elapsed, 1),
+        'errors': sum(1 for outcome, _ in samples if outcome != 'ok'),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p99_ms': round(percentile(timings, 99), 3)
+    }
+
+
+def run_benchmarks(threads=DEFAULT_THREADS, latency=DEFAULT_LATENCY, duration=DEFAULT_DURATION):
+    from benchmarks.standin import StandInServer, UpstreamBehaviour
+    from rail_uk import data, dynamodb, server
+
+    original_clients = (data.OPEN_LDBWS_URL, data.TRANSPORT_API_URL, data.HTTP_POOL_SIZE, dynamodb._table)
+    upstream = StandInServer(behaviour=UpstreamBehaviour(latency)).start()
+    results = {}
+    try:
+        configure_environment(upstream)
+        point_at_server(upstream)
+        install_table()
+        # Enough connections for the largest pool, before the session exists
+        data.set_http_pool_size(max(threads))
+        corpus = load_corpus(size=500)
+
+        with freeze_clock():
+            results[('lambda', 1)] = measure(lambda_style(), 1, duration, corpus)
+            for count in threads:
+                app = server.make_app(validators=[])
+                skill_server = server.PooledWSGIServer(('127.0.0.1', 0), app, threads=count)
+                serving = threading.Thread(target=skill_server.serve_forever, args=(0.05,), daemon=True)
+                serving.start()
+                try:
+                    results[('server', count)] = measure(over_http(skill_server.server_address[1]), count,
+                                                         duration, corpus)
+                finally:
+                    skill_server.stop()
+    finally:
+        upstream.stop()
+        data.OPEN_LDBWS_URL, data.TRANSPORT_API_URL, pool_size, dynamodb._table = original_clients
+        data.set_http_pool_size(pool_size)
+    return results
+
+
+def print_report(results):
+    print('{:<10}{:>10}{:>10}{:>16}{:>8}{:>10}{:>10}'.format(
+        'path', 'threads', 'requests', 'throughput_rps', 'errors', 'p50_ms', 'p99_ms'))
+    for (path, threads), result in results.items():
+        print('{:<10}{:>10}{requests:>10}{throughput_rps:>16}{errors:>8}{p50_ms:>10}{p99_ms:>10}'.format(
+            path, threads, **result))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, nargs='+', default=DEFAULT_THREADS, help='Server pool sizes to run')
+    parser.add_argument('--latency', default=DEFAULT_LATENCY, help='Upstream latency, e.g. fixed:50')
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help='Seconds of load per run')
+    args = parser.parse_args(argv)
+
+    print_report(run_benchmarks(args.threads, args.latency, args.duration))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,301 @@
+"""Local stand-in for OpenLDBWS and TransportAPI, serving the fixtures in
+tests/mock_responses so that the skill can be driven end-to-end without
+network access.
+
+The stand-in can also misbehave like a real upstream under load - with
+injected latency, errors and slow-loris responses - compress its responses
+as the real upstreams do, send them over a link of limited bandwidth, and be
+run on its own:
+
+    python -m benchmarks.standin --port 8080 --latency lognormal:80:0.5 --error-rate 0.01
+    python -m benchmarks.standin --compress --bandwidth 250000
+"""
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from collections import Counter
+import argparse
+import gzip
+import random
+import re
+import threading
+import time
+import zlib
+
+from jinja2 import Environment, FileSystemLoader
+
+from rail_uk import stations
+
+FIXTURE_DIR = 'tests/mock_responses/'
+SOAP_PATH = '/OpenLDBWS/ldb9.asmx'
+TIMETABLE_PATH = re.compile(r'^/v3/uk/train/station/(?P<origin>\w+)/[\d-]+/[\d:]+/timetable\.json')
+# A bandwidth-limited response is sent a packet's worth at a time
+BANDWIDTH_CHUNK = 1460
+# Synthetic boards hold board_rows services every this many minutes, up to
+# the request's numRows
+BOARD_WINDOW = 120
+
+_fixtures = Environment(loader=FileSystemLoader(searchpath=FIXTURE_DIR))
+
+
+def render_fixture(fixture, origin_crs, destination_crs):
+    origin = stations.get_station(origin_crs)
+    destination = stations.get_station(destination_crs)
+    req_vars = {
+        'origin_name': origin.name if origin else origin_crs,
+        'origin_crs': origin_crs,
+        'destination_name': destination.name if destination else destination_crs,
+        'destination_crs': destination_crs
+    }
+    if fixture.endswith('.json'):
+        # The TransportAPI fixture uses its own placeholder names
+        with open(FIXTURE_DIR + fixture) as file:
+            return file.read() \
+                .replace('{{ name }}', req_vars['origin_name']) \
+                .replace('{{ crs }}', origin_crs)
+    return _fixtures.get_template(fixture).render(req_vars=req_vars)
+
+
+# ----------------------------- Upstream Behaviour -----------------------------
+
+def parse_latency(spec):
+    """Build a latency sampler (returning seconds) from a spec such as
+    'fixed:50', 'uniform:20:200', 'lognormal:80:0.5' (median ms, sigma) or
+    'exponential:100' (mean ms).
+    """
+    if not spec:
+        return None
+    kind, *args = spec.split(':')
+    args = [float(arg) for arg in args]
+    if kind == 'fixed':
+        return lambda rng: args[0] / 1000
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(args[0], args[1]) / 1000
+    if kind == 'lognormal':
+        import math
+        return lambda rng: rng.lognormvariate(math.log(args[0]), args[1]) / 1000
+    if kind == 'exponential':
+        return lambda rng: rng.expovariate(1 / args[0]) / 1000
+    raise ValueError('Unknown latency distribution: ' + spec)
+
+
+class UpstreamBehaviour:
+    """How the stand-in treats each request: how long it waits before
+    responding, how often it fails, and how often it dribbles the response
+    out a few bytes at a time (slow-loris).
+    """
+
+    def __init__(self, latency=None, error_rate=0.0, slow_loris_rate=0.0, slow_loris_chunk=32,
+                 slow_loris_delay=0.2, seed=None):
+        self.latency = parse_latency(latency) if isinstance(latency, str) else latency
+        self.error_rate = error_rate
+        self.slow_loris_rate = slow_loris_rate
+        self.slow_loris_chunk = slow_loris_chunk
+        self.slow_loris_delay = slow_loris_delay
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def plan(self):
+        """Decide (delay in seconds, fail?, slow-loris?) for one request."""
+        with self._lock:
+            delay = self.latency(self._random) if self.latency else 0
+            fail = self._random.random() < self.error_rate
+            slow = not fail and self._random.random() < self.slow_loris_rate
+        return delay, fail, slow
+
+
+# ----------------------------- Server -----------------------------
+
+def _find(pattern, body, default=''):
+    match = re.search(pattern, body)
+    return match.group(1) if match else default
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, which Nagle's algorithm would
+    # otherwise hold back for a delayed ACK (~40ms per request).
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8')
+        if self.path != SOAP_PATH:
+            return self._respond(404, b'', 'text/plain')
+
+        origin = _find(r'<ldb:crs>(\w+)</ldb:crs>', body)
+        if 'GetFastestDeparturesRequest' in body:
+            operation = 'GetFastestDepartures'
+            destination = _find(r'<ldb:filterList>\s*<ldb:crs>(\w+)</ldb:crs>', body)
+            fixture = 'open_ldbws/fastest_departure.xml'
+        else:
+            operation = 'GetDepartureBoard'
+            destination = _find(r'<ldb:filterCrs>(\w+)</ldb:filterCrs>', body)
+            fixture = 'open_ldbws/departure_board.xml'
+
+        def render():
+            if self.server.boards is not None and operation == 'GetDepartureBoard':
+                window = int(_find(r'<ldb:timeWindow>(\d+)</ldb:timeWindow>', body, BOARD_WINDOW))
+                rows = int(_find(r'<ldb:numRows>(\d+)</ldb:numRows>', body, self.server.board_rows))
+                services = min(rows, self.server.board_rows * window // BOARD_WINDOW)
+                return self.server.boards.departure_board(origin, destination, rows=services, window=window)
+            return render_fixture(fixture, origin, destination)
+
+        self._serve(operation, render, 'application/soap+xml; charset=utf-8', 'open_ldbws/darwin_fault.xml')
+
+    def do_GET(self):
+        match = TIMETABLE_PATH.match(self.path)
+        if match is None:
+            return self._respond(404, b'', 'text/plain')
+
+        self._serve('timetable', lambda: render_fixture('transport_api/timetable.json', match.group('origin'), ''),
+                    'application/json')
+
+    def do_HEAD(self):
+        self._respond(200, b'', 'text/plain')
+
+    def _serve(self, operation, render, content_type, fault_fixture=None):
+        self.server.count(operation)
+        behaviour = self.server.get_behaviour(operation)
+        delay, fail, slow = behaviour.plan()
+        if delay:
+            time.sleep(delay)
+
+        if fail:
+            self.server.count_fault(operation, 'error')
+            content = render_fixture(fault_fixture, '', '') if fault_fixture else ''
+            return self._respond(500, content.encode('utf-8'), content_type)
+        if slow:
+            self.server.count_fault(operation, 'slow-loris')
+        self._respond(200, render().encode('utf-8'), content_type, behaviour if slow else None)
+
+    def _respond(self, status, content, content_type, slow_behaviour=None):
+        encoding = self._content_encoding() if content else None
+        if encoding == 'gzip':
+            content = gzip.compress(content)
+        elif encoding == 'deflate':
+            content = zlib.compress(content)
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+        self.server.count_bytes(len(content))
+        if slow_behaviour is not None:
+            chunk_size, delay = slow_behaviour.slow_loris_chunk, slow_behaviour.slow_loris_delay
+        elif self.server.bandwidth:
+            chunk_size = BANDWIDTH_CHUNK
+            delay = chunk_size / self.server.bandwidth
+        else:
+            self.wfile.write(content)
+            return
+
+        for offset in range(0, len(content), chunk_size):
+            self.wfile.write(content[offset:offset + chunk_size])
+            time.sleep(delay)
+
+    def _content_encoding(self):
+        if not self.server.compress:
+            return None
+        accepted = [value.split(';')[0].strip() for value in self.headers.get('Accept-Encoding', '').split(',')]
+        return next((encoding for encoding in ('gzip', 'deflate') if encoding in accepted), None)
+
+    def log_message(self, *_):
+        pass
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """Serves OpenLDBWS and TransportAPI fixtures, counting calls per
+    operation.
+    """
+    daemon_threads = True
+
+    def __init__(self, handler=StandInHandler, port=0, behaviour=None, host='127.0.0.1', board_rows=None,
+                 compress=False, bandwidth=None):
+        super().__init__((host, port), handler)
+        # Either one UpstreamBehaviour, or a dict of them keyed by operation
+        # ('GetDepartureBoard', 'GetFastestDepartures', 'timetable') with an
+        # optional 'default'
+        self.behaviour = behaviour or UpstreamBehaviour()
+        # Serve synthetic departure boards of this many services every two
+        # hours in place of the fixture
+        self.board_rows = board_rows
+        self.boards = None
+        if board_rows is not None:
+            from benchmarks.boards import BoardGenerator
+            self.boards = BoardGenerator()
+        # gzip or deflate responses for clients that accept them, and send
+        # them at `bandwidth` bytes a second
+        self.compress = compress
+        self.bandwidth = bandwidth
+        self.calls = Counter()
+        self.faults = Counter()
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    @property
+    def open_ldbws_url(self):
+        return self.base_url + SOAP_PATH
+
+    def get_behaviour(self, operation):
+        if isinstance(self.behaviour, dict):
+            return self.behaviour.get(operation) or self.behaviour.get('default') or UpstreamBehaviour()
+        return self.behaviour
+
+    def count(self, operation):
+        with self._lock:
+            self.calls[operation] += 1
+
+    def count_fault(self, operation, fault):
+        with self._lock:
+            self.faults[operation + ':' + fault] += 1
+
+    def count_bytes(self, size):
+        with self._lock:
+            self.bytes_sent += size
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', help='e.g. fixed:50, uniform:20:200, lognormal:80:0.5, exponential:100')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--slow-loris-rate', type=float, default=0.0)
+    parser.add_argument('--slow-loris-delay', type=float, default=0.2)
+    parser.add_argument('--board-rows', type=int,
+                        help='Serve synthetic departure boards of this many services every two hours')
+    parser.add_argument('--compress', action='store_true', help='gzip or deflate responses when accepted')
+    parser.add_argument('--bandwidth', type=float, help='Bytes a second to send responses at')
+    args = parser.parse_args(argv)
+
+    behaviour = UpstreamBehaviour(args.latency, args.error_rate, args.slow_loris_rate,
+                                  slow_loris_delay=args.slow_loris_delay)
+    server = StandInServer(port=args.port, behaviour=behaviour, host=args.host, board_rows=args.board_rows,
+                           compress=args.compress, bandwidth=args.bandwidth)
+    print('Serving OpenLDBWS at {} and TransportAPI at {}'.format(server.open_ldbws_url, server.base_url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
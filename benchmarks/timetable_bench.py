@@ -0,0 +1,144 @@
+"""Ingestion and query latency of the offline timetable engine, on a
+synthetic GTFS extract (or a real one with --feed), both loaded in memory
+and written to and opened as a mapped timetable file:
+
+    python -m benchmarks.timetable_bench
+    python -m benchmarks.timetable_bench --lines 1000 --trips-per-line 100
+    python -m benchmarks.timetable_bench --feed gtfs.zip
+"""
+from datetime import date
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import gtfs
+
+QUERY_DAY = date(2019, 3, 1)
+DEFAULT_QUERIES = 2000
+
+
+def measure_ingestion(feed_path, memory=True):
+    from rail_uk import timetable
+
+    start = time.perf_counter()
+    engine = timetable.load(feed_path)
+    elapsed = time.perf_counter() - start
+    results = {
+        'ingest_ms': round(elapsed * 1000, 1),
+        'trips': len(engine),
+        'trips_per_s': round(len(engine) / elapsed),
+        'feed_kb': round(os.path.getsize(feed_path) / 1024, 1) if os.path.isfile(feed_path) else None
+    }
+    if memory:
+        tracemalloc.start()
+        timetable.load(feed_path)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results['ingest_peak_kb'] = round(peak / 1024, 1)
+    return engine, results
+
+
+def measure_mapping(engine, mapped_path, memory=True):
+    """Write `engine` as a mapped timetable file and time opening it."""
+    from rail_uk import mapped_timetable
+
+    start = time.perf_counter()
+    mapped_timetable.write(engine, mapped_path)
+    results = {'write_ms': round((time.perf_counter() - start) * 1000, 1),
+               'file_kb': round(os.path.getsize(mapped_path) / 1024, 1)}
+
+    start = time.perf_counter()
+    mapped = mapped_timetable.open_timetable(mapped_path)
+    results['open_ms'] = round((time.perf_counter() - start) * 1000, 3)
+    if memory:
+        tracemalloc.start()
+        mapped_timetable.open_timetable(mapped_path).close()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results['open_peak_kb'] = round(peak / 1024, 1)
+    return mapped, results
+
+
+def query_pairs(engine, queries=DEFAULT_QUERIES, seed=0):
+    """Pick random pairs of stations that share a trip (answered early in
+    the scan) and random pairs of any stations (mostly unanswerable).
+    """
+    rng = random.Random(seed)
+    all_stations = sorted(engine.departures)
+    connected = _connected_pairs(engine, queries, rng)
+    unconnected = [(rng.choice(all_stations), rng.choice(all_stations)) for _ in range(queries)]
+    return {'connected': connected, 'random': unconnected}
+
+
+def measure_queries(engine, pairs, day=QUERY_DAY):
+    results = {}
+    for label, pairs in pairs.items():
+        for query in ('last_departure', 'next_departure'):
+            method = getattr(engine, query)
+            timings = []
+            for origin, destination in pairs:
+                start = time.perf_counter()
+                if query == 'last_departure':
+                    method(origin, destination, day)
+                else:
+                    method(origin, destination, day, 17 * 60)
+                timings.append((time.perf_counter() - start) * 1e6)
+            timings.sort()
+            results['{}_{}'.format(query, label)] = {
+                'p50_us': round(statistics.median(timings), 1),
+                'p99_us': round(timings[int(len(timings) * 0.99)], 1)
+            }
+    return results
+
+
+def _connected_pairs(engine, queries, rng):
+    origins = sorted(engine.departures)
+    pairs = []
+    for _ in range(queries):
+        origin = rng.choice(origins)
+        _, trip_index, position = rng.choice(engine.departures[origin])
+        calling_at = engine.trips[trip_index].calling_at
+        later = [crs for crs, stop in calling_at.items() if stop > position]
+        pairs.append((origin, rng.choice(later)))
+    return pairs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--feed', help='A GTFS extract to load instead of a synthetic one')
+    parser.add_argument('--lines', type=int, default=400)
+    parser.add_argument('--stops-per-line', type=int, default=12)
+    parser.add_argument('--trips-per-line', type=int, default=80)
+    parser.add_argument('--queries', type=int, default=DEFAULT_QUERIES)
+    parser.add_argument('--no-memory', action='store_true', help='Skip the (slow) allocation measurement')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        feed_path = args.feed or gtfs.write_feed(os.path.join(directory, 'timetable.zip'), lines=args.lines,
+                                                 stops_per_line=args.stops_per_line,
+                                                 trips_per_line=args.trips_per_line, seed=args.seed)
+        engine, ingestion = measure_ingestion(feed_path, memory=not args.no_memory)
+        mapped, mapping = measure_mapping(engine, os.path.join(directory, 'timetable.bin'),
+                                          memory=not args.no_memory)
+        pairs = query_pairs(engine, args.queries, args.seed)
+        queries = {'memory': measure_queries(engine, pairs), 'mapped': measure_queries(mapped, pairs)}
+        mapped.close()
+
+    print('Ingestion: ' + ', '.join('{}={}'.format(key, value) for key, value in ingestion.items()))
+    print('Mapped:    ' + ', '.join('{}={}'.format(key, value) for key, value in mapping.items()))
+    print()
+    print('{:<28}{:>12}{:>12}{:>12}{:>12}'.format('query', 'p50_us', 'p99_us', 'mapped_p50', 'mapped_p99'))
+    for name, result in queries['memory'].items():
+        print('{:<28}{p50_us:>12}{p99_us:>12}'.format(name, **result) +
+              '{p50_us:>12}{p99_us:>12}'.format(**queries['mapped'][name]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
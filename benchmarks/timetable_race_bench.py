@@ -0,0 +1,98 @@
+"""Latency and failures of scheduled timetable lookups with one provider,
+with a second to fall back to, and with both raced, against two stand-ins
+serving the TransportAPI fixture with their own latency and error rates.
+
+    python -m benchmarks.timetable_race_bench
+    python -m benchmarks.timetable_race_bench --primary lognormal:150:0.8 --primary-errors 0.05 \\
+        --mirror lognormal:80:0.4 --mirror-errors 0.01 --lookups 500
+"""
+from datetime import date
+from os import environ
+from unittest.mock import patch
+import argparse
+import statistics
+import sys
+import time
+
+from benchmarks.standin import StandInServer, UpstreamBehaviour
+
+DEFAULT_LOOKUPS = 200
+
+
+def measure(providers, mode, lookups=DEFAULT_LOOKUPS):
+    from rail_uk import timetable_providers
+    from rail_uk.dtos import APIParameters, Station
+    from rail_uk.exceptions import Error
+
+    params = APIParameters(Station('Clapham Junction', 'CLJ'), Station('London Waterloo', 'WAT'), 0)
+    timetable_providers.set_providers(providers)
+    timings = []
+    failures = 0
+    try:
+        with patch('rail_uk.timetable_providers.MODE', mode):
+            for _ in range(lookups):
+                start = time.perf_counter()
+                try:
+                    timetable_providers.get_departures(params, date.today(), '21:59')
+                except Error:
+                    failures += 1
+                timings.append((time.perf_counter() - start) * 1000)
+        stats = timetable_providers.get_stats()
+    finally:
+        timetable_providers.reset()
+
+    timings.sort()
+    return {
+        'p50_ms': round(statistics.median(timings), 1),
+        'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 1),
+        'p99_ms': round(timings[int(len(timings) * 0.99) - 1], 1),
+        'failures': failures,
+        'calls': {name: summary['calls'] for name, summary in stats.items()}
+    }
+
+
+def run_benchmarks(primary, primary_errors, mirror, mirror_errors, lookups=DEFAULT_LOOKUPS):
+    from rail_uk import timetable_providers
+
+    environ.setdefault('TRANSPORT_API_APP_ID', 'BENCHMARK')
+    environ.setdefault('TRANSPORT_API_KEY', 'BENCHMARK')
+    servers = [StandInServer(behaviour=UpstreamBehaviour(primary, primary_errors, seed=1)).start(),
+               StandInServer(behaviour=UpstreamBehaviour(mirror, mirror_errors, seed=2)).start()]
+    try:
+        def providers(count):
+            return [timetable_providers.TransportAPIProvider(name, server.base_url)
+                    for name, server in zip(('primary', 'mirror'), servers[:count])]
+
+        return {
+            'primary only': measure(providers(1), timetable_providers.FALLBACK, lookups),
+            'fallback': measure(providers(2), timetable_providers.FALLBACK, lookups),
+            'race': measure(providers(2), timetable_providers.RACE, lookups)
+        }
+    finally:
+        for server in servers:
+            server.stop()
+
+
+def print_report(results):
+    print('{:<14}{:>10}{:>10}{:>10}{:>10}   {}'.format('mode', 'p50_ms', 'p95_ms', 'p99_ms', 'failures', 'calls'))
+    for name, result in results.items():
+        calls = ', '.join('{}={}'.format(provider, count) for provider, count in result['calls'].items())
+        print('{:<14}{:>10}{:>10}{:>10}{:>10}   {}'.format(name, result['p50_ms'], result['p95_ms'], result['p99_ms'],
+                                                         result['failures'], calls))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--primary', default='lognormal:150:0.8', help='Latency of the first provider')
+    parser.add_argument('--primary-errors', type=float, default=0.05)
+    parser.add_argument('--mirror', default='lognormal:80:0.4', help='Latency of the second provider')
+    parser.add_argument('--mirror-errors', type=float, default=0.01)
+    parser.add_argument('--lookups', type=int, default=DEFAULT_LOOKUPS)
+    args = parser.parse_args(argv)
+
+    print_report(run_benchmarks(args.primary, args.primary_errors, args.mirror, args.mirror_errors, args.lookups))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
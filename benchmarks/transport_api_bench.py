@@ -0,0 +1,115 @@
+"""Parse time and memory of TransportAPI timetables, decoded whole as
+`get_timetable` used to, against the streaming extraction it uses now, on
+the test fixture and on larger synthetic evening windows.
+
+The streamed peak is of the extraction alone. In production the body never
+exists whole, whereas the decoded path also holds all of it.
+
+    python -m benchmarks.transport_api_bench
+    python -m benchmarks.transport_api_bench --departures 100 500 2000 --chunk-kb 4
+"""
+import argparse
+import copy
+import json
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+FIXTURE = 'tests/mock_responses/transport_api/timetable.json'
+DEFAULT_DEPARTURES = (50, 200, 1000)
+DEFAULT_ITERATIONS = 30
+DEFAULT_CHUNK_KB = 16
+
+
+def fixture_payload():
+    with open(FIXTURE, 'rb') as file:
+        return file.read().replace(b'{{ name }}', b'Home Town').replace(b'{{ crs }}', b'HTX')
+
+
+def synthetic_payload(departures, seed=0):
+    """A timetable of `departures` services shaped like the fixture's."""
+    rng = random.Random(seed)
+    document = json.loads(fixture_payload())
+    template = document['departures']['all'][0]
+    services = []
+    minutes = 18 * 60
+    for index in range(departures):
+        minutes += rng.randint(0, 3)
+        service = copy.deepcopy(template)
+        service['train_uid'] = 'P{:05d}'.format(index)
+        service['aimed_departure_time'] = service['aimed_arrival_time'] = '{:02d}:{:02d}'.format(
+            minutes // 60 % 24, minutes % 60)
+        service['destination_name'] = 'Train City {}'.format(rng.randint(1, 40))
+        services.append(service)
+    document['departures']['all'] = services
+    return json.dumps(document, indent=2).encode('utf-8')
+
+
+def decoded(content):
+    return json.loads(content)['departures']['all']
+
+
+def streamed(chunks):
+    from rail_uk import data, json_stream
+
+    return json_stream.extract_items(chunks, ('departures', 'all'), data.TIMETABLE_FIELDS)
+
+
+def measure(parse, payload, iterations=DEFAULT_ITERATIONS):
+    parse(payload)
+
+    tracemalloc.start()
+    parse(payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        parse(payload)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {'p50_ms': round(statistics.median(timings), 3), 'alloc_peak_kb': round(peak / 1024, 1)}
+
+
+def run_benchmarks(departures=DEFAULT_DEPARTURES, iterations=DEFAULT_ITERATIONS, chunk_kb=DEFAULT_CHUNK_KB, seed=0):
+    chunk_size = chunk_kb * 1024
+    payloads = [('fixture', fixture_payload())]
+    payloads += [('synthetic_{}'.format(count), synthetic_payload(count, seed)) for count in departures]
+
+    results = {}
+    for name, content in payloads:
+        chunks = [content[start:start + chunk_size] for start in range(0, len(content), chunk_size)]
+        results[name] = {
+            'kb': round(len(content) / 1024, 1),
+            'decoded': measure(decoded, content, iterations),
+            'streamed': measure(streamed, chunks, iterations)
+        }
+    return results
+
+
+def print_report(results):
+    print('{:<18}{:>10}{:>14}{:>14}{:>16}{:>16}'.format(
+        'payload', 'kb', 'decoded_ms', 'streamed_ms', 'decoded_kb', 'streamed_kb'))
+    for name, result in results.items():
+        print('{:<18}{:>10}{:>14}{:>14}{:>16}{:>16}'.format(
+            name, result['kb'], result['decoded']['p50_ms'], result['streamed']['p50_ms'],
+            result['decoded']['alloc_peak_kb'], result['streamed']['alloc_peak_kb']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--departures', type=int, nargs='+', default=DEFAULT_DEPARTURES,
+                        help='Sizes of synthetic timetable to parse')
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument('--chunk-kb', type=int, default=DEFAULT_CHUNK_KB)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print_report(run_benchmarks(args.departures, args.iterations, args.chunk_kb, args.seed))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
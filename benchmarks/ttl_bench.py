@@ -0,0 +1,252 @@
+"""Hit rate against freshness of the board cache's TTL policies, simulated by
+replaying a query history (as written by rail_uk/query_log.py) against
+synthetic live boards.
+
+Each route has a service every few minutes through the day, and some of
+those services are marked late (with estimates that may slip again), delayed
+without an estimate, or cancelled as their departure approaches. Every
+NextTrain query is answered through a board cache on a simulated clock. The
+answer is stale when its first departure differs from what OpenLDBWS would
+have said at that moment, and uncatchable when the user could no longer
+make it on foot. Without --queries, a day of peak-heavy queries over
+Zipf-distributed routes is generated.
+
+    python -m benchmarks.ttl_bench
+    python -m benchmarks.ttl_bench --queries queries.jsonl --fixed 30 60 300
+"""
+from bisect import bisect_left
+from datetime import datetime
+import argparse
+import random
+import sys
+import time
+
+from rail_uk.dtos import DepartureInfo
+
+DAY = datetime(2019, 3, 1)
+DEFAULT_FIXED_TTLS = (30, 60, 120, 300)
+DEFAULT_ROUTES = 200
+DEFAULT_QUERIES = 20000
+BOARD_ROWS = 3
+HEADWAYS = (5, 10, 15, 20, 30, 60)
+FIRST_SERVICE = 5 * 60
+LAST_SERVICE = 24 * 60
+# Shares of services that are late, delayed without an estimate and
+# cancelled, and of late services whose estimate slips again
+LATE = 0.2
+DELAYED = 0.03
+CANCELLED = 0.03
+SLIPS = 0.3
+
+
+class Service:
+
+    def __init__(self, std, events):
+        self.std = std
+        # (minute announced, status) in order, where a status is 'Delayed',
+        # 'Cancelled' or the minute of an estimate
+        self.events = events
+
+    def status_at(self, minute):
+        status = 'On time'
+        for announced_at, event in self.events:
+            if announced_at > minute:
+                break
+            status = event
+        return status
+
+    def etd_at(self, minute):
+        status = self.status_at(minute)
+        return status if isinstance(status, str) else _clock(status)
+
+    def departs_at(self, minute):
+        status = self.status_at(minute)
+        if status in ('On time', 'Cancelled'):
+            return self.std
+        if status == 'Delayed':
+            # Shown until an estimate is given
+            return self.std + 10
+        return status
+
+
+class Network:
+    """Live boards of every route, as they would have looked at any time of
+    the simulated days.
+    """
+
+    def __init__(self, seed=0):
+        self.seed = seed
+        self._services = {}
+
+    def services(self, origin, destination, day):
+        key = (origin, destination, day)
+        if key not in self._services:
+            self._services[key] = self._generate(random.Random('{}|{}|{}|{}'.format(self.seed, *key)))
+        return self._services[key]
+
+    def board(self, origin, destination, offset, at):
+        """The departures OpenLDBWS would list at `at` (epoch seconds) for a
+        user `offset` minutes from `origin`.
+        """
+        moment = datetime.fromtimestamp(at)
+        minute = moment.hour * 60 + moment.minute + moment.second / 60
+        services = self.services(origin, destination, moment.date())
+        earliest = minute + offset
+        departures = []
+        for service in services[bisect_left(services, (earliest - 120,)):]:
+            if service[0] > earliest + 120 or len(departures) == BOARD_ROWS:
+                break
+            if service[1].departs_at(minute) >= earliest:
+                departures.append(DepartureInfo(_clock(service[0]), service[1].etd_at(minute), 'Southern',
+                                                destination, False, True))
+        return departures or None
+
+    def departs_at(self, origin, destination, departure, at):
+        """When a listed `departure` actually leaves, as known at `at`."""
+        moment = datetime.fromtimestamp(at)
+        services = self.services(origin, destination, moment.date())
+        index = bisect_left(services, (int(departure.std[:2]) * 60 + int(departure.std[3:]),))
+        if index == len(services):
+            return None
+        return services[index][1].departs_at(moment.hour * 60 + moment.minute + moment.second / 60)
+
+    @staticmethod
+    def _generate(rng):
+        headway = rng.choice(HEADWAYS)
+        services = []
+        for std in range(FIRST_SERVICE + rng.randrange(headway), LAST_SERVICE, headway):
+            events = []
+            roll = rng.random()
+            if roll < LATE:
+                delay = rng.randint(1, 15)
+                announced = std - rng.uniform(5, 60)
+                events.append((announced, std + delay))
+                if rng.random() < SLIPS:
+                    events.append((rng.uniform(announced, std + delay), std + delay + rng.randint(1, 10)))
+            elif roll < LATE + DELAYED:
+                announced = std - rng.uniform(0, 20)
+                events.append((announced, 'Delayed'))
+                events.append((std + rng.uniform(0, 10), std + 10 + rng.randint(1, 20)))
+            elif roll < LATE + DELAYED + CANCELLED:
+                events.append((std - rng.uniform(0, 60), 'Cancelled'))
+            services.append((std, Service(std, events)))
+        return services
+
+
+def synthetic_queries(routes=DEFAULT_ROUTES, queries=DEFAULT_QUERIES, seed=0):
+    """A day of NextTrain queries, two thirds of them in the peaks, over
+    routes of Zipf-distributed popularity.
+    """
+    from rail_uk import query_log
+
+    rng = random.Random(seed)
+    route_list = [('O{:02d}'.format(index % 50), 'D{:03d}'.format(index), rng.choice((0, 0, 5, 10, 15)))
+                  for index in range(routes)]
+    weights = [1 / rank for rank in range(1, routes + 1)]
+    midnight = time.mktime(DAY.timetuple())
+    history = []
+    for _ in range(queries):
+        peak = rng.random()
+        if peak < 1 / 3:
+            minute = rng.gauss(8 * 60, 40)
+        elif peak < 2 / 3:
+            minute = rng.gauss(17 * 60 + 45, 45)
+        else:
+            minute = rng.uniform(6 * 60, 23 * 60)
+        origin, destination, offset = rng.choices(route_list, weights)[0]
+        history.append(query_log.Query(int(midnight + max(0, min(minute, 24 * 60 - 1)) * 60), 'NextTrain', origin,
+                                       destination, offset))
+    return sorted(history)
+
+
+def simulate(queries, network, policy, fixed_ttl=None):
+    """Answer every NextTrain query through a board cache using `policy`
+    ('adaptive', or 'fixed' for `fixed_ttl` seconds), returning its hit rate
+    and the share of answers that were stale or uncatchable.
+    """
+    from rail_uk import cache
+
+    now = [0.0]
+    board_cache = cache.TTLCache(len(queries) + 1, fixed_ttl or cache.BOARD_TTL, clock=lambda: now[0])
+    answered = hits = stale = uncatchable = 0
+    age = 0.0
+    for query in queries:
+        if query.intent != 'NextTrain':
+            continue
+        now[0] = query.at
+        moment = datetime.fromtimestamp(query.at)
+
+        def ttl(departures):
+            if policy == 'fixed':
+                return fixed_ttl
+            return cache.board_ttl(departures, query.offset, now=moment, policy=policy)
+
+        key = (query.origin, query.destination, query.offset)
+        departures, outcome = cache.fetch_through(
+            board_cache, key, lambda: network.board(query.origin, query.destination, query.offset, query.at),
+            ttl=ttl)
+        age += query.at - board_cache.get_entry(key).stored_at
+        hits += outcome == cache.HIT
+        answered += 1
+
+        truth = network.board(query.origin, query.destination, query.offset, query.at)
+        served = departures[0] if departures else None
+        if served != (truth[0] if truth else None):
+            stale += 1
+        if served is not None:
+            departs = network.departs_at(query.origin, query.destination, served, query.at)
+            if departs is not None and departs - query.offset < moment.hour * 60 + moment.minute + moment.second / 60:
+                uncatchable += 1
+
+    total = answered or 1
+    return {
+        'hit_rate': round(hits / total * 100, 1),
+        'upstream_calls': answered - hits,
+        'stale_pct': round(stale / total * 100, 2),
+        'uncatchable_pct': round(uncatchable / total * 100, 2),
+        'mean_age_s': round(age / total, 1)
+    }
+
+
+def run_benchmarks(queries, fixed_ttls=DEFAULT_FIXED_TTLS, seed=0):
+    network = Network(seed)
+    results = {'fixed {}s'.format(int(ttl)): simulate(queries, network, 'fixed', ttl) for ttl in fixed_ttls}
+    results['adaptive'] = simulate(queries, network, 'adaptive')
+    return results
+
+
+def print_report(results):
+    print('{:<14}{:>10}{:>16}{:>12}{:>18}{:>14}'.format('policy', 'hit_rate', 'upstream_calls', 'stale_pct',
+                                                        'uncatchable_pct', 'mean_age_s'))
+    for name, result in results.items():
+        print('{:<14}{hit_rate:>10}{upstream_calls:>16}{stale_pct:>12}{uncatchable_pct:>18}{mean_age_s:>14}'.format(
+            name, **result))
+
+
+def main(argv=None):
+    from rail_uk import query_log
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--queries', help='A query log to replay instead of a synthetic day')
+    parser.add_argument('--routes', type=int, default=DEFAULT_ROUTES)
+    parser.add_argument('--count', type=int, default=DEFAULT_QUERIES, help='Synthetic queries to generate')
+    parser.add_argument('--fixed', type=float, nargs='+', default=DEFAULT_FIXED_TTLS,
+                        help='Fixed TTLs, in seconds, to compare against')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.queries:
+        queries = sorted(query_log.read_file(args.queries))
+    else:
+        queries = synthetic_queries(args.routes, args.count, args.seed)
+    print_report(run_benchmarks(queries, args.fixed, args.seed))
+    return 0
+
+
+def _clock(minutes):
+    minutes = int(minutes) % (24 * 60)
+    return '{:02d}:{:02d}'.format(minutes // 60, minutes % 60)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
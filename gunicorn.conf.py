@@ -0,0 +1,16 @@
+"""gunicorn settings for the self-hosted endpoint, which gunicorn reads from
+the working directory (or pass `-c gunicorn.conf.py`):
+
+    gunicorn server_entry:application --workers 2 --threads 8
+
+Each worker is prepared and finished as `python server_entry.py` would.
+"""
+from rail_uk import server
+
+
+def post_fork(_, worker):
+    server.start_worker(worker.cfg.threads)
+
+
+def worker_exit(*_):
+    server.stop_worker()
@@ -0,0 +1,128 @@
+"""Time windows and row counts of departure board requests.
+
+OpenLDBWS returns every service in a board's time window, up to its row
+count, and a two-hour window at a busy station is a large response to parse
+for the one or two services a user is told about. With
+BOARD_WINDOW_POLICY='adaptive', boards are first asked for with a window
+covering BOARD_WINDOW_HEADWAYS of the route's expected gaps between
+services, and only as many rows as are read. The window is doubled, up to
+OpenLDBWS' limit of two hours, only while the board comes back empty.
+
+A route's expected gap comes from the offline timetable where it covers the
+route, or else from the next departure boards it has had so far. Fastest
+departure boards only use it, as their single service says nothing of the
+gaps between services. 'fixed' always asks for two hours and ten rows, as
+before.
+"""
+from datetime import datetime, timedelta
+from os import environ
+import math
+import threading
+
+from rail_uk import timetable
+
+ADAPTIVE = 'adaptive'
+FIXED = 'fixed'
+
+POLICY = environ.get('BOARD_WINDOW_POLICY', ADAPTIVE)
+MIN_WINDOW = int(environ.get('BOARD_MIN_WINDOW', 15))
+HEADWAYS = float(environ.get('BOARD_WINDOW_HEADWAYS', 2))
+# OpenLDBWS' largest time window, and the window and rows asked for by 'fixed'
+MAX_WINDOW = 120
+FIXED_ROWS = 10
+# The first window for a route nothing is known about yet
+UNKNOWN_WINDOW = 30
+# Rows read from each board (see parse_departures_soap_response). Fastest
+# departure boards hold a single service, so have no row count.
+ROWS = {'next': 3, 'fastest': None}
+# A faster service may leave after several slower ones, so fastest departure
+# boards cover more gaps between services
+FASTEST_HEADWAYS_FACTOR = 2
+# Weight of each new board in a route's average gap, and the routes
+# remembered before starting again
+SMOOTHING = 0.3
+MAX_ROUTES = 10000
+
+_headways = {}
+_headways_lock = threading.Lock()
+
+
+def plan(board, params, now=None):
+    """Return the (time window, rows) to ask for in turn, until a board has
+    departures.
+    """
+    rows = ROWS[board]
+    if POLICY == FIXED:
+        return [(MAX_WINDOW, rows and FIXED_ROWS)]
+
+    windows = []
+    window = first_window(board, params, now)
+    while window < MAX_WINDOW:
+        windows.append((window, rows))
+        window *= 2
+    windows.append((MAX_WINDOW, rows))
+    return windows
+
+
+def first_window(board, params, now=None):
+    headway = expected_headway(params, now)
+    if headway is None:
+        return UNKNOWN_WINDOW
+    covered = HEADWAYS * (FASTEST_HEADWAYS_FACTOR if board == 'fastest' else 1)
+    return min(MAX_WINDOW, max(MIN_WINDOW, int(math.ceil(headway * covered))))
+
+
+def expected_headway(params, now=None):
+    """Expected minutes between services from the origin calling at the
+    destination, from now plus the offset, or None if unknown.
+    """
+    scheduled = scheduled_headway(params, now)
+    if scheduled is not None:
+        return scheduled
+    return _headways.get((params.origin.crs, params.destination.crs))
+
+
+def scheduled_headway(params, now=None):
+    if not timetable.is_configured():
+        return None
+    engine = timetable.get_timetable()
+    if params.destination.crs not in engine.reachable_from(params.origin.crs):
+        return None
+    leaving = (now or datetime.now()) + timedelta(minutes=params.offset)
+    after = leaving.hour * 60 + leaving.minute
+    before = min(after + MAX_WINDOW - 1, timetable.MINUTES_PER_DAY - 1)
+    count = sum(1 for _ in engine.departures_from(params.origin.crs, leaving.date(), params.destination.crs,
+                                                  after, before))
+    return MAX_WINDOW / max(count, 1)
+
+
+def record(params, departures, window):
+    """Learn the route's gap between services from a board of `departures`
+    (None if empty) asked for over `window` minutes.
+    """
+    departures = departures or []
+    if len(departures) > 1:
+        times = [_minutes(departure.std) for departure in departures]
+        span = sum((later - earlier) % (24 * 60) for earlier, later in zip(times, times[1:]))
+        headway = max(1.0, span / (len(departures) - 1))
+    else:
+        # At most one service in the window
+        headway = float(window)
+
+    key = (params.origin.crs, params.destination.crs)
+    with _headways_lock:
+        if key not in _headways and len(_headways) >= MAX_ROUTES:
+            _headways.clear()
+        previous = _headways.get(key)
+        _headways[key] = headway if previous is None else previous + SMOOTHING * (headway - previous)
+
+
+def reset():
+    """Forget every route's gap between services, e.g. between tests."""
+    with _headways_lock:
+        _headways.clear()
+
+
+def _minutes(clock):
+    hours, minutes = clock.split(':')
+    return int(hours) * 60 + int(minutes)
@@ -0,0 +1,340 @@
+"""In-process caches of parsed upstream responses.
+
+Caches live for as long as the container (or server worker) does and are
+shared by all of its threads. Entries are evicted least recently used first
+once a cache is full.
+
+`fetch_through` serves an entry while it is fresh. For a while after it
+expires (the cache's stale window) it is still served straight away while a
+refresh is made, and up to its stale-if-error age it is served in place of
+an upstream failure. Departure boards are cached for as long as their
+departures are likely to stay as they are (see `board_ttl`). Refreshes are
+made on a background thread in a self-hosted server. Lambda freezes a
+container as soon as it has responded, so there they are started once the
+next invocation has built its response, a few at a time.
+"""
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from os import environ
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds a parsed departure board is fresh for, then served while being
+# refreshed for, and served for in place of an upstream failure
+BOARD_TTL = float(environ.get('BOARD_CACHE_TTL', 60))
+BOARD_STALE_WINDOW = float(environ.get('BOARD_STALE_WINDOW', 60))
+BOARD_STALE_IF_ERROR = float(environ.get('BOARD_STALE_IF_ERROR', 600))
+BOARD_CACHE_SIZE = int(environ.get('BOARD_CACHE_SIZE', 1000))
+# 'adaptive' caches each board for a share of the time until the user has to
+# set off for its first departure, within these bounds, or 'fixed' for
+# BOARD_CACHE_TTL. Empty boards are always cached for BOARD_CACHE_TTL.
+BOARD_TTL_POLICY = environ.get('BOARD_CACHE_TTL_POLICY', 'adaptive')
+BOARD_MIN_TTL = float(environ.get('BOARD_CACHE_MIN_TTL', 15))
+BOARD_MAX_TTL = float(environ.get('BOARD_CACHE_MAX_TTL', 300))
+SLACK_SHARE = 0.25
+# Shortens the TTL while a departure's estimate is likely to change: a late
+# estimate tends to slip further, and 'Delayed' has no estimate at all yet
+ON_TIME_SHARE = 1.0
+ESTIMATE_SHARE = 0.5
+CANCELLED_SHARE = 0.5
+DELAYED_SHARE = 0.25
+# Timetables only change day to day, and are keyed by date
+TIMETABLE_TTL = float(environ.get('TIMETABLE_CACHE_TTL', 3600))
+TIMETABLE_STALE_IF_ERROR = float(environ.get('TIMETABLE_STALE_IF_ERROR', 24 * 60 * 60))
+TIMETABLE_CACHE_SIZE = int(environ.get('TIMETABLE_CACHE_SIZE', 500))
+
+# 'background' in a long-running server, 'deferred' (to the next invocation)
+# in Lambda
+BACKGROUND = 'background'
+DEFERRED = 'deferred'
+REVALIDATE_THREADS = 2
+# Deferred refreshes started after each invocation, and the seconds it waits
+# for them before returning its response. The rest carry on when the
+# container is next thawed.
+DEFERRED_MAX_KEYS = int(environ.get('CACHE_DEFERRED_MAX_KEYS', 4))
+DEFERRED_WAIT = float(environ.get('CACHE_DEFERRED_WAIT', 0.05))
+
+# Returned by TTLCache.get on a miss, as None is a valid (empty) board
+MISSING = object()
+
+# fetch_through outcomes
+HIT = 'hit'
+MISS = 'miss'
+REFRESH = 'refresh'
+STALE = 'stale'
+STALE_ON_ERROR = 'stale-on-error'
+
+Entry = namedtuple('Entry', 'value, stored_at, expires_at')
+# What a fetch may return in place of a value: the most seconds it may be
+# cached for, and whether it was already stale where it came from
+Fetched = namedtuple('Fetched', 'value, max_ttl, stale')
+
+_board_cache = None
+_timetable_cache = None
+_revalidate_mode = environ.get('CACHE_REVALIDATE', DEFERRED)
+_revalidating = {}
+# Keys of the deferred refreshes already started
+_deferred_started = set()
+_revalidate_lock = threading.Lock()
+_revalidate_executor = None
+
+
+class TTLCache:
+
+    def __init__(self, max_size, ttl, stale_window=0, stale_if_error=0, clock=time.time):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_window = stale_window
+        self.stale_if_error = stale_if_error
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the value cached for `key`, or MISSING if there is no fresh
+        one.
+        """
+        entry = self.get_entry(key)
+        with self._lock:
+            if entry is None or entry.expires_at <= self.clock():
+                self.misses += 1
+                return MISSING
+            self.hits += 1
+            return entry.value
+
+    def get_entry(self, key):
+        """Return the Entry for `key`, fresh or not, while it may still be
+        served.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self.clock() >= self._retained_until(entry):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, value, ttl=None):
+        with self._lock:
+            now = self.clock()
+            self._entries[key] = Entry(value, now, now + (self.ttl if ttl is None else ttl))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def _retained_until(self, entry):
+        return max(entry.expires_at + self.stale_window, entry.stored_at + self.stale_if_error)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def fetch_through(cache, key, fetch, stale_errors=(), refresh=False, ttl=None, prefer_cached=False):
+    """Return (value, outcome) for `key`, calling `fetch` for the value when
+    the cache can't serve it. With `refresh`, the cache is only written.
+    `ttl`, if given, is called with each fetched value for the seconds to
+    cache it for, instead of the cache's own TTL. `fetch` may return a
+    Fetched to cache the value for no longer than a cache behind this one
+    holds it, and to report it stale. With `prefer_cached` (or if it is a
+    function, when it returns True), any entry still retained is served
+    rather than fetching, e.g. to spare an upstream's quota. A function is
+    only called once an entry has expired, since it may be costly.
+    """
+    entry = None if refresh else cache.get_entry(key)
+    now = cache.clock()
+    if entry is not None:
+        if now < entry.expires_at:
+            return entry.value, HIT
+        if prefer_cached() if callable(prefer_cached) else prefer_cached:
+            return entry.value, STALE
+        if now < entry.expires_at + cache.stale_window:
+            revalidate(cache, key, fetch, ttl)
+            return entry.value, STALE
+
+    try:
+        value = fetch()
+    except stale_errors:
+        if entry is None or now - entry.stored_at > cache.stale_if_error:
+            raise
+        logger.warning('Upstream failed, serving a response {:.0f}s old'.format(now - entry.stored_at),
+                       exc_info=True)
+        return entry.value, STALE_ON_ERROR
+
+    max_ttl, stale = None, False
+    if isinstance(value, Fetched):
+        value, max_ttl, stale = value
+    seconds = None if ttl is None else ttl(value)
+    if max_ttl is not None:
+        seconds = max(0, min(cache.ttl if seconds is None else seconds, max_ttl))
+    cache.put(key, value, ttl=seconds)
+    if stale:
+        return value, STALE
+    return value, REFRESH if refresh else MISS
+
+
+# ----------------------------- Revalidation -----------------------------
+
+def set_revalidate_mode(mode):
+    global _revalidate_mode
+    _revalidate_mode = mode
+
+
+def revalidate(cache, key, fetch, ttl=None):
+    """Refresh `key` in `cache` with `fetch`, once however many times the
+    stale entry is served in the meantime.
+    """
+    with _revalidate_lock:
+        if (id(cache), key) in _revalidating:
+            return
+        _revalidating[(id(cache), key)] = (cache, key, fetch, ttl)
+    if _revalidate_mode == BACKGROUND:
+        _get_executor().submit(_refresh, cache, key, fetch, ttl)
+
+
+def run_deferred(max_keys=DEFERRED_MAX_KEYS, wait=DEFERRED_WAIT):
+    """Start up to `max_keys` of the refreshes left by earlier invocations
+    on background threads, waiting up to `wait` seconds (or None for as long
+    as they take) for them to finish. Return how many were started.
+    """
+    from concurrent.futures import wait as wait_for
+
+    if _revalidate_mode == BACKGROUND:
+        return 0
+    with _revalidate_lock:
+        pending = [(pending_key, refresh) for pending_key, refresh in _revalidating.items()
+                   if pending_key not in _deferred_started][:max_keys]
+        _deferred_started.update(pending_key for pending_key, _ in pending)
+    futures = [_get_executor().submit(_refresh, *refresh) for _, refresh in pending]
+    if futures and (wait is None or wait > 0):
+        wait_for(futures, timeout=wait)
+    return len(futures)
+
+
+def _refresh(cache, key, fetch, ttl):
+    from rail_uk import quota
+
+    try:
+        with quota.priority(quota.BACKGROUND):
+            fetch_through(cache, key, fetch, refresh=True, ttl=ttl)
+    except Exception:
+        logger.warning('Could not refresh a stale cache entry', exc_info=True)
+    finally:
+        with _revalidate_lock:
+            _revalidating.pop((id(cache), key), None)
+            _deferred_started.discard((id(cache), key))
+
+
+def _get_executor():
+    global _revalidate_executor
+    if _revalidate_executor is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _revalidate_executor = ThreadPoolExecutor(max_workers=REVALIDATE_THREADS, thread_name_prefix='revalidate')
+    return _revalidate_executor
+
+
+# ----------------------------- Board TTLs -----------------------------
+
+def board_ttl(departures, offset, now=None, policy=None):
+    """Return the seconds to cache a board of `departures` for, for a user
+    `offset` minutes from the station, as of `now` (a local datetime).
+    """
+    if (policy or BOARD_TTL_POLICY) != 'adaptive' or not departures:
+        return BOARD_TTL
+    now = datetime.now() if now is None else now
+    return min(departure_ttl(departure, offset, now) for departure in departures)
+
+
+def departure_ttl(departure, offset, now):
+    until = _minutes_until(departure, now)
+    if until is None:
+        return BOARD_MIN_TTL
+
+    # Minutes before the user has to set off
+    slack = until - offset
+    if slack <= 0:
+        return BOARD_MIN_TTL
+
+    if departure.etd == 'On time':
+        share = ON_TIME_SHARE
+    elif _parse_clock(departure.etd) is not None:
+        share = ESTIMATE_SHARE
+    elif departure.etd == 'Cancelled':
+        share = CANCELLED_SHARE
+    else:
+        share = DELAYED_SHARE
+    return max(BOARD_MIN_TTL, min(BOARD_MAX_TTL, slack * 60 * SLACK_SHARE * share))
+
+
+def upcoming(departures, now=None):
+    """Return the departures on a board that haven't left as of `now`. A
+    delayed service without an estimate may still leave, so is kept.
+    """
+    now = datetime.now() if now is None else now
+    return [departure for departure in departures or []
+            if departure.etd == 'Delayed' or (_minutes_until(departure, now) or 0) >= 0]
+
+
+def _minutes_until(departure, now):
+    """Minutes from `now` until a departure leaves, across midnight either
+    way, or None if its times can't be read.
+    """
+    estimate = _parse_clock(departure.etd)
+    departs = _parse_clock(departure.std) if estimate is None else estimate
+    if departs is None:
+        return None
+    until = (departs - (now.hour * 60 + now.minute + now.second / 60)) % (24 * 60)
+    return until - 24 * 60 if until > 12 * 60 else until
+
+
+def _parse_clock(value):
+    """Minutes from midnight of an 'HH:MM' time, or None for anything else."""
+    if not isinstance(value, str) or len(value) != 5 or value[2] != ':':
+        return None
+    try:
+        return int(value[:2]) * 60 + int(value[3:])
+    except ValueError:
+        return None
+
+
+# ----------------------------- Caches -----------------------------
+
+def board_key(board, params):
+    return board, params.origin.crs, params.destination.crs, params.offset
+
+
+def get_board_cache():
+    global _board_cache
+    if _board_cache is None:
+        _board_cache = TTLCache(BOARD_CACHE_SIZE, BOARD_TTL, BOARD_STALE_WINDOW, BOARD_STALE_IF_ERROR)
+    return _board_cache
+
+
+def get_timetable_cache():
+    global _timetable_cache
+    if _timetable_cache is None:
+        _timetable_cache = TTLCache(TIMETABLE_CACHE_SIZE, TIMETABLE_TTL, TIMETABLE_TTL, TIMETABLE_STALE_IF_ERROR)
+    return _timetable_cache
+
+
+def clear():
+    """Empty every cache, and forget any pending refreshes, e.g. between
+    tests.
+    """
+    for cache in (_board_cache, _timetable_cache):
+        if cache is not None:
+            cache.clear()
+    with _revalidate_lock:
+        _revalidating.clear()
+        _deferred_started.clear()
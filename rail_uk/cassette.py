@@ -0,0 +1,244 @@
+"""Record and replay upstream traffic.
+
+While recording, every OpenLDBWS, TransportAPI and DynamoDB interaction (and
+the Alexa event that caused it) is written to a cassette: a single sqlite
+file indexed by request, holding zlib-compressed, redacted bodies and the
+time each call took. Replaying serves those responses back, optionally with
+their original timings, so production behaviour can be reproduced offline.
+
+Cassettes are enabled with CASSETTE_RECORD=<file> or CASSETTE_REPLAY=<file>,
+or with the `recording` and `replaying` context managers.
+"""
+from contextlib import contextmanager
+from os import environ
+import logging
+import threading
+import time
+
+from rail_uk import payload_capture
+
+logger = logging.getLogger(__name__)
+
+RECORD = 'record'
+REPLAY = 'replay'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS interactions (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    request_key TEXT NOT NULL,
+    recorded_at REAL NOT NULL,
+    elapsed REAL NOT NULL,
+    status INTEGER,
+    reason TEXT,
+    body_type TEXT NOT NULL,
+    body BLOB
+);
+CREATE INDEX IF NOT EXISTS interactions_by_request ON interactions (kind, request_key, id);
+'''
+
+_active = None
+
+
+class CassetteMiss(LookupError):
+    """Raised when replaying a request that the cassette never recorded."""
+    pass
+
+
+class CassetteResponse:
+    """Replayed stand-in for a requests.Response."""
+
+    def __init__(self, status_code, reason, content):
+        self.status_code = status_code
+        self.reason = reason
+        self.content = content
+        self.ok = status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        import json
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+
+class Cassette:
+
+    def __init__(self, path, mode=REPLAY, timing=True):
+        import sqlite3
+
+        self.path = path
+        self.mode = mode
+        self.timing = timing
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(SCHEMA)
+        # Replays of a request step through its recordings in order, then
+        # keep serving the last one
+        self._replay_positions = {}
+
+    def handle(self, kind, request, perform):
+        key = _make_key(request)
+        if self.mode == REPLAY:
+            return self._replay(kind, key)
+
+        start = time.perf_counter()
+        result = perform()
+        if not isinstance(result, (dict, list)):
+            # A streamed response has only its headers so far
+            result.content
+        self.save(kind, key, result, time.perf_counter() - start)
+        return result
+
+    def save(self, kind, key, result, elapsed):
+        import json
+        import zlib
+
+        if isinstance(result, (dict, list)):
+            body_type, status, reason = 'json', None, None
+            content = json.dumps(result, default=_json_default).encode('utf-8')
+        else:
+            body_type, status, reason = 'http', result.status_code, result.reason
+            content = result.content if isinstance(result.content, bytes) else result.content.encode('utf-8')
+
+        content = payload_capture.redact(content.decode('utf-8', errors='replace')).encode('utf-8')
+        with self._lock:
+            self._connection.execute(
+                'INSERT INTO interactions (kind, request_key, recorded_at, elapsed, status, reason, body_type, body) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (kind, key, time.time(), elapsed, status, reason, body_type, zlib.compress(content, 9)))
+            self._connection.commit()
+
+    def _replay(self, kind, key):
+        query = ('SELECT elapsed, status, reason, body_type, body FROM interactions '
+                 'WHERE kind = ? AND request_key = ? ORDER BY id {} LIMIT 1 OFFSET ?')
+        with self._lock:
+            position = self._replay_positions.get((kind, key), 0)
+            row = self._connection.execute(query.format('ASC'), (kind, key, position)).fetchone()
+            if row is not None:
+                self._replay_positions[(kind, key)] = position + 1
+            elif position:
+                row = self._connection.execute(query.format('DESC'), (kind, key, 0)).fetchone()
+        if row is None:
+            raise CassetteMiss('No {} interaction recorded for {}'.format(kind, key))
+
+        elapsed, status, reason, body_type, body = row
+        if self.timing:
+            time.sleep(elapsed)
+        return _decode(body_type, status, reason, body)
+
+    def interactions(self, kind=None):
+        """Yield (kind, request, response) for every recorded interaction."""
+        import json
+
+        query = 'SELECT kind, request_key, status, reason, body_type, body FROM interactions'
+        args = ()
+        if kind is not None:
+            query += ' WHERE kind = ?'
+            args = (kind,)
+        with self._lock:
+            rows = self._connection.execute(query + ' ORDER BY id', args).fetchall()
+        for row_kind, key, status, reason, body_type, body in rows:
+            yield row_kind, json.loads(key), _decode(body_type, status, reason, body)
+
+    def events(self):
+        """Return the recorded Alexa events, in the order they arrived."""
+        return [response for _, _, response in self.interactions('event')]
+
+    def close(self):
+        self._connection.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM interactions').fetchone()[0]
+
+
+# ----------------------------- Hooks -----------------------------
+
+def intercept(kind, request, perform):
+    """Perform an upstream call through the active cassette, if any.
+    `request` identifies the call (minus any credentials) and `perform` makes
+    it for real.
+    """
+    cassette = _active
+    if cassette is None:
+        return perform()
+    return cassette.handle(kind, request, perform)
+
+
+def record_event(event):
+    cassette = _active
+    if cassette is not None and cassette.mode == RECORD:
+        cassette.save('event', _make_key({'requestId': event.get('request', {}).get('requestId')}), event, 0)
+
+
+def activate(cassette):
+    global _active
+    _active = cassette
+
+
+def deactivate():
+    global _active
+    if _active is not None:
+        _active.close()
+    _active = None
+
+
+def activate_from_environment():
+    if environ.get('CASSETTE_RECORD'):
+        activate(Cassette(environ['CASSETTE_RECORD'], RECORD))
+    elif environ.get('CASSETTE_REPLAY'):
+        timing = environ.get('CASSETTE_TIMING', 'true').lower() == 'true'
+        activate(Cassette(environ['CASSETTE_REPLAY'], REPLAY, timing))
+    if _active is not None:
+        logger.warning('Cassette {} active: {}'.format(_active.mode, _active.path))
+
+
+@contextmanager
+def recording(path):
+    activate(Cassette(path, RECORD))
+    try:
+        yield _active
+    finally:
+        deactivate()
+
+
+@contextmanager
+def replaying(path, timing=True):
+    activate(Cassette(path, REPLAY, timing))
+    try:
+        yield _active
+    finally:
+        deactivate()
+
+
+def _make_key(request):
+    import json
+    return json.dumps(request, sort_keys=True, default=_json_default)
+
+
+def _json_default(value):
+    from decimal import Decimal
+
+    # boto3 returns DynamoDB numbers as Decimals
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError('{} is not JSON serialisable'.format(type(value).__name__))
+
+
+def _decode(body_type, status, reason, body):
+    import json
+    import zlib
+
+    content = zlib.decompress(body)
+    if body_type == 'json':
+        return json.loads(content.decode('utf-8'))
+    return CassetteResponse(status, reason, content)
@@ -1,29 +1,62 @@
 import logging
 from os import environ
-
-import requests
-import jinja2
-import xmltodict
 from datetime import date, datetime, timedelta
-from xml.dom import minidom
+from itertools import chain, islice
 
-from rail_uk.exceptions import ApplicationError, OpenLDBWSError, TransportAPIError
+from rail_uk.exceptions import ApplicationError, OpenLDBWSError, QuotaExceededError, TransportAPIError
 from rail_uk.dtos import DepartureInfo
+from rail_uk import board_window, cache, cassette, journey, json_stream, l2_cache, live_state, payload_capture, \
+    quota, timetable, timetable_providers, tracing
 
 logger = logging.getLogger(__name__)
 
+OPEN_LDBWS_URL = environ.get('OPEN_LDBWS_URL', 'https://lite.realtime.nationalrail.co.uk/OpenLDBWS/ldb9.asmx')
+TRANSPORT_API_URL = environ.get('TRANSPORT_API_URL', 'https://transportapi.com')
+TEMPLATE_DIR = 'res/templates/'
+# Seconds to wait for an upstream to connect, or between bytes of its response
+UPSTREAM_TIMEOUT = float(environ.get('UPSTREAM_TIMEOUT', 5))
+# Only these fields of each TransportAPI departure are kept
+TIMETABLE_FIELDS = ('aimed_departure_time', 'operator_name', 'destination_name')
+# Both upstreams compress their responses when asked, which are then
+# decompressed in chunks of this size straight into the parsers
+ACCEPT_ENCODING = 'gzip, deflate'
+UPSTREAM_CHUNK_BYTES = 16 * 1024
+# A streamed body up to this size is kept as it is parsed, so that a SOAP
+# fault (which is far smaller than a board) can be parsed again as one
+SOAP_FAULT_BYTES = 16 * 1024
+# Connections kept open to each upstream. Lambda only ever needs one, but a
+# self-hosted server (see rail_uk/server.py) needs one per request thread.
+HTTP_POOL_SIZE = int(environ.get('HTTP_POOL_SIZE', 10))
+# LastTrain's timetable lookup asks for departures from this time
+LAST_TRAIN_FROM = '21:59'
+# From this time, LastTrain starts fetching the route's evening board while
+# it looks up the last train, rather than after, unless the timetable is
+# already cached. The board runs from EVENING_BOARD_OFFSET minutes from now,
+# for EVENING_BOARD_WINDOW minutes, and holds every service in that time
+# (OpenLDBWS' limit is 150).
+SPECULATE_FROM = environ.get('LAST_TRAIN_SPECULATE_FROM', '21:00')
+EVENING_BOARD_OFFSET = -10
+EVENING_BOARD_WINDOW = 120
+EVENING_BOARD_ROWS = 150
+SPECULATION_THREADS = 2
+
+# Shared for the lifetime of the container, so that warm invocations reuse
+# compiled templates and pooled (already TLS-negotiated) connections.
+_http_session = None
+_template_env = None
+_speculation_executor = None
 
-def get_next_departures(params, num_departures=1):
-    request_vars = {
-        'access_token': environ['OPEN_LDBWS_ACCESS_TOKEN'],
-        'origin': params.origin.crs,
-        'destination': params.destination.crs,
-        'time_offset': params.offset,
-        'time_window': 120
-    }
-    response = make_soap_request(request_vars, 'departure_board.xml')
 
-    departures = parse_departures_soap_response(response, 'next')
+def get_next_departures(params, num_departures=1):
+    departures = get_live_departures(params, limit=3)
+    if departures is None:
+        try:
+            departures = get_departure_board(params)
+        except QuotaExceededError:
+            if not timetable.is_configured():
+                raise
+            logger.warning('OpenLDBWS quota reached, answering from the timetable')
+            departures = get_next_departures_offline(params, limit=3)
 
     if departures is None:
         return None
@@ -36,69 +69,238 @@ def get_next_departures(params, num_departures=1):
 
 
 def get_fastest_departure(params):
-    request_vars = {
-        'access_token': environ['OPEN_LDBWS_ACCESS_TOKEN'],
-        'origin': params.origin.crs,
-        'destination': params.destination.crs,
-        'time_offset': params.offset,
-        'time_window': 120
-    }
-    response = make_soap_request(request_vars, 'fastest_departure.xml')
+    if live_state.is_available() and live_state.get_live_state().covers(params.origin.crs):
+        departure = live_state.get_live_state().fastest_departure(params.origin.crs, params.destination.crs,
+                                                                  _minutes_from_now(params.offset))
+        if departure is not None:
+            return departure
 
-    return parse_fastest_departure_soap_response(response)
+    departure = get_fastest_board(params)
+    if departure is None and timetable.is_configured():
+        # GetFastestDepartures only considers direct services
+        logger.info('No direct service, planning a journey with changes')
+        return get_fastest_journey_offline(params)
+    return departure
 
 
 def get_last_departure(params):
+    # A cached timetable is looked up at once, so there's nothing to overlap
+    # the evening board with, and the board is only fetched if it's wanted
+    evening_board = None if is_timetable_cached(params, LAST_TRAIN_FROM) else speculate_evening_board(params)
     last_departure = get_last_departure_from_timetable(params)
     now = datetime.now()
     now_string = now.strftime('%H:%M')
     if last_departure.std < now_string:
         logger.debug('Last departure is in the past')
+        if evening_board is not None:
+            evening_board.cancel()
         return DepartureInfo(last_departure.std,
                              last_departure.etd,
                              last_departure.operator,
                              last_departure.final_dest,
                              in_past=True,
-                             live=False)
+                             live=False,
+                             stale=last_departure.stale)
     else:
-        live_etd = get_last_departure_live_time(last_departure, params)
+        live_etd = get_last_departure_live_time(last_departure, params, evening_board)
         if live_etd is not None:
             return DepartureInfo(last_departure.std,
                                  live_etd,
                                  last_departure.operator,
                                  last_departure.final_dest,
                                  in_past=False,
-                                 live=True)
+                                 live=True,
+                                 stale=last_departure.stale)
 
     return last_departure
 
 
+def get_departure_board(params, refresh=False):
+    """Return the next few departures for `params` from the board cache, or
+    from OpenLDBWS if there is no fresh board (or `refresh` is set), caching
+    the result. OpenLDBWS is asked for as small a window as is likely to hold
+    a departure (see rail_uk/board_window.py), and a wider one if it doesn't.
+    A stale board may be returned while it is refreshed, or if OpenLDBWS
+    fails, with each departure marked as stale.
+    """
+    def fetch():
+        departures = None
+        for window, rows in board_window.plan('next', params):
+            request_vars = {
+                'access_token': environ['OPEN_LDBWS_ACCESS_TOKEN'],
+                'origin': params.origin.crs,
+                'destination': params.destination.crs,
+                'time_offset': params.offset,
+                'time_window': window,
+                'num_rows': rows
+            }
+            response = make_soap_request(request_vars, 'departure_board.xml')
+            departures = parse_departures_soap_response(response, 'next')
+            board_window.record(params, departures, window)
+            if departures is not None:
+                break
+        tracing.annotate(board_window=window)
+        return departures
+
+    return _fetch_board('next', params, fetch, refresh)
+
+
+def get_fastest_board(params, refresh=False):
+    """Return the fastest direct departure for `params` through the board
+    caches, as get_departure_board does for the next.
+    """
+    def fetch():
+        departure = None
+        for window, _ in board_window.plan('fastest', params):
+            request_vars = {
+                'access_token': environ['OPEN_LDBWS_ACCESS_TOKEN'],
+                'origin': params.origin.crs,
+                'destination': params.destination.crs,
+                'time_offset': params.offset,
+                'time_window': window
+            }
+            response = make_soap_request(request_vars, 'fastest_departure.xml')
+            departure = parse_fastest_departure_soap_response(response)
+            if departure is not None:
+                break
+        tracing.annotate(board_window=window)
+        return None if departure is None else [departure]
+
+    departures = _fetch_board('fastest', params, fetch, refresh)
+    return None if departures is None else departures[0]
+
+
+def _fetch_board(board, params, fetch, refresh, ttl=None):
+    """Fetch a board through the in-process cache, then the shared L2 cache
+    behind it, caching it for as long as its departures are likely to hold
+    (or for `ttl(departures)` seconds, if given).
+    """
+    if ttl is None:
+        def ttl(departures):
+            return cache.board_ttl(departures, params.offset)
+
+    key = cache.board_key(board, params)
+
+    def fetch_shared():
+        # Held locally no longer than the shared cache holds it, and stale if
+        # it was served expired there
+        departures, expires_in = l2_cache.fetch(l2_cache.make_key(key), fetch, ttl)
+        if expires_in is None:
+            return departures
+        return cache.Fetched(departures, expires_in, expires_in <= 0)
+
+    departures, outcome = cache.fetch_through(
+        cache.get_board_cache(), key, fetch_shared,
+        stale_errors=(OpenLDBWSError, QuotaExceededError), refresh=refresh, ttl=ttl,
+        prefer_cached=lambda: quota.is_constrained(quota.OPEN_LDBWS))
+    tracing.annotate(cache=outcome)
+    if departures is not None and outcome in (cache.STALE, cache.STALE_ON_ERROR):
+        return [departure._replace(stale=True) for departure in departures]
+    return departures
+
+
+def get_evening_board(params, refresh=False):
+    """Return every departure on the route around now through the board
+    caches, which are keyed by origin and destination alone, so that the
+    last train can be matched against it locally however far the user is
+    from the station.
+    """
+    def fetch():
+        request_vars = {
+            'access_token': environ['OPEN_LDBWS_ACCESS_TOKEN'],
+            'origin': params.origin.crs,
+            'destination': params.destination.crs,
+            'time_offset': EVENING_BOARD_OFFSET,
+            'time_window': EVENING_BOARD_WINDOW,
+            'num_rows': EVENING_BOARD_ROWS
+        }
+        response = make_soap_request(request_vars, 'departure_board.xml')
+        return parse_departures_soap_response(response, 'evening')
+
+    def ttl(departures):
+        # The board starts before now, so ignore the services already gone
+        return cache.board_ttl(cache.upcoming(departures), 0)
+
+    return _fetch_board('evening', params._replace(offset=0), fetch, refresh, ttl)
+
+
+def speculate_evening_board(params):
+    """Start fetching the route's evening board on another thread, from
+    LAST_TRAIN_SPECULATE_FROM, so that it arrives while the last train is
+    looked up. Return its future, or None if it isn't likely to be wanted.
+    """
+    if datetime.now().strftime('%H:%M') < SPECULATE_FROM:
+        return None
+    if live_state.is_available() and live_state.get_live_state().covers(params.origin.crs):
+        return None
+    if quota.is_constrained(quota.OPEN_LDBWS):
+        return None
+
+    level = quota.current_priority()
+    trace = tracing.current_trace()
+
+    def fetch():
+        with quota.priority(level), tracing.continue_trace(trace):
+            return get_evening_board(params)
+
+    return _get_speculation_executor().submit(fetch)
+
+
+def get_live_departures(params, limit):
+    """Return departures from the local live state, or None if OpenLDBWS
+    should be asked instead.
+    """
+    if not live_state.is_available() or not live_state.get_live_state().covers(params.origin.crs):
+        return None
+    departures = live_state.get_live_state().departures(params.origin.crs, params.destination.crs,
+                                                        _minutes_from_now(params.offset), limit=limit)
+    return departures or None
+
+
 # ----------------------------- Request Helpers -----------------------------
 
+@tracing.traced()
 def make_soap_request(params, template_file):
-    template_loader = jinja2.FileSystemLoader(searchpath="res/templates/")
-    template_env = jinja2.Environment(loader=template_loader)
-    template = template_env.get_template(template_file)
+    template = get_template(template_file)
 
     body = template.render(req_vars=params)
-    url = "https://lite.realtime.nationalrail.co.uk/OpenLDBWS/ldb9.asmx"
-    headers = {'content-type': 'text/xml'}
+    url = OPEN_LDBWS_URL
+    headers = {'content-type': 'text/xml', 'accept-encoding': ACCEPT_ENCODING}
 
-    logger.debug('OpenLDBWS request: {} \nBody: {}'.format(url, body))
-    response = requests.post(url, data=body, headers=headers)
+    payload_capture.log_payload(logger, 'OpenLDBWS request: ' + url, body)
 
-    debug_str = minidom.parseString(response.content).toprettyxml()
-    logger.debug('OpenLDBWS response: \n' + debug_str)
+    def post():
+        # Only requests that reach OpenLDBWS use its quota, not replayed ones
+        quota.acquire(quota.OPEN_LDBWS)
+        return get_http_session().post(url, data=body, headers=headers, timeout=UPSTREAM_TIMEOUT, stream=True)
+
+    # Identifies the request for record/replay, without the access token
+    request_key = dict(params, template=template_file)
+    request_key.pop('access_token', None)
+    try:
+        response = cassette.intercept('openldbws', request_key, post)
+    except IOError as err:
+        # requests' connection errors and timeouts are all IOErrors
+        logger.error('OpenLDBWS could not be reached')
+        raise OpenLDBWSError('Request to Darwin failed - ' + str(err))
+
+    # Faults are small and parsed twice, so only boards are streamed
+    if response.ok and not payload_capture.is_wanted(logger):
+        return _board_body(_stream_body(response, tracing.current_span()))
+    tracing.current_span().set(payload_bytes=len(response.content))
+
+    payload_capture.log_payload(logger, 'OpenLDBWS response', lambda: _pretty_xml(response.content))
     return response.content
 
 
 def get_last_departure_from_timetable(params):
     departures = None
-    time = '21:59'
+    stale = False
+    time = LAST_TRAIN_FROM
     cutoff = '10:00'
 
     while departures is None or time < cutoff:
-        departures = get_timetable(params, time)
+        departures, stale = get_cached_timetable(params, time)
         if departures is None:
             logger.info('Abnormally early last train')
             time = (datetime.strptime(time, '%H:%M') - timedelta(hours=2)).strftime('%H:%M')
@@ -114,13 +316,106 @@ def get_last_departure_from_timetable(params):
                          latest_departure['operator_name'],
                          latest_departure['destination_name'],
                          in_past=False,
-                         live=False)
+                         live=False,
+                         stale=stale)
+
+
+def get_cached_timetable(params, time):
+    """Return the scheduled departures from `time` through the timetable
+    cache, from the quickest timetable provider to answer, and whether they
+    are stale.
+    """
+    today = date.today()
+    key = _timetable_key(params, today, time)
+    departures, outcome = cache.fetch_through(cache.get_timetable_cache(), key,
+                                              lambda: timetable_providers.get_departures(params, today, str(time)),
+                                              stale_errors=(TransportAPIError, QuotaExceededError),
+                                              prefer_cached=lambda: quota.is_constrained(quota.TRANSPORT_API))
+    tracing.annotate(timetable_cache=outcome)
+    return departures, outcome in (cache.STALE, cache.STALE_ON_ERROR)
+
+
+def is_timetable_cached(params, time):
+    """Whether the timetable cache holds departures from `time` today."""
+    entry = cache.get_timetable_cache().get_entry(_timetable_key(params, date.today(), time))
+    return entry is not None and entry.value is not None
+
+
+def _timetable_key(params, day, time):
+    return params.origin.crs, params.destination.crs, str(day), str(time)
+
+
+@tracing.traced()
+def get_next_departures_offline(params, limit):
+    leaving = datetime.now() + timedelta(minutes=params.offset)
+    scheduled = islice(timetable.get_timetable().departures_from(
+        params.origin.crs, leaving.date(), params.destination.crs, after=leaving.hour * 60 + leaving.minute), limit)
+    departures = [DepartureInfo(departure.std,
+                                departure.std,
+                                departure.operator,
+                                departure.final_dest,
+                                in_past=False,
+                                live=False) for departure in scheduled]
+    return departures or None
+
+
+@tracing.traced()
+def get_fastest_journey_offline(params):
+    planner = journey.get_planner()
+    leaving = datetime.now() + timedelta(minutes=params.offset)
+    day, after = leaving.date(), leaving.hour * 60 + leaving.minute
+    legs = planner.earliest_arrival(params.origin.crs, params.destination.crs, day, after)
+    if legs is None:
+        return None
+
+    # Overlay live running from the origin's board, which may change the plan,
+    # unless OpenLDBWS' quota is better kept for other requests
+    live_departures = []
+    if not quota.is_constrained(quota.OPEN_LDBWS):
+        request_vars = {
+            'access_token': environ['OPEN_LDBWS_ACCESS_TOKEN'],
+            'origin': params.origin.crs,
+            'destination': legs[0].destination,
+            'time_offset': params.offset,
+            'time_window': 120
+        }
+        try:
+            live_departures = parse_departures_soap_response(make_soap_request(request_vars, 'departure_board.xml'),
+                                                             'fastest') or []
+        except QuotaExceededError:
+            logger.warning('OpenLDBWS quota reached, planning from the timetable alone')
+        except OpenLDBWSError:
+            logger.warning('OpenLDBWS failed, planning from the timetable alone', exc_info=True)
+    delays = planner.delays_from_board(params.origin.crs, day, live_departures)
+    if delays:
+        legs = planner.earliest_arrival(params.origin.crs, params.destination.crs, day, after, delays=delays)
+        if legs is None:
+            return None
+
+    first_leg, changes, arrival = legs[0], len(legs) - 1, legs[-1].eta
+    logger.debug('Fastest journey has {} change(s), arriving at {}'.format(changes, arrival))
+    for live_departure in live_departures:
+        match = live_departure.std == first_leg.std and \
+                live_departure.operator == first_leg.operator and \
+                live_departure.final_dest == first_leg.final_dest
+        if match:
+            return live_departure._replace(changes=changes, arrival=arrival)
+    return DepartureInfo(first_leg.std,
+                         first_leg.etd,
+                         first_leg.operator,
+                         first_leg.final_dest,
+                         in_past=False,
+                         live=False,
+                         changes=changes,
+                         arrival=arrival)
 
 
-def get_timetable(params, time):
-    url = 'https://transportapi.com/v3/uk/train/station/{origin}/{date}/{time}/timetable.json'.format(
+@tracing.traced()
+def get_timetable(params, time, day=None, base_url=None):
+    url = '{base}/v3/uk/train/station/{origin}/{date}/{time}/timetable.json'.format(
+        base=base_url or TRANSPORT_API_URL,
         origin=params.origin.crs,
-        date=str(date.today()),
+        date=str(day or date.today()),
         time=str(time)
     )
 
@@ -131,26 +426,38 @@ def get_timetable(params, time):
         'to_offset': 'PT02:00:00',
         'train_status': 'passenger'
     }
-    response = requests.get(url, params=param_dict)
 
-    if response.ok:
-        logger.debug('TransportAPI response: \n' + str(response.json()))
-        data = response.json()
-        try:
-            return data['departures']['all']
-        except KeyError as err:
-            msg = 'TransportAPI responded in an unexpected way - {} not found in response'.format(err)
-            logger.error(msg)
-            raise TransportAPIError(msg)
-    elif response.status_code < 499:
-        logger.error('TransportAPI rejected request')
-        raise ApplicationError('Request to TransportAPI failed - ' + response.reason)
-    else:
-        logger.error('TransportAPI returned HTTP status 5xx')
-        raise TransportAPIError('Request to TransportAPI failed - ' + response.reason)
+    def get():
+        quota.acquire(quota.TRANSPORT_API)
+        return get_http_session().get(url, params=param_dict, headers={'accept-encoding': ACCEPT_ENCODING},
+                                      timeout=UPSTREAM_TIMEOUT, stream=True)
 
+    request_key = {'origin': params.origin.crs, 'time': str(time), 'calling_at': params.destination.crs}
+    try:
+        response = cassette.intercept('transportapi', request_key, get)
+    except IOError as err:
+        logger.error('TransportAPI could not be reached')
+        raise TransportAPIError('Request to TransportAPI failed - ' + str(err))
 
-def get_last_departure_live_time(departure, params):
+    try:
+        if response.ok:
+            return _extract_departures(response)
+        elif response.status_code < 499:
+            logger.error('TransportAPI rejected request')
+            raise ApplicationError('Request to TransportAPI failed - ' + response.reason)
+        else:
+            logger.error('TransportAPI returned HTTP status 5xx')
+            raise TransportAPIError('Request to TransportAPI failed - ' + response.reason)
+    finally:
+        response.close()
+
+
+def get_last_departure_live_time(departure, params, evening_board=None):
+    """Return the live estimate for the last `departure`, or None if there
+    isn't one. If it leaves within the evening board, it is matched against
+    that board (from the `evening_board` future if one was started), or else
+    OpenLDBWS is asked for the few minutes around it.
+    """
     time_format = '%H:%M'
     now = datetime.now()
     now_string = now.strftime(time_format)
@@ -162,18 +469,36 @@ def get_last_departure_live_time(departure, params):
         logger.debug('Last train is not close enough to fetch live time')
         return None
 
+    if live_state.is_available():
+        live_etd = live_state.get_live_state().expected_departure(params.origin.crs, params.destination.crs,
+                                                                  departure.std, departure.operator,
+                                                                  departure.final_dest)
+        if live_etd is not None:
+            return live_etd
+
+    if quota.is_constrained(quota.OPEN_LDBWS):
+        logger.info('OpenLDBWS quota is nearly used up, giving the timetabled time')
+        return None
+
     logger.debug('Fetching live time for last train')
-    request_vars = {
-        'type': 'Next',
-        'access_token': environ['OPEN_LDBWS_ACCESS_TOKEN'],
-        'origin': params.origin.crs,
-        'destination': params.destination.crs,
-        'time_offset': (t_delta.seconds//60) - 10,
-        'time_window': 20
-    }
-    response = make_soap_request(request_vars, 'departures.xml')
+    try:
+        if t_delta.seconds // 60 < EVENING_BOARD_OFFSET + EVENING_BOARD_WINDOW:
+            live_departures = evening_board.result() if evening_board is not None else get_evening_board(params)
+        else:
+            request_vars = {
+                'type': 'Next',
+                'access_token': environ['OPEN_LDBWS_ACCESS_TOKEN'],
+                'origin': params.origin.crs,
+                'destination': params.destination.crs,
+                'time_offset': (t_delta.seconds//60) - 10,
+                'time_window': 20
+            }
+            live_departures = parse_departures_soap_response(make_soap_request(request_vars, 'departure_board.xml'),
+                                                             'last')
+    except QuotaExceededError:
+        logger.warning('OpenLDBWS quota reached, giving the timetabled time')
+        return None
 
-    live_departures = parse_departures_soap_response(response, 'last')
     if live_departures is None:
         logger.warning('OpenLDBWS returned no live times')
         return None
@@ -188,9 +513,80 @@ def get_last_departure_live_time(departure, params):
     return None
 
 
+# ----------------------------- Shared Clients -----------------------------
+
+def set_http_pool_size(size):
+    """Keep up to `size` upstream connections open per host, replacing the
+    HTTP session if it has already been made with fewer.
+    """
+    global HTTP_POOL_SIZE, _http_session
+    HTTP_POOL_SIZE = size
+    if _http_session is not None:
+        _http_session.close()
+        _http_session = None
+
+
+def get_http_session():
+    """Return the container-wide HTTP session, creating it on first use."""
+    global _http_session
+    if _http_session is None:
+        import requests
+        _http_session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=HTTP_POOL_SIZE)
+        _http_session.mount('https://', adapter)
+        _http_session.mount('http://', adapter)
+    return _http_session
+
+
+def _get_speculation_executor():
+    global _speculation_executor
+    if _speculation_executor is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _speculation_executor = ThreadPoolExecutor(max_workers=SPECULATION_THREADS, thread_name_prefix='speculative')
+    return _speculation_executor
+
+
+def get_template(template_file):
+    """Return a compiled SOAP request template. Jinja caches each template
+    within the environment, so templates are only compiled once per container.
+    """
+    global _template_env
+    if _template_env is None:
+        import jinja2
+        template_loader = jinja2.FileSystemLoader(searchpath=TEMPLATE_DIR)
+        _template_env = jinja2.Environment(loader=template_loader)
+    return _template_env.get_template(template_file)
+
+
 # -----------------------------  Response Helpers -----------------------------
 
+def _extract_departures(response):
+    """Stream the departures out of a TransportAPI timetable, keeping only the
+    fields the skill reads. The body is only held whole when it is about to
+    be logged anyway.
+    """
+    if payload_capture.is_wanted(logger):
+        tracing.current_span().set(payload_bytes=len(response.content))
+        payload_capture.log_payload(logger, 'TransportAPI response', response.content)
+        chunks = [response.content]
+    else:
+        chunks = _stream_body(response, tracing.current_span())
+
+    try:
+        return json_stream.extract_items(chunks, ('departures', 'all'), TIMETABLE_FIELDS)
+    except KeyError as err:
+        msg = 'TransportAPI responded in an unexpected way - {} not found in response'.format(err)
+        logger.error(msg)
+        raise TransportAPIError(msg)
+    except ValueError as err:
+        logger.error('TransportAPI response could not be parsed')
+        raise TransportAPIError('TransportAPI responded with malformed JSON - ' + str(err))
+
+
+@tracing.traced()
 def parse_departures_soap_response(response, request_type):
+    import xmltodict
+
     departure_board = None
     try:
         raw_dict = xmltodict.parse(response)
@@ -203,9 +599,14 @@ def parse_departures_soap_response(response, request_type):
         logger.warning('OpenLDBWS returned no departures')
         return None
     all_departures = departure_board['lt5:trainServices']['lt5:service']
+    # xmltodict only builds a list for repeated elements
+    if not isinstance(all_departures, list):
+        all_departures = [all_departures]
 
     if request_type == 'next':
         max_list_size = 3
+    elif request_type == 'evening':
+        max_list_size = EVENING_BOARD_ROWS
     else:
         max_list_size = 10
 
@@ -227,7 +628,10 @@ def parse_departures_soap_response(response, request_type):
     return departures
 
 
+@tracing.traced()
 def parse_fastest_departure_soap_response(response):
+    import xmltodict
+
     departure_board = None
     try:
         raw_dict = xmltodict.parse(response)
@@ -251,7 +655,92 @@ def parse_fastest_departure_soap_response(response):
     )
 
 
+def _stream_body(response, span):
+    """Yield a streamed response's body, decompressed, as it arrives, then
+    release its connection. `span` is the request's, which has usually
+    finished by the time the body is read.
+    """
+    size = 0
+    try:
+        for chunk in response.iter_content(UPSTREAM_CHUNK_BYTES):
+            size += len(chunk)
+            yield chunk
+    finally:
+        span.set(payload_bytes=size)
+        response.close()
+
+
+def _board_body(chunks):
+    """Return a board that arrives in a single chunk as bytes, once its
+    connection has been released, since parsing it while the response is
+    still open only adds to the peak memory. Larger boards are streamed.
+    """
+    first = next(chunks, b'')
+    second = next(chunks, None)
+    if second is None:
+        return first
+    return _StreamedBody(chain((first, second), chunks))
+
+
+class _StreamedBody:
+    """A file-like view of streamed chunks, which xmltodict hands straight
+    to expat (it only accepts generators from 0.12).
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._pending = b''
+        # The chunks read so far, until there are more than SOAP_FAULT_BYTES
+        self._kept = []
+        self._kept_bytes = 0
+
+    def read(self, size=-1):
+        while size < 0 or len(self._pending) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._keep(chunk)
+            self._pending += chunk
+        if size < 0:
+            size = len(self._pending)
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def buffered(self):
+        """Return the whole body, or None if it was too large to keep."""
+        for chunk in self._chunks:
+            self._keep(chunk)
+        return None if self._kept is None else b''.join(self._kept)
+
+    def _keep(self, chunk):
+        if self._kept is None:
+            return
+        self._kept_bytes += len(chunk)
+        if self._kept_bytes > SOAP_FAULT_BYTES:
+            self._kept = None
+        else:
+            self._kept.append(chunk)
+
+
+def _minutes_from_now(offset):
+    leaving = datetime.now() + timedelta(minutes=offset)
+    return leaving.hour * 60 + leaving.minute
+
+
+def _pretty_xml(content):
+    from xml.dom import minidom
+    try:
+        return minidom.parseString(content).toprettyxml()
+    except Exception:
+        return content
+
+
 def handle_soap_fault(response):
+    import xmltodict
+
+    if isinstance(response, _StreamedBody):
+        # Part of it has been parsed as a board already
+        response = response.buffered()
     try:
         raw_dict = xmltodict.parse(response)
 
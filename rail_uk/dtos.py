@@ -6,4 +6,8 @@ HomeStation = namedtuple('HomeStation', 'station, distance')
 
 APIParameters = namedtuple('APIParameters', 'origin, destination, offset')
 
-DepartureInfo = namedtuple('DepartureInfo', 'std, etd, operator, final_dest, in_past, live')
+DepartureInfo = namedtuple('DepartureInfo', 'std, etd, operator, final_dest, in_past, live, stale, changes, arrival')
+# Only departures served from a stale cache entry are marked, and only the
+# first trains of journeys with changes have a count of them and the expected
+# arrival at the destination (namedtuple's `defaults` needs Python 3.7)
+DepartureInfo.__new__.__defaults__ = (False, 0, None)
@@ -1,29 +1,31 @@
-import boto3
 import logging
+
 from rail_uk.dtos import Station, HomeStation
 from rail_uk.exceptions import DynamoDBError
+from rail_uk import cassette, payload_capture, tracing
 
 
 logger = logging.getLogger(__name__)
 
+# Created on first use and shared by every invocation the container serves.
+_table = None
 
-def set_home_station(user_id, home_station_details):
 
-    db = boto3.resource('dynamodb', region_name='eu-west-1')
-    table = db.Table('RailUK')
+def set_home_station(user_id, home_station_details):
+    table = get_table()
 
     existing_details = get_home_station(user_id)
     if existing_details is None:
         logger.info('Setting user\'s home station')
-        response = table.put_item(
-            Item={
-                'UserID': user_id,
-                'station_name': home_station_details.station.name,
-                'station_crs': home_station_details.station.crs,
-                'distance': home_station_details.distance
-            }
-        )
-        logger.debug("DynamoDB PUT response: \n" + str(response))
+        item = {
+            'UserID': user_id,
+            'station_name': home_station_details.station.name,
+            'station_crs': home_station_details.station.crs,
+            'distance': home_station_details.distance
+        }
+        response = cassette.intercept('dynamodb', dict(item, operation='PutItem'),
+                                      lambda: table.put_item(Item=item))
+        payload_capture.log_payload(logger, 'DynamoDB PUT response', lambda: str(response))
 
         if _was_success(response):
             return "set"
@@ -32,19 +34,22 @@ def set_home_station(user_id, home_station_details):
         raise DynamoDBError('DynamoDB failed to set home station')
     else:
         logger.info('Updating user\'s home station')
-        response = table.update_item(
-            Key={
-                'UserID': user_id
-            },
-            UpdateExpression='SET station_name = :station_name, station_crs = :station_crs, distance = :distance',
-            ExpressionAttributeValues={
-                ':station_name': home_station_details.station.name,
-                ':station_crs': home_station_details.station.crs,
-                ':distance': home_station_details.distance
-            },
-            ReturnValues="UPDATED_NEW"
-        )
-        logger.debug("DynamoDB UPDATE response: \n" + str(response))
+        values = {
+            ':station_name': home_station_details.station.name,
+            ':station_crs': home_station_details.station.crs,
+            ':distance': home_station_details.distance
+        }
+        response = cassette.intercept('dynamodb', dict(values, operation='UpdateItem', UserID=user_id),
+                                      lambda: table.update_item(
+                                          Key={
+                                              'UserID': user_id
+                                          },
+                                          UpdateExpression='SET station_name = :station_name, '
+                                                           'station_crs = :station_crs, distance = :distance',
+                                          ExpressionAttributeValues=values,
+                                          ReturnValues="UPDATED_NEW"
+                                      ))
+        payload_capture.log_payload(logger, 'DynamoDB UPDATE response', lambda: str(response))
 
         if _was_success(response):
             return "updated"
@@ -53,17 +58,17 @@ def set_home_station(user_id, home_station_details):
         raise DynamoDBError('DynamoDB failed to update home station')
 
 
+@tracing.traced()
 def get_home_station(user_id):
+    table = get_table()
 
-    db = boto3.resource('dynamodb', region_name='eu-west-1')
-    table = db.Table('RailUK')
-
-    response = table.get_item(
-        Key={
-            'UserID': user_id
-        }
-    )
-    logger.debug("DynamoDB GET response: \n" + str(response))
+    response = cassette.intercept('dynamodb', {'operation': 'GetItem', 'UserID': user_id},
+                                  lambda: table.get_item(
+                                      Key={
+                                          'UserID': user_id
+                                      }
+                                  ))
+    payload_capture.log_payload(logger, 'DynamoDB GET response', lambda: str(response))
 
     if 'Item' not in response:
         logger.warning('DynamoDB returned no home station')
@@ -74,6 +79,37 @@ def get_home_station(user_id):
     return HomeStation(station, int(details['distance']))
 
 
+def get_home_stations():
+    """Return every user's home station, scanning the whole table."""
+    table = get_table()
+
+    home_stations = []
+    scan_args = {'ProjectionExpression': 'station_name, station_crs, distance'}
+    while True:
+        response = cassette.intercept('dynamodb', dict(scan_args, operation='Scan'),
+                                      lambda: table.scan(**scan_args))
+        if not _was_success(response):
+            logger.error('DynamoDB failed to scan home stations')
+            raise DynamoDBError('DynamoDB failed to scan home stations')
+
+        for details in response.get('Items', []):
+            station = Station(details['station_name'], details['station_crs'])
+            home_stations.append(HomeStation(station, int(details['distance'])))
+        if 'LastEvaluatedKey' not in response:
+            return home_stations
+        scan_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def get_table():
+    global _table
+    if _table is None:
+        # boto3 takes ~100ms to import, so only pay for it when DynamoDB is used.
+        import boto3
+        db = boto3.resource('dynamodb', region_name='eu-west-1')
+        _table = db.Table('RailUK')
+    return _table
+
+
 def _was_success(query_response):
     try:
         http_status = query_response['ResponseMetadata']['HTTPStatusCode']
@@ -2,7 +2,8 @@ import logging
 
 from rail_uk.intents import get_next_train, get_fastest_train, get_last_train, set_home_station, get_welcome_response, \
     handle_session_end_request, get_error_response, get_api_error_response, get_db_error_response
-from rail_uk.exceptions import ApplicationError, OpenLDBWSError, TransportAPIError, DynamoDBError
+from rail_uk.exceptions import ApplicationError, OpenLDBWSError, TransportAPIError, DynamoDBError, QuotaExceededError
+from rail_uk import tracing
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +13,7 @@ def on_launch(session):
     want
     """
     logger.info('Launched without intent: ' + session['sessionId'])
+    tracing.annotate(intent='LaunchRequest')
     return get_welcome_response()
 
 
@@ -20,6 +22,7 @@ def on_intent(intent_request, session):
     """
     intent = intent_request['intent']
     intent_name = intent_request['intent']['name']
+    tracing.annotate(intent=intent_name)
 
     # Dispatch to skill's intent handlers
     try:
@@ -45,7 +48,7 @@ def on_intent(intent_request, session):
             logger.error('Invalid intent provided')
             raise ValueError("Invalid intent")
 
-    except (OpenLDBWSError, TransportAPIError):
+    except (OpenLDBWSError, TransportAPIError, QuotaExceededError):
         logger.exception('-[API ERROR]- Underlying API failed:')
         return get_api_error_response()
 
@@ -20,3 +20,8 @@ class DynamoDBError(Error):
 class ApplicationError(Error):
     """Raised when an unknown error occurs."""
     pass
+
+
+class QuotaExceededError(Error):
+    """Raised when a request would take an upstream API past its quota"""
+    pass
@@ -0,0 +1,256 @@
+"""Streaming heavy-hitter tracking of the routes users ask about.
+
+Every departure query updates a Space-Saving summary of (origin,
+destination) pairs. The summary holds a fixed number of counters, however
+many routes are seen. Each counter's count overestimates its route's true
+count by at most its error, and any route asked for more than
+total / capacity times is guaranteed a counter.
+
+Each container periodically writes its summary to the query log (see
+rail_uk/query_log.py), so only when QUERY_LOG is set, as a snapshot line:
+
+    {"heavy_hitters": {"container": "...", "at": 1551470700, "total": 5120, "capacity": 256,
+                       "counters": [["HTX", "TTX", 412, 3], ...]}}
+
+The report merges the latest snapshot from every container into a ranking
+of the busiest routes, with the share of traffic each covers:
+
+    python -m rail_uk.heavy_hitters queries.jsonl --top 20
+"""
+from os import environ, urandom
+import heapq
+import json
+import sys
+import threading
+import time
+
+CAPACITY = int(environ.get('HEAVY_HITTERS_CAPACITY', 256))
+# Seconds between each container's snapshots to the query log. Counts since
+# the last snapshot are lost with the container, which Lambda may stop at
+# any time after an invocation.
+SNAPSHOT_SECONDS = float(environ.get('HEAVY_HITTERS_SNAPSHOT_SECONDS', 60))
+# The heap of minimum candidates is rebuilt once it holds this many times
+# as many entries as there are counters
+HEAP_SLACK = 4
+
+_tracker = None
+_lock = threading.Lock()
+# Identifies this container's snapshots
+_container = urandom(8).hex()
+_last_snapshot_at = None
+# The tracker's total at that snapshot
+_snapshot_total = 0
+
+
+class SpaceSaving:
+
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.total = 0
+        # item -> [count, error]
+        self._counters = {}
+        # (count, item), including entries outdated by later updates
+        self._heap = []
+
+    def update(self, item, count=1):
+        self.total += count
+        counter = self._counters.get(item)
+        if counter is not None:
+            counter[0] += count
+        elif len(self._counters) < self.capacity:
+            counter = self._counters[item] = [count, 0]
+        else:
+            # The new item takes over the smallest counter, and inherits its
+            # count as possible overestimation
+            minimum, evicted = self._pop_minimum()
+            del self._counters[evicted]
+            counter = self._counters[item] = [minimum + count, minimum]
+        heapq.heappush(self._heap, (counter[0], item))
+        if len(self._heap) > HEAP_SLACK * self.capacity:
+            self._heap = [(counter[0], item) for item, counter in self._counters.items()]
+            heapq.heapify(self._heap)
+
+    def minimum(self):
+        """The smallest count, or 0 while there are counters to spare."""
+        if len(self._counters) < self.capacity:
+            return 0
+        return min(counter[0] for counter in self._counters.values())
+
+    def top(self, k=None):
+        """Return up to `k` (item, count, error), most frequent first."""
+        ranked = sorted(((item, count, error) for item, (count, error) in self._counters.items()),
+                        key=lambda entry: (-entry[1], entry[0]))
+        return ranked if k is None else ranked[:k]
+
+    def merge(self, other):
+        """Return a summary of both streams. A route missing from one summary
+        may still have been counted up to that summary's minimum, which is
+        added to its count and error.
+        """
+        own_minimum, other_minimum = self.minimum(), other.minimum()
+        combined = {}
+        for item, (count, error) in self._counters.items():
+            other_counter = other._counters.get(item, (other_minimum, other_minimum))
+            combined[item] = [count + other_counter[0], error + other_counter[1]]
+        for item, (count, error) in other._counters.items():
+            if item not in combined:
+                combined[item] = [count + own_minimum, error + own_minimum]
+
+        merged = SpaceSaving(max(self.capacity, other.capacity))
+        merged.total = self.total + other.total
+        kept = sorted(combined.items(), key=lambda entry: (-entry[1][0], entry[0]))[:merged.capacity]
+        merged._counters = dict(kept)
+        merged._heap = [(counter[0], item) for item, counter in kept]
+        heapq.heapify(merged._heap)
+        return merged
+
+    def to_dict(self):
+        return {
+            'total': self.total,
+            'capacity': self.capacity,
+            'counters': [list(item) + [count, error] for item, count, error in self.top()]
+        }
+
+    @classmethod
+    def from_dict(cls, snapshot):
+        summary = cls(snapshot['capacity'])
+        summary.total = snapshot['total']
+        for *item, count, error in snapshot['counters']:
+            summary._counters[tuple(item)] = [count, error]
+        summary._heap = [(counter[0], item) for item, counter in summary._counters.items()]
+        heapq.heapify(summary._heap)
+        return summary
+
+    def _pop_minimum(self):
+        while True:
+            count, item = heapq.heappop(self._heap)
+            counter = self._counters.get(item)
+            if counter is not None and counter[0] == count:
+                return count, item
+
+    def __len__(self):
+        return len(self._counters)
+
+
+def get_tracker():
+    global _tracker
+    if _tracker is None:
+        _tracker = SpaceSaving()
+    return _tracker
+
+
+def record(origin, destination):
+    tracker = get_tracker()
+    with _lock:
+        tracker.update((origin, destination))
+
+
+def take_snapshot(now=None, force=False):
+    """Return this container's summary for the query log if a snapshot is
+    due, or None. The first is due SNAPSHOT_SECONDS after the first query.
+    With `force`, one is due whenever queries have been counted since the
+    last, e.g. as the container stops.
+    """
+    global _last_snapshot_at, _snapshot_total
+    now = time.time() if now is None else now
+    with _lock:
+        tracker = get_tracker()
+        if _last_snapshot_at is None:
+            _last_snapshot_at = now
+        if force:
+            if tracker.total == _snapshot_total:
+                return None
+        elif now - _last_snapshot_at < SNAPSHOT_SECONDS:
+            return None
+        _last_snapshot_at, _snapshot_total = now, tracker.total
+        return dict(tracker.to_dict(), container=_container, at=int(now))
+
+
+def reset():
+    global _tracker, _last_snapshot_at, _snapshot_total
+    with _lock:
+        _tracker = None
+        _last_snapshot_at = None
+        _snapshot_total = 0
+
+
+# ----------------------------- Report -----------------------------
+
+def read_snapshots(lines):
+    """Return the latest snapshot in `lines` from each container."""
+    latest = {}
+    for line in lines:
+        if '"heavy_hitters"' not in line:
+            continue
+        try:
+            snapshot = json.loads(line)['heavy_hitters']
+            container, at = snapshot['container'], snapshot['at']
+        except (ValueError, KeyError, TypeError):
+            continue
+        if container not in latest or at >= latest[container]['at']:
+            latest[container] = snapshot
+    return list(latest.values())
+
+
+def merge_snapshots(snapshots):
+    merged = None
+    for snapshot in snapshots:
+        summary = SpaceSaving.from_dict(snapshot)
+        merged = summary if merged is None else merged.merge(summary)
+    return merged if merged is not None else SpaceSaving()
+
+
+def build_report(summary, top=20):
+    """Rank the busiest routes, with the share of all queries each is
+    guaranteed to account for, and the running total of those shares.
+    """
+    rows = []
+    covered = 0
+    for rank, ((origin, destination), count, error) in enumerate(summary.top(top), start=1):
+        guaranteed = count - error
+        covered += guaranteed
+        rows.append({
+            'rank': rank,
+            'origin': origin,
+            'destination': destination,
+            'count': count,
+            'error': error,
+            'share': round(guaranteed / summary.total, 4) if summary.total else 0.0,
+            'cumulative_share': round(covered / summary.total, 4) if summary.total else 0.0
+        })
+    return {'total': summary.total, 'routes': rows}
+
+
+def print_report(report):
+    print('{} queries'.format(report['total']))
+    print('{:>5}  {:<8}{:<12}{:>8}{:>8}{:>8}{:>12}'.format(
+        'rank', 'origin', 'destination', 'count', 'error', 'share', 'cumulative'))
+    for row in report['routes']:
+        print('{rank:>5}  {origin:<8}{destination:<12}{count:>8}{error:>8}{share:>8.1%}{cumulative_share:>12.1%}'
+              .format(**row))
+
+
+def main(argv=None):
+    from contextlib import ExitStack
+    import argparse
+    import itertools
+
+    parser = argparse.ArgumentParser(description='Rank the busiest routes from heavy-hitter snapshots in a query log')
+    parser.add_argument('log', nargs='+', help='Query log file(s), as collected from every container')
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args(argv)
+
+    with ExitStack() as stack:
+        files = [stack.enter_context(open(path, 'r')) for path in args.log]
+        snapshots = read_snapshots(itertools.chain(*files))
+    report = build_report(merge_snapshots(snapshots), args.top)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
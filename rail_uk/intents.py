@@ -3,6 +3,8 @@ import logging
 from rail_uk.dtos import Station, APIParameters, HomeStation
 from rail_uk import data
 from rail_uk import dynamodb
+from rail_uk import query_log
+from rail_uk import tracing
 
 logger = logging.getLogger(__name__)
 
@@ -78,6 +80,7 @@ def get_fastest_train(intent, session):
     if parameters is None:
         return elicit_slot('origin', 'Which station would you like to travel from?')
 
+    query_log.record('FastestTrain', parameters)
     departures = data.get_fastest_departure(parameters)
 
     speech = build_departure_speech(departures, parameters, 'fastest')
@@ -92,6 +95,7 @@ def get_next_train(intent, session):
     if parameters is None:
         return elicit_slot('origin', 'Which station would you like to travel from?')
 
+    query_log.record('NextTrain', parameters)
     departure = data.get_next_departures(parameters)
 
     speech = build_departure_speech(departure, parameters, 'next')
@@ -106,6 +110,7 @@ def get_last_train(intent, session):
     if parameters is None:
         return elicit_slot('origin', 'Which station would you like to travel from?')
 
+    query_log.record('LastTrain', parameters)
     departure = data.get_last_departure(parameters)
 
     speech = build_last_departure_speech(departure, parameters)
@@ -198,7 +203,7 @@ def build_departure_speech(departure, api_params, intent_type):
     else:
         service_status = '.'
 
-    return departure_details + service_status
+    return departure_details + service_status + build_changes_notice(departure) + build_stale_notice(departure)
 
 
 def build_last_departure_speech(departure, api_params):
@@ -228,7 +233,20 @@ def build_last_departure_speech(departure, api_params):
     else:
         service_status = '.'
 
-    return departure_details + service_status
+    return departure_details + service_status + build_stale_notice(departure)
+
+
+def build_changes_notice(departure):
+    if not departure.changes:
+        return ''
+    changes = '1 change' if departure.changes == 1 else '{} changes'.format(departure.changes)
+    return ' The journey has {}, arriving at around {}.'.format(changes, departure.arrival)
+
+
+def build_stale_notice(departure):
+    if departure.stale:
+        return ' This information may be slightly out of date.'
+    return ''
 
 
 def build_speechlet_response(speech, reprompt, should_end_session, directives=None):
@@ -253,6 +271,7 @@ def build_speechlet_response(speech, reprompt, should_end_session, directives=No
     }
 
 
+@tracing.traced()
 def build_response(session_attributes, speechlet_response):
     return {
         'version': '1.0',
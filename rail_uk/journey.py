@@ -0,0 +1,307 @@
+"""Journey planning with changes over the offline timetable.
+
+Earliest-arrival queries are answered with the Connection Scan Algorithm.
+Every timetabled hop between two consecutive calls of a trip is a
+connection, held in parallel typed arrays sorted by departure time, and a
+query is a single forward pass over those departing after the requested
+time - stopping as soon as no later connection could arrive sooner.
+
+Arrivals are labelled by the number of trips taken to reach each station,
+so that journeys are limited to a number of changes. Live delays read from
+OpenLDBWS boards are overlaid on the scan without rebuilding the table.
+"""
+from collections import OrderedDict, namedtuple
+import bisect
+import heapq
+import logging
+import time
+
+from rail_uk import timetable as timetable_module
+from rail_uk.timetable import MINUTES_PER_DAY, format_time
+
+logger = logging.getLogger(__name__)
+
+# Connection flags
+PICKS_UP = 1
+SETS_DOWN = 2
+
+MAX_CHANGES = 2
+# Minimum time allowed to change between trains
+CHANGE_MINUTES = 5
+# Days of connections kept per planner - today and perhaps tomorrow
+CACHED_DAYS = 2
+
+INFINITY = 1 << 30
+
+# Parallel columns, one entry per connection, sorted by departure time.
+# Station columns index into `stations`, a sequence of CRS codes.
+Connections = namedtuple('Connections', 'stations, departure_times, arrival_times, departure_stations, '
+                                        'arrival_stations, trips, flags')
+# Array typecodes of the columns after `stations`
+COLUMN_TYPES = ('H', 'H', 'H', 'H', 'I', 'B')
+
+# One train taken in a journey. Expected times equal the scheduled ones
+# unless a live delay is known.
+Leg = namedtuple('Leg', 'origin, destination, std, etd, sta, eta, operator, final_dest, trip_id')
+
+_planner = None
+
+
+class Planner:
+
+    def __init__(self, timetable):
+        self.timetable = timetable
+        self.connections = timetable.connections()
+        self._stations = {crs: index for index, crs in enumerate(self.connections.stations)}
+        self._days = OrderedDict()
+
+    # ----------------------------- Queries -----------------------------
+
+    def earliest_arrival(self, origin_crs, destination_crs, day, after=0, max_changes=MAX_CHANGES, delays=None,
+                         change_minutes=CHANGE_MINUTES):
+        """Return the legs of the journey from `origin_crs` leaving after
+        `after` (minutes from midnight) on `day` that arrives at
+        `destination_crs` soonest, with at most `max_changes` changes, or
+        None if there is no such journey. `delays` are as returned by
+        delays_from_board.
+        """
+        origin = self._stations.get(origin_crs)
+        target = self._stations.get(destination_crs)
+        if origin is None or target is None or origin == target:
+            return None
+        max_legs = max_changes + 1
+        # Most pairs of stations are too far apart to plan between without
+        # a scan of the whole day
+        if not self._within_reach(origin_crs, destination_crs, max_legs):
+            return None
+        columns = self.day_connections(day)
+        if columns is None:
+            return None
+        delays = delays or {}
+
+        # ready[k][station] is the soonest a train can be boarded at a station
+        # reached with at most k trips, and labels[k] the legs that got there
+        ready = [[INFINITY] * len(self.connections.stations) for _ in range(max_legs + 1)]
+        for level in ready:
+            level[origin] = after
+        labels = [{} for _ in range(max_legs + 1)]
+        latest = ready[max_legs]
+        # The fewest trips taken to board each trip (0 if not boarded), and
+        # where it was boarded
+        trip_legs = bytearray(len(self.timetable))
+        boarded_at = {}
+        best = INFINITY
+
+        for connection in _scan_from(columns, after, delays):
+            departure_time, arrival_time, departure_station, arrival_station, trip, flags = connection
+            if departure_time >= best:
+                break
+            legs = trip_legs[trip]
+            if legs != 1 and latest[departure_station] <= departure_time and flags & PICKS_UP:
+                for taken in range(legs - 1 if legs else max_legs):
+                    if ready[taken][departure_station] <= departure_time:
+                        legs = trip_legs[trip] = taken + 1
+                        boarded_at[trip] = connection
+                        break
+            if legs and flags & SETS_DOWN:
+                if arrival_station == target and arrival_time < best:
+                    best = arrival_time
+                arrival_ready = arrival_time + change_minutes
+                for level in range(legs, max_legs + 1):
+                    if ready[level][arrival_station] <= arrival_ready:
+                        break
+                    ready[level][arrival_station] = arrival_ready
+                    labels[level][arrival_station] = (boarded_at[trip], connection, legs)
+
+        if best == INFINITY:
+            return None
+        journey = []
+        station, level = target, max_legs
+        while station != origin:
+            board, alight, legs = labels[level][station]
+            journey.append(self._leg(board, alight, delays))
+            station, level = board[2], legs - 1
+        journey.reverse()
+        return journey
+
+    def delays_from_board(self, station_crs, day, departures):
+        """Match the live departures on a station's board (DepartureInfos) to
+        the trips they run, returning {trip: (minutes, delay)} where the delay
+        applies to the trip from `minutes` onwards, and is None if the trip
+        is cancelled.
+        """
+        station = self._stations.get(station_crs)
+        columns = self.day_connections(day)
+        if station is None or columns is None or not departures:
+            return {}
+
+        delays = {}
+        for departure in departures:
+            scheduled = _parse_time(departure.std)
+            if scheduled is None:
+                continue
+            delay = _delay(departure.etd, scheduled)
+            if delay == 0:
+                continue
+            # Boards don't say which service day a departure belongs to
+            for minutes in (scheduled, scheduled + MINUTES_PER_DAY):
+                for trip in _departing(columns, station, minutes):
+                    details = self.timetable.scheduled_departure(trip, minutes)
+                    if details.final_dest == departure.final_dest and details.operator == departure.operator:
+                        delays[trip] = (minutes, delay)
+        return delays
+
+    def day_connections(self, day):
+        """Return the columns of the connections running on `day`, or None if
+        `day` is outside the timetable. Built on first use, so that scans
+        don't check every connection's days run.
+        """
+        if day in self._days:
+            return self._days[day]
+        from array import array
+        from itertools import compress
+
+        start = time.time()
+        running = self.timetable.running_trips(day)
+        columns = None
+        if running is not None:
+            selected = bytes(running[trip] for trip in self.connections.trips)
+            columns = tuple(memoryview(array(typecode, compress(column, selected)))
+                            for typecode, column in zip(COLUMN_TYPES, self.connections[1:]))
+            logger.info('Selected {} connections running on {} in {:.0f}ms'.format(
+                len(columns[0]), day, (time.time() - start) * 1000))
+        self._days[day] = columns
+        if len(self._days) > CACHED_DAYS:
+            self._days.popitem(last=False)
+        return columns
+
+    def _within_reach(self, origin_crs, destination_crs, max_legs):
+        """Whether any `max_legs` trips join the stations on some day."""
+        seen = {origin_crs}
+        frontier = [origin_crs]
+        for legs in range(max_legs):
+            next_frontier = []
+            for crs in frontier:
+                reachable = self.timetable.reachable_from(crs)
+                if destination_crs in reachable:
+                    return True
+                if legs < max_legs - 1:
+                    next_frontier.extend(station for station in reachable if station not in seen)
+                    seen.update(reachable)
+            frontier = next_frontier
+        return False
+
+    def _leg(self, board, alight, delays):
+        trip = board[4]
+        since, delay = delays.get(trip, (None, None))
+        # Connections after a delay is known are scanned at their expected times
+        departure_delay = delay if delay and board[0] >= since + delay else 0
+        arrival_delay = delay if delay and alight[0] >= since + delay else 0
+        departure_time, arrival_time = board[0] - departure_delay, alight[1] - arrival_delay
+        details = self.timetable.scheduled_departure(trip, departure_time)
+        stations = self.connections.stations
+        return Leg(stations[board[2]], stations[alight[3]],
+                   details.std, format_time(board[0]), format_time(arrival_time), format_time(alight[1]),
+                   details.operator, details.final_dest, details.trip_id)
+
+
+def _scan_from(columns, after, delays):
+    delayed = [delay for _, delay in delays.values() if delay]
+    # Delayed trips may be caught after `after` from a call timetabled before it
+    start = bisect.bisect_left(columns[0], after - max(delayed, default=0))
+    connections = zip(*(column[start:] for column in columns))
+    if delays:
+        return _overlay(connections, delays)
+    return connections
+
+
+def _departing(columns, station, minutes):
+    departure_times, departure_stations, trips = columns[0], columns[2], columns[4]
+    start = bisect.bisect_left(departure_times, minutes)
+    end = bisect.bisect_right(departure_times, minutes, start)
+    return [trips[index] for index in range(start, end) if departure_stations[index] == station]
+
+
+def _overlay(connections, delays):
+    """Yield `connections` in departure order with those of delayed trips
+    moved to their expected times, and those of cancelled trips left out.
+    """
+    pending = []
+    for connection in connections:
+        while pending and pending[0] <= connection:
+            yield heapq.heappop(pending)
+        trip = connection[4]
+        if trip in delays:
+            since, delay = delays[trip]
+            if connection[0] >= since:
+                if delay is not None:
+                    heapq.heappush(pending, (connection[0] + delay, connection[1] + delay) + connection[2:])
+                continue
+        yield connection
+    while pending:
+        yield heapq.heappop(pending)
+
+
+# ----------------------------- Building -----------------------------
+
+def build_connections(timetable):
+    """Build the Connections of an in-memory timetable.Timetable."""
+    from array import array
+
+    start = time.time()
+    # Bit n is set if a trip picks up at its nth stop
+    pickups = [0] * len(timetable.trips)
+    for entries in timetable.departures.values():
+        for _, trip_index, position in entries:
+            pickups[trip_index] |= 1 << position
+
+    stations = {}
+    rows = []
+    for trip_index, trip in enumerate(timetable.trips):
+        station_indexes = [stations.setdefault(crs, len(stations)) for crs in trip.stops]
+        for position in range(len(trip.stops) - 1):
+            departure_time, arrival_time = trip.departs[position], trip.arrivals[position + 1]
+            if departure_time is None or arrival_time is None:
+                continue
+            flags = PICKS_UP if (pickups[trip_index] >> position) & 1 else 0
+            if trip.calling_at.get(trip.stops[position + 1]) == position + 1:
+                flags |= SETS_DOWN
+            rows.append((departure_time, arrival_time, station_indexes[position], station_indexes[position + 1],
+                         trip_index, flags))
+    rows.sort()
+
+    connections = Connections(tuple(stations), *(array(typecode, column) for typecode, column in zip(
+        COLUMN_TYPES, zip(*rows) if rows else ((),) * len(COLUMN_TYPES))))
+    logger.info('Built {} connections in {:.0f}ms'.format(len(rows), (time.time() - start) * 1000))
+    return connections
+
+
+def get_planner():
+    """Return the container-wide planner over the offline timetable."""
+    global _planner
+    if _planner is None:
+        _planner = Planner(timetable_module.get_timetable())
+    return _planner
+
+
+def _parse_time(value):
+    try:
+        hours, minutes = value.split(':')
+        return int(hours) * 60 + int(minutes)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _delay(etd, scheduled):
+    """Minutes late from a board's etd - 0 if on time or unknown ('Delayed'),
+    or None if cancelled.
+    """
+    if etd == 'Cancelled':
+        return None
+    expected = _parse_time(etd)
+    if expected is None:
+        return 0
+    # An expected time past midnight is still later than the scheduled one,
+    # but a train running early is not delayed by nearly a day
+    late = (expected - scheduled) % MINUTES_PER_DAY
+    return late if late < MINUTES_PER_DAY // 2 else 0
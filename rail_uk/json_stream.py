@@ -0,0 +1,130 @@
+"""Incremental extraction from large JSON responses.
+
+TransportAPI timetables run to hundreds of departures of a dozen or more
+fields each, of which the skill reads three. `extract_items` walks a response
+body chunk by chunk down to one array and decodes its items one at a time,
+keeping only the wanted fields - so neither the whole body nor its full
+object tree is held at once. Each value is still decoded by the json
+module's C scanner; only the walk between them is Python.
+"""
+import codecs
+import json
+import re
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_SEPARATOR = re.compile(r'[ \t\n\r]*([,\]])[ \t\n\r]*')
+_NUMBER_CHARS = '0123456789+-.eE'
+
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """A cursor over JSON text arriving in chunks, holding only the text not
+    yet consumed.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decode = codecs.getincrementaldecoder('utf-8')().decode
+        self.buffer = ''
+        self.position = 0
+
+    def _more(self):
+        for chunk in self._chunks:
+            text = self._decode(chunk) if isinstance(chunk, bytes) else chunk
+            if text:
+                self.buffer = self.buffer[self.position:] + text
+                self.position = 0
+                return True
+        return False
+
+    def peek(self):
+        """Skip whitespace and return the next character, or '' at the end."""
+        while True:
+            position = self.position = _WHITESPACE.match(self.buffer, self.position).end()
+            if position < len(self.buffer):
+                return self.buffer[position]
+            if not self._more():
+                return ''
+
+    def take(self, expected):
+        char = self.peek()
+        if char not in expected:
+            raise ValueError('Expected one of {!r} but found {!r}'.format(expected, char or 'end of input'))
+        self.position += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.position)
+            except ValueError:
+                # The value may just be cut short by the end of the chunk
+                if self._more():
+                    continue
+                raise
+            # As may a number, which decodes as far as the chunk goes
+            number = isinstance(value, (int, float)) and not isinstance(value, bool)
+            if number and not self.buffer[end:].lstrip(_NUMBER_CHARS) and self._more():
+                continue
+            self.position = end
+            return value
+
+    def items(self):
+        """Yield the items of the array the reader is in, through its ']'."""
+        scan = _decoder.scan_once
+        while True:
+            # Items and separators wholly within the buffer are matched
+            # directly, and anything cut short by a chunk goes the long way
+            try:
+                item, end = scan(self.buffer, self.position)
+                match = _SEPARATOR.match(self.buffer, end)
+            except (StopIteration, ValueError):
+                match = None
+            if match is None:
+                item = self.value()
+                separator = self.take(',]')
+                if separator == ',':
+                    self.peek()
+            else:
+                separator = match.group(1)
+                self.position = match.end()
+            yield item
+            if separator == ']':
+                return
+
+
+def extract_items(chunks, path, fields):
+    """Return the items of the array at `path` (a sequence of object keys)
+    in the JSON document arriving as `chunks`, each object cut down to the
+    keys in `fields` it has. Raises KeyError for the first key of `path` not
+    found, and ValueError if the document is malformed. A value other than
+    an array at `path` is returned as it is.
+    """
+    reader = _Reader(chunks)
+    for key in path:
+        _find_key(reader, key)
+
+    if reader.peek() != '[':
+        return reader.value()
+    reader.position += 1
+
+    if reader.peek() == ']':
+        return []
+    return [{field: item[field] for field in fields if field in item} if isinstance(item, dict) else item
+            for item in reader.items()]
+
+
+def _find_key(reader, key):
+    """Advance `reader` from the start of an object to the value of `key`."""
+    if reader.take('{') and reader.peek() == '}':
+        raise KeyError(key)
+    while True:
+        name = reader.value()
+        reader.take(':')
+        if name == key:
+            return
+        reader.value()
+        if reader.take(',}') == '}':
+            raise KeyError(key)
@@ -0,0 +1,271 @@
+"""Second cache tier, shared by every container.
+
+Sits behind the in-process board cache (see rail_uk/cache.py), so that a
+container with a cold cache can still answer from a board another container
+fetched moments before. Parsed boards are stored compactly - zlib-compressed
+JSON rows, behind a format byte - keyed by board, origin, destination and
+walking offset.
+
+L2_CACHE selects the store:
+
+    dynamodb:RailUKCache      a DynamoDB table with partition key CacheKey,
+                              and TTL enabled on its delete_at attribute
+    sqlite:/tmp/l2.sqlite     a local file, shared by the processes on one host
+    sqlite::memory:           within this process only, for tests
+
+Each entry carries a version. When an entry is missing or has expired, a
+container must first claim a short lease on it with a conditional write, and
+only the one that does fetches from upstream and writes the new version.
+The others serve the expired entry if there is one, or wait briefly for the
+new version rather than all calling upstream at once.
+"""
+from collections import namedtuple
+from os import environ
+import json
+import logging
+import threading
+import time
+import zlib
+
+from rail_uk.dtos import DepartureInfo
+
+logger = logging.getLogger(__name__)
+
+# Seconds a lease lasts, and that a container without one waits for the
+# holder's new version before fetching for itself
+LEASE_SECONDS = float(environ.get('L2_LEASE_SECONDS', 5))
+LEASE_WAIT = float(environ.get('L2_LEASE_WAIT', 1))
+POLL_SECONDS = 0.05
+# Seconds an entry is kept for after it expires, for containers to serve
+# while it is refreshed
+RETAIN_SECONDS = 600
+# Bumped whenever the payload layout changes, so old entries read as misses
+FORMAT = 1
+
+Item = namedtuple('Item', 'version, payload, expires_at, lease_until')
+
+_store = None
+_store_lock = threading.Lock()
+
+
+# ----------------------------- Serialisation -----------------------------
+
+def encode(departures):
+    """Serialise a list of DepartureInfo (or None) to bytes."""
+    rows = None if departures is None else [list(departure[:6]) for departure in departures]
+    return bytes([FORMAT]) + zlib.compress(json.dumps(rows, separators=(',', ':')).encode('utf-8'))
+
+
+def decode(payload):
+    if not payload or payload[0] != FORMAT:
+        raise ValueError('Unknown L2 cache entry format')
+    rows = json.loads(zlib.decompress(payload[1:]).decode('utf-8'))
+    return None if rows is None else [DepartureInfo(*row) for row in rows]
+
+
+# ----------------------------- Stores -----------------------------
+
+class SqliteStore:
+    """Stand-in for the DynamoDB table, which can also be shared by the
+    worker processes of a self-hosted server.
+    """
+
+    def __init__(self, path):
+        import sqlite3
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS entries (cache_key TEXT PRIMARY KEY, '
+                                 'version INTEGER, payload BLOB, expires_at REAL, lease_until REAL, '
+                                 'delete_at REAL)')
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT version, payload, expires_at, lease_until, delete_at FROM entries WHERE cache_key = ?',
+                (key,)).fetchone()
+        return None if row is None else _item(*row)
+
+    def claim(self, key, version, lease_until, now):
+        with self._lock:
+            self._connection.execute('INSERT OR IGNORE INTO entries (cache_key, version, delete_at) VALUES (?, 0, ?)',
+                                     (key, lease_until + RETAIN_SECONDS))
+            updated = self._connection.execute(
+                'UPDATE entries SET lease_until = ? WHERE cache_key = ? AND version = ? '
+                'AND (lease_until IS NULL OR lease_until < ?)', (lease_until, key, version, now)).rowcount
+        return updated == 1
+
+    def put(self, key, version, payload, expires_at, delete_at, expected_version):
+        with self._lock:
+            updated = self._connection.execute(
+                'UPDATE entries SET version = ?, payload = ?, expires_at = ?, lease_until = NULL, delete_at = ? '
+                'WHERE cache_key = ? AND version = ?',
+                (version, payload, expires_at, delete_at, key, expected_version)).rowcount
+        return updated == 1
+
+
+class DynamoDBStore:
+
+    def __init__(self, table_name):
+        self.table_name = table_name
+        self._table = None
+
+    def get_table(self):
+        if self._table is None:
+            import boto3
+            self._table = boto3.resource('dynamodb', region_name='eu-west-1').Table(self.table_name)
+        return self._table
+
+    def get(self, key):
+        response = self.get_table().get_item(Key={'CacheKey': key}, ConsistentRead=True)
+        item = response.get('Item')
+        if item is None:
+            return None
+        payload = item.get('payload')
+        return _item(int(item['entry_version']),
+                     None if payload is None else bytes(payload),
+                     _number(item.get('expires_at')),
+                     _number(item.get('lease_until')),
+                     _number(item.get('delete_at')))
+
+    def claim(self, key, version, lease_until, now):
+        # A claim may create the entry, which is deleted in turn if its holder never writes it
+        return self._conditionally(lambda: self.get_table().update_item(
+            Key={'CacheKey': key},
+            UpdateExpression='SET lease_until = :lease_until, entry_version = if_not_exists(entry_version, :zero), '
+                             'delete_at = if_not_exists(delete_at, :delete_at)',
+            ConditionExpression='(attribute_not_exists(entry_version) OR entry_version = :version) '
+                                'AND (attribute_not_exists(lease_until) OR lease_until < :now)',
+            ExpressionAttributeValues={':lease_until': _decimal(lease_until), ':zero': 0, ':version': version,
+                                       ':now': _decimal(now), ':delete_at': int(lease_until + RETAIN_SECONDS)}
+        ))
+
+    def put(self, key, version, payload, expires_at, delete_at, expected_version):
+        return self._conditionally(lambda: self.get_table().put_item(
+            Item={
+                'CacheKey': key,
+                'entry_version': version,
+                'payload': payload,
+                'expires_at': _decimal(expires_at),
+                # DynamoDB's TTL deletion wants whole epoch seconds
+                'delete_at': int(delete_at)
+            },
+            ConditionExpression='attribute_not_exists(CacheKey) OR entry_version = :expected',
+            ExpressionAttributeValues={':expected': expected_version}
+        ))
+
+    @staticmethod
+    def _conditionally(write):
+        from botocore.exceptions import ClientError
+
+        try:
+            write()
+            return True
+        except ClientError as err:
+            if err.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+
+def open_store(spec):
+    kind, _, location = spec.partition(':')
+    if kind == 'dynamodb':
+        return DynamoDBStore(location)
+    if kind == 'sqlite':
+        return SqliteStore(location)
+    raise ValueError('Unknown L2 cache store: ' + spec)
+
+
+def get_store():
+    """Return the container's L2 store, or None if there isn't one."""
+    global _store
+    if _store is None and environ.get('L2_CACHE'):
+        with _store_lock:
+            if _store is None:
+                _store = open_store(environ['L2_CACHE'])
+    return _store
+
+
+def set_store(store):
+    global _store
+    _store = store
+
+
+# ----------------------------- Fetching -----------------------------
+
+def fetch(key, fetch_upstream, ttl, store=None):
+    """Return (departures, expires_in) for `key`: the departures from the
+    shared store while they are fresh, otherwise from `fetch_upstream`,
+    writing them back for the other containers for `ttl` seconds (or a
+    function of the departures returning them), and the seconds until the
+    store's entry expires. That is zero or less for an expired entry served
+    while another container replaces it, and None when the store wasn't
+    used. Store failures are logged and the upstream used instead.
+    """
+    store = store or get_store()
+    if store is None:
+        return fetch_upstream(), None
+
+    try:
+        item = store.get(key)
+        now = time.time()
+        if item is not None and item.payload is not None and item.expires_at > now:
+            logger.debug('L2 cache hit: ' + key)
+            return decode(item.payload), item.expires_at - now
+
+        version = 0 if item is None else item.version
+        if not store.claim(key, version, now + LEASE_SECONDS, now):
+            return _wait_for_holder(store, key, item, fetch_upstream)
+    except Exception:
+        logger.warning('L2 cache unavailable, fetching from upstream', exc_info=True)
+        return fetch_upstream(), None
+
+    value = fetch_upstream()
+    seconds = ttl(value) if callable(ttl) else ttl
+    try:
+        now = time.time()
+        if not store.put(key, version + 1, encode(value), now + seconds, now + seconds + RETAIN_SECONDS, version):
+            logger.info('L2 cache entry {} was written by another container'.format(key))
+    except Exception:
+        logger.warning('Could not write to the L2 cache', exc_info=True)
+    return value, seconds
+
+
+def _wait_for_holder(store, key, item, fetch_upstream):
+    """Another container holds the lease, so serve the entry it is replacing
+    if there is one, or give it a moment to write a new one.
+    """
+    if item is not None and item.payload is not None:
+        logger.debug('L2 cache entry {} is being refreshed, serving it expired'.format(key))
+        return decode(item.payload), item.expires_at - time.time()
+
+    deadline = time.time() + LEASE_WAIT
+    while time.time() < deadline:
+        time.sleep(POLL_SECONDS)
+        item = store.get(key)
+        if item is not None and item.payload is not None:
+            return decode(item.payload), item.expires_at - time.time()
+    logger.info('L2 cache entry {} was not written in time, fetching from upstream'.format(key))
+    return fetch_upstream(), None
+
+
+def _item(version, payload, expires_at, lease_until, delete_at):
+    """An Item, without its payload once past `delete_at`. DynamoDB's TTL can
+    take days to delete it, and the version is still needed to replace it.
+    """
+    if delete_at is not None and delete_at <= time.time():
+        return Item(version, None, None, lease_until)
+    return Item(version, payload, expires_at, lease_until)
+
+
+def make_key(board_key):
+    return '|'.join(str(part) for part in board_key)
+
+
+def _decimal(value):
+    from decimal import Decimal
+    return Decimal(str(round(value, 3)))
+
+
+def _number(value):
+    return None if value is None else float(value)
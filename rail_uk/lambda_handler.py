@@ -2,10 +2,18 @@ from os import environ
 import logging
 
 from rail_uk.events import on_launch, on_intent
+from rail_uk import cache, cassette, payload_capture, prefetch, profiling, query_log, tracing, warmup
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=environ.get('LOG_LEVEL', 'WARNING'))
 
+# Provisioned concurrency runs module initialisation before any traffic
+# arrives, so the init phase can be paid for up front when requested.
+if environ.get('WARM_UP_ON_INIT', 'false').lower() == 'true':
+    warmup.initialise()
+
+cassette.activate_from_environment()
+
 
 def lambda_handler(event, _):
     """
@@ -13,6 +21,32 @@ def lambda_handler(event, _):
     etc.) The JSON body of the request is provided in the event parameter.
     """
 
+    # A route summary that is due is written whatever the invocation, since
+    # Lambda gives no warning before stopping the container
+    query_log.flush()
+
+    # Scheduled prefetches and keep-warm pings have no Alexa session, so
+    # return before validating one
+    if prefetch.is_prefetch_event(event):
+        return prefetch.handle(event)
+    if warmup.is_warm_up_event(event):
+        return warmup.warm_up(event)
+
+    cassette.record_event(event)
+    tracing.start_trace()
+    payload_capture.start_request()
+    try:
+        with profiling.profile_invocation(event):
+            return _handle_request(event)
+    finally:
+        tracing.finish_trace()
+        # Stale cache entries served by earlier invocations are refreshed
+        # once the response is built, as the container was frozen as soon as
+        # they responded
+        cache.run_deferred()
+
+
+def _handle_request(event):
     # Prevent someone else from configuring a skill that sends requests to this function
     skill_id = environ['SKILL_ID']
     if event['session']['application']['applicationId'] != skill_id:
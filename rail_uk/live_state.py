@@ -0,0 +1,455 @@
+"""Live departure boards served from local state.
+
+Consumes a Darwin Push Port-style stream of schedule, forecast, cancellation
+and deactivation messages - one JSON object per line, from a file or a TCP
+socket - into an in-memory columnar store of live service state, indexed by
+the stations each service calls at. Next, fastest and last-train live times
+are then answered without a SOAP request per utterance, with OpenLDBWS as
+the fallback while the stream is stale or doesn't cover a station.
+
+    {"type": "schedule", "rid": "201902281234567", "ssd": "2019-02-28", "toc": "Southern",
+     "locations": [{"crs": "BTN", "ptd": "21:00"}, {"crs": "VIC", "pta": "22:02"}]}
+    {"type": "forecast", "rid": "201902281234567", "locations": [{"crs": "BTN", "etd": "21:04"}]}
+    {"type": "cancellation", "rid": "201902281234567"}
+    {"type": "deactivated", "rid": "201902281234567"}
+
+A schedule's service date (`ssd`) defaults to the day it was received, and
+only today's services - and yesterday's still running past midnight - are
+matched. Deactivated services, and those that finished a while ago, are
+compacted out of the columns every few minutes.
+
+The stream is read from LIVE_STATE_STREAM - a file path or tcp://host:port -
+by a background thread, started once per container.
+"""
+from array import array
+from datetime import datetime
+from os import environ
+import bisect
+import logging
+import threading
+import time
+
+from rail_uk.dtos import DepartureInfo
+
+logger = logging.getLogger(__name__)
+
+# The state is no longer trusted once the stream has been quiet this long
+MAX_AGE = float(environ.get('LIVE_STATE_MAX_AGE', 120))
+RECONNECT_SECONDS = 5
+COMPACT_SECONDS = 300
+# How long after its last call a service is kept, in case it's running late
+PAST_MINUTES = 60
+MINUTES_PER_DAY = 24 * 60
+# Stands in for a time a message left out
+NO_TIME = -1
+
+# Service flags
+CANCELLED = 1
+DEACTIVATED = 2
+# Call flags
+DELAYED = 1
+
+_live_state = None
+_consumer = None
+
+
+class LiveState:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.last_message_at = None
+        self.messages = 0
+        self._compacted_at = time.time()
+        self._clear()
+
+    def _clear(self):
+        self._services = {}
+
+        # Service columns. Days are date ordinals.
+        self.rids = []
+        self.service_days = array('I')
+        self.operators = []
+        self.destinations = []
+        self.service_flags = bytearray()
+        # Where each service's calls start in the call columns, and how many
+        # there are. A re-sent schedule is appended and the service repointed.
+        self.first_calls = array('I')
+        self.call_counts = array('H')
+
+        # Call columns. Times are minutes from midnight at the start of the
+        # service's day, so calls after midnight run past 1440.
+        self.call_stations = []
+        self.scheduled_arrivals = array('h')
+        self.scheduled_departures = array('h')
+        self.expected_arrivals = array('h')
+        self.expected_departures = array('h')
+        self.call_flags = bytearray()
+        self.call_services = array('I')
+
+        # crs -> [(scheduled departure, call)] sorted by time
+        self.boards = {}
+
+    # ----------------------------- Ingestion -----------------------------
+
+    def ingest(self, lines):
+        """Apply each JSON message in `lines`, returning how many there were."""
+        import json
+
+        count = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                message = json.loads(line)
+                self.apply(message)
+            except (ValueError, KeyError, TypeError):
+                logger.warning('Skipping malformed live state message')
+                continue
+            count += 1
+        return count
+
+    def apply(self, message):
+        handler = getattr(self, '_apply_' + str(message.get('type')), None)
+        if handler is None:
+            logger.debug('Ignoring live state message of type {}'.format(message.get('type')))
+            return
+        with self._lock:
+            handler(message)
+            self.messages += 1
+            self.last_message_at = time.time()
+            if self.last_message_at - self._compacted_at >= COMPACT_SECONDS:
+                self._compact()
+
+    def _apply_schedule(self, message):
+        from rail_uk import stations
+
+        locations = message['locations']
+        day = datetime.strptime(message['ssd'], '%Y-%m-%d').toordinal() if 'ssd' in message else _now()[0]
+        service = self._services.get(message['rid'])
+        if service is None:
+            service = self._services[message['rid']] = len(self.rids)
+            self.rids.append(message['rid'])
+            self.service_days.append(day)
+            self.operators.append(message.get('toc', ''))
+            self.destinations.append('')
+            self.service_flags.append(0)
+            self.first_calls.append(0)
+            self.call_counts.append(0)
+        else:
+            self._unindex(service)
+
+        self.service_days[service] = day
+        final = locations[-1]
+        station = stations.get_station(final['crs'])
+        self.destinations[service] = final.get('name') or (station.name if station else final['crs'])
+        self.operators[service] = message.get('toc', self.operators[service])
+        if message.get('cancelled'):
+            self.service_flags[service] |= CANCELLED
+        self.first_calls[service] = len(self.call_stations)
+        self.call_counts[service] = len(locations)
+
+        previous = 0
+        for location in locations:
+            arrival = _service_minutes(location.get('pta'), previous)
+            previous = arrival if arrival != NO_TIME else previous
+            departure = _service_minutes(location.get('ptd'), previous)
+            previous = departure if departure != NO_TIME else previous
+            self.call_stations.append(location['crs'])
+            self.scheduled_arrivals.append(arrival)
+            self.scheduled_departures.append(departure)
+            self.expected_arrivals.append(NO_TIME)
+            self.expected_departures.append(NO_TIME)
+            self.call_flags.append(0)
+            self.call_services.append(service)
+        self._index(service)
+
+    def _apply_forecast(self, message):
+        service = self._services.get(message['rid'])
+        if service is None:
+            return
+        first = self.first_calls[service]
+        calls = range(first, first + self.call_counts[service])
+        for location in message.get('locations', ()):
+            for call in calls:
+                if self.call_stations[call] == location['crs']:
+                    self._forecast(call, location)
+                    break
+
+    def _forecast(self, call, location):
+        for field, scheduled, expected in (('eta', self.scheduled_arrivals, self.expected_arrivals),
+                                           ('etd', self.scheduled_departures, self.expected_departures)):
+            value = location.get(field)
+            if value is None:
+                continue
+            if value == 'Delayed':
+                self.call_flags[call] |= DELAYED
+                continue
+            minutes = _parse_time(value)
+            if minutes != NO_TIME and scheduled[call] != NO_TIME:
+                # Forecasts are clock times, so follow the scheduled day
+                minutes += (scheduled[call] - minutes + MINUTES_PER_DAY // 2) // MINUTES_PER_DAY * MINUTES_PER_DAY
+                expected[call] = minutes
+                self.call_flags[call] &= ~DELAYED
+
+    def _apply_cancellation(self, message):
+        service = self._services.get(message['rid'])
+        if service is not None:
+            self.service_flags[service] |= CANCELLED
+
+    def _apply_deactivated(self, message):
+        service = self._services.get(message['rid'])
+        if service is not None and not self.service_flags[service] & DEACTIVATED:
+            self.service_flags[service] |= DEACTIVATED
+            self._unindex(service)
+
+    def _index(self, service):
+        first = self.first_calls[service]
+        for call in range(first, first + self.call_counts[service] - 1):
+            if self.scheduled_departures[call] != NO_TIME:
+                bisect.insort(self.boards.setdefault(self.call_stations[call], []),
+                              (self.scheduled_departures[call], call))
+
+    def _unindex(self, service):
+        first = self.first_calls[service]
+        for call in range(first, first + self.call_counts[service] - 1):
+            board = self.boards.get(self.call_stations[call])
+            if board:
+                index = bisect.bisect_left(board, (self.scheduled_departures[call], call))
+                if index < len(board) and board[index][1] == call:
+                    del board[index]
+
+    def compact(self):
+        """Drop deactivated and finished services, and the calls of schedules
+        since re-sent, from the columns.
+        """
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        day, minutes = _now()
+        now = day * MINUTES_PER_DAY + minutes
+        services = [service for service in range(len(self.rids))
+                    if not self.service_flags[service] & DEACTIVATED and self._ends_at(service) + PAST_MINUTES >= now]
+        previous = {name: getattr(self, name) for name in _SERVICE_COLUMNS + _CALL_COLUMNS}
+        calls = len(self.call_stations)
+        self._clear()
+
+        for service in services:
+            new_service = self._services[previous['rids'][service]] = len(self.rids)
+            for name in _SERVICE_COLUMNS:
+                getattr(self, name).append(previous[name][service])
+            first = previous['first_calls'][service]
+            self.first_calls[new_service] = len(self.call_stations)
+            for call in range(first, first + previous['call_counts'][service]):
+                for name in _CALL_COLUMNS:
+                    getattr(self, name).append(previous[name][call])
+                self.call_services[-1] = new_service
+
+        for service in range(len(self.rids)):
+            first = self.first_calls[service]
+            for call in range(first, first + self.call_counts[service] - 1):
+                if self.scheduled_departures[call] != NO_TIME:
+                    self.boards.setdefault(self.call_stations[call], []).append((self.scheduled_departures[call],
+                                                                                  call))
+        for board in self.boards.values():
+            board.sort()
+
+        self._compacted_at = time.time()
+        logger.debug('Compacted live state from {} to {} calls'.format(calls, len(self.call_stations)))
+
+    def _ends_at(self, service):
+        """When the service's last call is, as expected where there's a
+        forecast, in minutes since midnight of date ordinal zero.
+        """
+        last = self.first_calls[service] + self.call_counts[service] - 1
+        end = max(self.scheduled_arrivals[last], self.scheduled_departures[last], self.expected_arrivals[last])
+        return self.service_days[service] * MINUTES_PER_DAY + end
+
+    # ----------------------------- Queries -----------------------------
+
+    def departures(self, origin_crs, destination_crs=None, after=0, window=120, limit=10):
+        """Return up to `limit` DepartureInfos from `origin_crs` in the
+        `window` minutes from `after`, optionally only those later calling at
+        `destination_crs`, in scheduled order as OpenLDBWS boards are.
+        """
+        with self._lock:
+            return [self._departure_info(call) for call, _ in self._matching(origin_crs, destination_crs, after,
+                                                                             window, limit)]
+
+    def fastest_departure(self, origin_crs, destination_crs, after=0, window=120):
+        """Return the departure in the window expected to reach
+        `destination_crs` soonest, or None.
+        """
+        with self._lock:
+            running = [(arrival, call) for call, arrival in self._matching(origin_crs, destination_crs, after, window)
+                       if not self.service_flags[self.call_services[call]] & CANCELLED]
+            if not running:
+                return None
+            return self._departure_info(min(running)[1])
+
+    def expected_departure(self, origin_crs, destination_crs, std, operator, final_dest):
+        """Return the live etd of a particular departure, or None if the
+        service isn't known.
+        """
+        scheduled = _parse_time(std)
+        with self._lock:
+            for call, _ in self._matching(origin_crs, destination_crs, scheduled, 0):
+                service = self.call_services[call]
+                if self.operators[service] == operator and self.destinations[service] == final_dest:
+                    return self._etd(call)
+        return None
+
+    def covers(self, crs):
+        return bool(self.boards.get(crs))
+
+    def _matching(self, origin_crs, destination_crs, after, window, limit=None):
+        """Yield (call, expected arrival at the destination) for departures
+        from `origin_crs` between `after` and `after + window`, including
+        those of services that started the previous day.
+        """
+        board = self.boards.get(origin_crs)
+        if not board:
+            return
+        today = _now()[0]
+        found = 0
+        for start, day in ((after, today), (after + MINUTES_PER_DAY, today - 1)):
+            first = bisect.bisect_left(board, (start,))
+            last = bisect.bisect_right(board, (start + window, float('inf')))
+            for _, call in board[first:last]:
+                if self.service_days[self.call_services[call]] != day:
+                    continue
+                arrival = self._arrival_at(call, destination_crs) if destination_crs else None
+                if destination_crs and arrival is None:
+                    continue
+                yield call, arrival
+                found += 1
+                if limit is not None and found >= limit:
+                    return
+
+    def _arrival_at(self, call, destination_crs):
+        service = self.call_services[call]
+        end = self.first_calls[service] + self.call_counts[service]
+        for later in range(call + 1, end):
+            if self.call_stations[later] == destination_crs and self.scheduled_arrivals[later] != NO_TIME:
+                expected = self.expected_arrivals[later]
+                return expected if expected != NO_TIME else self.scheduled_arrivals[later]
+        return None
+
+    def _departure_info(self, call):
+        service = self.call_services[call]
+        return DepartureInfo(_format_time(self.scheduled_departures[call]),
+                             self._etd(call),
+                             self.operators[service],
+                             self.destinations[service],
+                             in_past=False,
+                             live=True)
+
+    def _etd(self, call):
+        # As OpenLDBWS reports them
+        if self.service_flags[self.call_services[call]] & CANCELLED:
+            return 'Cancelled'
+        if self.call_flags[call] & DELAYED:
+            return 'Delayed'
+        expected = self.expected_departures[call]
+        if expected == NO_TIME or expected == self.scheduled_departures[call]:
+            return 'On time'
+        return _format_time(expected)
+
+    def __len__(self):
+        return len(self._services)
+
+
+# The columns _compact copies across, besides the indices it renumbers
+_SERVICE_COLUMNS = ('rids', 'service_days', 'operators', 'destinations', 'service_flags', 'first_calls',
+                    'call_counts')
+_CALL_COLUMNS = ('call_stations', 'scheduled_arrivals', 'scheduled_departures', 'expected_arrivals',
+                 'expected_departures', 'call_flags', 'call_services')
+
+
+# ----------------------------- Stream -----------------------------
+
+def open_stream(source):
+    """Yield the lines of a stream - a file path, or tcp://host:port."""
+    if source.startswith('tcp://'):
+        import socket
+
+        host, port = source[len('tcp://'):].rsplit(':', 1)
+        with socket.create_connection((host, int(port))) as connection:
+            with connection.makefile('rb') as stream:
+                yield from stream
+    else:
+        with open(source, 'rb') as stream:
+            yield from stream
+
+
+def consume(state, source):
+    """Feed `state` from `source` until it ends. Sockets are reconnected
+    whenever they drop, files are read once.
+    """
+    while True:
+        try:
+            count = state.ingest(open_stream(source))
+            logger.info('Live state stream {} ended after {} messages'.format(source, count))
+        except (IOError, OSError) as err:
+            logger.warning('Live state stream {} failed: {}'.format(source, err))
+        if not source.startswith('tcp://'):
+            return
+        time.sleep(RECONNECT_SECONDS)
+
+
+def is_configured():
+    return bool(environ.get('LIVE_STATE_STREAM'))
+
+
+def get_live_state():
+    """Return the container-wide live state, starting the stream consumer on
+    first use.
+    """
+    global _live_state, _consumer
+    if _live_state is None:
+        _live_state = LiveState()
+        _consumer = threading.Thread(target=consume, args=(_live_state, environ['LIVE_STATE_STREAM']),
+                                     name='live-state', daemon=True)
+        _consumer.start()
+    return _live_state
+
+
+def is_available():
+    """Whether queries can be answered locally - the stream is configured and
+    has delivered a message recently.
+    """
+    if not is_configured():
+        return False
+    last_message_at = get_live_state().last_message_at
+    return last_message_at is not None and time.time() - last_message_at < MAX_AGE
+
+
+def _now():
+    """Today's date ordinal, and minutes since midnight."""
+    now = datetime.now()
+    return now.toordinal(), now.hour * 60 + now.minute
+
+
+def _parse_time(value):
+    if not value:
+        return NO_TIME
+    try:
+        hours, minutes = value.split(':')[:2]
+        return int(hours) * 60 + int(minutes)
+    except ValueError:
+        return NO_TIME
+
+
+def _service_minutes(value, previous):
+    """Minutes from the start of the service day, rolling over midnight."""
+    minutes = _parse_time(value)
+    if minutes == NO_TIME:
+        return NO_TIME
+    while minutes < previous - MINUTES_PER_DAY // 2:
+        minutes += MINUTES_PER_DAY
+    return minutes
+
+
+def _format_time(minutes):
+    minutes %= MINUTES_PER_DAY
+    return '{:02d}:{:02d}'.format(minutes // 60, minutes % 60)
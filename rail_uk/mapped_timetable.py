@@ -0,0 +1,334 @@
+"""Memory-mapped columnar timetable file.
+
+A Timetable built from a national GTFS extract takes seconds and hundreds
+of megabytes to load, so it is instead written offline to a compact binary
+file shipped in res/. Opening the file only maps it: each query pages in
+just the columns for the origin it touches, read in place through typed
+memoryviews.
+
+    python -m rail_uk.mapped_timetable gtfs.zip res/timetable.bin
+
+Layout (little-endian): a header, a table of section offsets, then one
+8-byte-aligned typed array per section. Stations are numbered in
+stations.csv registry order, followed by any the registry lacks.
+"""
+from datetime import date
+from os import environ
+import bisect
+import logging
+import struct
+import sys
+import time
+
+from rail_uk.timetable import MINUTES_PER_DAY, ScheduledDeparture
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'RUKT'
+VERSION = 2
+HEADER = struct.Struct('<4sHHIIIIIII')
+# Set on a stop's station index if the trip does not set down there
+NO_SET_DOWN = 0x8000
+
+# (name, array typecode) in file order
+SECTIONS = (
+    ('station_codes', 'I'),     # string index per station
+    ('station_names', 'I'),     # string index per station
+    ('origin_offsets', 'I'),    # per station, into the departure columns
+    ('departure_times', 'H'),   # minutes from the start of the service day
+    ('departure_trips', 'I'),
+    ('departure_positions', 'H'),
+    ('reach_offsets', 'I'),     # per station, into reach_stations
+    ('reach_stations', 'H'),    # sorted stations reachable without changing
+    ('trip_services', 'I'),
+    ('trip_operators', 'I'),    # string index per trip
+    ('trip_ids', 'I'),          # string index per trip
+    ('stop_offsets', 'I'),      # per trip, into stop_stations
+    ('stop_stations', 'H'),
+    ('days_run', 'B'),          # day_bytes per service, bit n for feed day n
+    ('connection_departure_times', 'H'),    # journey.Connections, sorted by departure
+    ('connection_arrival_times', 'H'),
+    ('connection_departure_stations', 'H'),
+    ('connection_arrival_stations', 'H'),
+    ('connection_trips', 'I'),
+    ('connection_flags', 'B'),
+    ('string_offsets', 'I'),
+    ('strings', 'B')            # utf-8
+)
+
+
+class MappedTimetable:
+    """Answers the same queries as timetable.Timetable, from a mapped file."""
+
+    def __init__(self, path):
+        import mmap
+
+        if sys.byteorder != 'little':
+            raise ValueError('Mapped timetables can only be read on little-endian hosts')
+        self.path = path
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._map)
+
+        (magic, version, _, feed_start, day_bytes, station_count, trip_count, service_count,
+         _, _) = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a version {} timetable file'.format(path, VERSION))
+        self.feed_start = date.fromordinal(feed_start)
+        self.day_bytes = day_bytes
+        self.trip_count = trip_count
+        self.service_count = service_count
+
+        table_offset = HEADER.size
+        for index, (name, typecode) in enumerate(SECTIONS):
+            start, end = struct.unpack_from('<II', self._map, table_offset + index * 8)
+            setattr(self, '_' + name, view[start:end].cast(typecode))
+
+        self._codes = [self._string(code) for code in self._station_codes]
+        self._stations = {code: index for index, code in enumerate(self._codes)}
+
+    # ----------------------------- Queries -----------------------------
+
+    def departures_from(self, origin_crs, day, destination_crs=None, after=0, before=None):
+        for departure_time, trip in self._matching(origin_crs, day, destination_crs, after, before):
+            yield self._scheduled_departure(departure_time, trip)
+
+    def next_departure(self, origin_crs, destination_crs, day, after=0):
+        return next(self.departures_from(origin_crs, day, destination_crs, after), None)
+
+    def last_departure(self, origin_crs, destination_crs, day, before=None):
+        match = next(self._matching(origin_crs, day, destination_crs, 0, before, reverse=True), None)
+        if match is None:
+            return None
+        return self._scheduled_departure(*match)
+
+    def _matching(self, origin_crs, day, destination_crs, after, before, reverse=False):
+        origin = self._stations.get(origin_crs)
+        offset = (day - self.feed_start).days
+        if origin is None or offset < 0 or offset >= self.day_bytes * 8:
+            return
+        destination = None
+        if destination_crs is not None:
+            destination = self._stations.get(destination_crs)
+            if destination is None or not self._reaches(origin, destination):
+                return
+
+        # The origin's departures are a contiguous, time-sorted run of the
+        # departure columns, so the window is found by bisection in place
+        first, last = self._origin_offsets[origin], self._origin_offsets[origin + 1]
+        times = self._departure_times[first:last]
+        start = bisect.bisect_left(times, after)
+        end = len(times) if before is None else bisect.bisect_right(times, before)
+        positions = range(end - 1, start - 1, -1) if reverse else range(start, end)
+
+        day_byte, day_bit = offset // 8, 1 << (offset % 8)
+        for index in positions:
+            trip = self._departure_trips[first + index]
+            if not self._days_run[self._trip_services[trip] * self.day_bytes + day_byte] & day_bit:
+                continue
+            if destination is not None and not self._calls_after(trip, self._departure_positions[first + index],
+                                                                 destination):
+                continue
+            yield times[index], trip
+
+    def _reaches(self, origin, destination):
+        reachable = self._reach_stations[self._reach_offsets[origin]:self._reach_offsets[origin + 1]]
+        index = bisect.bisect_left(reachable, destination)
+        return index < len(reachable) and reachable[index] == destination
+
+    def _calls_after(self, trip, position, destination):
+        start, end = self._stop_offsets[trip], self._stop_offsets[trip + 1]
+        for stop in self._stop_stations[start + position + 1:end]:
+            if stop == destination:
+                return True
+        return False
+
+    def _scheduled_departure(self, departure_time, trip):
+        minutes = departure_time % MINUTES_PER_DAY
+        final_station = self._stop_stations[self._stop_offsets[trip + 1] - 1] & ~NO_SET_DOWN
+        return ScheduledDeparture('{:02d}:{:02d}'.format(minutes // 60, minutes % 60),
+                                  self._string(self._trip_operators[trip]),
+                                  self._string(self._station_names[final_station]),
+                                  self._string(self._trip_ids[trip]))
+
+    # ----------------------------- Journey Planning -----------------------------
+
+    def connections(self):
+        from rail_uk.journey import Connections
+
+        return Connections(self._codes, self._connection_departure_times, self._connection_arrival_times,
+                           self._connection_departure_stations, self._connection_arrival_stations,
+                           self._connection_trips, self._connection_flags)
+
+    def running_trips(self, day):
+        offset = (day - self.feed_start).days
+        if offset < 0 or offset >= self.day_bytes * 8:
+            return None
+        day_byte, day_bit = offset // 8, 1 << (offset % 8)
+        services = [1 if self._days_run[service * self.day_bytes + day_byte] & day_bit else 0
+                    for service in range(self.service_count)]
+        return bytearray(services[service] for service in self._trip_services)
+
+    def scheduled_departure(self, trip_index, departure_time):
+        return self._scheduled_departure(departure_time, trip_index)
+
+    def reachable_from(self, origin_crs):
+        origin = self._stations.get(origin_crs)
+        if origin is None:
+            return ()
+        return {self._codes[station]
+                for station in self._reach_stations[self._reach_offsets[origin]:self._reach_offsets[origin + 1]]}
+
+    def _string(self, index):
+        return bytes(self._strings[self._string_offsets[index]:self._string_offsets[index + 1]]).decode('utf-8')
+
+    def close(self):
+        for name, _ in SECTIONS:
+            getattr(self, '_' + name).release()
+        self._map.close()
+
+    def __len__(self):
+        return self.trip_count
+
+
+def open_timetable(path):
+    start = time.time()
+    timetable = MappedTimetable(path)
+    logger.info('Mapped {} trips from {} in {:.1f}ms'.format(len(timetable), path, (time.time() - start) * 1000))
+    return timetable
+
+
+def is_mapped_file(path):
+    try:
+        with open(path, 'rb') as file:
+            return file.read(len(MAGIC)) == MAGIC
+    except (IsADirectoryError, FileNotFoundError):
+        return False
+
+
+# ----------------------------- Building -----------------------------
+
+def write(timetable, path):
+    """Write a timetable.Timetable to `path` in the mapped format."""
+    from array import array
+    from rail_uk import stations
+
+    # Station numbering follows the registry, then any stations it lacks
+    names = {}
+    for trip in timetable.trips:
+        names.setdefault(trip.stops[-1], trip.final_dest)
+    codes = [station.crs for station in stations.get_station_registry().values()]
+    known = set(codes)
+    codes.extend(sorted((set(timetable.departures) | set(names)) - known))
+    if len(codes) >= NO_SET_DOWN:
+        raise ValueError('Too many stations for the mapped format: {}'.format(len(codes)))
+    station_index = {crs: index for index, crs in enumerate(codes)}
+
+    strings = _StringTable()
+    station = stations.get_station
+    columns = {name: array(typecode) for name, typecode in SECTIONS}
+    columns['station_codes'].extend(strings.add(crs) for crs in codes)
+    columns['station_names'].extend(strings.add(names.get(crs) or (station(crs).name if station(crs) else crs))
+                                    for crs in codes)
+
+    for crs in codes:
+        columns['origin_offsets'].append(len(columns['departure_times']))
+        columns['reach_offsets'].append(len(columns['reach_stations']))
+        for departure_time, trip_index, position in timetable.departures.get(crs, ()):
+            columns['departure_times'].append(departure_time)
+            columns['departure_trips'].append(trip_index)
+            columns['departure_positions'].append(position)
+        columns['reach_stations'].extend(sorted(station_index[destination]
+                                                for destination in timetable.reachable.get(crs, ())))
+    columns['origin_offsets'].append(len(columns['departure_times']))
+    columns['reach_offsets'].append(len(columns['reach_stations']))
+
+    for trip in timetable.trips:
+        columns['trip_services'].append(trip.service)
+        columns['trip_operators'].append(strings.add(trip.operator))
+        columns['trip_ids'].append(strings.add(trip.trip_id))
+        columns['stop_offsets'].append(len(columns['stop_stations']))
+        for position, crs in enumerate(trip.stops):
+            sets_down = trip.calling_at.get(crs) == position
+            columns['stop_stations'].append(station_index[crs] | (0 if sets_down else NO_SET_DOWN))
+    columns['stop_offsets'].append(len(columns['stop_stations']))
+
+    connections = timetable.connections()
+    renumbered = [station_index[crs] for crs in connections.stations]
+    columns['connection_departure_times'].extend(connections.departure_times)
+    columns['connection_arrival_times'].extend(connections.arrival_times)
+    columns['connection_departure_stations'].extend(renumbered[station] for station in connections.departure_stations)
+    columns['connection_arrival_stations'].extend(renumbered[station] for station in connections.arrival_stations)
+    columns['connection_trips'].extend(connections.trips)
+    columns['connection_flags'].extend(connections.flags)
+
+    day_bytes = max((bitmap.bit_length() for bitmap in timetable.days_run), default=0) // 8 + 1
+    for bitmap in timetable.days_run:
+        columns['days_run'].frombytes(bitmap.to_bytes(day_bytes, 'little'))
+    columns['string_offsets'], columns['strings'] = strings.columns()
+
+    feed_start = timetable.feed_start.toordinal() if timetable.feed_start else 0
+    header = HEADER.pack(MAGIC, VERSION, 0, feed_start, day_bytes, len(codes), len(timetable.trips),
+                         len(timetable.days_run), len(columns['departure_times']), len(columns['stop_stations']))
+    offset = _align(len(header) + len(SECTIONS) * 8)
+    table, blobs = [], []
+    for name, _ in SECTIONS:
+        column = columns[name]
+        if sys.byteorder != 'little':
+            column.byteswap()
+        blob = column.tobytes()
+        table.append(struct.pack('<II', offset, offset + len(blob)))
+        blobs.append(blob + b'\0' * (_align(len(blob)) - len(blob)))
+        offset += _align(len(blob))
+
+    with open(path, 'wb') as file:
+        file.write(header)
+        file.write(b''.join(table))
+        file.write(b'\0' * (_align(file.tell()) - file.tell()))
+        for blob in blobs:
+            file.write(blob)
+    return path
+
+
+class _StringTable:
+
+    def __init__(self):
+        self._indexes = {}
+        self._strings = []
+
+    def add(self, text):
+        index = self._indexes.get(text)
+        if index is None:
+            index = self._indexes[text] = len(self._strings)
+            self._strings.append(text.encode('utf-8'))
+        return index
+
+    def columns(self):
+        from array import array
+
+        offsets = array('I', [0])
+        for encoded in self._strings:
+            offsets.append(offsets[-1] + len(encoded))
+        return offsets, array('B', b''.join(self._strings))
+
+
+def _align(size):
+    return (size + 7) & ~7
+
+
+def main(argv=None):
+    import argparse
+    from rail_uk import timetable
+
+    parser = argparse.ArgumentParser(description='Build a mapped timetable file from a GTFS extract')
+    parser.add_argument('feed', help='GTFS extract (.zip or directory)')
+    parser.add_argument('output', nargs='?', default=environ.get('TIMETABLE_FILE') or 'res/timetable.bin')
+    args = parser.parse_args(argv)
+
+    write(timetable.load(args.feed), args.output)
+    print('Mapped timetable written to ' + args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
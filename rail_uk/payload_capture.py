@@ -0,0 +1,88 @@
+from os import environ
+import logging
+import random
+import re
+import threading
+
+# Sampled captures are written here, so that they are emitted even when the
+# skill's own loggers are quieter than DEBUG.
+capture_logger = logging.getLogger('rail_uk.payloads')
+capture_logger.setLevel(logging.INFO)
+
+SECRET_ENV_VARS = ('OPEN_LDBWS_ACCESS_TOKEN', 'TRANSPORT_API_APP_ID', 'TRANSPORT_API_KEY')
+SECRET_PATTERNS = (
+    re.compile(r'(<(?:\w+:)?TokenValue>)[^<]*(</)'),
+    re.compile(r'(\bapp_(?:id|key)=)[^&\s"\']*()'),
+    re.compile(r'(["\']app_(?:id|key)["\']\s*:\s*["\'])[^"\']*()')
+)
+REDACTED = '[REDACTED]'
+
+_local = threading.local()
+
+
+def get_sample_rate():
+    return float(environ.get('PAYLOAD_SAMPLE_RATE', 0))
+
+
+def get_capture_limit():
+    return int(environ.get('PAYLOAD_CAPTURE_LIMIT', 4096))
+
+
+def start_request():
+    """Decide once per invocation whether its payloads are captured, so that a
+    sampled request is captured in full rather than piecemeal.
+    """
+    rate = get_sample_rate()
+    _local.sampled = rate > 0 and random.random() < rate
+
+
+def is_sampled():
+    return getattr(_local, 'sampled', False)
+
+
+def is_wanted(source_logger):
+    """Whether a payload logged to `source_logger` would be written - for
+    callers that would otherwise never hold the whole payload.
+    """
+    return source_logger.isEnabledFor(logging.DEBUG) or is_sampled()
+
+
+def log_payload(source_logger, label, payload):
+    """Log an upstream payload at DEBUG, or capture it if this request was
+    sampled. `payload` may be a callable, in which case it is only evaluated
+    (and any formatting paid for) when the payload is actually written.
+    """
+    if not is_wanted(source_logger):
+        return
+    debug_enabled = source_logger.isEnabledFor(logging.DEBUG)
+
+    if callable(payload):
+        payload = payload()
+    text = truncate(redact(_to_text(payload)), get_capture_limit())
+
+    if debug_enabled:
+        source_logger.debug('%s: \n%s', label, text)
+    else:
+        capture_logger.info('[%s] %s: \n%s', source_logger.name, label, text)
+
+
+def redact(text):
+    for var in SECRET_ENV_VARS:
+        secret = environ.get(var)
+        if secret:
+            text = text.replace(secret, REDACTED)
+    for pattern in SECRET_PATTERNS:
+        text = pattern.sub(r'\g<1>' + REDACTED + r'\g<2>', text)
+    return text
+
+
+def truncate(text, limit):
+    if len(text) <= limit:
+        return text
+    return '{}... [{} characters truncated]'.format(text[:limit], len(text) - limit)
+
+
+def _to_text(payload):
+    if isinstance(payload, bytes):
+        return payload.decode('utf-8', errors='replace')
+    return str(payload)
@@ -0,0 +1,222 @@
+"""Commute-time prefetching of departure boards.
+
+Most NextTrain queries are from users' home stations, in the same morning and
+evening peaks. Shortly before each peak (PREFETCH_LEAD minutes) and
+repeatedly during it, this job fetches the boards for the routes users have
+recently asked about from their home stations into the board cache, so that
+peak-hour queries are answered without waiting on OpenLDBWS.
+
+Routes are learned from the query history in PREFETCH_HISTORY (as written by
+rail_uk/query_log.py and collected from every container), kept to those from
+a home station in the RailUK table, and grouped by origin. In Lambda, with
+QUERY_LOG='stdout', the history defaults to the function's own CloudWatch
+Logs group. Boards are then fetched on PREFETCH_CONCURRENCY threads, one
+origin per thread at a time.
+
+A self-hosted server (see rail_uk/server.py) runs the job every
+PREFETCH_INTERVAL seconds when PREFETCH_ENABLED is 'true'. In Lambda, a
+scheduled event of {"prefetch": true} runs it once, filling the cache of
+whichever container receives it.
+"""
+from collections import Counter
+from datetime import datetime
+from os import environ
+import logging
+import threading
+import time
+
+from rail_uk.dtos import APIParameters, Station
+
+logger = logging.getLogger(__name__)
+
+# Local times of the peaks, as comma-separated HH:MM-HH:MM ranges
+PEAKS = environ.get('PREFETCH_PEAKS', '07:00-09:30,16:30-19:00')
+LEAD_MINUTES = int(environ.get('PREFETCH_LEAD', 15))
+INTERVAL = float(environ.get('PREFETCH_INTERVAL', 45))
+CONCURRENCY = int(environ.get('PREFETCH_CONCURRENCY', 4))
+# Days of history routes are learned from, and how many are kept
+HISTORY_DAYS = 14
+MAX_ROUTES = 200
+# Seconds the learned routes are reused for before the history is re-read
+ROUTES_MAX_AGE = 15 * 60
+# Seconds the home stations are reused for before the table is scanned again
+HOMES_MAX_AGE = 6 * 60 * 60
+
+_routes = None
+_routes_loaded_at = None
+_homes = None
+_homes_loaded_at = None
+_scheduler = None
+
+
+def is_enabled():
+    return environ.get('PREFETCH_ENABLED', 'false').lower() == 'true'
+
+
+def is_prefetch_event(event):
+    return isinstance(event, dict) and 'session' not in event and event.get('prefetch') is True
+
+
+def parse_peaks(spec):
+    """Parse 'HH:MM-HH:MM,...' into (start, end) minutes from midnight."""
+    peaks = []
+    for window in filter(None, (part.strip() for part in spec.split(','))):
+        start, end = (_parse_minutes(time_string) for time_string in window.split('-'))
+        peaks.append((start, end))
+    return peaks
+
+
+def is_active(now, peaks, lead=LEAD_MINUTES):
+    """Whether `now` is during a peak, or within `lead` minutes before one."""
+    minutes = now.hour * 60 + now.minute
+    return any(start - lead <= minutes < end for start, end in peaks)
+
+
+def select_routes(queries, homes, peaks, max_routes=MAX_ROUTES):
+    """Return the most asked-about NextTrain routes during `peaks`, as
+    {origin: [(destination, offset)]}. With `homes`, a set of station codes,
+    only routes from a home station are kept.
+    """
+    counts = Counter()
+    for query in queries:
+        if query.intent != 'NextTrain':
+            continue
+        if homes is not None and query.origin not in homes:
+            continue
+        if not is_active(datetime.fromtimestamp(query.at), peaks, lead=0):
+            continue
+        counts[(query.origin, query.destination, query.offset)] += 1
+
+    routes = {}
+    for (origin, destination, offset), _ in counts.most_common(max_routes):
+        routes.setdefault(origin, []).append((destination, offset))
+    return routes
+
+
+def get_history():
+    """Where the query history is read from, or '' if there's none."""
+    from rail_uk import query_log
+
+    history = environ.get('PREFETCH_HISTORY') or query_log.get_destination()
+    if history == 'stdout':
+        # Lambda collects stdout into the function's log group
+        log_group = environ.get('AWS_LAMBDA_LOG_GROUP_NAME')
+        return query_log.CLOUDWATCH + log_group if log_group else ''
+    return history
+
+
+def get_homes(now=None):
+    """Return the home stations' codes, scanning the RailUK table at most
+    every HOMES_MAX_AGE seconds, or None if they have never been read.
+    """
+    from rail_uk import dynamodb
+
+    global _homes, _homes_loaded_at
+    now = time.time() if now is None else now
+    if _homes is None or now - _homes_loaded_at > HOMES_MAX_AGE:
+        try:
+            _homes = {home.station.crs for home in dynamodb.get_home_stations()}
+            _homes_loaded_at = now
+        except Exception:
+            logger.exception('Could not read home stations')
+    return _homes
+
+
+def load_routes(now=None):
+    from rail_uk import query_log
+
+    now = time.time() if now is None else now
+    history = get_history()
+    if not history:
+        logger.warning('No query history to prefetch from')
+        return {}
+
+    homes = get_homes(now)
+    if homes is None:
+        logger.warning('No home stations, prefetching every peak route')
+    try:
+        queries = list(query_log.read_history(history, since=now - HISTORY_DAYS * 24 * 60 * 60))
+    except Exception:
+        logger.exception('Could not read query history')
+        return {}
+    return select_routes(queries, homes, parse_peaks(PEAKS))
+
+
+def get_routes():
+    global _routes, _routes_loaded_at
+    if _routes is None or time.time() - _routes_loaded_at > ROUTES_MAX_AGE:
+        _routes = load_routes()
+        _routes_loaded_at = time.time()
+        logger.info('Prefetching {} route(s) from {} origin(s)'.format(
+            sum(len(destinations) for destinations in _routes.values()), len(_routes)))
+    return _routes
+
+
+def prefetch(routes, concurrency=CONCURRENCY):
+    """Fetch every route's board into the board cache, returning how many
+    were fetched and how many failed.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from rail_uk import data, quota, stations
+
+    def fetch_origin(origin, destinations):
+        fetched = failed = 0
+        for destination, offset in destinations:
+            params = APIParameters(stations.get_station(origin) or Station(origin, origin),
+                                   stations.get_station(destination) or Station(destination, destination), offset)
+            try:
+                with quota.priority(quota.BACKGROUND):
+                    data.get_departure_board(params, refresh=True)
+                fetched += 1
+            except Exception:
+                logger.warning('Could not prefetch {} to {}'.format(origin, destination), exc_info=True)
+                failed += 1
+        return fetched, failed
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='prefetch') as executor:
+        outcomes = list(executor.map(lambda route: fetch_origin(*route), routes.items()))
+    return {'fetched': sum(fetched for fetched, _ in outcomes), 'failed': sum(failed for _, failed in outcomes)}
+
+
+def run(now=None):
+    """Prefetch every route if a peak is near or under way."""
+    now = datetime.now() if now is None else now
+    if not is_active(now, parse_peaks(PEAKS)):
+        logger.debug('Outside peak hours, not prefetching')
+        return {'fetched': 0, 'failed': 0}
+    start = time.time()
+    result = prefetch(get_routes())
+    logger.info('Prefetched {fetched} board(s), {failed} failed, in {ms:.0f}ms'.format(
+        ms=(time.time() - start) * 1000, **result))
+    return result
+
+
+def handle(event):
+    logger.info('Prefetch event received from: {}'.format(event.get('source', 'unknown')))
+    return run()
+
+
+def start_scheduler(interval=INTERVAL):
+    """Run the job every `interval` seconds on a background thread, once per
+    process.
+    """
+    global _scheduler
+    if _scheduler is not None:
+        return _scheduler
+
+    def loop():
+        while True:
+            try:
+                run()
+            except Exception:
+                logger.exception('Prefetch run failed')
+            time.sleep(interval)
+
+    _scheduler = threading.Thread(target=loop, name='prefetch', daemon=True)
+    _scheduler.start()
+    return _scheduler
+
+
+def _parse_minutes(value):
+    hours, minutes = value.strip().split(':')
+    return int(hours) * 60 + int(minutes)
@@ -0,0 +1,145 @@
+from contextlib import contextmanager
+from os import environ, path
+import io
+import json
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Profiles are written here, so that they are emitted even when the skill's
+# own loggers are quieter than INFO.
+profile_logger = logging.getLogger('rail_uk.profiles')
+profile_logger.setLevel(logging.INFO)
+
+# Functions whose cumulative time is reported as upstream latency
+UPSTREAM_FUNCTIONS = ('get_home_station', 'set_home_station', 'make_soap_request', 'get_timetable')
+
+# cProfile and tracemalloc are process-wide, so a threaded server profiles one
+# request at a time
+_profile_lock = threading.Lock()
+
+
+def get_sample_rate():
+    return float(environ.get('PROFILE_SAMPLE_RATE', 0))
+
+
+def is_selected():
+    rate = get_sample_rate()
+    return rate > 0 and random.random() < rate
+
+
+@contextmanager
+def profile_invocation(event):
+    """Profile the wrapped invocation with cProfile and tracemalloc if it is
+    selected by PROFILE_SAMPLE_RATE. The summary is written to the log, or to
+    the directory named by PROFILE_OUTPUT (e.g. /tmp) along with the raw
+    cProfile stats. An invocation selected while another is being profiled
+    isn't profiled.
+    """
+    if not is_selected():
+        yield
+        return
+    if not _profile_lock.acquire(blocking=False):
+        logger.debug('Another invocation is being profiled')
+        yield
+        return
+
+    try:
+        with _profile(event):
+            yield
+    finally:
+        _profile_lock.release()
+
+
+@contextmanager
+def _profile(event):
+    import cProfile
+    import tracemalloc
+
+    trace_memory = environ.get('PROFILE_MEMORY', 'true').lower() == 'true'
+    # Leave tracing to whatever started it, e.g. a benchmark
+    start_tracing = trace_memory and not tracemalloc.is_tracing()
+    if start_tracing:
+        tracemalloc.start()
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        duration_ms = (time.perf_counter() - start) * 1000
+        try:
+            snapshot = tracemalloc.take_snapshot() if trace_memory else None
+            _write_profile(_get_intent_name(event), duration_ms, profiler, snapshot)
+        except Exception:
+            logger.exception('Failed to write profile')
+        finally:
+            if start_tracing:
+                tracemalloc.stop()
+
+
+def summarise(intent_name, duration_ms, profiler, snapshot=None, top_n=None):
+    import pstats
+
+    if top_n is None:
+        top_n = int(environ.get('PROFILE_TOP_N', 20))
+
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    # (file, line, function) -> (primitive calls, total calls, own time, cumulative time, callers)
+    entries = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+
+    upstream_ms = {}
+    for (_, _, function), (_, _, _, cumulative, _) in entries:
+        if function in UPSTREAM_FUNCTIONS:
+            upstream_ms[function] = round(upstream_ms.get(function, 0) + cumulative * 1000, 3)
+
+    summary = {
+        'intent': intent_name,
+        'duration_ms': round(duration_ms, 3),
+        'upstream_ms': upstream_ms,
+        'top_calls': [
+            {
+                'function': '{}:{}({})'.format(file_name, line, function),
+                'calls': calls,
+                'own_ms': round(own_time * 1000, 3),
+                'cumulative_ms': round(cumulative * 1000, 3)
+            }
+            for (file_name, line, function), (_, calls, own_time, cumulative, _) in entries[:top_n]
+        ]
+    }
+
+    if snapshot is not None:
+        summary['top_allocations'] = [
+            {
+                'location': str(stat.traceback),
+                'size_kb': round(stat.size / 1024, 3),
+                'count': stat.count
+            }
+            for stat in snapshot.statistics('lineno')[:top_n]
+        ]
+
+    return summary
+
+
+def _write_profile(intent_name, duration_ms, profiler, snapshot):
+    summary = summarise(intent_name, duration_ms, profiler, snapshot)
+    output = environ.get('PROFILE_OUTPUT', 'log')
+
+    if output == 'log':
+        profile_logger.info('Invocation profile: %s', json.dumps(summary))
+        return
+
+    file_stem = path.join(output, 'profile-{}-{}'.format(intent_name, int(time.time() * 1000)))
+    profiler.dump_stats(file_stem + '.prof')
+    with open(file_stem + '.json', 'w') as file:
+        json.dump(summary, file, indent=2)
+    profile_logger.info('Invocation profile written to %s.json', file_stem)
+
+
+def _get_intent_name(event):
+    request = event.get('request', {})
+    return request.get('intent', {}).get('name', request.get('type', 'Unknown'))
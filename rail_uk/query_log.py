@@ -0,0 +1,125 @@
+"""History of the departure queries the skill has answered.
+
+Each query is written as one JSON line to QUERY_LOG - a file path, or
+'stdout' to emit it alongside the metric lines for the log pipeline to
+collect from every container:
+
+    {"query": {"at": 1551470700, "intent": "NextTrain", "origin": "HTX", "destination": "TTX", "offset": 10}}
+
+Every minute or so the container's heavy-hitter summary of the busiest
+routes (see rail_uk/heavy_hitters.py) is written along with a query, or by
+`flush` between invocations and as a server worker stops. Nothing is logged
+when QUERY_LOG is unset, including the summaries. The prefetch job reads the
+history back to learn which routes are asked for, and when, from a file or
+from the CloudWatch Logs group that Lambda's stdout is collected into.
+"""
+from collections import namedtuple
+from os import environ
+import json
+import sys
+import threading
+import time
+
+from rail_uk import heavy_hitters
+
+Query = namedtuple('Query', 'at, intent, origin, destination, offset')
+
+# Prefixes the name of a CloudWatch Logs group to read a history from
+CLOUDWATCH = 'cloudwatch://'
+
+_lock = threading.Lock()
+
+
+def get_destination():
+    return environ.get('QUERY_LOG', '')
+
+
+def record(intent, params, at=None):
+    """Count the query towards the route's heavy-hitter tracking, and log it
+    (with the tracker's summary, when a snapshot is due) if QUERY_LOG is set.
+    """
+    if params.destination is None:
+        return
+    heavy_hitters.record(params.origin.crs, params.destination.crs)
+
+    destination = get_destination()
+    if not destination:
+        return
+    at = time.time() if at is None else at
+    line = json.dumps({'query': {
+        'at': int(at),
+        'intent': intent,
+        'origin': params.origin.crs,
+        'destination': params.destination.crs,
+        'offset': int(params.offset)
+    }}) + '\n'
+    snapshot = heavy_hitters.take_snapshot(at)
+    if snapshot is not None:
+        line += json.dumps({'heavy_hitters': snapshot}) + '\n'
+    _write(destination, line)
+
+
+def flush(force=False):
+    """Write the heavy-hitter summary if QUERY_LOG is set and a snapshot is
+    due, or with `force`, if any queries have been counted since the last.
+    """
+    destination = get_destination()
+    if not destination:
+        return
+    snapshot = heavy_hitters.take_snapshot(force=force)
+    if snapshot is not None:
+        _write(destination, json.dumps({'heavy_hitters': snapshot}) + '\n')
+
+
+def _write(destination, line):
+    with _lock:
+        if destination == 'stdout':
+            sys.stdout.write(line)
+        else:
+            with open(destination, 'a') as file:
+                file.write(line)
+
+
+def read(lines, since=None):
+    """Yield each Query in `lines` (at or after `since`, if given). Anything
+    else in them, such as metric lines, is skipped.
+    """
+    for line in lines:
+        if '"query"' not in line:
+            continue
+        try:
+            query = json.loads(line)['query']
+            entry = Query(query['at'], query['intent'], query['origin'], query['destination'], query['offset'])
+        except (ValueError, KeyError, TypeError):
+            continue
+        if since is None or entry.at >= since:
+            yield entry
+
+
+def read_file(path, since=None):
+    with open(path, 'r') as file:
+        yield from read(file, since)
+
+
+def read_history(source, since=None):
+    """Yield each Query from `source`, a file path or cloudwatch://log-group."""
+    if source.startswith(CLOUDWATCH):
+        yield from read_log_group(source[len(CLOUDWATCH):], since)
+    else:
+        yield from read_file(source, since)
+
+
+def read_log_group(log_group, since=None):
+    # boto3 takes ~100ms to import, so only pay for it when the logs are read.
+    import boto3
+
+    client = boto3.client('logs', region_name=environ.get('AWS_REGION', 'eu-west-1'))
+    request = {'logGroupName': log_group, 'filterPattern': '"query"'}
+    if since is not None:
+        request['startTime'] = int(since * 1000)
+    while True:
+        response = client.filter_log_events(**request)
+        yield from read((event['message'] for event in response.get('events', [])), since)
+        if 'nextToken' not in response:
+            return
+        request['nextToken'] = response['nextToken']
@@ -0,0 +1,355 @@
+"""Request quotas of the upstream APIs.
+
+OpenLDBWS and TransportAPI both cut a client off past its request quota, and
+TransportAPI bills for every call. A provider's quota is set as
+'<requests>/<seconds>' in OPEN_LDBWS_QUOTA or TRANSPORT_API_QUOTA, and every
+request to it must first take a token from its bucket. Tokens are added at
+the quota's rate, plus QUOTA_BURST seconds' worth at the start of each
+period, and taken from a counter shared by every container, so that between
+them they never exceed the quota however traffic is spread.
+
+QUOTA_STORE selects where the counters are kept:
+
+    (unset)                   in this process only
+    dynamodb:RailUKQuota      a DynamoDB table with partition key CounterKey,
+                              and TTL enabled on its delete_at attribute
+    sqlite:/tmp/quota.sqlite  a local file, shared by the processes on one host
+
+The last QUOTA_RESERVE of the tokens added so far are kept for interactive
+requests, so that prefetching and cache refreshes (run within
+`priority(BACKGROUND)`) stop first. While a provider is into its reserve it
+is constrained, and rail_uk/data.py answers from its caches and the
+timetable where it can rather than calling it. Usage is written as a
+CloudWatch embedded-metric line per provider every QUOTA_METRICS_SECONDS.
+"""
+from contextlib import contextmanager
+from os import environ
+import json
+import logging
+import sys
+import threading
+import time
+
+from rail_uk.exceptions import QuotaExceededError
+from rail_uk import tracing
+
+logger = logging.getLogger(__name__)
+
+OPEN_LDBWS = 'openldbws'
+TRANSPORT_API = 'transportapi'
+QUOTA_VARIABLES = {OPEN_LDBWS: 'OPEN_LDBWS_QUOTA', TRANSPORT_API: 'TRANSPORT_API_QUOTA'}
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+BURST_SECONDS = float(environ.get('QUOTA_BURST', 300))
+RESERVE = float(environ.get('QUOTA_RESERVE', 0.2))
+# Tokens taken from the shared counter at a time, to spare a round trip per
+# request. Unused ones are lost with the container.
+BATCH = int(environ.get('QUOTA_BATCH', 1))
+METRICS_SECONDS = float(environ.get('QUOTA_METRICS_SECONDS', 60))
+# Seconds a container trusts the last count it read before reading it again
+COUNT_MAX_AGE = 1.0
+
+_quotas = {}
+_quotas_lock = threading.Lock()
+_store = None
+_store_lock = threading.Lock()
+_local = threading.local()
+
+
+class Quota:
+    """A provider's token bucket, whose spent tokens are counted per quota
+    period in `store`.
+    """
+
+    def __init__(self, provider, limit, period, store, burst=BURST_SECONDS, reserve=RESERVE, batch=BATCH,
+                 clock=time.time):
+        self.provider = provider
+        self.limit = limit
+        self.period = period
+        self.store = store
+        self.burst = burst
+        self.reserve = reserve
+        self.batch = max(1, batch)
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._tokens = 0
+        self._tokens_window = None
+        self._count = (None, 0, 0.0)
+        self.granted = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.denied = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._metrics_due = clock() + METRICS_SECONDS
+
+    def allowance(self, now=None):
+        """Tokens added so far this period."""
+        now = self.clock() if now is None else now
+        elapsed = now - (now // self.period) * self.period
+        return min(self.limit, self.limit * (elapsed + self.burst) / self.period)
+
+    def ceiling(self, priority, now=None):
+        allowance = self.allowance(now)
+        return allowance if priority == INTERACTIVE else allowance * (1 - self.reserve)
+
+    def acquire(self, priority=INTERACTIVE):
+        """Take a token, or raise QuotaExceededError if there are none left
+        for `priority`.
+        """
+        now = self.clock()
+        window = int(now // self.period)
+        with self._lock:
+            if self._tokens_window == window and self._tokens > 0 and \
+                    (priority == INTERACTIVE or self._count[1] < self.ceiling(priority, now)):
+                self._tokens -= 1
+                self.granted[priority] += 1
+                return
+        key = self._key(window)
+        used = self.store.add(key, self.batch, (window + 2) * self.period)
+        with self._lock:
+            if used > self.ceiling(priority, now):
+                self.denied[priority] += 1
+                self._count = (window, used - self.batch, now)
+                denied = True
+            else:
+                self._count = (window, used, now)
+                self._tokens, self._tokens_window = self.batch - 1, window
+                self.granted[priority] += 1
+                denied = False
+        if denied:
+            self.store.add(key, -self.batch, (window + 2) * self.period)
+            raise QuotaExceededError('{} quota reached ({:.0f} of {} requests per {:.0f}s)'.format(
+                self.provider, used - self.batch, self.limit, self.period))
+
+    def used(self):
+        """Tokens spent this period by every container, as last read."""
+        now = self.clock()
+        window = int(now // self.period)
+        counted_window, used, read_at = self._count
+        if counted_window != window or now - read_at > COUNT_MAX_AGE:
+            used = self.store.get(self._key(window))
+            self._count = (window, used, now)
+        return used
+
+    def is_constrained(self):
+        """Whether only interactive requests can be made."""
+        return self.used() >= self.ceiling(BACKGROUND)
+
+    def take_metrics(self):
+        """Return this provider's usage as an embedded-metric record, if one
+        is due, resetting its request counts.
+        """
+        now = self.clock()
+        if now < self._metrics_due:
+            return None
+        self._metrics_due = now + METRICS_SECONDS
+        with self._lock:
+            granted, denied = dict(self.granted), dict(self.denied)
+            for counts in (self.granted, self.denied):
+                for priority in counts:
+                    counts[priority] = 0
+        metrics = {
+            'QuotaUsed': self.used(),
+            'QuotaAllowance': round(self.allowance(now), 1),
+            'QuotaLimit': self.limit,
+            'QuotaGranted': granted[INTERACTIVE] + granted[BACKGROUND],
+            'QuotaDenied': denied[INTERACTIVE] + denied[BACKGROUND],
+            'QuotaDeniedBackground': denied[BACKGROUND]
+        }
+        record = {
+            '_aws': {
+                'Timestamp': int(now * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': tracing.NAMESPACE,
+                    'Dimensions': [['Provider']],
+                    'Metrics': [{'Name': name, 'Unit': 'Count'} for name in metrics]
+                }]
+            },
+            'Provider': self.provider
+        }
+        record.update(metrics)
+        return record
+
+    def _key(self, window):
+        return '{}|{}'.format(self.provider, window)
+
+
+# ----------------------------- Counter Stores -----------------------------
+
+class LocalStore:
+    """Counters within this process, for a single container or tests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def add(self, key, amount, delete_at):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            return self._counters[key]
+
+    def get(self, key):
+        with self._lock:
+            return self._counters.get(key, 0)
+
+
+class SqliteStore:
+    """Counters shared by the worker processes of a self-hosted server."""
+
+    def __init__(self, path):
+        import sqlite3
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS counters (counter_key TEXT PRIMARY KEY, '
+                                 'used INTEGER, delete_at REAL)')
+
+    def add(self, key, amount, delete_at):
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                self._connection.execute('INSERT OR IGNORE INTO counters VALUES (?, 0, ?)', (key, delete_at))
+                self._connection.execute('UPDATE counters SET used = used + ? WHERE counter_key = ?', (amount, key))
+                used = self._connection.execute('SELECT used FROM counters WHERE counter_key = ?',
+                                                (key,)).fetchone()[0]
+                self._connection.execute('DELETE FROM counters WHERE delete_at < ?', (time.time(),))
+            finally:
+                self._connection.execute('COMMIT')
+        return used
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute('SELECT used FROM counters WHERE counter_key = ?', (key,)).fetchone()
+        return 0 if row is None else row[0]
+
+
+class DynamoDBStore:
+
+    def __init__(self, table_name):
+        self.table_name = table_name
+        self._table = None
+
+    def get_table(self):
+        if self._table is None:
+            import boto3
+            self._table = boto3.resource('dynamodb', region_name='eu-west-1').Table(self.table_name)
+        return self._table
+
+    def add(self, key, amount, delete_at):
+        response = self.get_table().update_item(
+            Key={'CounterKey': key},
+            UpdateExpression='ADD used :amount SET delete_at = :delete_at',
+            ExpressionAttributeValues={':amount': amount, ':delete_at': int(delete_at)},
+            ReturnValues='UPDATED_NEW'
+        )
+        return int(response['Attributes']['used'])
+
+    def get(self, key):
+        item = self.get_table().get_item(Key={'CounterKey': key}, ConsistentRead=True).get('Item')
+        return 0 if item is None else int(item.get('used', 0))
+
+
+def open_store(spec):
+    if not spec:
+        return LocalStore()
+    kind, _, location = spec.partition(':')
+    if kind == 'dynamodb':
+        return DynamoDBStore(location)
+    if kind == 'sqlite':
+        return SqliteStore(location)
+    raise ValueError('Unknown quota store: ' + spec)
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = open_store(environ.get('QUOTA_STORE', ''))
+    return _store
+
+
+def set_store(store):
+    global _store
+    _store = store
+
+
+# ----------------------------- Governor -----------------------------
+
+def parse_quota(spec):
+    """Parse '<requests>/<seconds>' into (limit, period), or None if unset."""
+    if not spec:
+        return None
+    limit, _, period = spec.partition('/')
+    return int(limit), float(period or 24 * 60 * 60)
+
+
+def get_quota(provider):
+    """Return the provider's Quota, or None if it has none configured."""
+    if provider not in _quotas:
+        with _quotas_lock:
+            if provider not in _quotas:
+                parsed = parse_quota(environ.get(QUOTA_VARIABLES[provider], ''))
+                _quotas[provider] = None if parsed is None else \
+                    Quota(provider, parsed[0], parsed[1], get_store(), BURST_SECONDS, RESERVE, BATCH)
+    return _quotas[provider]
+
+
+def acquire(provider):
+    """Take a token for a request to `provider` at the current priority. If
+    the counters can't be reached, the request is let through.
+    """
+    quota = get_quota(provider)
+    if quota is None:
+        return
+    try:
+        quota.acquire(current_priority())
+    except QuotaExceededError:
+        logger.warning('{} request refused at {} priority'.format(provider, current_priority()))
+        raise
+    except Exception:
+        logger.warning('Could not count a request against the {} quota'.format(provider), exc_info=True)
+    finally:
+        try:
+            emit_metrics(quota)
+        except Exception:
+            logger.warning('Could not emit {} quota metrics'.format(provider), exc_info=True)
+
+
+def is_constrained(provider):
+    quota = get_quota(provider)
+    if quota is None:
+        return False
+    try:
+        return quota.is_constrained()
+    except Exception:
+        logger.warning('Could not read the {} quota'.format(provider), exc_info=True)
+        return False
+
+
+@contextmanager
+def priority(level):
+    """Make the requests within at `level` priority, on this thread."""
+    previous = current_priority()
+    _local.priority = level
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def current_priority():
+    return getattr(_local, 'priority', INTERACTIVE)
+
+
+def emit_metrics(quota):
+    record = quota.take_metrics()
+    if record is not None:
+        sys.stdout.write(json.dumps(record) + '\n')
+
+
+def reset():
+    """Forget every provider's quota and the store, e.g. between tests."""
+    global _store
+    with _quotas_lock:
+        _quotas.clear()
+    _store = None
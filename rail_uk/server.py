@@ -0,0 +1,422 @@
+"""Self-hosted HTTPS endpoint mode.
+
+Alexa can send requests to an HTTPS endpoint instead of a Lambda function.
+`make_app` wraps lambda_handler in a WSGI app, which `serve` runs in one or
+more worker processes, each answering requests on a fixed pool of threads.
+All of a process's threads share its caches and connection pools (compiled
+templates, the HTTP session, the station registry, timetable, journey
+planner and live state), which stay hot for as long as it runs.
+
+Before a request is handled it is passed to each validator in turn, which
+may reject it by raising InvalidRequest. By default these check the request
+timestamp and its signature, as Alexa requires of any HTTPS endpoint.
+Verifying signatures needs the `cryptography` package, which is checked for
+when the app is made. TLS itself is expected to be terminated in front of
+the server, by a load balancer or reverse proxy holding a trusted
+certificate.
+
+Each worker process is prepared by `start_worker` once it has forked, and
+finished by `stop_worker`. `serve` calls them itself, and gunicorn.conf.py
+calls them from gunicorn's hooks.
+
+    python server_entry.py
+    gunicorn server_entry:application
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from os import environ
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+import json
+import logging
+import os
+import signal
+import threading
+import time
+
+from rail_uk.exceptions import ApplicationError
+
+logger = logging.getLogger(__name__)
+
+HOST = environ.get('SERVER_HOST', '0.0.0.0')
+PORT = int(environ.get('SERVER_PORT', 8080))
+WORKERS = int(environ.get('SERVER_WORKERS', 1))
+THREADS = int(environ.get('SERVER_THREADS', 8))
+# Seconds that in-flight requests are given to finish on shutdown
+SHUTDOWN_TIMEOUT = float(environ.get('SERVER_SHUTDOWN_TIMEOUT', 10))
+
+# Alexa requests are a few kilobytes at most
+MAX_BODY_BYTES = 128 * 1024
+# Alexa's limits for a request to be accepted
+TIMESTAMP_TOLERANCE = 150
+CERT_URL_HOST = 's3.amazonaws.com'
+CERT_URL_PATH = '/echo.api/'
+SIGNING_DOMAIN = 'echo-api.amazon.com'
+
+# Signing certificate chains by URL, shared by every thread in the process
+_certificates = {}
+_certificates_lock = threading.Lock()
+
+
+class InvalidRequest(Exception):
+    """Raised by a validator to reject a request before it is handled."""
+    pass
+
+
+# ----------------------------- Validators -----------------------------
+
+def verify_timestamp(_, event):
+    """Reject requests more than TIMESTAMP_TOLERANCE seconds old, which may
+    be replayed.
+    """
+    try:
+        timestamp = datetime.strptime(event['request']['timestamp'][:19], '%Y-%m-%dT%H:%M:%S')
+    except (KeyError, TypeError, ValueError):
+        raise InvalidRequest('Request has no valid timestamp')
+    if abs((datetime.utcnow() - timestamp).total_seconds()) > TIMESTAMP_TOLERANCE:
+        raise InvalidRequest('Request timestamp is too old')
+
+
+def verify_signature(request, _):
+    """Reject requests that weren't signed by Alexa: the body must be signed
+    (SHA-256 with RSA) by a certificate for echo-api.amazon.com, fetched
+    from an Amazon URL and chaining to a trusted root.
+    """
+    cert_url = request.headers.get('signaturecertchainurl')
+    signature = request.headers.get('signature-256')
+    if not cert_url or not signature:
+        raise InvalidRequest('Request is not signed')
+    if not is_valid_cert_url(cert_url):
+        raise InvalidRequest('Signing certificate URL is not Amazon\'s: ' + cert_url)
+
+    certificate = get_signing_certificate(cert_url)
+
+    import base64
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding
+
+    try:
+        certificate.public_key().verify(base64.b64decode(signature), request.body, padding.PKCS1v15(),
+                                        hashes.SHA256())
+    except (InvalidSignature, ValueError, TypeError):
+        # TypeError for a key that isn't RSA
+        raise InvalidRequest('Request signature is invalid')
+
+
+def is_valid_cert_url(cert_url):
+    from urllib.parse import urlsplit
+    import posixpath
+
+    url = urlsplit(cert_url)
+    path = posixpath.normpath(url.path) + ('/' if url.path.endswith('/') else '')
+    return url.scheme.lower() == 'https' and \
+        (url.hostname or '').lower() == CERT_URL_HOST and \
+        url.port in (None, 443) and \
+        path.startswith(CERT_URL_PATH)
+
+
+def get_signing_certificate(cert_url):
+    """Return the checked signing certificate at `cert_url`, downloading and
+    validating its chain only the first time it's seen.
+    """
+    with _certificates_lock:
+        chain = _certificates.get(cert_url)
+    if chain is None:
+        from rail_uk import data
+
+        try:
+            response = data.get_http_session().get(cert_url, timeout=data.UPSTREAM_TIMEOUT)
+        except IOError as err:
+            # requests' connection errors and timeouts are all IOErrors
+            raise InvalidRequest('Signing certificate could not be fetched - ' + str(err))
+        if not response.ok:
+            raise InvalidRequest('Signing certificate could not be fetched')
+        chain = _load_chain(response.content)
+        with _certificates_lock:
+            _certificates[cert_url] = chain
+
+    certificate = chain[0]
+    now = datetime.utcnow()
+    if not certificate.not_valid_before <= now <= certificate.not_valid_after:
+        raise InvalidRequest('Signing certificate has expired')
+    return certificate
+
+
+def _load_chain(pem):
+    import certifi
+    from cryptography import x509
+    from cryptography.exceptions import InvalidSignature, UnsupportedAlgorithm
+
+    try:
+        chain = x509.load_pem_x509_certificates(pem)
+        names = chain[0].extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+        if SIGNING_DOMAIN not in names.get_values_for_type(x509.DNSName):
+            raise InvalidRequest('Signing certificate is not for ' + SIGNING_DOMAIN)
+        for certificate, issuer in zip(chain, chain[1:]):
+            certificate.verify_directly_issued_by(issuer)
+    except (ValueError, TypeError, IndexError, x509.ExtensionNotFound, InvalidSignature, UnsupportedAlgorithm):
+        raise InvalidRequest('Signing certificate chain is invalid')
+
+    with open(certifi.where(), 'rb') as file:
+        roots = x509.load_pem_x509_certificates(file.read())
+    for root in roots:
+        if root.subject == chain[-1].issuer:
+            try:
+                chain[-1].verify_directly_issued_by(root)
+                return chain
+            except (ValueError, TypeError, InvalidSignature, UnsupportedAlgorithm):
+                continue
+    raise InvalidRequest('Signing certificate chain is not trusted')
+
+
+def get_validators():
+    if environ.get('SERVER_VERIFY_REQUESTS', 'true').lower() != 'true':
+        logger.warning('Request verification is disabled - only do this behind something that verifies them')
+        return []
+    # Fail at startup, rather than on every signed request
+    from importlib.util import find_spec
+    if find_spec('cryptography') is None:
+        raise ApplicationError('Verifying requests needs the cryptography package (see requirements-server.txt), '
+                               'or set SERVER_VERIFY_REQUESTS=false behind something that verifies them')
+    return [verify_timestamp, verify_signature]
+
+
+# ----------------------------- WSGI App -----------------------------
+
+class Request:
+    """What validators are given of a request: its raw body, and its headers
+    by lower-case name.
+    """
+
+    def __init__(self, wsgi_environ, body):
+        self.environ = wsgi_environ
+        self.body = body
+        self.headers = {key[5:].replace('_', '-').lower(): value
+                        for key, value in wsgi_environ.items() if key.startswith('HTTP_')}
+
+
+def make_app(handler=None, validators=None):
+    """Return a WSGI app answering Alexa requests POSTed to any path with
+    `handler` (lambda_handler by default), once every validator has passed
+    them. GET /ping is a health check.
+    """
+    if handler is None:
+        from rail_uk.lambda_handler import lambda_handler
+        handler = lambda_handler
+    if validators is None:
+        validators = get_validators()
+
+    def application(wsgi_environ, start_response):
+        method = wsgi_environ['REQUEST_METHOD']
+        if method == 'GET' and wsgi_environ.get('PATH_INFO') == '/ping':
+            return _respond(start_response, '200 OK', {'status': 'ok'})
+        if method != 'POST':
+            return _respond(start_response, '405 Method Not Allowed', {'error': 'Requests must be POSTed'})
+
+        try:
+            length = int(wsgi_environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if length > MAX_BODY_BYTES:
+            return _respond(start_response, '413 Payload Too Large', {'error': 'Request is too large'})
+        request = Request(wsgi_environ, wsgi_environ['wsgi.input'].read(length))
+
+        try:
+            event = json.loads(request.body)
+        except ValueError:
+            return _respond(start_response, '400 Bad Request', {'error': 'Request is not JSON'})
+        try:
+            for validator in validators:
+                validator(request, event)
+        except InvalidRequest as err:
+            logger.warning('Rejected request - {}'.format(err))
+            return _respond(start_response, '400 Bad Request', {'error': str(err)})
+
+        try:
+            response = handler(event, None)
+        except Exception:
+            logger.exception('Request failed')
+            return _respond(start_response, '500 Internal Server Error', {'error': 'Request failed'})
+        return _respond(start_response, '200 OK', response or {})
+
+    return application
+
+
+def _respond(start_response, status, body):
+    content = json.dumps(body).encode('utf-8')
+    start_response(status, [('Content-Type', 'application/json;charset=UTF-8'),
+                            ('Content-Length', str(len(content)))])
+    return [content]
+
+
+# ----------------------------- Server -----------------------------
+
+class _QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, *_):
+        pass
+
+
+class PooledWSGIServer(WSGIServer):
+    """Answers each connection on one of a fixed pool of `threads`."""
+
+    def __init__(self, address, app, threads=THREADS, bind_and_activate=True):
+        super().__init__(address, _QuietHandler, bind_and_activate)
+        self.set_app(app)
+        self.threads = threads
+        self._pool = None
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def serve_forever(self, poll_interval=0.5):
+        # Created here, so that each forked worker has its own threads
+        self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='request')
+        super().serve_forever(poll_interval)
+
+    def process_request(self, request, client_address):
+        future = self._pool.submit(self._process, request, client_address)
+        with self._lock:
+            self._in_flight.add(future)
+        future.add_done_callback(self._finished)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def _finished(self, future):
+        with self._lock:
+            self._in_flight.discard(future)
+
+    def drain(self, timeout=SHUTDOWN_TIMEOUT):
+        """Wait up to `timeout` seconds for accepted requests to finish,
+        returning how many didn't.
+        """
+        from concurrent.futures import wait
+
+        with self._lock:
+            in_flight = list(self._in_flight)
+        _, unfinished = wait(in_flight, timeout=timeout)
+        if self._pool is not None:
+            self._pool.shutdown(wait=not unfinished)
+        return len(unfinished)
+
+    def stop(self, timeout=SHUTDOWN_TIMEOUT):
+        """Stop accepting connections, then drain. Call from another thread
+        than the one serving.
+        """
+        self.shutdown()
+        unfinished = self.drain(timeout)
+        self.server_close()
+        if unfinished:
+            logger.warning('Shut down with {} request(s) unfinished'.format(unfinished))
+        return unfinished
+
+
+def start_worker(threads=THREADS):
+    """Prepare this worker process to answer requests on `threads` threads:
+    size its upstream connection pool, warm it up, refresh stale cache
+    entries in the background and start prefetching if enabled.
+    """
+    from rail_uk import cache, data, prefetch, warmup
+
+    # One upstream connection per thread, so that none have to wait for one
+    data.set_http_pool_size(max(data.HTTP_POOL_SIZE, threads))
+    warmup.initialise()
+    cache.set_revalidate_mode(cache.BACKGROUND)
+    if prefetch.is_enabled():
+        prefetch.start_scheduler()
+
+
+def stop_worker():
+    """Write out what this worker process still holds, as it stops."""
+    from rail_uk import query_log
+
+    query_log.flush(force=True)
+
+
+def run_worker(server):
+    """Serve until SIGTERM or SIGINT, then finish in-flight requests."""
+    start_worker(server.threads)
+    stopping = threading.Event()
+
+    def stop(*_):
+        if not stopping.is_set():
+            stopping.set()
+            # serve_forever must be stopped from another thread
+            threading.Thread(target=server.shutdown, name='shutdown').start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    server.serve_forever()
+
+    unfinished = server.drain()
+    server.server_close()
+    stop_worker()
+    logger.info('Worker {} stopped with {} request(s) unfinished'.format(os.getpid(), unfinished))
+    return unfinished
+
+
+def serve(host=HOST, port=PORT, workers=WORKERS, threads=THREADS, app=None):
+    """Run the server until SIGTERM or SIGINT. With more than one worker, the
+    listening socket is shared by that many forked processes, which are
+    restarted if they die and each drained on shutdown.
+    """
+    server = PooledWSGIServer((host, port), app or make_app(), threads)
+    logger.warning('Serving Alexa requests on {}:{} with {} worker(s) of {} thread(s)'.format(
+        host, server.server_address[1], workers, threads))
+    if workers <= 1:
+        return run_worker(server)
+
+    children = {}
+    stopping = threading.Event()
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(server)
+            except BaseException:
+                logger.exception('Worker failed')
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = time.time()
+
+    def signal_children(signal_number):
+        for pid in children:
+            try:
+                os.kill(pid, signal_number)
+            except ProcessLookupError:
+                pass
+
+    def stop(*_):
+        stopping.set()
+        signal_children(signal.SIGTERM)
+
+    for _ in range(workers):
+        spawn()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    deadline = None
+    while children:
+        if stopping.is_set() and deadline is None:
+            deadline = time.time() + SHUTDOWN_TIMEOUT + 5
+        pid, _ = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            if deadline is not None and time.time() > deadline:
+                signal_children(signal.SIGKILL)
+                deadline = float('inf')
+            time.sleep(0.1)
+            continue
+        started = children.pop(pid)
+        if not stopping.is_set():
+            logger.error('Worker {} exited after {:.0f}s, restarting'.format(pid, time.time() - started))
+            spawn()
+    server.server_close()
+    return 0
@@ -0,0 +1,28 @@
+import csv
+import logging
+
+from rail_uk.dtos import Station
+
+logger = logging.getLogger(__name__)
+
+STATIONS_FILE = 'res/stations.csv'
+
+_registry = None
+
+
+def get_station_registry():
+    """Return every known station keyed by CRS code, loading the registry
+    from disk the first time it is requested.
+    """
+    global _registry
+    if _registry is None:
+        # The file is the Alexa slot export (name, CRS, synonyms...), saved
+        # with a byte order mark, hence utf-8-sig
+        with open(STATIONS_FILE, 'r', encoding='utf-8-sig', newline='') as file:
+            _registry = {row[1]: Station(row[0], row[1]) for row in csv.reader(file)}
+        logger.debug('Loaded {} stations'.format(len(_registry)))
+    return _registry
+
+
+def get_station(crs):
+    return get_station_registry().get(crs)
@@ -0,0 +1,354 @@
+"""Offline timetable engine for scheduled queries.
+
+Ingests a GTFS extract of the published rail timetable - a .zip or a
+directory of .txt files - into services indexed by the stations they call
+at, each with a days-run bitmap, so that questions such as "the last
+departure from A calling at B today" are answered in memory without
+TransportAPI.
+
+The extract is read from TIMETABLE_FILE, once per container. TIMETABLE_FILE
+may instead name a file prebuilt by rail_uk.mapped_timetable, which opens
+in milliseconds.
+"""
+from collections import namedtuple
+from operator import itemgetter
+from datetime import datetime, timedelta
+from os import environ
+import bisect
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 24 * 60
+DAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+# One trip over the tracks, sharing its days-run bitmap with every other
+# trip of its GTFS service. `stops` lists the stations it calls at in order,
+# and `calling_at` maps each one it sets down at to its position in `stops`.
+# `arrivals` and `departs` hold the minutes at each stop, or None if the
+# feed leaves a stop untimed.
+Trip = namedtuple('Trip', 'trip_id, operator, final_dest, service, stops, calling_at, arrivals, departs')
+
+ScheduledDeparture = namedtuple('ScheduledDeparture', 'std, operator, final_dest, trip_id')
+
+_timetable = None
+
+
+class Timetable:
+
+    def __init__(self):
+        # Bit n of a days-run bitmap is set if the service runs on the nth day
+        # after feed_start
+        self.feed_start = None
+        self.days_run = []
+        self.trips = []
+        # crs -> [(departure minutes, trip index, position)] sorted by time.
+        # Minutes are counted from midnight at the start of the service day,
+        # so services after midnight run past 1440.
+        self.departures = {}
+        # crs -> every station reachable from it without changing, so that
+        # pairs with no direct service are rejected without a scan
+        self.reachable = {}
+        self._connections = None
+
+    # ----------------------------- Queries -----------------------------
+
+    def runs_on(self, trip, day):
+        offset = (day - self.feed_start).days
+        return offset >= 0 and (self.days_run[trip.service] >> offset) & 1 == 1
+
+    def departures_from(self, origin_crs, day, destination_crs=None, after=0, before=None):
+        """Yield the scheduled departures from `origin_crs` on `day` between
+        `after` and `before` (minutes from midnight, inclusive), in time
+        order, optionally only those later calling at `destination_crs`.
+        """
+        for departure_time, trip, _ in self._matching(origin_crs, day, destination_crs, after, before):
+            yield _scheduled_departure(departure_time, trip)
+
+    def next_departure(self, origin_crs, destination_crs, day, after=0):
+        return next(self.departures_from(origin_crs, day, destination_crs, after), None)
+
+    def last_departure(self, origin_crs, destination_crs, day, before=None):
+        """Return the last departure from `origin_crs` calling at
+        `destination_crs` on `day`, or None if no service runs between them.
+        """
+        match = next(self._matching(origin_crs, day, destination_crs, 0, before, reverse=True), None)
+        if match is None:
+            return None
+        return _scheduled_departure(match[0], match[1])
+
+    def _matching(self, origin_crs, day, destination_crs, after, before, reverse=False):
+        entries = self.departures.get(origin_crs)
+        if not entries or self.feed_start is None:
+            return
+        if destination_crs is not None and destination_crs not in self.reachable.get(origin_crs, ()):
+            return
+        start = bisect.bisect_left(entries, (after,))
+        end = len(entries) if before is None else bisect.bisect_left(entries, (before + 1,))
+        positions = range(end - 1, start - 1, -1) if reverse else range(start, end)
+
+        offset = (day - self.feed_start).days
+        if offset < 0:
+            return
+        for index in positions:
+            departure_time, trip_index, position = entries[index]
+            trip = self.trips[trip_index]
+            if (self.days_run[trip.service] >> offset) & 1 == 0:
+                continue
+            if destination_crs is not None and trip.calling_at.get(destination_crs, -1) <= position:
+                continue
+            yield departure_time, trip, position
+
+    # ----------------------------- Journey Planning -----------------------------
+
+    def connections(self):
+        """Return the journey.Connections of every trip, built on first use."""
+        if self._connections is None:
+            from rail_uk import journey
+            self._connections = journey.build_connections(self)
+        return self._connections
+
+    def running_trips(self, day):
+        """Return a flag per trip, set if it runs on `day`, or None if `day`
+        is outside the timetable.
+        """
+        offset = -1 if self.feed_start is None else (day - self.feed_start).days
+        if offset < 0:
+            return None
+        services = [(bitmap >> offset) & 1 for bitmap in self.days_run]
+        return bytearray(services[trip.service] for trip in self.trips)
+
+    def scheduled_departure(self, trip_index, departure_time):
+        return _scheduled_departure(departure_time, self.trips[trip_index])
+
+    def reachable_from(self, origin_crs):
+        return self.reachable.get(origin_crs, ())
+
+    def __len__(self):
+        return len(self.trips)
+
+
+# ----------------------------- Loading -----------------------------
+
+def is_configured():
+    return bool(environ.get('TIMETABLE_FILE'))
+
+
+def get_timetable():
+    """Return the container-wide timetable, loading TIMETABLE_FILE on first
+    use.
+    """
+    global _timetable
+    if _timetable is None:
+        from rail_uk import mapped_timetable
+
+        path = environ['TIMETABLE_FILE']
+        if mapped_timetable.is_mapped_file(path):
+            _timetable = mapped_timetable.open_timetable(path)
+        else:
+            _timetable = load(path)
+    return _timetable
+
+
+def load(path):
+    """Build a Timetable from a GTFS extract (.zip or directory)."""
+    start = time.time()
+    with _Feed(path) as feed:
+        timetable = _build(feed)
+    logger.info('Loaded {} trips from {} in {:.0f}ms'.format(
+        len(timetable), path, (time.time() - start) * 1000))
+    return timetable
+
+
+def _build(feed):
+    timetable = Timetable()
+
+    # agency_id may be left out of feeds with a single operator
+    operators = {row.get('agency_id', ''): row['agency_name'] for row in feed.rows('agency.txt')}
+    default_operator = next(iter(operators.values()), '')
+    route_operators = {row['route_id']: operators.get(row.get('agency_id', ''), default_operator)
+                       for row in feed.rows('routes.txt')}
+    stops = _load_stops(feed.rows('stops.txt'))
+    services = _load_days_run(timetable, feed)
+
+    trip_details = {}
+    for row in feed.rows('trips.txt'):
+        service = services.get(row['service_id'])
+        if service is not None:
+            trip_details[row['trip_id']] = (route_operators.get(row['route_id'], ''), service)
+
+    # stop_times.txt holds most of a feed's rows, so is read by column
+    calls = {}
+    # A feed only has a few thousand distinct times
+    times = {}
+    columns = ('trip_id', 'stop_sequence', 'stop_id', 'departure_time', 'arrival_time', 'pickup_type',
+               'drop_off_type')
+    for trip_id, sequence, stop_id, departure, arrival, pickup, drop_off in feed.columns('stop_times.txt', columns):
+        if trip_id in trip_details:
+            departure, arrival = departure or arrival, arrival or departure
+            departure_minutes = times.get(departure)
+            if departure_minutes is None:
+                departure_minutes = times[departure] = _parse_gtfs_time(departure)
+            arrival_minutes = times.get(arrival)
+            if arrival_minutes is None:
+                arrival_minutes = times[arrival] = _parse_gtfs_time(arrival)
+            calls.setdefault(trip_id, []).append((int(sequence), stops[stop_id], departure_minutes, pickup != '1',
+                                                  drop_off != '1', arrival_minutes))
+
+    patterns = set()
+    for trip_id, trip_calls in calls.items():
+        trip_calls.sort()
+        operator, service = trip_details[trip_id]
+        final_name = trip_calls[-1][1][1]
+        calling_at = {crs: position for position, (_, (crs, _), _, _, sets_down, _) in enumerate(trip_calls)
+                      if sets_down and position > 0}
+        trip_index = len(timetable.trips)
+        stops = tuple(call[1][0] for call in trip_calls)
+        timetable.trips.append(Trip(trip_id, operator, final_name, service, stops, calling_at,
+                                    tuple(call[5] for call in trip_calls), tuple(call[2] for call in trip_calls)))
+
+        for position, (_, (crs, _), departure_time, picks_up, _, _) in enumerate(trip_calls[:-1]):
+            if picks_up and departure_time is not None:
+                timetable.departures.setdefault(crs, []).append((departure_time, trip_index, position))
+
+        # Most trips repeat a stopping pattern already seen
+        pattern = tuple((call[1][0], call[3], call[4]) for call in trip_calls)
+        if pattern not in patterns:
+            patterns.add(pattern)
+            for position, (crs, picks_up, _) in enumerate(pattern[:-1]):
+                if picks_up:
+                    timetable.reachable.setdefault(crs, set()).update(
+                        destination for destination, stop in calling_at.items() if stop > position)
+
+    for entries in timetable.departures.values():
+        entries.sort()
+    return timetable
+
+
+def _load_stops(rows):
+    rows = list(rows)
+    codes = {row['stop_id']: (row.get('stop_code') or row['stop_id'], row['stop_name']) for row in rows}
+    # Platforms are children of their station
+    return {row['stop_id']: codes.get(row.get('parent_station') or row['stop_id'], codes[row['stop_id']])
+            for row in rows}
+
+
+def _load_days_run(timetable, feed):
+    """Fill in timetable.days_run, returning the index of each service's
+    bitmap by GTFS service_id.
+    """
+    calendar = list(feed.rows('calendar.txt', required=False))
+    exceptions = list(feed.rows('calendar_dates.txt', required=False))
+    dates = [_parse_date(row['start_date']) for row in calendar] + [_parse_date(row['date']) for row in exceptions]
+    if not dates:
+        return {}
+    end_dates = [_parse_date(row['end_date']) for row in calendar] + [_parse_date(row['date']) for row in exceptions]
+    timetable.feed_start = min(dates)
+    total_days = (max(end_dates) - timetable.feed_start).days + 1
+
+    # Bitmaps of every Monday, Tuesday, ... in the feed
+    weekdays = [0] * 7
+    for offset in range(total_days):
+        weekdays[(timetable.feed_start + timedelta(days=offset)).weekday()] |= 1 << offset
+
+    bitmaps = {}
+    for row in calendar:
+        first = (_parse_date(row['start_date']) - timetable.feed_start).days
+        last = (_parse_date(row['end_date']) - timetable.feed_start).days
+        in_range = ((1 << (last + 1)) - 1) ^ ((1 << first) - 1)
+        days = 0
+        for weekday, name in enumerate(DAYS):
+            if row[name] == '1':
+                days |= weekdays[weekday]
+        bitmaps[row['service_id']] = days & in_range
+    for row in exceptions:
+        bit = 1 << (_parse_date(row['date']) - timetable.feed_start).days
+        bitmap = bitmaps.get(row['service_id'], 0)
+        bitmaps[row['service_id']] = bitmap | bit if row['exception_type'] == '1' else bitmap & ~bit
+
+    services = {}
+    for service_id, bitmap in bitmaps.items():
+        services[service_id] = len(timetable.days_run)
+        timetable.days_run.append(bitmap)
+    return services
+
+
+class _Feed:
+
+    def __init__(self, path):
+        self.path = path
+        self._zip = None
+        if not os.path.isdir(path):
+            import zipfile
+            self._zip = zipfile.ZipFile(path)
+
+    def rows(self, name, required=True):
+        import csv
+
+        file = self._open(name, required)
+        if file is None:
+            return
+        with file:
+            yield from csv.DictReader(file)
+
+    def columns(self, name, fields):
+        """Yield tuples of the given fields, with '' for any the file lacks."""
+        import csv
+
+        with self._open(name) as file:
+            reader = csv.reader(file)
+            header = next(reader)
+            indexes = [header.index(field) if field in header else None for field in fields]
+            if None not in indexes:
+                getter = itemgetter(*indexes)
+                for row in reader:
+                    yield getter(row)
+            else:
+                for row in reader:
+                    yield tuple('' if index is None else row[index] for index in indexes)
+
+    def _open(self, name, required=True):
+        import io
+
+        if self._zip is not None:
+            if name not in self._zip.namelist():
+                if required:
+                    raise FileNotFoundError('{} not found in {}'.format(name, self.path))
+                return None
+            return io.TextIOWrapper(self._zip.open(name), encoding='utf-8-sig')
+
+        file_path = os.path.join(self.path, name)
+        if not required and not os.path.exists(file_path):
+            return None
+        return open(file_path, encoding='utf-8-sig')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        if self._zip is not None:
+            self._zip.close()
+
+
+def _scheduled_departure(departure_time, trip):
+    return ScheduledDeparture(format_time(departure_time), trip.operator, trip.final_dest, trip.trip_id)
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y%m%d').date()
+
+
+def _parse_gtfs_time(value):
+    # GTFS times are HH:MM:SS from the start of the service day, and may
+    # pass 24:00:00
+    if not value:
+        return None
+    hours, minutes, _ = value.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def format_time(minutes):
+    minutes %= MINUTES_PER_DAY
+    return '{:02d}:{:02d}'.format(minutes // 60, minutes % 60)
@@ -0,0 +1,300 @@
+"""Scheduled departures from any of several timetable providers.
+
+LastTrain reads the scheduled departures between two stations in two-hour
+windows. TIMETABLE_PROVIDERS lists who can answer, in the order to start
+with:
+
+    offline                   the GTFS extract in TIMETABLE_FILE
+    transportapi              TransportAPI
+    transportapi:<base URL>   another TransportAPI-compatible endpoint, e.g. a
+                              mirror or benchmarks/standin.py
+
+A provider returns None when it can't answer for a route (the offline
+timetable doesn't cover every station), or a list of departures - possibly
+empty - when it can. With TIMETABLE_PROVIDER_MODE='fallback' providers are
+asked one at a time until one answers, and with 'race' the first
+TIMETABLE_RACE_WIDTH are asked at once and the first answer is taken.
+Either way they are ordered by their expected latency: a moving average of
+their response times plus a penalty for recent failures, so a slow or
+failing provider drops down the order by itself. Every
+TIMETABLE_EXPLORE_EVERY lookups, the provider asked least recently goes
+first instead, so that one which has recovered can win its place back.
+Other kinds of provider can be added with `register`.
+"""
+from os import environ
+import logging
+import threading
+import time
+
+from rail_uk.exceptions import ApplicationError, Error
+from rail_uk import quota, timetable, tracing
+
+logger = logging.getLogger(__name__)
+
+FALLBACK = 'fallback'
+RACE = 'race'
+
+PROVIDERS = environ.get('TIMETABLE_PROVIDERS', 'offline,transportapi')
+MODE = environ.get('TIMETABLE_PROVIDER_MODE', FALLBACK)
+RACE_WIDTH = int(environ.get('TIMETABLE_RACE_WIDTH', 2))
+EXPLORE_EVERY = int(environ.get('TIMETABLE_EXPLORE_EVERY', 20))
+# Weight of each new response time in a provider's moving average, and what
+# a failure adds to its expected latency (the upstream timeout)
+SMOOTHING = 0.2
+FAILURE_PENALTY_MS = 5000
+# Minutes in each window, as asked of TransportAPI with to_offset
+WINDOW_MINUTES = 120
+RACE_THREADS = 4
+
+_kinds = {}
+_providers = None
+_providers_lock = threading.Lock()
+_executor = None
+_lookups = 0
+
+
+class LatencyStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.mean_ms = None
+        self.failure_rate = 0.0
+        self.last_asked = 0.0
+
+    def record(self, elapsed_ms, ok):
+        with self._lock:
+            self.calls += 1
+            self.last_asked = time.time()
+            self.failures += 0 if ok else 1
+            self.mean_ms = elapsed_ms if self.mean_ms is None else \
+                self.mean_ms + SMOOTHING * (elapsed_ms - self.mean_ms)
+            self.failure_rate += SMOOTHING * ((0 if ok else 1) - self.failure_rate)
+
+    def expected_ms(self):
+        """Expected milliseconds to an answer. Providers that haven't been
+        asked yet are expected to be instant, so that they are measured.
+        """
+        return (self.mean_ms or 0.0) + self.failure_rate * FAILURE_PENALTY_MS
+
+    def summary(self):
+        return {'calls': self.calls, 'failures': self.failures,
+                'mean_ms': None if self.mean_ms is None else round(self.mean_ms, 1),
+                'expected_ms': round(self.expected_ms(), 1)}
+
+
+class Provider:
+    """Answers scheduled departure lookups for a window of `WINDOW_MINUTES`."""
+
+    def __init__(self, name):
+        self.name = name
+        self.stats = LatencyStats()
+
+    def is_available(self):
+        return True
+
+    def warm_up(self):
+        """Do any one-off work before the first lookup, outside its timing."""
+        pass
+
+    def departures(self, params, day, at):
+        """Return the departures from `params.origin` calling at
+        `params.destination` on `day`, from `at` ('HH:MM'), as dicts of
+        TransportAPI's aimed_departure_time, operator_name and
+        destination_name. Return None if the route isn't covered.
+        """
+        raise NotImplementedError
+
+
+class OfflineProvider(Provider):
+
+    def __init__(self, name, _=None):
+        super().__init__(name)
+
+    def is_available(self):
+        return timetable.is_configured()
+
+    def warm_up(self):
+        timetable.get_timetable()
+
+    def departures(self, params, day, at):
+        engine = timetable.get_timetable()
+        if params.destination.crs not in engine.reachable_from(params.origin.crs):
+            return None
+        after = int(at[:2]) * 60 + int(at[3:])
+        # Compared as same-day 'HH:MM' strings, so services after midnight
+        # are left out, as they are from TransportAPI
+        before = min(after + WINDOW_MINUTES - 1, timetable.MINUTES_PER_DAY - 1)
+        return [{'aimed_departure_time': departure.std,
+                 'operator_name': departure.operator,
+                 'destination_name': departure.final_dest}
+                for departure in engine.departures_from(params.origin.crs, day, params.destination.crs, after, before)]
+
+
+class TransportAPIProvider(Provider):
+
+    def __init__(self, name, base_url=None):
+        super().__init__(name)
+        self.base_url = base_url
+
+    def departures(self, params, day, at):
+        from rail_uk import data
+
+        return data.get_timetable(params, at, day=day, base_url=self.base_url) or []
+
+
+def register(kind, factory):
+    """Make providers of `kind` available to TIMETABLE_PROVIDERS, built with
+    factory(name, argument) from a 'kind' or 'kind:argument' entry.
+    """
+    _kinds[kind] = factory
+
+
+register('offline', OfflineProvider)
+register('transportapi', TransportAPIProvider)
+
+
+# ----------------------------- Lookups -----------------------------
+
+def get_departures(params, day, at):
+    """Return the scheduled departures in the window from `at`, or None if
+    there are none. If no provider answers, the last one's error is raised.
+    """
+    providers = ordered_providers()
+    if not providers:
+        raise ApplicationError('No timetable provider is available')
+    if MODE == RACE and len(providers) > 1:
+        return _race(providers[:RACE_WIDTH], params, day, at)
+    return _fall_back(providers, params, day, at)
+
+
+def _fall_back(providers, params, day, at):
+    error = None
+    for provider in providers:
+        try:
+            departures = _ask(provider, params, day, at)
+        except Error as err:
+            logger.warning('Timetable provider {} failed, trying the next'.format(provider.name), exc_info=True)
+            error = err
+            continue
+        if departures is not None:
+            tracing.annotate(timetable_provider=provider.name)
+            return departures or None
+    if error is not None:
+        raise error
+    return None
+
+
+def _race(providers, params, day, at):
+    """Ask every provider at once and return the first answer. The rest are
+    left to finish in the background, so that their latency is still
+    measured.
+    """
+    from concurrent.futures import FIRST_COMPLETED, wait
+
+    level = quota.current_priority()
+    trace = tracing.current_trace()
+
+    def ask(provider):
+        with quota.priority(level), tracing.continue_trace(trace):
+            return _ask(provider, params, day, at)
+
+    pending = {_get_executor().submit(ask, provider): provider for provider in providers}
+    error = None
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            provider = pending.pop(future)
+            try:
+                departures = future.result()
+            except Error as err:
+                logger.warning('Timetable provider {} failed'.format(provider.name), exc_info=True)
+                error = err
+                continue
+            if departures is not None:
+                tracing.annotate(timetable_provider=provider.name)
+                return departures or None
+    if error is not None:
+        raise error
+    return None
+
+
+def _ask(provider, params, day, at):
+    provider.warm_up()
+    start = time.perf_counter()
+    try:
+        departures = provider.departures(params, day, at)
+    except Exception:
+        provider.stats.record((time.perf_counter() - start) * 1000, ok=False)
+        raise
+    provider.stats.record((time.perf_counter() - start) * 1000, ok=True)
+    return departures
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _executor = ThreadPoolExecutor(max_workers=RACE_THREADS, thread_name_prefix='timetable')
+    return _executor
+
+
+# ----------------------------- Providers -----------------------------
+
+def parse_providers(spec):
+    providers = []
+    for entry in filter(None, (part.strip() for part in spec.split(','))):
+        kind, _, argument = entry.partition(':')
+        if kind not in _kinds:
+            raise ValueError('Unknown timetable provider: ' + entry)
+        providers.append(_kinds[kind](entry, argument or None))
+    return providers
+
+
+def get_providers():
+    global _providers
+    if _providers is None:
+        with _providers_lock:
+            if _providers is None:
+                _providers = parse_providers(PROVIDERS)
+    return _providers
+
+
+def set_providers(providers):
+    global _providers
+    _providers = providers
+
+
+def ordered_providers():
+    """Return the available providers, fastest expected first, or now and
+    then the one asked least recently first.
+    """
+    global _lookups
+    providers = [provider for provider in get_providers() if provider.is_available()]
+    ordered = [provider for _, _, provider in sorted(
+        (provider.stats.expected_ms(), index, provider) for index, provider in enumerate(providers))]
+
+    with _providers_lock:
+        _lookups += 1
+        lookup = _lookups
+    if EXPLORE_EVERY and lookup % EXPLORE_EVERY == 0 and len(ordered) > 1:
+        stalest = min(ordered, key=lambda provider: provider.stats.last_asked)
+        ordered.remove(stalest)
+        ordered.insert(0, stalest)
+    return ordered
+
+
+def get_stats():
+    return {provider.name: provider.stats.summary() for provider in get_providers()}
+
+
+def reset():
+    """Rebuild the providers from TIMETABLE_PROVIDERS, forgetting their
+    statistics, e.g. between tests.
+    """
+    global _lookups
+    set_providers(None)
+    with _providers_lock:
+        _lookups = 0
+
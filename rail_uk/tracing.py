@@ -0,0 +1,272 @@
+from contextlib import contextmanager
+from os import environ
+from functools import wraps
+import json
+import logging
+import math
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = 'RailUK'
+
+_enabled = environ.get('TRACING_ENABLED', 'false').lower() == 'true'
+_local = threading.local()
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def is_enabled():
+    return _enabled
+
+
+def set_enabled(enabled):
+    global _enabled
+    _enabled = enabled
+
+
+# ----------------------------- Invocation Traces -----------------------------
+
+class Trace:
+    """Timing spans and dimensions collected over a single invocation."""
+
+    def __init__(self, dimensions):
+        self.start = time.perf_counter()
+        self.dimensions = dict(dimensions)
+        self.spans = []
+        self.stack = []
+
+    def branch(self):
+        """Return a view of this trace for another thread, sharing its
+        dimensions and spans but with its own stack of open spans.
+        """
+        branch = Trace.__new__(Trace)
+        branch.start, branch.dimensions, branch.spans, branch.stack = self.start, self.dimensions, self.spans, []
+        return branch
+
+
+class Span:
+
+    def __init__(self, trace, name, dimensions):
+        self.trace = trace
+        self.name = name
+        self.dimensions = dimensions
+        self.start = None
+        self.duration_ms = None
+
+    def set(self, **dimensions):
+        self.dimensions.update(dimensions)
+
+    def __enter__(self):
+        self.trace.stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.duration_ms = (time.perf_counter() - self.start) * 1000
+        self.trace.stack.pop()
+        self.trace.spans.append(self)
+        return False
+
+
+class _NoopSpan:
+    """Stands in for a span when tracing is disabled, so that instrumented
+    code costs no more than a function call.
+    """
+
+    def set(self, **_):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def start_trace(**dimensions):
+    _local.trace = Trace(dimensions) if _enabled else None
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def continue_trace(trace):
+    """Record this thread's spans and dimensions into `trace`, taken from the
+    thread that handed it work, e.g. a worker fetching on a request's behalf.
+    """
+    previous = current_trace()
+    _local.trace = None if trace is None else trace.branch()
+    try:
+        yield
+    finally:
+        _local.trace = previous
+
+
+def annotate(**dimensions):
+    """Add dimensions (e.g. intent name, cache outcome) to the current trace."""
+    trace = current_trace()
+    if trace is not None:
+        trace.dimensions.update(dimensions)
+
+
+def span(name, **dimensions):
+    trace = current_trace() if _enabled else None
+    if trace is None:
+        return _NOOP_SPAN
+    return Span(trace, name, dimensions)
+
+
+def current_span():
+    trace = current_trace() if _enabled else None
+    if trace is None or not trace.stack:
+        return _NOOP_SPAN
+    return trace.stack[-1]
+
+
+def traced(name=None):
+    """Decorate a function so that each call is recorded as a span."""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def finish_trace():
+    """Close the current trace, fold its spans into the in-process histograms
+    and emit it as a single CloudWatch embedded-metric-format line.
+    """
+    trace = current_trace()
+    _local.trace = None
+    if trace is None:
+        return None
+
+    total_ms = (time.perf_counter() - trace.start) * 1000
+    _record('total', total_ms)
+    for trace_span in trace.spans:
+        _record(trace_span.name, trace_span.duration_ms)
+
+    record = build_metric_record(trace, total_ms)
+    sys.stdout.write(json.dumps(record) + '\n')
+    return record
+
+
+def build_metric_record(trace, total_ms):
+    # Copied first, since worker threads may still be recording into them
+    dimensions, spans = dict(trace.dimensions), list(trace.spans)
+    metric_values = {'total': round(total_ms, 3)}
+    for trace_span in spans:
+        value = round(trace_span.duration_ms, 3)
+        existing = metric_values.get(trace_span.name)
+        if existing is None:
+            metric_values[trace_span.name] = value
+        elif isinstance(existing, list):
+            existing.append(value)
+        else:
+            metric_values[trace_span.name] = [existing, value]
+
+    dimension_names = sorted(dimensions)
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': NAMESPACE,
+                'Dimensions': [dimension_names] if dimension_names else [[]],
+                'Metrics': [{'Name': metric, 'Unit': 'Milliseconds'} for metric in metric_values]
+            }]
+        },
+        'spans': [
+            dict(trace_span.dimensions, name=trace_span.name, ms=round(trace_span.duration_ms, 3))
+            for trace_span in spans
+        ]
+    }
+    # CloudWatch only accepts strings as dimension values
+    record.update((name, str(value)) for name, value in dimensions.items())
+    record.update(metric_values)
+    return record
+
+
+# ----------------------------- Histograms -----------------------------
+
+class Histogram:
+    """Log-linear latency histogram with ~19% bucket resolution."""
+
+    BUCKETS_PER_DOUBLING = 4
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value_ms):
+        bucket = self._bucket(value_ms)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value_ms
+        self.max = max(self.max, value_ms)
+
+    def percentile(self, percent):
+        if self.count == 0:
+            return None
+        target = math.ceil(self.count * percent / 100.0)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return min(self._upper_bound(bucket), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max
+        }
+
+    def _bucket(self, value_ms):
+        if value_ms <= 0.001:
+            return -40
+        return int(math.floor(math.log2(value_ms) * self.BUCKETS_PER_DOUBLING))
+
+    def _upper_bound(self, bucket):
+        return 2 ** ((bucket + 1) / self.BUCKETS_PER_DOUBLING)
+
+
+def _record(name, value_ms):
+    with _histograms_lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.record(value_ms)
+
+
+def get_histograms():
+    return _histograms
+
+
+def histogram_summary():
+    with _histograms_lock:
+        return {name: histogram.summary() for name, histogram in _histograms.items()}
+
+
+def reset_histograms():
+    with _histograms_lock:
+        _histograms.clear()
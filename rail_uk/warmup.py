@@ -0,0 +1,70 @@
+from datetime import date
+from os import environ
+import logging
+import time
+
+from rail_uk import data, dynamodb, journey, stations, timetable
+
+logger = logging.getLogger(__name__)
+
+# Event sources which only exist to keep a container warm
+WARM_UP_SOURCES = ('aws.events', 'serverless-plugin-warmup')
+
+_initialised = False
+
+
+def is_warm_up_event(event):
+    """Identify keep-warm pings, which carry no Alexa session."""
+    if not isinstance(event, dict) or 'session' in event:
+        return False
+    return event.get('warmup') is True or event.get('source') in WARM_UP_SOURCES
+
+
+def initialise(connect=None):
+    """Perform the per-container init phase: compile the SOAP templates, load
+    the station registry (and offline timetable and journey planner, if
+    configured) and create the HTTP session and DynamoDB table clients. When
+    `connect` is set (or WARM_UP_CONNECT is 'true'), TLS connections to the
+    upstream APIs are also opened so that the first real request can reuse
+    them.
+
+    Safe to call repeatedly - the work is only done once per container.
+    """
+    global _initialised
+    if connect is None:
+        connect = environ.get('WARM_UP_CONNECT', 'false').lower() == 'true'
+
+    if not _initialised:
+        start = time.time()
+        for template_file in ('departure_board.xml', 'fastest_departure.xml'):
+            data.get_template(template_file)
+        stations.get_station_registry()
+        if timetable.is_configured():
+            journey.get_planner().day_connections(date.today())
+        data.get_http_session()
+        dynamodb.get_table()
+        _initialised = True
+        logger.info('Container initialised in {:.0f}ms'.format((time.time() - start) * 1000))
+
+    if connect:
+        _open_connections()
+
+
+def warm_up(event):
+    """Handle a keep-warm ping without touching Alexa validation or intent
+    dispatch.
+    """
+    logger.info('Warm-up event received from: {}'.format(event.get('source', 'unknown')))
+    initialise(connect=event.get('connect'))
+    return {'warm': True}
+
+
+def _open_connections():
+    session = data.get_http_session()
+    for url in (data.OPEN_LDBWS_URL, data.TRANSPORT_API_URL):
+        try:
+            # Any response will do - this only exists to leave a negotiated
+            # connection in the session's pool.
+            session.head(url, timeout=2).close()
+        except Exception:
+            logger.warning('Could not pre-connect to {}'.format(url))
@@ -0,0 +1,15 @@
+from os import environ
+import logging
+import sys
+
+from rail_uk import server
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=environ.get('LOG_LEVEL', 'WARNING'))
+
+# For any WSGI server, e.g. `gunicorn server_entry:application`
+application = server.make_app()
+
+
+if __name__ == '__main__':
+    sys.exit(server.serve(app=application))
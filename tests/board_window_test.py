@@ -0,0 +1,53 @@
+from datetime import datetime
+from unittest import TestCase
+from unittest.mock import patch
+import logging
+
+from rail_uk import board_window
+from helpers import helpers
+
+NOW = datetime(2019, 2, 28, 21, 59)
+
+
+class TestBoardWindow(TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+        self.mock_env = helpers.get_test_env()
+        self.mock_env.start()
+        self.params = helpers.generate_test_api_params()
+
+    def tearDown(self):
+        self.mock_env.stop()
+        board_window.reset()
+
+    def test_plan_unknown_route(self):
+        self.assertListEqual(board_window.plan('next', self.params), [(30, 3), (60, 3), (120, 3)])
+        self.assertListEqual(board_window.plan('fastest', self.params), [(30, None), (60, None), (120, None)])
+
+    @patch('rail_uk.board_window.POLICY', board_window.FIXED)
+    def test_plan_fixed(self):
+        self.assertListEqual(board_window.plan('next', self.params), [(120, 10)])
+        self.assertListEqual(board_window.plan('fastest', self.params), [(120, None)])
+
+    def test_learns_headway(self):
+        departures = [helpers.generate_departure_details()._replace(std=std) for std in ('23:56', '23:59', '00:02')]
+        board_window.record(self.params, departures, 30)
+        self.assertEqual(board_window.expected_headway(self.params), 3)
+        # Never narrower than BOARD_MIN_WINDOW
+        self.assertListEqual(board_window.plan('next', self.params), [(15, 3), (30, 3), (60, 3), (120, 3)])
+
+        # An empty board moves the average towards its whole window
+        board_window.record(self.params, None, 120)
+        self.assertAlmostEqual(board_window.expected_headway(self.params), 3 + 0.3 * 117)
+        self.assertListEqual(board_window.plan('next', self.params), [(77, 3), (120, 3)])
+        self.assertListEqual(board_window.plan('fastest', self.params), [(120, None)])
+
+    @patch.dict('os.environ', {'TIMETABLE_FILE': 'tests/mock_responses/gtfs'})
+    @patch('rail_uk.timetable._timetable', None)
+    def test_scheduled_headway(self):
+        # Two departures in the next two hours
+        self.assertEqual(board_window.expected_headway(self.params, now=NOW), 60)
+        self.assertListEqual(board_window.plan('next', self.params, now=NOW), [(120, 3)])
+        # Past the last departure
+        self.assertEqual(board_window.scheduled_headway(self.params, now=NOW.replace(hour=23)), 120)
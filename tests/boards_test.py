@@ -0,0 +1,87 @@
+import logging
+from unittest import TestCase
+
+import xmltodict
+
+from benchmarks import parser_bench
+from benchmarks.boards import BoardGenerator, BOARD_SIZES
+from rail_uk import data
+from rail_uk.dtos import DepartureInfo
+from helpers import helpers
+
+
+class TestBoards(TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+        self.mock_env = helpers.get_test_env()
+        self.mock_env.start()
+        self.boards = BoardGenerator(seed=1)
+
+    def tearDown(self):
+        self.mock_env.stop()
+
+    def test_departure_board_deterministic(self):
+        board = self.boards.departure_board('CLJ', 'WAT', rows=20)
+        self.assertEqual(board, BoardGenerator(seed=1).departure_board('CLJ', 'WAT', rows=20))
+        self.assertNotEqual(board, BoardGenerator(seed=2).departure_board('CLJ', 'WAT', rows=20))
+
+    def test_departure_board_parses(self):
+        board = self.boards.departure_board('CLJ', 'WAT', **BOARD_SIZES['clapham_junction'])
+
+        departures = data.parse_departures_soap_response(board, 'last')
+        self.assertEqual(len(departures), 10)
+        self.assertIsInstance(departures[0], DepartureInfo)
+        self.assertListEqual([departure.std for departure in departures],
+                             sorted(departure.std for departure in departures))
+
+    def test_departure_board_single_service(self):
+        board = self.boards.departure_board('CLJ', 'WAT', rows=1)
+
+        departures = data.parse_departures_soap_response(board, 'next')
+        self.assertEqual(len(departures), 1)
+
+    def test_departure_board_empty(self):
+        board = self.boards.departure_board('CLJ', 'WAT', rows=0)
+        self.assertIsNone(data.parse_departures_soap_response(board, 'next'))
+
+    def test_delays_and_cancellations(self):
+        boards = BoardGenerator(seed=1, delay_rate=0.3, cancel_rate=0.2)
+        board = boards.departure_board('CLJ', 'WAT', rows=150)
+
+        departures = data.parse_departures_soap_response(board, 'last')
+        services = xmltodict.parse(board)['soap:Envelope']['soap:Body']['GetDepartureBoardResponse'][
+            'GetStationBoardResult']['lt5:trainServices']['lt5:service']
+        estimates = [service['lt4:etd'] for service in services]
+        self.assertIn('Cancelled', estimates)
+        self.assertTrue(any(':' in estimate for estimate in estimates))
+        self.assertTrue(all('lt4:cancelReason' in service for service in services
+                            if service['lt4:etd'] == 'Cancelled'))
+        self.assertEqual(len(departures), 10)
+
+    def test_details_board(self):
+        board = self.boards.details_board('WAT', rows=5, calling_points=8)
+
+        result = xmltodict.parse(board)['soap:Envelope']['soap:Body']['GetDepBoardWithDetailsResponse'][
+            'GetStationBoardResult']
+        services = result['lt7:trainServices']['lt7:service']
+        self.assertEqual(result['lt4:crs'], 'WAT')
+        self.assertEqual(len(services), 5)
+        for service in services:
+            calling_points = service['lt7:subsequentCallingPoints']['lt7:callingPointList']['lt7:callingPoint']
+            self.assertEqual(len(calling_points), 8)
+            self.assertEqual(calling_points[-1]['lt7:crs'],
+                             service['lt5:destination']['lt4:location']['lt4:crs'])
+
+    def test_fastest_departures(self):
+        departure = data.parse_fastest_departure_soap_response(self.boards.fastest_departures('CLJ', 'WAT'))
+        self.assertIsInstance(departure, DepartureInfo)
+
+        empty = self.boards.fastest_departures('CLJ', 'WAT', empty=True)
+        self.assertIsNone(data.parse_fastest_departure_soap_response(empty))
+
+    def test_parser_bench(self):
+        results = parser_bench.run_benchmarks(rows=[5], iterations=2)
+
+        self.assertEqual(sorted(results), ['departures_last_5', 'departures_next_5', 'fastest'])
+        self.assertGreater(results['departures_next_5']['alloc_peak_kb'], 0)
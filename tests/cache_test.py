@@ -0,0 +1,194 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from unittest import TestCase
+from unittest.mock import Mock
+
+from rail_uk import cache
+from rail_uk.dtos import DepartureInfo
+from rail_uk.exceptions import OpenLDBWSError
+
+
+class TestCache(TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+        self.now = 1000.0
+        self.cache = cache.TTLCache(2, 60, clock=lambda: self.now)
+        cache.clear()
+
+    def test_expiry(self):
+        self.cache.put('a', None)
+        self.cache.put('b', 'board', ttl=10)
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.get('b'), 'board')
+
+        self.now += 30
+        self.assertIsNone(self.cache.get('a'))
+        self.assertIs(self.cache.get('b'), cache.MISSING)
+        self.assertEqual((self.cache.hits, self.cache.misses), (3, 1))
+
+    def test_least_recently_used_evicted(self):
+        self.cache.put('a', 1)
+        self.cache.put('b', 2)
+        self.cache.get('a')
+        self.cache.put('c', 3)
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIs(self.cache.get('b'), cache.MISSING)
+        self.assertEqual(self.cache.get('c'), 3)
+
+    def test_fetch_through(self):
+        fetch = Mock(side_effect=['board', 'newer board'])
+        self.assertEqual(cache.fetch_through(self.cache, 'a', fetch), ('board', cache.MISS))
+        self.assertEqual(cache.fetch_through(self.cache, 'a', fetch), ('board', cache.HIT))
+        self.assertEqual(cache.fetch_through(self.cache, 'a', fetch, refresh=True), ('newer board', cache.REFRESH))
+        self.assertEqual(fetch.call_count, 2)
+
+    def test_fetch_through_prefer_cached(self):
+        stale_cache = cache.TTLCache(2, 60, stale_window=30, clock=lambda: self.now)
+        fetch = Mock(side_effect=['board', 'newer board'])
+        prefer_cached = Mock(return_value=True)
+        cache.fetch_through(stale_cache, 'a', fetch, prefer_cached=prefer_cached)
+        self.assertEqual(cache.fetch_through(stale_cache, 'a', fetch, prefer_cached=prefer_cached),
+                         ('board', cache.HIT))
+        prefer_cached.assert_not_called()
+
+        # Only asked once the entry has expired
+        self.now += 70
+        self.assertEqual(cache.fetch_through(stale_cache, 'a', fetch, prefer_cached=prefer_cached),
+                         ('board', cache.STALE))
+        prefer_cached.assert_called_once_with()
+        self.assertEqual(fetch.call_count, 1)
+
+    def test_fetch_through_ttl(self):
+        cache.fetch_through(self.cache, 'a', lambda: 'board', ttl=lambda value: 10)
+        cache.fetch_through(self.cache, 'b', lambda: 'board')
+
+        self.now += 30
+        self.assertIs(self.cache.get('a'), cache.MISSING)
+        self.assertEqual(self.cache.get('b'), 'board')
+
+    def test_fetch_through_fetched(self):
+        self.assertEqual(cache.fetch_through(self.cache, 'a', lambda: cache.Fetched('board', 20, False),
+                                             ttl=lambda value: 40), ('board', cache.MISS))
+        self.assertEqual(cache.fetch_through(self.cache, 'b', lambda: cache.Fetched('board', -5, True)),
+                         ('board', cache.STALE))
+
+        self.assertIs(self.cache.get('b'), cache.MISSING)
+        self.now += 30
+        self.assertIs(self.cache.get('a'), cache.MISSING)
+
+    def test_stale_while_revalidate(self):
+        stale_cache = cache.TTLCache(2, 60, stale_window=30, clock=lambda: self.now)
+        fetch = Mock(side_effect=['board', 'newer board'])
+        cache.fetch_through(stale_cache, 'a', fetch)
+
+        self.now += 70
+        self.assertEqual(cache.fetch_through(stale_cache, 'a', fetch), ('board', cache.STALE))
+        self.assertEqual(cache.fetch_through(stale_cache, 'a', fetch), ('board', cache.STALE))
+        self.assertEqual(fetch.call_count, 1)
+
+        self.assertEqual(cache.run_deferred(wait=None), 1)
+        self.assertEqual(cache.run_deferred(wait=None), 0)
+        self.assertEqual(cache.fetch_through(stale_cache, 'a', fetch), ('newer board', cache.HIT))
+
+    def test_run_deferred_bounded(self):
+        stale_cache = cache.TTLCache(5, 60, stale_window=30, clock=lambda: self.now)
+        release = threading.Event()
+        for key in 'abc':
+            cache.fetch_through(stale_cache, key, lambda: 'board')
+        self.now += 70
+
+        def fetch():
+            release.wait(5)
+            return 'newer board'
+
+        try:
+            for key in 'abc':
+                cache.fetch_through(stale_cache, key, fetch)
+            start = time.perf_counter()
+            self.assertEqual(cache.run_deferred(max_keys=2, wait=0.05), 2)
+            self.assertLess(time.perf_counter() - start, 1)
+            # Those still running aren't started again
+            self.assertEqual(cache.run_deferred(max_keys=2, wait=0), 1)
+            self.assertEqual(cache.run_deferred(max_keys=2, wait=0), 0)
+        finally:
+            release.set()
+
+    def test_stale_while_revalidate_in_background(self):
+        stale_cache = cache.TTLCache(2, 60, stale_window=30, clock=lambda: self.now)
+        release = threading.Event()
+        cache.fetch_through(stale_cache, 'a', lambda: 'board')
+        self.now += 70
+
+        def fetch():
+            release.wait(5)
+            return 'newer board'
+
+        cache.set_revalidate_mode(cache.BACKGROUND)
+        try:
+            self.assertEqual(cache.fetch_through(stale_cache, 'a', fetch), ('board', cache.STALE))
+            self.assertEqual(cache.run_deferred(), 0)
+            release.set()
+            for _ in range(100):
+                if stale_cache.get('a') == 'newer board':
+                    break
+                time.sleep(0.05)
+        finally:
+            cache.set_revalidate_mode(cache.DEFERRED)
+        self.assertEqual(stale_cache.get('a'), 'newer board')
+
+    def test_stale_on_error(self):
+        stale_cache = cache.TTLCache(2, 60, stale_if_error=600, clock=lambda: self.now)
+        cache.fetch_through(stale_cache, 'a', lambda: 'board')
+        failing = Mock(side_effect=OpenLDBWSError('Request to Darwin failed'))
+
+        self.now += 300
+        self.assertEqual(cache.fetch_through(stale_cache, 'a', failing, stale_errors=(OpenLDBWSError,)),
+                         ('board', cache.STALE_ON_ERROR))
+        with self.assertRaises(OpenLDBWSError):
+            cache.fetch_through(stale_cache, 'a', failing)
+
+        self.now += 301
+        with self.assertRaises(OpenLDBWSError):
+            cache.fetch_through(stale_cache, 'a', failing, stale_errors=(OpenLDBWSError,))
+
+    def test_board_ttl(self):
+        now = datetime(2019, 3, 1, 17, 50)
+
+        def ttl(std, etd, offset=0):
+            return cache.board_ttl([DepartureInfo(std, etd, 'Southern', 'London Victoria', False, True)], offset,
+                                   now=now)
+
+        # A quarter of the time until the user has to set off, within bounds
+        self.assertEqual(ttl('18:30', 'On time'), cache.BOARD_MAX_TTL)
+        self.assertEqual(ttl('18:02', 'On time'), 180)
+        self.assertEqual(ttl('18:02', 'On time', offset=8), 60)
+        self.assertEqual(ttl('17:52', 'On time'), 30)
+        self.assertEqual(ttl('17:52', 'On time', offset=5), cache.BOARD_MIN_TTL)
+        # A service whose estimate may still move is refreshed sooner
+        self.assertEqual(ttl('17:56', '18:02'), 90)
+        self.assertEqual(ttl('18:02', 'Cancelled'), 90)
+        self.assertEqual(ttl('18:02', 'Delayed'), 45)
+        # Across midnight, and for a service still shown after it was due
+        self.assertEqual(ttl('00:10', 'On time'), cache.BOARD_MAX_TTL)
+        self.assertEqual(ttl('17:45', 'Delayed'), cache.BOARD_MIN_TTL)
+
+        self.assertEqual(cache.board_ttl(None, 0, now=now), cache.BOARD_TTL)
+        self.assertEqual(cache.board_ttl([DepartureInfo('18:02', 'On time', 'Southern', 'London Victoria', False,
+                                                        True)], 0, now=now, policy='fixed'), cache.BOARD_TTL)
+
+    def test_upcoming(self):
+        now = datetime(2019, 3, 1, 21, 45)
+
+        def departure(std, etd):
+            return DepartureInfo(std, etd, 'Southern', 'London Victoria', False, True)
+
+        gone, leaving, late, delayed = (departure('21:40', 'On time'), departure('21:45', 'On time'),
+                                        departure('21:40', '21:50'), departure('21:40', 'Delayed'))
+        self.assertListEqual(cache.upcoming([gone, leaving, late, delayed], now=now), [leaving, late, delayed])
+        self.assertListEqual(cache.upcoming([departure('23:50', 'On time')], now=datetime(2019, 3, 1, 0, 5)), [])
+        self.assertListEqual(cache.upcoming(None, now=now), [])
@@ -0,0 +1,159 @@
+import logging
+import os
+import tempfile
+from decimal import Decimal
+from unittest import TestCase
+from unittest.mock import patch, Mock
+
+from rail_uk import cassette, data, dynamodb
+from rail_uk.dtos import DepartureInfo
+from helpers import helpers
+
+
+class TestCassette(TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+        self.mock_env = helpers.get_test_env()
+        self.mock_env.start()
+        handle, self.path = tempfile.mkstemp(suffix='.cassette')
+        os.close(handle)
+
+    def tearDown(self):
+        cassette.deactivate()
+        self.mock_env.stop()
+        os.remove(self.path)
+
+    def test_intercept_inactive(self):
+        perform = Mock(return_value='response')
+        self.assertEqual(cassette.intercept('openldbws', {'origin': 'HTX'}, perform), 'response')
+        perform.assert_called_once_with()
+
+    def test_record_and_replay(self):
+        recorded = helpers.MockRestResponse(content=b'<Test>12345</Test>')
+        with cassette.recording(self.path):
+            cassette.intercept('openldbws', {'origin': 'HTX'}, lambda: recorded)
+
+        perform = Mock()
+        with cassette.replaying(self.path, timing=False):
+            response = cassette.intercept('openldbws', {'origin': 'HTX'}, perform)
+
+        perform.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.reason, 'OK')
+        self.assertTrue(response.ok)
+        self.assertEqual(response.content, b'<Test>12345</Test>')
+
+    def test_replay_miss(self):
+        with cassette.replaying(self.path, timing=False):
+            with self.assertRaises(cassette.CassetteMiss):
+                cassette.intercept('openldbws', {'origin': 'HTX'}, Mock())
+
+    def test_replay_sequence(self):
+        with cassette.recording(self.path):
+            for status in (500, 200):
+                cassette.intercept('transportapi', {'origin': 'HTX'},
+                                   lambda: helpers.MockRestResponse(json_content={}, status_code=status))
+
+        with cassette.replaying(self.path, timing=False):
+            statuses = [cassette.intercept('transportapi', {'origin': 'HTX'}, Mock()).status_code
+                        for _ in range(3)]
+        self.assertListEqual(statuses, [500, 200, 200])
+
+    @patch('rail_uk.cassette.time.sleep')
+    def test_replay_timing(self, mock_sleep):
+        with cassette.recording(self.path) as recording:
+            recording.save('dynamodb', cassette._make_key({'UserID': 'A'}), {'Item': {}}, 0.25)
+
+        with cassette.replaying(self.path):
+            cassette.intercept('dynamodb', {'UserID': 'A'}, Mock())
+        mock_sleep.assert_called_once_with(0.25)
+
+    def test_record_timing_includes_body(self):
+        now = [10.0]
+
+        class StreamedResponse(helpers.MockRestResponse):
+            # Only the headers have arrived until the body is read
+            @property
+            def content(self):
+                now[0] += 0.5
+                return self._content
+
+            @content.setter
+            def content(self, content):
+                self._content = content
+
+        with patch('rail_uk.cassette.time.perf_counter', lambda: now[0]):
+            with cassette.recording(self.path) as recording:
+                cassette.intercept('openldbws', {'origin': 'HTX'}, lambda: StreamedResponse(content=b'<Test/>'))
+                elapsed = recording._connection.execute('SELECT elapsed FROM interactions').fetchone()[0]
+        self.assertEqual(elapsed, 0.5)
+
+    def test_secrets_redacted(self):
+        body = b'<typ:TokenValue>MOCK_DARWIN_TOKEN</typ:TokenValue>'
+        with cassette.recording(self.path) as recording:
+            cassette.intercept('openldbws', {'origin': 'HTX'}, lambda: helpers.MockRestResponse(content=body))
+            _, _, response = next(recording.interactions())
+
+        self.assertEqual(response.content, b'<typ:TokenValue>[REDACTED]</typ:TokenValue>')
+
+    def test_dynamodb_decimals(self):
+        item = {'Item': {'station_crs': 'HTX', 'distance': Decimal('10')}}
+        with cassette.recording(self.path):
+            cassette.intercept('dynamodb', {'operation': 'GetItem', 'UserID': 'A'}, lambda: item)
+
+        with cassette.replaying(self.path, timing=False):
+            response = cassette.intercept('dynamodb', {'operation': 'GetItem', 'UserID': 'A'}, Mock())
+        self.assertDictEqual(response, {'Item': {'station_crs': 'HTX', 'distance': 10}})
+
+    def test_record_event(self):
+        event = helpers.generate_test_event('LaunchRequest')
+        with cassette.recording(self.path) as recording:
+            cassette.record_event(event)
+            self.assertListEqual(recording.events(), [event])
+
+    @patch('rail_uk.data.quota.acquire')
+    @patch('rail_uk.data.get_http_session')
+    def test_replay_soap_request(self, mock_session, mock_acquire):
+        test_params = helpers.generate_test_api_params()
+        request_vars = {
+            'access_token': 'MOCK_DARWIN_TOKEN',
+            'origin': test_params.origin.crs,
+            'destination': test_params.destination.crs,
+            'time_offset': 0,
+            'time_window': 120
+        }
+        board = helpers.generate_test_soap_response('open_ldbws', 'departure_board.xml')
+        mock_session.return_value.post.return_value = helpers.MockRestResponse(content=board.encode())
+
+        with cassette.recording(self.path):
+            data.make_soap_request(request_vars, 'departure_board.xml')
+        mock_acquire.assert_called_once_with('openldbws')
+        mock_session.reset_mock()
+        mock_acquire.reset_mock()
+
+        with cassette.replaying(self.path, timing=False):
+            response = data.make_soap_request(dict(request_vars, access_token='OTHER_TOKEN'), 'departure_board.xml')
+        mock_session.return_value.post.assert_not_called()
+        # Replayed requests don't use up the quota
+        mock_acquire.assert_not_called()
+
+        departures = data.parse_departures_soap_response(response, 'next')
+        self.assertIsInstance(departures[0], DepartureInfo)
+
+    def test_replay_home_station(self):
+        dynamodb._table = Mock()
+        dynamodb._table.get_item.return_value = {
+            'Item': {'station_name': 'Home Town', 'station_crs': 'HTX', 'distance': Decimal('10')}
+        }
+        with cassette.recording(self.path):
+            dynamodb.get_home_station('amzn1.ask.account.TEST')
+        dynamodb._table = Mock()
+
+        with cassette.replaying(self.path, timing=False):
+            home_station = dynamodb.get_home_station('amzn1.ask.account.TEST')
+        dynamodb._table.get_item.assert_not_called()
+        dynamodb._table = None
+
+        self.assertEqual(home_station.station.crs, 'HTX')
+        self.assertEqual(home_station.distance, 10)
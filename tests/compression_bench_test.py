@@ -0,0 +1,32 @@
+import logging
+from unittest import TestCase
+from unittest.mock import patch
+
+from benchmarks import compression_bench
+from helpers import helpers
+
+
+@patch('rail_uk.data.payload_capture.is_wanted', return_value=False)
+class TestCompressionBench(TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+        self.mock_env = helpers.get_test_env()
+        self.mock_env.start()
+
+    def tearDown(self):
+        self.mock_env.stop()
+
+    def test_board(self, _):
+        # Departures are parsed from the decompressed stream either way
+        plain = compression_bench.measure(compression_bench.fetch_board, 'identity', board_rows=50, bandwidth=0,
+                                          iterations=1)
+        compressed = compression_bench.measure(compression_bench.fetch_board, 'gzip', board_rows=50, bandwidth=0,
+                                               iterations=1)
+        self.assertLess(compressed['response_bytes'] * 4, plain['response_bytes'])
+
+    def test_timetable(self, _):
+        plain = compression_bench.measure(compression_bench.fetch_timetable, 'identity', bandwidth=0, iterations=1)
+        compressed = compression_bench.measure(compression_bench.fetch_timetable, 'deflate', bandwidth=0,
+                                               iterations=1)
+        self.assertLess(compressed['response_bytes'], plain['response_bytes'])
@@ -1,11 +1,13 @@
 import logging
+import threading
 from unittest import TestCase
 from unittest.mock import patch, Mock
-from datetime import datetime
+from datetime import date, datetime
 
-from rail_uk import data
+from rail_uk import board_window, cache, data, timetable_providers
 from rail_uk.dtos import Station, APIParameters, DepartureInfo
-from rail_uk.exceptions import ApplicationError, OpenLDBWSError, TransportAPIError
+from rail_uk.journey import Leg
+from rail_uk.exceptions import ApplicationError, OpenLDBWSError, QuotaExceededError, TransportAPIError
 from helpers import helpers
 
 
@@ -15,6 +17,9 @@ class TestData(TestCase):
         logging.basicConfig(level='DEBUG')
         self.mock_env = helpers.get_test_env()
         self.mock_env.start()
+        cache.clear()
+        timetable_providers.reset()
+        board_window.reset()
 
     def tearDown(self):
         self.mock_env.stop()
@@ -78,6 +83,108 @@ class TestData(TestCase):
         self.assertEqual(len(departures), 2)
         self.assertTupleEqual(departures[0], example_departure)
 
+    @patch('rail_uk.data.make_soap_request')
+    @patch('rail_uk.data.parse_departures_soap_response')
+    def test_get_next_departures_cached(self, mock_parser, mock_request):
+        test_params = helpers.generate_test_api_params()
+        example_departure = helpers.generate_departure_details(etd='On time', in_past=False)
+        mock_parser.return_value = [example_departure]
+
+        self.assertTupleEqual(data.get_next_departures(test_params), example_departure)
+        self.assertTupleEqual(data.get_next_departures(test_params), example_departure)
+        mock_request.assert_called_once()
+
+        data.get_departure_board(test_params, refresh=True)
+        self.assertEqual(mock_request.call_count, 2)
+
+    @patch('rail_uk.cache.BOARD_TTL_POLICY', 'fixed')
+    @patch('rail_uk.cache._board_cache')
+    @patch('rail_uk.data.make_soap_request')
+    @patch('rail_uk.data.parse_departures_soap_response')
+    def test_get_next_departures_stale_on_error(self, mock_parser, mock_request, _):
+        now = [1000.0]
+        cache._board_cache = cache.TTLCache(10, 60, stale_window=30, stale_if_error=600, clock=lambda: now[0])
+        test_params = helpers.generate_test_api_params()
+        example_departure = helpers.generate_departure_details(etd='On time', in_past=False)
+        mock_parser.return_value = [example_departure]
+        data.get_next_departures(test_params)
+
+        now[0] += 75
+        self.assertTrue(data.get_next_departures(test_params).stale)
+        mock_request.assert_called_once()
+
+        now[0] += 60
+        mock_request.side_effect = OpenLDBWSError('Request to Darwin failed - Read timed out.')
+        self.assertTupleEqual(data.get_next_departures(test_params), example_departure._replace(stale=True))
+
+        now[0] += 600
+        with self.assertRaises(OpenLDBWSError):
+            data.get_next_departures(test_params)
+
+    @patch('rail_uk.data.quota.is_constrained', return_value=False)
+    @patch('rail_uk.data.make_soap_request')
+    @patch('rail_uk.data.parse_departures_soap_response')
+    def test_get_next_departures_quota_only_read_upstream(self, mock_parser, _, mock_constrained):
+        mock_parser.return_value = [helpers.generate_departure_details(etd='On time', in_past=False)]
+        test_params = helpers.generate_test_api_params()
+        for _ in range(3):
+            data.get_next_departures(test_params)
+        # The quota's shared store isn't read for boards served from the cache
+        mock_constrained.assert_not_called()
+
+    @patch('rail_uk.data.make_soap_request')
+    @patch('rail_uk.data.parse_departures_soap_response')
+    def test_get_next_departures_widened(self, mock_parser, mock_request):
+        example_departure = helpers.generate_departure_details(etd='On time', in_past=False)
+        mock_parser.side_effect = [None, [example_departure]]
+
+        self.assertTupleEqual(data.get_next_departures(helpers.generate_test_api_params()), example_departure)
+        windows = [(call[0][0]['time_window'], call[0][0]['num_rows']) for call in mock_request.call_args_list]
+        self.assertListEqual(windows, [(30, 3), (60, 3)])
+
+    @patch('rail_uk.data.make_soap_request')
+    @patch('rail_uk.data.live_state')
+    @patch('rail_uk.data.datetime')
+    def test_get_next_departures_live_state(self, mock_time, mock_live_state, mock_request):
+        test_params = helpers.generate_test_api_params()
+        example_departure = helpers.generate_departure_details(etd='On time', in_past=False)
+
+        mock_time.now.return_value = datetime(2019, 2, 28, 21, 45)
+        mock_live_state.is_available.return_value = True
+        mock_live_state.get_live_state.return_value.departures.return_value = [example_departure]
+
+        departure = data.get_next_departures(test_params)
+        self.assertTupleEqual(departure, example_departure)
+        mock_live_state.get_live_state.return_value.departures.assert_called_once_with('HTX', 'TTX', 21 * 60 + 45,
+                                                                                      limit=3)
+        mock_request.assert_not_called()
+
+    @patch('rail_uk.data.make_soap_request')
+    @patch('rail_uk.data.parse_departures_soap_response')
+    @patch('rail_uk.data.live_state')
+    def test_get_next_departures_live_state_not_covered(self, mock_live_state, mock_parser, mock_request):
+        mock_live_state.is_available.return_value = True
+        mock_live_state.get_live_state.return_value.covers.return_value = False
+        mock_parser.return_value = None
+
+        self.assertIsNone(data.get_next_departures(helpers.generate_test_api_params()))
+        # Asked of OpenLDBWS instead, widening the empty board to two hours
+        self.assertEqual(mock_request.call_args[0][0]['time_window'], 120)
+
+    @patch('rail_uk.data.make_soap_request')
+    @patch('rail_uk.data.live_state')
+    @patch('rail_uk.data.datetime')
+    def test_get_fastest_departure_live_state(self, mock_time, mock_live_state, mock_request):
+        example_departure = helpers.generate_departure_details(etd='On time', in_past=False)
+
+        mock_time.now.return_value = datetime(2019, 2, 28, 21, 45)
+        mock_live_state.is_available.return_value = True
+        mock_live_state.get_live_state.return_value.fastest_departure.return_value = example_departure
+
+        departure = data.get_fastest_departure(helpers.generate_test_api_params())
+        self.assertTupleEqual(departure, example_departure)
+        mock_request.assert_not_called()
+
     @patch('rail_uk.data.make_soap_request')
     @patch('rail_uk.data.parse_fastest_departure_soap_response')
     def test_get_fastest_departure(self, mock_parser, mock_request):
@@ -90,6 +197,102 @@ class TestData(TestCase):
         departure = data.get_fastest_departure(test_params)
         self.assertTupleEqual(departure, example_departure)
 
+    @patch.dict('os.environ', {'TIMETABLE_FILE': 'tests/mock_responses/gtfs'})
+    @patch('rail_uk.timetable._timetable', None)
+    @patch('rail_uk.data.make_soap_request')
+    @patch('rail_uk.data.datetime')
+    def test_get_next_departures_quota_reached(self, mock_time, mock_request):
+        test_params = helpers.generate_test_api_params()
+        mock_time.now.return_value = datetime(2019, 2, 28, 20, 0)
+        mock_request.side_effect = QuotaExceededError('openldbws quota reached')
+        expected_departure = DepartureInfo('21:00', '21:00', 'Train Operator Limited', 'Train City',
+                                           in_past=False, live=False)
+
+        departure = data.get_next_departures(test_params)
+        self.assertTupleEqual(departure, expected_departure)
+
+    @patch.dict('os.environ', {'TIMETABLE_FILE': 'tests/mock_responses/gtfs'})
+    @patch('rail_uk.journey._planner', None)
+    @patch('rail_uk.timetable._timetable', None)
+    @patch('rail_uk.data.make_soap_request')
+    @patch('rail_uk.data.parse_fastest_departure_soap_response')
+    @patch('rail_uk.data.parse_departures_soap_response')
+    @patch('rail_uk.data.datetime')
+    def test_get_fastest_departure_offline(self, mock_time, mock_board_parser, mock_parser, _):
+        test_params = APIParameters(Station('Train Town', 'TTX'), Station('Train City', 'TCX'), 0)
+        mock_time.now.return_value = datetime(2019, 2, 28, 20, 0)
+        mock_parser.return_value = None
+        mock_board_parser.return_value = None
+        expected_departure = DepartureInfo('21:31', '21:31', 'Train Operator Limited', 'Train City',
+                                           in_past=False, live=False, arrival='22:00')
+
+        departure = data.get_fastest_departure(test_params)
+        self.assertTupleEqual(departure, expected_departure)
+
+    @patch.dict('os.environ', {'TIMETABLE_FILE': 'tests/mock_responses/gtfs'})
+    @patch('rail_uk.journey._planner', None)
+    @patch('rail_uk.timetable._timetable', None)
+    @patch('rail_uk.data.make_soap_request')
+    @patch('rail_uk.data.parse_fastest_departure_soap_response')
+    @patch('rail_uk.data.parse_departures_soap_response')
+    @patch('rail_uk.data.datetime')
+    def test_get_fastest_departure_offline_live(self, mock_time, mock_board_parser, mock_parser, mock_request):
+        test_params = APIParameters(Station('Home Town', 'HTX'), Station('Train City', 'TCX'), 0)
+        mock_time.now.return_value = datetime(2019, 2, 28, 20, 0)
+        mock_parser.return_value = None
+        live_departure = DepartureInfo('21:00', '21:10', 'Train Operator Limited', 'Train City',
+                                       in_past=False, live=True)
+        mock_board_parser.return_value = [live_departure]
+
+        departure = data.get_fastest_departure(test_params)
+        self.assertTupleEqual(departure, live_departure._replace(arrival='22:10'))
+        self.assertEqual(mock_request.call_args[0][0]['destination'], 'TCX')
+
+    @patch.dict('os.environ', {'TIMETABLE_FILE': 'tests/mock_responses/gtfs'})
+    @patch('rail_uk.journey._planner', None)
+    @patch('rail_uk.timetable._timetable', None)
+    @patch('rail_uk.data.make_soap_request')
+    @patch('rail_uk.data.parse_fastest_departure_soap_response')
+    @patch('rail_uk.data.parse_departures_soap_response')
+    @patch('rail_uk.data.datetime')
+    def test_get_fastest_departure_offline_live_failed(self, mock_time, mock_board_parser, mock_parser, _):
+        test_params = APIParameters(Station('Home Town', 'HTX'), Station('Train City', 'TCX'), 0)
+        mock_time.now.return_value = datetime(2019, 2, 28, 20, 0)
+        mock_parser.return_value = None
+        mock_board_parser.side_effect = OpenLDBWSError('Request to Darwin failed - Internal server error')
+
+        departure = data.get_fastest_departure(test_params)
+        self.assertTupleEqual(departure, DepartureInfo('21:00', '21:00', 'Train Operator Limited', 'Train City',
+                                                       in_past=False, live=False, arrival='22:00'))
+
+    @patch('rail_uk.data.journey.get_planner')
+    @patch('rail_uk.data.make_soap_request')
+    @patch('rail_uk.data.parse_departures_soap_response', return_value=None)
+    @patch('rail_uk.data.datetime')
+    def test_get_fastest_journey_offline_changes(self, mock_time, _, __, mock_planner):
+        mock_time.now.return_value = datetime(2019, 2, 28, 22, 0)
+        mock_planner.return_value.earliest_arrival.return_value = [
+            Leg('TTX', 'HTX', '22:10', '22:10', '22:40', '22:40', 'Train Operator Limited', 'Home Town', 'T5'),
+            Leg('HTX', 'ELS', '22:45', '22:45', '23:50', '23:55', 'Train Operator Limited', 'Elsewhere', 'T3')
+        ]
+        mock_planner.return_value.delays_from_board.return_value = {}
+
+        departure = data.get_fastest_journey_offline(APIParameters(Station('Train Town', 'TTX'),
+                                                                   Station('Elsewhere', 'ELS'), 0))
+        self.assertTupleEqual(departure, DepartureInfo('22:10', '22:10', 'Train Operator Limited', 'Home Town',
+                                                       in_past=False, live=False, changes=1, arrival='23:55'))
+
+    @patch('rail_uk.data.make_soap_request')
+    @patch('rail_uk.data.parse_fastest_departure_soap_response')
+    @patch('rail_uk.data.get_fastest_journey_offline')
+    def test_get_fastest_departure_unconfigured(self, mock_offline, mock_parser, _):
+        mock_parser.return_value = None
+
+        self.assertIsNone(data.get_fastest_departure(helpers.generate_test_api_params()))
+        mock_offline.assert_not_called()
+        # Empty fastest boards aren't taken as next train headways
+        self.assertIsNone(board_window.expected_headway(helpers.generate_test_api_params()))
+
     @patch('rail_uk.data.get_last_departure_from_timetable')
     @patch('rail_uk.data.datetime')
     @patch('rail_uk.data.get_last_departure_live_time')
@@ -106,9 +309,10 @@ class TestData(TestCase):
         departure = data.get_last_departure(test_params)
         self.assertTupleEqual(departure, test_departure)
 
+    @patch('rail_uk.data.speculate_evening_board', return_value=None)
     @patch('rail_uk.data.get_last_departure_from_timetable')
     @patch('rail_uk.data.datetime')
-    def test_get_last_departure_in_past(self, mock_time, mock_timetable):
+    def test_get_last_departure_in_past(self, mock_time, mock_timetable, _):
         test_params = helpers.generate_test_api_params()
 
         mock_timetable.return_value = helpers.generate_departure_details()
@@ -120,6 +324,33 @@ class TestData(TestCase):
         expected_departure = helpers.generate_departure_details(in_past=True)
         self.assertTupleEqual(departure, expected_departure)
 
+    @patch('rail_uk.data.speculate_evening_board')
+    @patch('rail_uk.data.get_last_departure_from_timetable')
+    @patch('rail_uk.data.datetime')
+    def test_get_last_departure_in_past_speculated(self, mock_time, mock_timetable, mock_speculate):
+        mock_timetable.return_value = helpers.generate_departure_details()
+        mock_time.now.return_value.strftime.return_value = '23:00'
+
+        data.get_last_departure(helpers.generate_test_api_params())
+        # The evening board isn't wanted after all
+        mock_speculate.return_value.cancel.assert_called_once_with()
+
+    @patch('rail_uk.data.make_soap_request')
+    @patch('rail_uk.data.datetime')
+    def test_get_last_departure_in_past_cached(self, mock_time, mock_request):
+        test_params = helpers.generate_test_api_params()
+        mock_time.now.return_value.strftime.return_value = '23:00'
+        mock_time.strptime.side_effect = datetime.strptime
+        cache.get_timetable_cache().put(('HTX', 'TTX', str(date.today()), data.LAST_TRAIN_FROM), [
+            {'aimed_departure_time': '22:00', 'operator_name': 'Train Operator Limited',
+             'destination_name': 'Train Town'}
+        ])
+
+        departure = data.get_last_departure(test_params)
+        self.assertTrue(departure.in_past)
+        # The last train was known to have gone, so no board was asked for
+        mock_request.assert_not_called()
+
     @patch('rail_uk.data.get_last_departure_from_timetable')
     @patch('rail_uk.data.datetime')
     @patch('rail_uk.data.get_last_departure_live_time')
@@ -137,10 +368,37 @@ class TestData(TestCase):
         mock_live_etd.assert_called()
         self.assertTupleEqual(departure, expected_departure)
 
+    @patch('rail_uk.data.get_last_departure_from_timetable')
+    @patch('rail_uk.data.datetime')
+    @patch('rail_uk.data.make_soap_request')
+    @patch('rail_uk.data.parse_departures_soap_response')
+    def test_get_last_departure_speculative(self, mock_parser, mock_request, mock_time, mock_timetable):
+        board_requested = threading.Event()
+        mock_time_now = Mock()
+        mock_time_now.strftime.return_value = '21:45'
+        mock_time.now.return_value = mock_time_now
+        mock_time.strptime.side_effect = datetime.strptime
+        mock_request.side_effect = lambda *_: board_requested.set()
+        mock_parser.return_value = [helpers.generate_departure_details(different=True),
+                                    helpers.generate_departure_details(etd='22:03')]
+
+        def timetable_lookup(_):
+            # The board is asked for while the last train is still being looked up
+            self.assertTrue(board_requested.wait(5))
+            return helpers.generate_departure_details()
+        mock_timetable.side_effect = timetable_lookup
+
+        departure = data.get_last_departure(helpers.generate_test_api_params())
+        self.assertTupleEqual(departure, helpers.generate_departure_details(etd='22:03')._replace(live=True))
+        request_vars = mock_request.call_args[0][0]
+        self.assertEqual((request_vars['time_offset'], request_vars['time_window']), (-10, 120))
+        mock_parser.assert_called_once_with(None, 'evening')
+
     # --------------------------- Test Request Helpers ---------------------------
 
-    @patch('rail_uk.data.requests')
-    def test_make_soap_request(self, mock_requests):
+    @patch('rail_uk.data.get_http_session')
+    @patch('rail_uk.data.payload_capture.is_wanted', return_value=True)
+    def test_make_soap_request(self, _, mock_session):
         mock_params = {
             'access_token': 'MOCK_DARWIN_TOKEN',
             'origin': 'HTX',
@@ -150,12 +408,58 @@ class TestData(TestCase):
         }
 
         test_data = '<TestData>12345</TestData>'
-        mock_requests.post.return_value = helpers.MockRestResponse(content=test_data)
+        mock_session.return_value.post.return_value = helpers.MockRestResponse(content=test_data)
 
         response = data.make_soap_request(mock_params, 'departure_board.xml')
-        mock_requests.post.assert_called()
+        mock_session.return_value.post.assert_called()
         self.assertEqual(test_data, response)
 
+    @patch('rail_uk.data.get_http_session')
+    @patch('rail_uk.data.payload_capture.is_wanted', return_value=False)
+    def test_make_soap_request_streamed(self, _, mock_session):
+        test_data = helpers.generate_test_soap_response('open_ldbws', 'departure_board.xml').encode('utf-8')
+        mock_response = helpers.MockRestResponse(content=test_data)
+        mock_session.return_value.post.return_value = mock_response
+
+        response = data.make_soap_request({'access_token': 'MOCK_DARWIN_TOKEN'}, 'departure_board.xml')
+        self.assertEqual(mock_session.return_value.post.call_args[1]['headers']['accept-encoding'], 'gzip, deflate')
+        self.assertTrue(mock_session.return_value.post.call_args[1]['stream'])
+        self.assertEqual(len(data.parse_departures_soap_response(response, 'last')), 10)
+
+    @patch('rail_uk.data.get_http_session')
+    @patch('rail_uk.data.UPSTREAM_CHUNK_BYTES', 1024)
+    def test_make_soap_request_single_chunk(self, mock_session):
+        board = helpers.generate_test_soap_response('open_ldbws', 'departure_board.xml').encode('utf-8')
+        mock_session.return_value.post.return_value = helpers.MockRestResponse(content=board)
+        self.assertIsInstance(data.make_soap_request({'access_token': 'MOCK_DARWIN_TOKEN'}, 'departure_board.xml'),
+                              data._StreamedBody)
+
+        # A board that arrives in one chunk is parsed once its connection is released
+        mock_session.return_value.post.return_value = helpers.MockRestResponse(content=board[:1000])
+        self.assertEqual(data.make_soap_request({'access_token': 'MOCK_DARWIN_TOKEN'}, 'departure_board.xml'),
+                         board[:1000])
+
+    @patch('rail_uk.data.get_http_session')
+    @patch('rail_uk.data.payload_capture.is_wanted', return_value=False)
+    @patch('rail_uk.data.UPSTREAM_CHUNK_BYTES', 100)
+    def test_make_soap_request_streamed_fault(self, _, mock_session):
+        fault = helpers.generate_test_soap_response('open_ldbws', 'darwin_fault.xml').encode('utf-8')
+        mock_session.return_value.post.return_value = helpers.MockRestResponse(content=fault)
+
+        response = data.make_soap_request({'access_token': 'MOCK_DARWIN_TOKEN'}, 'departure_board.xml')
+        self.assertIsInstance(response, data._StreamedBody)
+        with self.assertRaises(OpenLDBWSError) as context:
+            data.parse_departures_soap_response(response, 'next')
+        self.assertNotIn('Could not parse', str(context.exception))
+
+    @patch('rail_uk.data.get_http_session')
+    def test_make_soap_request_unreachable(self, mock_session):
+        mock_session.return_value.post.side_effect = IOError('Read timed out.')
+
+        with self.assertRaises(OpenLDBWSError) as context:
+            data.make_soap_request({}, 'departure_board.xml')
+        self.assertEqual('Request to Darwin failed - Read timed out.', str(context.exception))
+
     @patch('rail_uk.data.get_timetable')
     def test_get_last_departure_from_timetable(self, mock_timetable):
         test_params = helpers.generate_test_api_params()
@@ -167,6 +471,17 @@ class TestData(TestCase):
         self.assertTupleEqual(departure, expected_departure)
         mock_timetable.assert_called_once()
 
+    @patch('rail_uk.data.get_timetable')
+    def test_get_last_departure_from_timetable_cached(self, mock_timetable):
+        test_params = helpers.generate_test_api_params()
+        mock_timetable.return_value = helpers.generate_test_timetable()
+
+        data.get_last_departure_from_timetable(test_params)
+        departure = data.get_last_departure_from_timetable(test_params)
+
+        self.assertTupleEqual(departure, helpers.generate_departure_details())
+        mock_timetable.assert_called_once()
+
     @patch('rail_uk.data.get_timetable')
     def test_get_last_departure_from_timetable_early(self, mock_timetable):
         test_params = helpers.generate_test_api_params()
@@ -178,9 +493,38 @@ class TestData(TestCase):
         self.assertTupleEqual(departure, expected_departure)
         self.assertEqual(mock_timetable.call_count, 2)
 
-    @patch('requests.get', side_effect=helpers.generate_mock_rest_response)
+    @patch.dict('os.environ', {'TIMETABLE_FILE': 'tests/mock_responses/gtfs'})
+    @patch('rail_uk.timetable._timetable', None)
+    @patch('rail_uk.data.get_timetable')
+    @patch('rail_uk.data.date')
+    def test_get_last_departure_from_timetable_offline(self, mock_date, mock_timetable):
+        test_params = helpers.generate_test_api_params()
+        mock_date.today.return_value = date(2019, 2, 28)
+        expected_departure = DepartureInfo('22:50', '22:50', 'Train Operator Limited', 'Train Town',
+                                           in_past=False, live=False)
+
+        departure = data.get_last_departure_from_timetable(test_params)
+
+        self.assertTupleEqual(departure, expected_departure)
+        mock_timetable.assert_not_called()
+
+    @patch.dict('os.environ', {'TIMETABLE_FILE': 'tests/mock_responses/gtfs'})
+    @patch('rail_uk.timetable._timetable', None)
+    @patch('rail_uk.data.get_timetable')
+    @patch('rail_uk.data.date')
+    def test_get_last_departure_from_timetable_offline_fallback(self, mock_date, mock_timetable):
+        test_params = helpers.generate_test_api_params()
+        mock_date.today.return_value = date(2019, 3, 3)
+        mock_timetable.return_value = helpers.generate_test_timetable()
+
+        departure = data.get_last_departure_from_timetable(test_params)
+
+        self.assertTupleEqual(departure, helpers.generate_departure_details())
+        mock_timetable.assert_called_once()
+
+    @patch('rail_uk.data.get_http_session')
     @patch('rail_uk.data.date')
-    def test_get_timetable_ok(self, mock_date, mock_api):
+    def test_get_timetable_ok(self, mock_date, mock_session):
         expected_url = 'https://transportapi.com/v3/uk/train/station/HTX/2019-03-01/19:45/timetable.json'
         expected_params = {
             'app_id': 'MOCK_APP_ID',
@@ -191,16 +535,37 @@ class TestData(TestCase):
         }
         expected_data = ['Example Departures']
         mock_date.today.return_value = '2019-03-01'
+        mock_api = mock_session.return_value.get
+        mock_api.side_effect = helpers.generate_mock_rest_response
 
         test_params = helpers.generate_test_api_params()
         result = data.get_timetable(test_params, '19:45')
         self.assertListEqual(result, expected_data)
-        mock_api.assert_called_with(expected_url, params=expected_params)
+        mock_api.assert_called_with(expected_url, params=expected_params, headers={'accept-encoding': 'gzip, deflate'},
+                                    timeout=data.UPSTREAM_TIMEOUT, stream=True)
 
-    @patch('requests.get', side_effect=helpers.generate_mock_rest_response)
+    @patch('rail_uk.data.get_http_session')
+    @patch('rail_uk.data.payload_capture.is_wanted', return_value=False)
+    def test_get_timetable_streamed(self, _, mock_session):
+        mock_session.return_value.get.return_value = helpers.generate_test_rest_response()
+
+        result = data.get_timetable(helpers.generate_test_api_params(), '19:45')
+        expected = [{field: departure[field] for field in data.TIMETABLE_FIELDS}
+                    for departure in helpers.generate_test_timetable()]
+        self.assertListEqual(result, expected)
+
+    @patch('rail_uk.data.get_http_session')
+    def test_get_timetable_malformed(self, mock_session):
+        mock_session.return_value.get.return_value = helpers.MockRestResponse(content=b'{"departures": {"all": [{')
+
+        with self.assertRaises(TransportAPIError):
+            data.get_timetable(helpers.generate_test_api_params(), '19:45')
+
+    @patch('rail_uk.data.get_http_session')
     @patch('rail_uk.data.date')
-    def test_get_timetable_client_err(self, mock_date, _):
+    def test_get_timetable_client_err(self, mock_date, mock_session):
         mock_date.today.return_value = '2019-03-01'
+        mock_session.return_value.get.side_effect = helpers.generate_mock_rest_response
         test_params = APIParameters(
             Station('Invalid query', 'XXX'),
             Station('_', '_'),
@@ -211,10 +576,11 @@ class TestData(TestCase):
             data.get_timetable(test_params, '19:45')
         self.assertEqual('Request to TransportAPI failed - Not found', str(context.exception))
 
-    @patch('requests.get', side_effect=helpers.generate_mock_rest_response)
+    @patch('rail_uk.data.get_http_session')
     @patch('rail_uk.data.date')
-    def test_get_timetable_api_err(self, mock_date, _):
+    def test_get_timetable_api_err(self, mock_date, mock_session):
         mock_date.today.return_value = '2019-03-01'
+        mock_session.return_value.get.side_effect = helpers.generate_mock_rest_response
         test_params = APIParameters(
             Station('Simulated API failure', 'BROKEN'),
             Station('_', '_'),
@@ -225,10 +591,11 @@ class TestData(TestCase):
             data.get_timetable(test_params, '19:45')
         self.assertEqual('Request to TransportAPI failed - Internal server error', str(context.exception))
 
-    @patch('requests.get', side_effect=helpers.generate_mock_rest_response)
+    @patch('rail_uk.data.get_http_session')
     @patch('rail_uk.data.date')
-    def test_get_timetable_unknown_err(self, mock_date, _):
+    def test_get_timetable_unknown_err(self, mock_date, mock_session):
         mock_date.today.return_value = '2019-03-01'
+        mock_session.return_value.get.side_effect = helpers.generate_mock_rest_response
         test_params = APIParameters(
             Station('Simulated new API version', 'UPDATED'),
             Station('_', '_'),
@@ -240,6 +607,14 @@ class TestData(TestCase):
         expected_err = 'TransportAPI responded in an unexpected way - \'departures\' not found in response'
         self.assertEqual(expected_err, str(context.exception))
 
+    @patch('rail_uk.data.get_http_session')
+    def test_get_timetable_unreachable(self, mock_session):
+        mock_session.return_value.get.side_effect = IOError('Connection refused')
+
+        with self.assertRaises(TransportAPIError) as context:
+            data.get_timetable(helpers.generate_test_api_params(), '19:45')
+        self.assertEqual('Request to TransportAPI failed - Connection refused', str(context.exception))
+
     @patch('rail_uk.data.datetime')
     @patch('rail_uk.data.make_soap_request', return_value=helpers.MockRestResponse(json_content={}))
     @patch('rail_uk.data.parse_departures_soap_response')
@@ -263,6 +638,79 @@ class TestData(TestCase):
         mock_request.assert_called_once()
         mock_parser.assert_called_once()
 
+    @patch('rail_uk.data.datetime')
+    @patch('rail_uk.data.make_soap_request')
+    @patch('rail_uk.data.parse_departures_soap_response')
+    def test_get_last_departure_live_time_evening_board(self, mock_parser, mock_request, mock_time):
+        mock_time_now = Mock()
+        mock_time_now.strftime.return_value = '21:45'
+        mock_time.now.return_value = mock_time_now
+        mock_time.strptime.side_effect = datetime.strptime
+        mock_parser.return_value = [helpers.generate_departure_details(etd='On time')]
+
+        test_params = helpers.generate_test_api_params()
+        for _ in range(2):
+            etd = data.get_last_departure_live_time(helpers.generate_departure_details(), test_params)
+            self.assertEqual(etd, 'On time')
+        # Matched against the same cached board, whatever the user's offset
+        etd = data.get_last_departure_live_time(helpers.generate_departure_details(), test_params._replace(offset=5))
+        self.assertEqual(etd, 'On time')
+        mock_request.assert_called_once()
+
+    @patch('rail_uk.cache.datetime')
+    @patch('rail_uk.data.make_soap_request')
+    @patch('rail_uk.data.parse_departures_soap_response')
+    def test_get_evening_board_departed(self, mock_parser, mock_request, mock_time):
+        mock_time.now.return_value = datetime(2019, 3, 1, 21, 45)
+        mock_parser.return_value = [
+            helpers.generate_departure_details(etd='21:42', different=True),
+            helpers.generate_departure_details(etd='On time')
+        ]
+
+        test_params = helpers.generate_test_api_params()
+        data.get_evening_board(test_params)
+
+        # Cached for as long as the service still to leave, not the one gone
+        entry = cache.get_board_cache().get_entry(cache.board_key('evening', test_params._replace(offset=0)))
+        self.assertEqual(entry.expires_at - entry.stored_at, cache.board_ttl(
+            [helpers.generate_departure_details(etd='On time')], 0, now=mock_time.now.return_value))
+        self.assertGreater(entry.expires_at - entry.stored_at, cache.BOARD_MIN_TTL)
+        mock_request.assert_called_once()
+
+    @patch('rail_uk.data.datetime')
+    @patch('rail_uk.data.make_soap_request')
+    @patch('rail_uk.data.quota.is_constrained', return_value=True)
+    def test_get_last_departure_live_time_quota_constrained(self, _, mock_request, mock_time):
+        mock_time_now = Mock()
+        mock_time_now.strftime.return_value = '21:45'
+        mock_time.now.return_value = mock_time_now
+        mock_time.strptime.side_effect = datetime.strptime
+
+        etd = data.get_last_departure_live_time(helpers.generate_departure_details(),
+                                                helpers.generate_test_api_params())
+
+        self.assertIsNone(etd)
+        mock_request.assert_not_called()
+
+    @patch('rail_uk.data.datetime')
+    @patch('rail_uk.data.make_soap_request')
+    @patch('rail_uk.data.live_state')
+    def test_get_last_departure_live_time_live_state(self, mock_live_state, mock_request, mock_time):
+        mock_time_now = Mock()
+        mock_time_now.strftime.return_value = '21:45'
+        mock_time.now.return_value = mock_time_now
+        mock_time.strptime.side_effect = datetime.strptime
+        mock_live_state.is_available.return_value = True
+        mock_live_state.get_live_state.return_value.expected_departure.return_value = '22:05'
+
+        test_departure = helpers.generate_departure_details()
+        etd = data.get_last_departure_live_time(test_departure, helpers.generate_test_api_params())
+
+        self.assertEqual(etd, '22:05')
+        mock_live_state.get_live_state.return_value.expected_departure.assert_called_once_with(
+            'HTX', 'TTX', '22:00', 'Train Operator Limited', 'Train City')
+        mock_request.assert_not_called()
+
     @patch('rail_uk.data.datetime')
     @patch('rail_uk.data.logger')
     def test_get_last_departure_live_not_available(self, mock_logger, mock_time):
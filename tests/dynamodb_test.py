@@ -11,6 +11,7 @@ class TestDynamoDB(TestCase):
 
     def setUp(self):
         logging.basicConfig(level='DEBUG')
+        dynamodb._table = None
 
     @patch('boto3.resource')
     def test_get_home_station_success(self, mock_boto3):
@@ -52,6 +53,28 @@ class TestDynamoDB(TestCase):
 
         self.assertIsNone(result)
 
+    @patch('boto3.resource')
+    def test_get_home_stations(self, mock_boto3):
+        mock_table = Mock()
+        mock_table.scan.side_effect = [
+            {
+                'Items': [{'distance': '10', 'station_crs': 'FWY', 'station_name': 'Five Ways'}],
+                'LastEvaluatedKey': {'UserID': 'existing_user'},
+                'ResponseMetadata': {'HTTPStatusCode': 200}
+            },
+            {
+                'Items': [{'distance': '0', 'station_crs': 'BHM', 'station_name': 'Birmingham New Street'}],
+                'ResponseMetadata': {'HTTPStatusCode': 200}
+            }
+        ]
+        mock_boto3.return_value.Table.return_value = mock_table
+
+        result = dynamodb.get_home_stations()
+
+        self.assertListEqual(result, [HomeStation(Station('Five Ways', 'FWY'), 10),
+                                      HomeStation(Station('Birmingham New Street', 'BHM'), 0)])
+        self.assertEqual(mock_table.scan.call_args[1]['ExclusiveStartKey'], {'UserID': 'existing_user'})
+
     @patch('boto3.resource')
     @patch('rail_uk.dynamodb.get_home_station')
     def test_set_home_station_success(self, mock_get, mock_boto3):
@@ -5,6 +5,7 @@ from unittest import TestCase
 from unittest.mock import patch
 
 from lambda_entry import lambda_handler
+from rail_uk import cache
 from helpers import helpers
 
 
@@ -14,6 +15,7 @@ class TestEndToEnd(TestCase):
         logging.basicConfig(level='DEBUG')
         self.mock_env = helpers.get_test_env()
         self.mock_env.start()
+        cache.clear()
         self.default_slots = {
             'destination': {
                 'name': 'Train Town',
@@ -46,14 +48,14 @@ class TestEndToEnd(TestCase):
                           'service to Train City, which is running on time.'
         self.assertEqual(speech, expected_speech)
 
-    @patch('requests.get')
+    @patch('rail_uk.data.get_http_session')
     @patch('rail_uk.data.get_last_departure_live_time', return_value=None)
-    def test_last_train(self, _, mock_timetable_request):
+    def test_last_train(self, _, mock_session):
         request_vars = {
             'origin_name': self.default_slots['origin']['name'],
             'origin_crs': self.default_slots['origin']['id']
         }
-        mock_timetable_request.return_value = helpers.generate_test_rest_response(request_vars)
+        mock_session.return_value.get.return_value = helpers.generate_test_rest_response(request_vars)
         response = lambda_handler(_make_mock_event('LastTrain', self.default_slots), None)
         speech = response['response']['outputSpeech']['text']
         expected_speech = 'The last train to Train Town from Home Town is the 22:00 Train Operator Limited ' \
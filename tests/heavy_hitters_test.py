@@ -0,0 +1,88 @@
+from collections import Counter
+from unittest import TestCase
+from unittest.mock import patch
+import json
+import logging
+import random
+
+from rail_uk import heavy_hitters, query_log
+from rail_uk.heavy_hitters import SpaceSaving
+from helpers import helpers
+
+
+def zipf_stream(routes, length, seed=0):
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, routes + 1)]
+    return [('R{}'.format(index), 'DST') for index in rng.choices(range(routes), weights, k=length)]
+
+
+class TestHeavyHitters(TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+        heavy_hitters.reset()
+
+    def tearDown(self):
+        heavy_hitters.reset()
+
+    def test_exact_under_capacity(self):
+        summary = SpaceSaving(4)
+        for item in ['a', 'b', 'a', 'c', 'a', 'b']:
+            summary.update(item)
+
+        self.assertListEqual(summary.top(), [('a', 3, 0), ('b', 2, 0), ('c', 1, 0)])
+        self.assertEqual(summary.total, 6)
+
+    def test_error_bounds(self):
+        stream = zipf_stream(routes=2000, length=20000)
+        truth = Counter(stream)
+        summary = SpaceSaving(100)
+        for item in stream:
+            summary.update(item)
+
+        self.assertEqual(len(summary), 100)
+        for item, count, error in summary.top():
+            self.assertGreaterEqual(count, truth[item])
+            self.assertLessEqual(count - error, truth[item])
+        tracked = {item for item, _, _ in summary.top()}
+        for item, count in truth.items():
+            if count > summary.total / summary.capacity:
+                self.assertIn(item, tracked)
+        self.assertListEqual([item for item, _, _ in summary.top(5)], [item for item, _ in truth.most_common(5)])
+
+    def test_merge(self):
+        stream = zipf_stream(routes=500, length=10000, seed=1)
+        truth = Counter(stream)
+        halves = SpaceSaving(50), SpaceSaving(50)
+        for index, item in enumerate(stream):
+            halves[index % 2].update(item)
+
+        merged = halves[0].merge(halves[1])
+        self.assertEqual(merged.total, len(stream))
+        self.assertEqual(len(merged), 50)
+        for item, count, error in merged.top():
+            self.assertGreaterEqual(count, truth[item])
+            self.assertLessEqual(count - error, truth[item])
+        self.assertEqual(merged.top(1)[0][0], truth.most_common(1)[0][0])
+
+    @patch('rail_uk.heavy_hitters.SNAPSHOT_SECONDS', 60)
+    def test_snapshots_through_query_log(self):
+        params = helpers.generate_test_api_params()
+        written = []
+        with patch.dict('os.environ', {'QUERY_LOG': 'stdout'}), patch('sys.stdout.write', written.append):
+            for at in (0, 30, 60, 90):
+                query_log.record('NextTrain', params, at=at)
+
+        lines = ''.join(written).splitlines()
+        self.assertEqual(len(lines), 5)
+        snapshot = json.loads(lines[3])['heavy_hitters']
+        self.assertEqual(snapshot['counters'], [['HTX', 'TTX', 3, 0]])
+
+        # Another container's snapshot, and an older one from this container
+        other = dict(snapshot, container='other', counters=[['BTN', 'VIC', 5, 0]], total=5)
+        lines += [json.dumps({'heavy_hitters': other}), json.dumps({'heavy_hitters': dict(snapshot, at=0)})]
+        report = heavy_hitters.build_report(heavy_hitters.merge_snapshots(heavy_hitters.read_snapshots(lines)))
+
+        self.assertEqual(report['total'], 8)
+        self.assertListEqual([(row['origin'], row['count'], row['cumulative_share']) for row in report['routes']],
+                             [('BTN', 5, 0.625), ('HTX', 3, 1.0)])
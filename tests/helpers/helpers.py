@@ -53,6 +53,8 @@ class MockRestResponse:
 
     def __init__(self, json_content=None, content=None, status_code=200):
         self.json_content = json_content
+        if content is None:
+            content = b'' if json_content is None else json.dumps(json_content).encode()
         self.content = content
         self.status_code = status_code
         reason_dict = {
@@ -66,6 +68,13 @@ class MockRestResponse:
     def json(self):
         return self.json_content
 
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
 
 def generate_mock_rest_response(*args, **_):
     if args[0] == 'https://transportapi.com/v3/uk/train/station/HTX/2019-03-01/19:45/timetable.json':
@@ -227,6 +227,24 @@ class TestIntents(TestCase):
                             'service to Train City, which will likely depart at around 20:10.'
         self.assertEqual(response, expected_response)
 
+    def test_build_departure_speech_stale(self):
+        test_departure = helpers.generate_departure_details(etd='On time')._replace(stale=True)
+        response = intents.build_departure_speech(test_departure, helpers.generate_test_api_params(), 'next')
+        expected_response = 'The next train to Train Town from Home Town is the 22:00 Train Operator Limited ' \
+                            'service to Train City, which is running on time. This information may be slightly ' \
+                            'out of date.'
+        self.assertEqual(response, expected_response)
+
+    def test_build_departure_speech_changes(self):
+        test_departure = helpers.generate_departure_details(etd='On time')._replace(changes=2, arrival='23:55')
+        response = intents.build_departure_speech(test_departure, helpers.generate_test_api_params(), 'fastest')
+        expected_response = 'The fastest train to Train Town from Home Town is the 22:00 Train Operator Limited ' \
+                            'service to Train City, which is running on time. The journey has 2 changes, ' \
+                            'arriving at around 23:55.'
+        self.assertEqual(response, expected_response)
+        self.assertIn('has 1 change,', intents.build_departure_speech(test_departure._replace(changes=1),
+                                                                      helpers.generate_test_api_params(), 'fastest'))
+
     def test_build_last_departure_speech_no_trains(self):
         response = intents.build_last_departure_speech(None, helpers.generate_test_api_params())
         expected_response = 'I cannot find a train to Train Town from Home Town today.'
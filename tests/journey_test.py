@@ -0,0 +1,118 @@
+import logging
+import os
+import shutil
+import tempfile
+from datetime import date
+from unittest import TestCase
+from unittest.mock import patch
+
+from benchmarks import gtfs, journey_bench
+from rail_uk import journey, mapped_timetable, timetable
+from rail_uk.dtos import DepartureInfo
+from rail_uk.journey import Leg
+from helpers import helpers
+
+FEED = 'tests/mock_responses/gtfs'
+THURSDAY = date(2019, 2, 28)
+
+
+class TestJourney(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.timetable = timetable.load(FEED)
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+        self.mock_env = helpers.get_test_env()
+        self.mock_env.start()
+        self.planner = journey.Planner(self.timetable)
+
+    def tearDown(self):
+        self.mock_env.stop()
+
+    def test_connections(self):
+        connections = self.timetable.connections()
+        self.assertEqual(len(connections.departure_times), 9)
+        self.assertListEqual(list(connections.departure_times), sorted(connections.departure_times))
+        self.assertIs(self.timetable.connections(), connections)
+
+    def test_direct(self):
+        legs = self.planner.earliest_arrival('HTX', 'TCX', THURSDAY, after=20 * 60)
+        self.assertListEqual(legs, [Leg('HTX', 'TCX', '21:00', '21:00', '22:00', '22:00', 'Train Operator Limited',
+                                        'Train City', 'T1')])
+        # T7 passes through Train City but does not set down there
+        self.assertIsNone(self.planner.earliest_arrival('HTX', 'TCX', THURSDAY, after=21 * 60 + 1))
+
+    def test_change(self):
+        legs = self.planner.earliest_arrival('TTX', 'ELS', THURSDAY, after=22 * 60, change_minutes=0)
+        self.assertListEqual([(leg.origin, leg.destination, leg.trip_id) for leg in legs],
+                             [('TTX', 'HTX', 'T5'), ('HTX', 'ELS', 'T3')])
+        self.assertEqual(legs[-1].sta, '23:50')
+
+    def test_change_too_short(self):
+        # T5 arrives at Home Town as T3 leaves
+        self.assertIsNone(self.planner.earliest_arrival('TTX', 'ELS', THURSDAY, after=22 * 60))
+
+    def test_max_changes(self):
+        self.assertIsNone(self.planner.earliest_arrival('TTX', 'ELS', THURSDAY, after=22 * 60, max_changes=0,
+                                                        change_minutes=0))
+
+    def test_not_running(self):
+        self.assertIsNone(self.planner.earliest_arrival('HTX', 'TCX', date(2019, 3, 2)))
+        self.assertIsNone(self.planner.earliest_arrival('HTX', 'TCX', date(2018, 12, 31)))
+        self.assertIsNone(self.planner.earliest_arrival('HTX', 'XXX', THURSDAY))
+
+    def test_delay(self):
+        board = [DepartureInfo('21:00', '21:10', 'Train Operator Limited', 'Train City', in_past=False, live=True),
+                 DepartureInfo('22:15', 'On time', 'Train Operator Limited', 'Train Town', in_past=False, live=True)]
+        delays = self.planner.delays_from_board('HTX', THURSDAY, board)
+        self.assertDictEqual(delays, {0: (21 * 60, 10)})
+
+        legs = self.planner.earliest_arrival('HTX', 'TCX', THURSDAY, after=20 * 60, delays=delays)
+        self.assertTupleEqual(legs[0][2:6], ('21:00', '21:10', '22:00', '22:10'))
+
+    def test_delay_misses_change(self):
+        board = [DepartureInfo('23:00', '23:04', 'Train Operator Limited', 'Home Town', in_past=False, live=True)]
+        delays = self.planner.delays_from_board('TTX', THURSDAY, board)
+        self.assertIsNone(self.planner.earliest_arrival('TTX', 'ELS', THURSDAY, after=22 * 60, delays=delays,
+                                                        change_minutes=0))
+
+    def test_cancellation(self):
+        board = [DepartureInfo('21:00', 'Cancelled', 'Train Operator Limited', 'Train City', in_past=False, live=True)]
+        delays = self.planner.delays_from_board('HTX', THURSDAY, board)
+        self.assertDictEqual(delays, {0: (21 * 60, None)})
+        self.assertIsNone(self.planner.earliest_arrival('HTX', 'TCX', THURSDAY, after=20 * 60, delays=delays))
+
+    def test_mapped(self):
+        directory = tempfile.mkdtemp()
+        try:
+            mapped = mapped_timetable.open_timetable(mapped_timetable.write(self.timetable,
+                                                                            os.path.join(directory, 'feed.bin')))
+            planner = journey.Planner(mapped)
+            for origin, destination, after in (('HTX', 'TCX', 20 * 60), ('TTX', 'ELS', 22 * 60), ('HTX', 'TTX', 0)):
+                self.assertEqual(planner.earliest_arrival(origin, destination, THURSDAY, after, change_minutes=0),
+                                 self.planner.earliest_arrival(origin, destination, THURSDAY, after, change_minutes=0))
+            del planner
+            mapped.close()
+        finally:
+            shutil.rmtree(directory)
+
+    @patch.dict('os.environ', {'TIMETABLE_FILE': FEED})
+    @patch('rail_uk.journey._planner', None)
+    @patch('rail_uk.timetable._timetable', None)
+    def test_get_planner(self):
+        self.assertIs(journey.get_planner(), journey.get_planner())
+
+    def test_synthetic_feed(self):
+        directory = tempfile.mkdtemp()
+        try:
+            engine = timetable.load(gtfs.write_feed(os.path.join(directory, 'feed.zip'), lines=5,
+                                                    trips_per_line=6))
+            planner, build = journey_bench.measure_build(engine)
+            self.assertGreater(build['connections'], 0)
+
+            pairs = journey_bench.random_pairs(planner, queries=20)
+            self.assertEqual(len(journey_bench.measure_queries(planner, pairs, max_changes=1)), 3)
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,45 @@
+import json
+from unittest import TestCase
+
+from rail_uk import json_stream
+from helpers import helpers
+
+PATH = ('departures', 'all')
+FIELDS = ('aimed_departure_time', 'operator_name', 'destination_name')
+
+
+def chunked(content, size):
+    return [content[start:start + size] for start in range(0, len(content), size)]
+
+
+class TestJsonStream(TestCase):
+
+    def setUp(self):
+        self.content = helpers.generate_test_rest_response().content
+        self.expected = [{field: departure[field] for field in FIELDS}
+                         for departure in json.loads(self.content)['departures']['all']]
+
+    def test_extract_items(self):
+        self.assertListEqual(json_stream.extract_items([self.content], PATH, FIELDS), self.expected)
+
+    def test_extract_items_chunked(self):
+        # Every chunk boundary, including mid-string, mid-number and mid-character
+        content = self.content.replace(b'Train City', 'Träin City'.encode('utf-8'))
+        expected = json_stream.extract_items([content], PATH, FIELDS)
+        for size in (1, 2, 7, 64):
+            self.assertListEqual(json_stream.extract_items(chunked(content, size), PATH, FIELDS), expected)
+        self.assertEqual(json_stream.extract_items(chunked(b'{"a": [12345, 6.5e3]}', 1), ('a',), ()), [12345, 6500])
+
+    def test_missing_key(self):
+        for content in (b'{"departures": {"some": []}}', b'{"departures": {}}', b'{}'):
+            with self.assertRaises(KeyError):
+                json_stream.extract_items([content], PATH, FIELDS)
+
+    def test_not_an_array(self):
+        self.assertIsNone(json_stream.extract_items([b'{"departures": {"all": null}}'], PATH, FIELDS))
+        self.assertListEqual(json_stream.extract_items([b'{"departures": {"all": [ ]}}'], PATH, FIELDS), [])
+
+    def test_malformed(self):
+        for content in (b'', b'[]', b'{"departures": {"all": [{}, ]}}', b'{"departures": {"all": [{}'):
+            with self.assertRaises(ValueError):
+                json_stream.extract_items(chunked(content, 4), PATH, FIELDS)
@@ -0,0 +1,173 @@
+from unittest import TestCase
+from unittest.mock import Mock, patch
+import logging
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+from rail_uk import cache, data, l2_cache
+from helpers import helpers
+
+KEY = 'next|HTX|TTX|0'
+
+
+class TestL2Cache(TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+        self.mock_env = helpers.get_test_env()
+        self.mock_env.start()
+        self.store = l2_cache.SqliteStore(':memory:')
+        self.departures = [helpers.generate_departure_details(etd='On time'),
+                           helpers.generate_departure_details(etd='22:04', different=True)]
+
+    def tearDown(self):
+        self.mock_env.stop()
+
+    def test_encode(self):
+        payload = l2_cache.encode(self.departures)
+        self.assertListEqual(l2_cache.decode(payload), self.departures)
+        self.assertIsNone(l2_cache.decode(l2_cache.encode(None)))
+        self.assertLess(len(payload), len(repr(self.departures)) // 2)
+        with self.assertRaises(ValueError):
+            l2_cache.decode(b'\x00' + payload[1:])
+
+    def test_fetch(self):
+        upstream = Mock(return_value=self.departures)
+        self.assertTupleEqual(l2_cache.fetch(KEY, upstream, 60, store=self.store), (self.departures, 60))
+        departures, expires_in = l2_cache.fetch(KEY, upstream, 60, store=self.store)
+        self.assertListEqual(departures, self.departures)
+        self.assertTrue(0 < expires_in <= 60)
+        upstream.assert_called_once()
+        self.assertEqual(self.store.get(KEY).version, 1)
+
+    def test_fetch_expired(self):
+        upstream = Mock(side_effect=[self.departures, self.departures[:1]])
+        l2_cache.fetch(KEY, upstream, -1, store=self.store)
+        self.assertTupleEqual(l2_cache.fetch(KEY, upstream, 60, store=self.store), (self.departures[:1], 60))
+        self.assertEqual(self.store.get(KEY).version, 2)
+
+    def test_conditional_writes(self):
+        self.assertTrue(self.store.claim(KEY, 0, time.time() + 5, time.time()))
+        self.assertFalse(self.store.claim(KEY, 0, time.time() + 5, time.time()))
+        self.assertTrue(self.store.put(KEY, 1, b'payload', time.time() + 60, time.time() + 600, 0))
+        self.assertFalse(self.store.put(KEY, 1, b'other payload', time.time() + 60, time.time() + 600, 0))
+        self.assertFalse(self.store.claim(KEY, 0, time.time() + 5, time.time()))
+        self.assertTrue(self.store.claim(KEY, 1, time.time() + 5, time.time()))
+
+    @patch('rail_uk.l2_cache.LEASE_WAIT', 2)
+    def test_stampede(self):
+        release = threading.Event()
+        calls = []
+
+        def slow_upstream():
+            calls.append(threading.current_thread().name)
+            release.wait(5)
+            return self.departures
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(l2_cache.fetch(KEY, slow_upstream, 60,
+                                                                                  store=self.store)[0]))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.2)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertListEqual(results, [self.departures] * 4)
+
+    def test_serves_expired_while_leased(self):
+        l2_cache.fetch(KEY, lambda: self.departures, -1, store=self.store)
+        self.assertTrue(self.store.claim(KEY, 1, time.time() + 5, time.time()))
+
+        upstream = Mock()
+        departures, expires_in = l2_cache.fetch(KEY, upstream, 60, store=self.store)
+        self.assertListEqual(departures, self.departures)
+        self.assertLessEqual(expires_in, 0)
+        upstream.assert_not_called()
+
+    def test_past_delete_at(self):
+        self.store.claim(KEY, 0, time.time() + 5, time.time())
+        self.store.put(KEY, 1, l2_cache.encode(self.departures), time.time() - 600, time.time() - 1, 0)
+        # Left for the TTL to delete, but no longer served
+        self.assertEqual(self.store.get(KEY), l2_cache.Item(1, None, None, None))
+
+        upstream = Mock(return_value=self.departures[:1])
+        self.assertTupleEqual(l2_cache.fetch(KEY, upstream, 60, store=self.store), (self.departures[:1], 60))
+        self.assertEqual(self.store.get(KEY).version, 2)
+
+    def test_store_failure(self):
+        store = Mock()
+        store.get.side_effect = IOError('Connection refused')
+        self.assertTupleEqual(l2_cache.fetch(KEY, lambda: self.departures, 60, store=store), (self.departures, None))
+
+    def test_dynamodb_store(self):
+        store = l2_cache.DynamoDBStore('RailUKCache')
+        store._table = Mock()
+        store._table.get_item.return_value = {'Item': {'CacheKey': KEY, 'entry_version': 3, 'payload': b'\x01',
+                                                       'expires_at': 100}}
+        store._table.update_item.side_effect = ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}},
+                                                           'UpdateItem')
+
+        self.assertEqual(store.get(KEY), l2_cache.Item(3, b'\x01', 100.0, None))
+        store._table.get_item.return_value['Item']['delete_at'] = 700
+        self.assertEqual(store.get(KEY), l2_cache.Item(3, None, None, None))
+        self.assertFalse(store.claim(KEY, 3, 105, 100))
+        self.assertEqual(store._table.update_item.call_args[1]['ExpressionAttributeValues'][':delete_at'],
+                         105 + l2_cache.RETAIN_SECONDS)
+        self.assertTrue(store.put(KEY, 4, b'\x01', 160, 760.5, 3))
+        self.assertEqual(store._table.put_item.call_args[1]['Item']['delete_at'], 760)
+
+    @patch('rail_uk.data.make_soap_request')
+    @patch('rail_uk.data.parse_fastest_departure_soap_response')
+    @patch('rail_uk.data.parse_departures_soap_response')
+    def test_shared_between_containers(self, mock_parser, mock_fastest_parser, mock_request):
+        mock_parser.return_value = self.departures
+        mock_fastest_parser.return_value = self.departures[1]
+        test_params = helpers.generate_test_api_params()
+        l2_cache.set_store(self.store)
+        try:
+            for _ in range(2):
+                # Each pass is a container with a cold in-process cache
+                cache.clear()
+                self.assertTupleEqual(data.get_next_departures(test_params), self.departures[0])
+                self.assertTupleEqual(data.get_fastest_departure(test_params), self.departures[1])
+        finally:
+            l2_cache.set_store(None)
+            cache.clear()
+
+        self.assertEqual(mock_request.call_count, 2)
+
+    @patch('rail_uk.data.make_soap_request')
+    @patch('rail_uk.data.parse_departures_soap_response')
+    def test_expiry_shared_with_containers(self, mock_parser, mock_request):
+        mock_parser.return_value = self.departures
+        test_params = helpers.generate_test_api_params()
+        key = cache.board_key('next', test_params)
+        board_cache = cache.get_board_cache()
+        l2_cache.set_store(self.store)
+        try:
+            # Fresh in the shared cache for a few more seconds only
+            l2_cache.fetch(l2_cache.make_key(key), lambda: self.departures, 5, store=self.store)
+            cache.clear()
+            self.assertFalse(data.get_next_departures(test_params).stale)
+            entry = board_cache.get_entry(key)
+            self.assertLessEqual(entry.expires_at - entry.stored_at, 5)
+
+            # Expired, and being replaced by another container
+            self.store.put(l2_cache.make_key(key), 2, l2_cache.encode(self.departures), time.time() - 30,
+                           time.time() + 570, 1)
+            self.assertTrue(self.store.claim(l2_cache.make_key(key), 2, time.time() + 5, time.time()))
+            cache.clear()
+            self.assertTrue(data.get_next_departures(test_params).stale)
+            entry = board_cache.get_entry(key)
+            self.assertEqual(entry.expires_at, entry.stored_at)
+        finally:
+            l2_cache.set_store(None)
+            cache.clear()
+
+        mock_request.assert_not_called()
@@ -0,0 +1,49 @@
+import logging
+from unittest import TestCase
+
+from benchmarks import lambda_bench
+from helpers import helpers
+
+
+class TestLambdaBench(TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+        self.mock_env = helpers.get_test_env()
+        self.mock_env.start()
+
+    def tearDown(self):
+        self.mock_env.stop()
+
+    def test_run_benchmarks(self):
+        results = lambda_bench.run_benchmarks(iterations=2, cold=False, names=['HelpIntent', 'NextTrain'])
+
+        self.assertEqual(sorted(results), ['HelpIntent', 'NextTrain'])
+        self.assertEqual(results['HelpIntent']['upstream_calls'], 0)
+        self.assertEqual(results['NextTrain']['upstream_calls'], 1)
+
+    def test_find_regressions(self):
+        baselines = {
+            'NextTrain': {'warm_p50_ms': 2.0, 'cold_ms': 100.0, 'upstream_calls': 1},
+            'LastTrain': {'warm_p50_ms': 4.0, 'alloc_peak_kb': 70.0, 'upstream_calls': 2}
+        }
+        results = {
+            'NextTrain': {'warm_p50_ms': 3.5, 'cold_ms': 110.0, 'upstream_calls': 2},
+            'LastTrain': {'warm_p50_ms': 4.5, 'alloc_peak_kb': 90.0, 'upstream_calls': 2},
+            'FastestTrain': {'warm_p50_ms': 50.0, 'upstream_calls': 5}
+        }
+
+        regressions = lambda_bench.find_regressions(results, baselines, threshold=0.5)
+        self.assertEqual(regressions, [
+            'NextTrain warm_p50_ms: 3.5 (baseline 2.0)',
+            'NextTrain upstream_calls: 2 (baseline 1)',
+            'LastTrain alloc_peak_kb: 90.0 (baseline 70.0)'
+        ])
+        self.assertEqual(lambda_bench.find_regressions(results, baselines, 0.5, lambda_bench.GATED_METRICS), [
+            'NextTrain upstream_calls: 2 (baseline 1)'
+        ])
+        gated = lambda_bench.GATED_METRICS + lambda_bench.ALLOCATION_METRICS
+        self.assertEqual(lambda_bench.find_regressions(results, baselines, 0.5, gated), [
+            'NextTrain upstream_calls: 2 (baseline 1)',
+            'LastTrain alloc_peak_kb: 90.0 (baseline 70.0)'
+        ])
@@ -1,10 +1,23 @@
+import json
 import logging
-from unittest import TestCase
+import subprocess
+import sys
+import threading
+import time
+from io import StringIO
+from unittest import TestCase, skipIf
 from unittest.mock import patch
 
-from rail_uk import lambda_handler
+from rail_uk import cache, lambda_handler, tracing
+from rail_uk.exceptions import OpenLDBWSError
 from helpers import helpers
 
+# Cumulative time (in microseconds) that importing the Lambda entry point may
+# take. Trivial intents pay this on every cold start, so it must stay well
+# below the ~200ms it took when boto3/requests were imported eagerly.
+IMPORT_TIME_BUDGET_US = 50000
+LAZY_MODULES = ('boto3', 'requests', 'jinja2', 'xmltodict', 'xml.dom.minidom')
+
 
 class TestLambdaHandler(TestCase):
 
@@ -47,3 +60,86 @@ class TestLambdaHandler(TestCase):
         test_event = helpers.generate_test_event('SessionEndedRequest')
         lambda_handler.lambda_handler(test_event, {})
         mock_logger.info.assert_called_with('Session ended: {}'.format(test_event['session']['sessionId']))
+
+    @patch('rail_uk.lambda_handler.on_intent')
+    def test_lambda_handler_deferred_refresh_during_outage(self, mock_intent):
+        mock_intent.return_value = 'You can ask for the next train.'
+        board_cache = cache.TTLCache(10, 60, stale_window=60, clock=time.time)
+        board_cache.put('another route', ['board'], ttl=0)
+        release = threading.Event()
+
+        def fetch():
+            # OpenLDBWS timing out
+            release.wait(5)
+            raise OpenLDBWSError('Request to Darwin failed - Read timed out.')
+
+        try:
+            self.assertEqual(cache.fetch_through(board_cache, 'another route', fetch, stale_errors=(OpenLDBWSError,)),
+                             (['board'], cache.STALE))
+            start = time.perf_counter()
+            response = lambda_handler.lambda_handler(helpers.generate_test_event('IntentRequest'), {})
+            self.assertLess(time.perf_counter() - start, 1)
+            self.assertEqual(response, 'You can ask for the next train.')
+        finally:
+            release.set()
+            cache.clear()
+
+    @patch('rail_uk.lambda_handler.on_intent')
+    @patch('rail_uk.lambda_handler.warmup.initialise')
+    @patch('rail_uk.lambda_handler.cache.run_deferred')
+    def test_lambda_handler_warm_up(self, mock_deferred, mock_initialise, mock_intent):
+        response = lambda_handler.lambda_handler({'source': 'aws.events', 'detail-type': 'Scheduled Event'}, {})
+
+        mock_initialise.assert_called_once()
+        mock_intent.assert_not_called()
+        mock_deferred.assert_not_called()
+        self.assertEqual(response, {'warm': True})
+
+    @patch('rail_uk.lambda_handler.on_intent')
+    @patch('rail_uk.lambda_handler.warmup.initialise')
+    @patch('rail_uk.lambda_handler.prefetch.run')
+    def test_lambda_handler_prefetch(self, mock_run, mock_initialise, mock_intent):
+        mock_run.return_value = {'fetched': 3, 'failed': 0}
+        response = lambda_handler.lambda_handler({'source': 'aws.events', 'prefetch': True}, {})
+
+        mock_initialise.assert_not_called()
+        mock_intent.assert_not_called()
+        self.assertEqual(response, {'fetched': 3, 'failed': 0})
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_lambda_handler_emits_trace(self, mock_stdout):
+        test_event = helpers.generate_test_event('LaunchRequest')
+        tracing.set_enabled(True)
+        try:
+            lambda_handler.lambda_handler(test_event, {})
+        finally:
+            tracing.set_enabled(False)
+
+        record = json.loads(mock_stdout.getvalue())
+        self.assertEqual(record['intent'], 'LaunchRequest')
+        self.assertIn('build_response', [span['name'] for span in record['spans']])
+
+    @skipIf(sys.version_info < (3, 7), '-X importtime needs Python 3.7')
+    def test_lambda_entry_import_time(self):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import lambda_entry'],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        import_times = _parse_import_times(result.stderr)
+
+        for module in LAZY_MODULES:
+            self.assertNotIn(module, import_times, '{} should be imported lazily'.format(module))
+        self.assertLess(import_times['lambda_entry'], IMPORT_TIME_BUDGET_US)
+
+
+def _parse_import_times(importtime_output):
+    """Map each module in `python -X importtime` output to its cumulative
+    import time in microseconds.
+    """
+    import_times = {}
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        import_times[module.strip()] = int(cumulative)
+    if not import_times:
+        raise ValueError('No import times in the output of python -X importtime:\n' + importtime_output)
+    return import_times
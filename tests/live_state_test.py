@@ -0,0 +1,170 @@
+from datetime import datetime
+import logging
+from unittest import TestCase
+from unittest.mock import patch
+
+from benchmarks import live_state_bench, push_stream
+from rail_uk import live_state
+from rail_uk.dtos import DepartureInfo
+from helpers import helpers
+
+STREAM = 'tests/mock_responses/push_stream.jsonl'
+
+
+class TestLiveState(TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+        self.mock_env = helpers.get_test_env()
+        self.mock_env.start()
+        self.state = live_state.LiveState()
+        self.count = self.state.ingest(live_state.open_stream(STREAM))
+
+    def tearDown(self):
+        self.mock_env.stop()
+
+    def test_ingest(self):
+        self.assertEqual(self.count, 8)
+        self.assertEqual(self.state.messages, 7)
+        self.assertEqual(len(self.state), 4)
+        self.assertEqual(len(self.state.boards['HTX']), 4)
+
+    def test_departures(self):
+        departures = self.state.departures('HTX', 'TTX', after=20 * 60 + 50)
+        self.assertListEqual(departures, [
+            DepartureInfo('21:00', '21:05', 'Train Operator Limited', 'Train City', in_past=False, live=True),
+            DepartureInfo('21:15', 'On time', 'Train Operator Limited', 'Train Town', in_past=False, live=True)
+        ])
+        self.assertEqual(len(self.state.departures('HTX', after=20 * 60 + 50, limit=2)), 2)
+        self.assertListEqual(self.state.departures('HTX', 'TCX', after=21 * 60 + 1), [])
+
+    def test_departures_cancelled(self):
+        departure = self.state.departures('HTX', 'ELS', after=21 * 60)[0]
+        self.assertEqual(departure.etd, 'Cancelled')
+        self.assertIsNone(self.state.fastest_departure('HTX', 'ELS', after=21 * 60))
+
+    def test_departures_after_midnight(self):
+        self.assertEqual(self.state.departures('HTX', 'TTX', after=23 * 60 + 45)[0].std, '23:50')
+
+    def test_fastest_departure(self):
+        departure = self.state.fastest_departure('HTX', 'TTX', after=20 * 60 + 50)
+        self.assertEqual(departure.std, '21:00')
+
+        self.state.apply({'type': 'forecast', 'rid': '201902287000001', 'locations': [{'crs': 'TTX', 'eta': '21:45'}]})
+        self.assertEqual(self.state.fastest_departure('HTX', 'TTX', after=20 * 60 + 50).std, '21:15')
+
+    def test_expected_departure(self):
+        self.assertEqual(self.state.expected_departure('HTX', 'TCX', '21:00', 'Train Operator Limited', 'Train City'),
+                         '21:05')
+        self.assertIsNone(self.state.expected_departure('HTX', 'TCX', '21:00', 'Midland Rail', 'Train City'))
+
+    def test_delayed(self):
+        self.state.apply({'type': 'forecast', 'rid': '201902287000002',
+                          'locations': [{'crs': 'HTX', 'etd': 'Delayed'}]})
+        self.assertEqual(self.state.departures('HTX', 'TTX', after=21 * 60 + 10)[0].etd, 'Delayed')
+
+    def test_deactivated(self):
+        self.state.apply({'type': 'deactivated', 'rid': '201902287000001'})
+        departures = self.state.departures('HTX', 'TTX', after=20 * 60, window=240)
+        self.assertListEqual([departure.std for departure in departures], ['21:15', '23:50'])
+        self.assertFalse(self.state.covers('TTX'))
+
+    def test_schedule_update(self):
+        self.state.apply({'type': 'schedule', 'rid': '201902287000002', 'toc': 'Train Operator Limited',
+                          'locations': [{'crs': 'HTX', 'ptd': '21:25'}, {'crs': 'TTX', 'pta': '21:50',
+                                                                         'name': 'Train Town'}]})
+        self.assertEqual(len(self.state), 4)
+        departures = self.state.departures('HTX', 'TTX', after=21 * 60 + 10, window=240)
+        self.assertListEqual([departure.std for departure in departures], ['21:25', '23:50'])
+
+    def test_day_rollover(self):
+        today, _ = live_state._now()
+        with patch('rail_uk.live_state._now', return_value=(today + 1, 21 * 60)):
+            # Yesterday's services don't run again today
+            self.assertListEqual(self.state.departures('HTX', 'TTX', after=20 * 60 + 50), [])
+            self.assertIsNone(self.state.fastest_departure('HTX', 'TTX', after=20 * 60 + 50))
+
+        self.state.apply({'type': 'schedule', 'rid': '201903017000001', 'ssd': '2019-03-01',
+                          'toc': 'Train Operator Limited',
+                          'locations': [{'crs': 'HTX', 'ptd': '00:10'}, {'crs': 'TTX', 'pta': '00:40'}]})
+        march_first = datetime(2019, 3, 1).toordinal()
+        with patch('rail_uk.live_state._now', return_value=(march_first, 0)):
+            self.assertListEqual([departure.std for departure in self.state.departures('HTX', 'TTX', after=0)],
+                                 ['00:10'])
+        # Services that started the day before are still matched after midnight
+        self.state.apply({'type': 'schedule', 'rid': '201902287000005', 'ssd': '2019-02-28',
+                          'toc': 'Train Operator Limited',
+                          'locations': [{'crs': 'HTX', 'ptd': '00:05'}, {'crs': 'TTX', 'pta': '00:35'}]})
+        with patch('rail_uk.live_state._now', return_value=(march_first, 0)):
+            departures = self.state.departures('HTX', 'TTX', after=0)
+        self.assertListEqual([departure.std for departure in departures], ['00:10'])
+
+    def test_compact(self):
+        today, _ = live_state._now()
+        calls = len(self.state.call_stations)
+        self.state.apply({'type': 'deactivated', 'rid': '201902287000003'})
+        self.state.apply({'type': 'schedule', 'rid': '201902287000002', 'toc': 'Train Operator Limited',
+                          'locations': [{'crs': 'HTX', 'ptd': '21:25'}, {'crs': 'TTX', 'pta': '21:50',
+                                                                         'name': 'Train Town'}]})
+        with patch('rail_uk.live_state._now', return_value=(today, 21 * 60)):
+            self.state.compact()
+        # The deactivated service, and the re-sent schedule's old calls, are gone
+        self.assertEqual(len(self.state), 3)
+        self.assertEqual(len(self.state.call_stations), calls - 2)
+        with patch('rail_uk.live_state._now', return_value=(today, 21 * 60)):
+            departures = self.state.departures('HTX', 'TTX', after=20 * 60 + 50, window=240)
+        self.assertListEqual([departure.std for departure in departures], ['21:00', '21:25', '23:50'])
+        self.assertEqual(departures[0].etd, '21:05')
+
+        # Once a service's last call is long past, it goes too
+        with patch('rail_uk.live_state._now', return_value=(today + 1, 3 * 60)):
+            self.state.compact()
+        self.assertEqual(len(self.state), 0)
+        self.assertFalse(any(self.state.boards.values()))
+
+    @patch('rail_uk.live_state.time')
+    def test_compact_periodically(self, mock_time):
+        mock_time.time.return_value = self.state._compacted_at + live_state.COMPACT_SECONDS
+        self.state.apply({'type': 'deactivated', 'rid': '201902287000003'})
+        self.assertEqual(len(self.state), 3)
+
+    @patch.dict('os.environ', {'LIVE_STATE_STREAM': STREAM})
+    @patch('rail_uk.live_state._live_state', None)
+    def test_get_live_state(self):
+        state = live_state.get_live_state()
+        live_state._consumer.join(timeout=5)
+
+        self.assertIs(live_state.get_live_state(), state)
+        self.assertEqual(len(state), 4)
+        self.assertTrue(live_state.is_available())
+
+    @patch('rail_uk.live_state._live_state', None)
+    def test_not_configured(self):
+        self.assertFalse(live_state.is_available())
+
+    @patch.dict('os.environ', {'LIVE_STATE_STREAM': STREAM})
+    @patch('rail_uk.live_state._live_state')
+    @patch('rail_uk.live_state.time')
+    def test_stale(self, mock_time, mock_state):
+        mock_state.last_message_at = 1000
+        mock_time.time.return_value = 1000 + live_state.MAX_AGE
+        self.assertFalse(live_state.is_available())
+
+    def test_socket_stream(self):
+        messages = push_stream.generate_messages(services=20)
+        server = push_stream.StreamServer(messages).start()
+        try:
+            state = live_state.LiveState()
+            self.assertEqual(state.ingest(live_state.open_stream(server.source)), len(messages))
+        finally:
+            server.stop()
+        # Every service has run and been deactivated by the end of the day
+        self.assertEqual(len(state), 20)
+        self.assertFalse(any(state.boards.values()))
+
+    def test_benchmark(self):
+        messages = push_stream.generate_messages(services=50)
+        _, ingestion = live_state_bench.measure_ingestion(messages, memory=False)
+        self.assertEqual(ingestion['messages'], len(messages))
+        self.assertEqual(len(live_state_bench.measure_queries(messages, queries=20)), 2)
+        self.assertEqual(live_state_bench.measure_stream(messages[:100], rate=2000)['offered_per_s'], 2000)
@@ -0,0 +1,69 @@
+import logging
+import random
+from unittest import TestCase
+
+from benchmarks import loadtest
+from benchmarks.lambda_bench import configure_environment, install_table, point_at_server
+from benchmarks.standin import StandInServer, UpstreamBehaviour, parse_latency
+from rail_uk import cache, data, dynamodb
+from helpers import helpers
+
+
+class TestLoadTest(TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+        self.mock_env = helpers.get_test_env()
+        self.mock_env.start()
+        cache.clear()
+
+    def tearDown(self):
+        self.mock_env.stop()
+
+    def test_parse_latency(self):
+        rng = random.Random(0)
+        self.assertEqual(parse_latency('fixed:50')(rng), 0.05)
+        self.assertTrue(0.02 <= parse_latency('uniform:20:200')(rng) <= 0.2)
+        self.assertGreater(parse_latency('lognormal:80:0.5')(rng), 0)
+        self.assertGreater(parse_latency('exponential:100')(rng), 0)
+        self.assertIsNone(parse_latency(None))
+        with self.assertRaises(ValueError):
+            parse_latency('pareto:1')
+
+    def test_upstream_behaviour_plan(self):
+        self.assertEqual(UpstreamBehaviour().plan(), (0, False, False))
+        self.assertEqual(UpstreamBehaviour('fixed:10', error_rate=1.0).plan(), (0.01, True, False))
+        self.assertEqual(UpstreamBehaviour(slow_loris_rate=1.0).plan(), (0, False, True))
+
+    def test_run_load(self):
+        corpus = loadtest.load_corpus(size=20)
+        samples, elapsed = loadtest.run_load(corpus, rate=200, concurrency=4, duration=0.1,
+                                             handler=lambda event, _: None)
+        report = loadtest.build_report(samples, elapsed, 200, 0.1)
+
+        self.assertEqual(report['requests'], 20)
+        self.assertEqual(report['outcomes'], {'ok': 20})
+        self.assertIsNotNone(report['latency']['p99_ms'])
+
+    def test_run_load_with_upstream_errors(self):
+        original_clients = (data.OPEN_LDBWS_URL, data.TRANSPORT_API_URL, dynamodb._table)
+        server = StandInServer(behaviour={'GetDepartureBoard': UpstreamBehaviour(error_rate=1.0)}).start()
+        try:
+            configure_environment(server)
+            point_at_server(server)
+            install_table()
+            corpus = [loadtest.get_benchmark_events()['NextTrain']]
+            samples, elapsed = loadtest.run_load(corpus, rate=100, concurrency=2, duration=0.05)
+        finally:
+            server.stop()
+            data.OPEN_LDBWS_URL, data.TRANSPORT_API_URL, dynamodb._table = original_clients
+
+        report = loadtest.build_report(samples, elapsed)
+        self.assertEqual(report['outcomes'], {'api_error': 5})
+        self.assertEqual(server.faults['GetDepartureBoard:error'], 5)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(loadtest.percentile(values, 50), 51)
+        self.assertEqual(loadtest.percentile(values, 99), 99)
+        self.assertIsNone(loadtest.percentile([], 50))
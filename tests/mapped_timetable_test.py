@@ -0,0 +1,74 @@
+import logging
+import os
+import shutil
+import tempfile
+from datetime import date, timedelta
+from unittest import TestCase
+from unittest.mock import patch
+
+from rail_uk import mapped_timetable, timetable
+from helpers import helpers
+
+FEED = 'tests/mock_responses/gtfs'
+STATIONS = ('HTX', 'TTX', 'TCX', 'ELS', 'XXX')
+
+
+class TestMappedTimetable(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.directory, 'timetable.bin')
+        cls.timetable = timetable.load(FEED)
+        mapped_timetable.write(cls.timetable, cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+        self.mock_env = helpers.get_test_env()
+        self.mock_env.start()
+        self.mapped = mapped_timetable.open_timetable(self.path)
+
+    def tearDown(self):
+        self.mapped.close()
+        self.mock_env.stop()
+
+    def test_open(self):
+        self.assertEqual(len(self.mapped), 7)
+        self.assertEqual(self.mapped.feed_start, date(2019, 1, 1))
+
+    def test_matches_timetable(self):
+        days = [date(2018, 12, 31)] + [date(2019, 2, 28) + timedelta(days=offset) for offset in range(4)]
+        days.append(date(2020, 1, 1))
+        for day in days:
+            for origin in STATIONS:
+                self.assertListEqual(list(self.mapped.departures_from(origin, day)),
+                                     list(self.timetable.departures_from(origin, day)))
+                for destination in STATIONS:
+                    self.assertEqual(self.mapped.last_departure(origin, destination, day),
+                                     self.timetable.last_departure(origin, destination, day))
+                    self.assertEqual(self.mapped.last_departure(origin, destination, day, before=1439),
+                                     self.timetable.last_departure(origin, destination, day, before=1439))
+                    self.assertEqual(self.mapped.next_departure(origin, destination, day, after=21 * 60),
+                                     self.timetable.next_departure(origin, destination, day, after=21 * 60))
+
+    def test_departures_window(self):
+        departures = self.mapped.departures_from('HTX', date(2019, 2, 28), after=22 * 60, before=23 * 60 + 30)
+        self.assertListEqual([departure.trip_id for departure in departures], ['T2', 'T7', 'T3'])
+
+    def test_not_a_timetable(self):
+        self.assertTrue(mapped_timetable.is_mapped_file(self.path))
+        self.assertFalse(mapped_timetable.is_mapped_file(FEED))
+        self.assertFalse(mapped_timetable.is_mapped_file(FEED + '/stops.txt'))
+        with self.assertRaises(ValueError):
+            mapped_timetable.MappedTimetable(FEED + '/stops.txt')
+
+    @patch('rail_uk.timetable._timetable', None)
+    def test_get_timetable(self):
+        with patch.dict('os.environ', {'TIMETABLE_FILE': self.path}):
+            engine = timetable.get_timetable()
+        self.assertIsInstance(engine, mapped_timetable.MappedTimetable)
+        engine.close()
@@ -0,0 +1,77 @@
+import logging
+from unittest import TestCase
+from unittest.mock import patch, Mock
+
+from rail_uk import payload_capture
+from helpers import helpers
+
+
+class TestPayloadCapture(TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+        self.mock_env = helpers.get_test_env()
+        self.mock_env.start()
+        self.mock_logger = Mock()
+        self.mock_logger.name = 'rail_uk.data'
+
+    def tearDown(self):
+        self.mock_env.stop()
+        payload_capture._local.sampled = False
+
+    def test_log_payload_skipped(self):
+        self.mock_logger.isEnabledFor.return_value = False
+        payload = Mock()
+        payload_capture.start_request()
+
+        payload_capture.log_payload(self.mock_logger, 'OpenLDBWS response', payload)
+        payload.assert_not_called()
+        self.mock_logger.debug.assert_not_called()
+
+    def test_log_payload_debug(self):
+        self.mock_logger.isEnabledFor.return_value = True
+
+        payload_capture.log_payload(self.mock_logger, 'OpenLDBWS response', lambda: '<Test>12345</Test>')
+        self.mock_logger.debug.assert_called_with('%s: \n%s', 'OpenLDBWS response', '<Test>12345</Test>')
+
+    @patch('rail_uk.payload_capture.capture_logger')
+    @patch('rail_uk.payload_capture.random')
+    def test_log_payload_sampled(self, mock_random, mock_capture_logger):
+        self.mock_logger.isEnabledFor.return_value = False
+        mock_random.random.return_value = 0.0005
+
+        with patch.dict('os.environ', {'PAYLOAD_SAMPLE_RATE': '0.001'}):
+            payload_capture.start_request()
+        payload_capture.log_payload(self.mock_logger, 'TransportAPI response', b'{"departures": {}}')
+
+        self.assertTrue(payload_capture.is_sampled())
+        mock_capture_logger.info.assert_called_with('[%s] %s: \n%s', 'rail_uk.data', 'TransportAPI response',
+                                                    '{"departures": {}}')
+
+    @patch('rail_uk.payload_capture.random')
+    def test_start_request_not_sampled(self, mock_random):
+        mock_random.random.return_value = 0.5
+        with patch.dict('os.environ', {'PAYLOAD_SAMPLE_RATE': '0.001'}):
+            payload_capture.start_request()
+        self.assertFalse(payload_capture.is_sampled())
+
+    def test_redact(self):
+        soap = '<typ:TokenValue>MOCK_DARWIN_TOKEN</typ:TokenValue>'
+        self.assertEqual(payload_capture.redact(soap), '<typ:TokenValue>[REDACTED]</typ:TokenValue>')
+
+        url = 'timetable.json?app_id=abc&app_key=def'
+        self.assertEqual(payload_capture.redact(url), 'timetable.json?app_id=[REDACTED]&app_key=[REDACTED]')
+
+        message = "{'id': 'timetable.json?token=MOCK_API_KEY'}"
+        self.assertEqual(payload_capture.redact(message), "{'id': 'timetable.json?token=[REDACTED]'}")
+
+    def test_truncate(self):
+        self.assertEqual(payload_capture.truncate('x' * 10, 10), 'x' * 10)
+        self.assertEqual(payload_capture.truncate('x' * 15, 10), 'x' * 10 + '... [5 characters truncated]')
+
+    def test_capture_limit(self):
+        self.mock_logger.isEnabledFor.return_value = True
+        with patch.dict('os.environ', {'PAYLOAD_CAPTURE_LIMIT': '4'}):
+            payload_capture.log_payload(self.mock_logger, 'DynamoDB GET response', 'abcdefgh')
+        self.mock_logger.debug.assert_called_with('%s: \n%s', 'DynamoDB GET response',
+                                                  'abcd... [4 characters truncated]')
@@ -0,0 +1,106 @@
+from datetime import datetime
+from unittest import TestCase
+from unittest.mock import patch
+import logging
+import os
+
+from rail_uk import prefetch
+from rail_uk.dtos import HomeStation, Station
+from rail_uk.exceptions import DynamoDBError, OpenLDBWSError
+from rail_uk.query_log import Query
+from helpers import helpers
+
+PEAKS = [(7 * 60, 9 * 60 + 30), (16 * 60 + 30, 19 * 60)]
+
+
+def at(hour, minute=0):
+    return datetime(2019, 3, 1, hour, minute).timestamp()
+
+
+class TestPrefetch(TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+        self.mock_env = helpers.get_test_env()
+        self.mock_env.start()
+
+    def tearDown(self):
+        self.mock_env.stop()
+
+    def test_parse_peaks(self):
+        self.assertListEqual(prefetch.parse_peaks('07:00-09:30, 16:30-19:00'), PEAKS)
+        self.assertListEqual(prefetch.parse_peaks(''), [])
+
+    def test_is_active(self):
+        self.assertTrue(prefetch.is_active(datetime(2019, 3, 1, 6, 50), PEAKS, lead=15))
+        self.assertTrue(prefetch.is_active(datetime(2019, 3, 1, 18, 59), PEAKS, lead=15))
+        self.assertFalse(prefetch.is_active(datetime(2019, 3, 1, 6, 40), PEAKS, lead=15))
+        self.assertFalse(prefetch.is_active(datetime(2019, 3, 1, 12, 0), PEAKS, lead=15))
+
+    def test_select_routes(self):
+        queries = [
+            Query(at(8), 'NextTrain', 'HTX', 'TTX', 10),
+            Query(at(8, 5), 'NextTrain', 'HTX', 'TTX', 10),
+            Query(at(17), 'NextTrain', 'HTX', 'TCY', 10),
+            Query(at(17), 'NextTrain', 'BTN', 'VIC', 5),
+            Query(at(8), 'NextTrain', 'HTX', 'TTX', 0),
+            Query(at(12), 'NextTrain', 'HTX', 'BTN', 10),
+            Query(at(8), 'LastTrain', 'HTX', 'BTN', 10)
+        ]
+        homes = {'HTX', 'BTN'}
+
+        self.assertDictEqual(prefetch.select_routes(queries, homes, PEAKS),
+                             {'HTX': [('TTX', 10), ('TCY', 10), ('TTX', 0)], 'BTN': [('VIC', 5)]})
+        self.assertDictEqual(prefetch.select_routes(queries, homes, PEAKS, max_routes=1), {'HTX': [('TTX', 10)]})
+        self.assertDictEqual(prefetch.select_routes(queries, {'BTN'}, PEAKS), {'BTN': [('VIC', 5)]})
+        self.assertIn(('TTX', 0), prefetch.select_routes(queries, None, PEAKS)['HTX'])
+
+    @patch.dict('os.environ', {'PREFETCH_HISTORY': '', 'QUERY_LOG': 'stdout',
+                               'AWS_LAMBDA_LOG_GROUP_NAME': '/aws/lambda/RailUK'})
+    def test_get_history_lambda(self):
+        self.assertEqual(prefetch.get_history(), 'cloudwatch:///aws/lambda/RailUK')
+        with patch.dict('os.environ', {'PREFETCH_HISTORY': 'queries.jsonl'}):
+            self.assertEqual(prefetch.get_history(), 'queries.jsonl')
+        del os.environ['AWS_LAMBDA_LOG_GROUP_NAME']
+        self.assertEqual(prefetch.get_history(), '')
+
+    @patch('rail_uk.prefetch._homes', None)
+    @patch('rail_uk.prefetch._homes_loaded_at', None)
+    @patch('rail_uk.dynamodb.get_home_stations')
+    def test_get_homes(self, mock_home_stations):
+        mock_home_stations.return_value = [HomeStation(Station('Home Town', 'HTX'), 10)]
+
+        self.assertSetEqual(prefetch.get_homes(now=1000), {'HTX'})
+        self.assertSetEqual(prefetch.get_homes(now=1000 + prefetch.ROUTES_MAX_AGE), {'HTX'})
+        mock_home_stations.assert_called_once()
+
+        # A failed scan keeps the stations already read
+        mock_home_stations.side_effect = DynamoDBError('DynamoDB failed to scan home stations')
+        self.assertSetEqual(prefetch.get_homes(now=2000 + prefetch.HOMES_MAX_AGE), {'HTX'})
+        self.assertEqual(mock_home_stations.call_count, 2)
+
+    @patch('rail_uk.stations.get_station')
+    @patch('rail_uk.data.get_departure_board')
+    def test_prefetch(self, mock_board, mock_station):
+        mock_station.side_effect = lambda crs: Station('Home Town', 'HTX') if crs == 'HTX' else None
+        mock_board.side_effect = [None, OpenLDBWSError('Request to Darwin failed')]
+
+        result = prefetch.prefetch({'HTX': [('TTX', 10), ('TCY', 10)]}, concurrency=2)
+
+        self.assertDictEqual(result, {'fetched': 1, 'failed': 1})
+        params = mock_board.call_args_list[0][0][0]
+        self.assertEqual(params.origin, Station('Home Town', 'HTX'))
+        self.assertEqual(params.destination, Station('TTX', 'TTX'))
+        self.assertEqual(params.offset, 10)
+        self.assertTrue(mock_board.call_args_list[0][1]['refresh'])
+
+    @patch('rail_uk.prefetch.prefetch')
+    @patch('rail_uk.prefetch.get_routes')
+    def test_run_outside_peak(self, mock_routes, mock_prefetch):
+        self.assertDictEqual(prefetch.run(datetime(2019, 3, 1, 12, 0)), {'fetched': 0, 'failed': 0})
+        mock_routes.assert_not_called()
+        mock_prefetch.assert_not_called()
+
+        mock_prefetch.return_value = {'fetched': 1, 'failed': 0}
+        self.assertDictEqual(prefetch.run(datetime(2019, 3, 1, 8, 0)), {'fetched': 1, 'failed': 0})
+        mock_prefetch.assert_called_once_with(mock_routes.return_value)
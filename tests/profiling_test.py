@@ -0,0 +1,78 @@
+import json
+import logging
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from rail_uk import profiling
+from helpers import helpers
+
+
+def make_soap_request():
+    return [str(number) for number in range(1000)]
+
+
+def _handle_request():
+    return make_soap_request()
+
+
+class TestProfiling(TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+        self.test_event = helpers.generate_test_event('LaunchRequest', 'TEST')
+
+    @patch('rail_uk.profiling._write_profile')
+    def test_profile_invocation_not_selected(self, mock_write):
+        with patch.dict(os.environ, {'PROFILE_SAMPLE_RATE': '0'}):
+            with profiling.profile_invocation(self.test_event):
+                _handle_request()
+        mock_write.assert_not_called()
+
+    @patch('rail_uk.profiling.profile_logger')
+    def test_profile_invocation_to_log(self, mock_logger):
+        with patch.dict(os.environ, {'PROFILE_SAMPLE_RATE': '1', 'PROFILE_OUTPUT': 'log', 'PROFILE_TOP_N': '5'}):
+            with profiling.profile_invocation(self.test_event):
+                _handle_request()
+
+        message, summary_json = mock_logger.info.call_args[0]
+        summary = json.loads(summary_json)
+        self.assertEqual(summary['intent'], 'LaunchRequest')
+        self.assertIn('make_soap_request', summary['upstream_ms'])
+        self.assertEqual(len(summary['top_calls']), 5)
+        self.assertLessEqual(len(summary['top_allocations']), 5)
+
+    @patch('rail_uk.profiling.profile_logger')
+    def test_profile_invocation_to_directory(self, _):
+        with tempfile.TemporaryDirectory() as output_dir:
+            env = {'PROFILE_SAMPLE_RATE': '1', 'PROFILE_OUTPUT': output_dir, 'PROFILE_MEMORY': 'false'}
+            with patch.dict(os.environ, env):
+                with profiling.profile_invocation(self.test_event):
+                    _handle_request()
+
+            output_files = sorted(os.listdir(output_dir))
+            self.assertEqual(len(output_files), 2)
+            self.assertTrue(output_files[0].endswith('.json'))
+            self.assertTrue(output_files[1].endswith('.prof'))
+            with open(os.path.join(output_dir, output_files[0])) as file:
+                self.assertNotIn('top_allocations', json.load(file))
+
+    @patch('rail_uk.profiling.profile_logger')
+    def test_profile_invocation_error(self, mock_logger):
+        with patch.dict(os.environ, {'PROFILE_SAMPLE_RATE': '1', 'PROFILE_MEMORY': 'false'}):
+            with self.assertRaises(ValueError):
+                with profiling.profile_invocation(self.test_event):
+                    raise ValueError('Invalid Application ID')
+        mock_logger.info.assert_called_once()
+
+    @patch('rail_uk.profiling._write_profile')
+    def test_profile_invocation_concurrent(self, mock_write):
+        with patch.dict(os.environ, {'PROFILE_SAMPLE_RATE': '1'}):
+            with profiling.profile_invocation(self.test_event):
+                # e.g. another request on a threaded server
+                with profiling.profile_invocation(self.test_event):
+                    _handle_request()
+            with profiling.profile_invocation(self.test_event):
+                _handle_request()
+        self.assertEqual(mock_write.call_count, 2)
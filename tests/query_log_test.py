@@ -0,0 +1,80 @@
+from unittest import TestCase
+from unittest.mock import patch
+import logging
+import os
+import tempfile
+
+from rail_uk import heavy_hitters, query_log
+from helpers import helpers
+
+
+class TestQueryLog(TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+        handle, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+        heavy_hitters.reset()
+
+    def test_record_and_read(self):
+        params = helpers.generate_test_api_params()
+        with patch.dict('os.environ', {'QUERY_LOG': self.path}):
+            query_log.record('NextTrain', params, at=100)
+            query_log.record('LastTrain', params._replace(offset=10), at=200)
+        with open(self.path, 'a') as file:
+            file.write('{"total": 12.5}\nnot json\n')
+
+        self.assertListEqual(list(query_log.read_file(self.path)), [
+            query_log.Query(100, 'NextTrain', 'HTX', 'TTX', 0),
+            query_log.Query(200, 'LastTrain', 'HTX', 'TTX', 10)
+        ])
+        self.assertListEqual([query.at for query in query_log.read_file(self.path, since=150)], [200])
+
+    @patch('boto3.client')
+    def test_read_history_log_group(self, mock_client):
+        mock_client.return_value.filter_log_events.side_effect = [
+            {'events': [{'message': '{"query": {"at": 100, "intent": "NextTrain", "origin": "HTX", '
+                                    '"destination": "TTX", "offset": 0}}\n'}],
+             'nextToken': 'next'},
+            {'events': [{'message': '{"query": {"at": 200, "intent": "NextTrain", "origin": "HTX", '
+                                    '"destination": "TCX", "offset": 10}}\n'}]}
+        ]
+
+        queries = list(query_log.read_history('cloudwatch:///aws/lambda/RailUK', since=50))
+        self.assertListEqual(queries, [
+            query_log.Query(100, 'NextTrain', 'HTX', 'TTX', 0),
+            query_log.Query(200, 'NextTrain', 'HTX', 'TCX', 10)
+        ])
+        first, second = mock_client.return_value.filter_log_events.call_args_list
+        self.assertDictEqual(first[1], {'logGroupName': '/aws/lambda/RailUK', 'filterPattern': '"query"',
+                                        'startTime': 50000})
+        self.assertEqual(second[1]['nextToken'], 'next')
+
+    @patch.dict('os.environ', {'QUERY_LOG': ''})
+    def test_record_disabled(self):
+        query_log.record('NextTrain', helpers.generate_test_api_params())
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+    @patch('rail_uk.heavy_hitters.SNAPSHOT_SECONDS', 60)
+    def test_flush(self):
+        params = helpers.generate_test_api_params()
+        with patch.dict('os.environ', {'QUERY_LOG': self.path}):
+            query_log.record('NextTrain', params)
+            query_log.flush()
+            # Written before the next is due, e.g. as a server worker stops
+            query_log.flush(force=True)
+            query_log.flush(force=True)
+
+        with open(self.path) as file:
+            lines = file.read().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('"heavy_hitters"', lines[1])
+
+    @patch.dict('os.environ', {'QUERY_LOG': ''})
+    def test_flush_disabled(self):
+        query_log.record('NextTrain', helpers.generate_test_api_params())
+        query_log.flush(force=True)
+        self.assertEqual(os.path.getsize(self.path), 0)
@@ -0,0 +1,123 @@
+from unittest import TestCase
+from unittest.mock import Mock, patch
+import json
+import logging
+import time
+
+from rail_uk import quota
+from rail_uk.exceptions import QuotaExceededError
+from helpers import helpers
+
+
+class TestQuota(TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+        self.mock_env = helpers.get_test_env()
+        self.mock_env.start()
+        self.now = 86400.0
+        self.store = quota.LocalStore()
+
+    def tearDown(self):
+        self.mock_env.stop()
+        quota.reset()
+
+    def make_quota(self, store=None, **kwargs):
+        # 1000 requests a day, 100 of them available at once
+        options = dict(burst=8640, reserve=0.2, batch=1)
+        options.update(kwargs)
+        return quota.Quota('transportapi', 1000, 86400, store or self.store, clock=lambda: self.now, **options)
+
+    def test_acquire(self):
+        bucket = self.make_quota()
+        for _ in range(100):
+            bucket.acquire()
+        with self.assertRaises(QuotaExceededError):
+            bucket.acquire()
+        # The denied token is handed back
+        self.assertEqual(bucket.used(), 100)
+
+        self.now += 864
+        for _ in range(10):
+            bucket.acquire()
+        with self.assertRaises(QuotaExceededError):
+            bucket.acquire()
+
+    def test_background_reserve(self):
+        bucket = self.make_quota()
+        for _ in range(80):
+            bucket.acquire(quota.BACKGROUND)
+        self.assertTrue(bucket.is_constrained())
+        with self.assertRaises(QuotaExceededError):
+            bucket.acquire(quota.BACKGROUND)
+        bucket.acquire(quota.INTERACTIVE)
+        self.assertDictEqual(bucket.denied, {quota.INTERACTIVE: 0, quota.BACKGROUND: 1})
+
+    def test_shared_between_containers(self):
+        containers = [self.make_quota(batch=5) for _ in range(3)]
+        granted = 0
+        for _ in range(50):
+            for container in containers:
+                try:
+                    container.acquire()
+                    granted += 1
+                except QuotaExceededError:
+                    pass
+        self.assertLessEqual(granted, 100)
+        self.assertGreaterEqual(granted, 90)
+
+    def test_new_period(self):
+        bucket = self.make_quota(burst=86400)
+        for _ in range(1000):
+            bucket.acquire()
+        with self.assertRaises(QuotaExceededError):
+            bucket.acquire()
+        self.now += 86400
+        bucket.acquire()
+
+    def test_sqlite_store(self):
+        store = quota.SqliteStore(':memory:')
+        self.assertEqual(store.add('transportapi|1', 3, time.time() + 60), 3)
+        self.assertEqual(store.add('transportapi|1', -1, time.time() + 60), 2)
+        self.assertEqual(store.get('transportapi|1'), 2)
+        self.assertEqual(store.get('transportapi|2'), 0)
+
+    def test_dynamodb_store(self):
+        store = quota.DynamoDBStore('RailUKQuota')
+        store._table = Mock()
+        store._table.update_item.return_value = {'Attributes': {'used': 7}}
+        store._table.get_item.return_value = {}
+
+        self.assertEqual(store.add('openldbws|1', 1, 172800.5), 7)
+        self.assertEqual(store._table.update_item.call_args[1]['ExpressionAttributeValues'],
+                         {':amount': 1, ':delete_at': 172800})
+        self.assertEqual(store.get('openldbws|1'), 0)
+
+    def test_metrics(self):
+        bucket = self.make_quota()
+        bucket.acquire()
+        self.assertIsNone(bucket.take_metrics())
+
+        self.now += quota.METRICS_SECONDS
+        record = bucket.take_metrics()
+        self.assertEqual(record['Provider'], 'transportapi')
+        self.assertEqual(record['QuotaUsed'], 1)
+        self.assertEqual(record['QuotaGranted'], 1)
+        self.assertEqual(record['_aws']['CloudWatchMetrics'][0]['Dimensions'], [['Provider']])
+        json.dumps(record)
+
+    def test_unconfigured(self):
+        quota.acquire(quota.OPEN_LDBWS)
+        self.assertFalse(quota.is_constrained(quota.OPEN_LDBWS))
+
+    @patch.dict('os.environ', {'TRANSPORT_API_QUOTA': '2/86400', 'QUOTA_STORE': ''})
+    def test_priority(self):
+        with patch('rail_uk.quota.BURST_SECONDS', 86400):
+            quota.acquire(quota.TRANSPORT_API)
+            with quota.priority(quota.BACKGROUND):
+                self.assertEqual(quota.current_priority(), quota.BACKGROUND)
+                with self.assertRaises(QuotaExceededError):
+                    quota.acquire(quota.TRANSPORT_API)
+            self.assertEqual(quota.current_priority(), quota.INTERACTIVE)
+            quota.acquire(quota.TRANSPORT_API)
+            self.assertTrue(quota.is_constrained(quota.TRANSPORT_API))
@@ -0,0 +1,212 @@
+from datetime import datetime, timedelta
+from http.client import HTTPConnection
+from importlib.util import find_spec
+from unittest import TestCase, skipIf
+from unittest.mock import Mock, patch
+import json
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from rail_uk import server
+from rail_uk.exceptions import ApplicationError
+from helpers import helpers
+
+
+def post(port, body, headers=None, method='POST', path='/'):
+    connection = HTTPConnection('127.0.0.1', port, timeout=5)
+    connection.request(method, path, body=body, headers=headers or {})
+    response = connection.getresponse()
+    result = response.status, json.loads(response.read() or b'null')
+    connection.close()
+    return result
+
+
+def make_request(body=b'{}', **headers):
+    wsgi_environ = {'HTTP_' + name.upper(): value for name, value in headers.items()}
+    return server.Request(wsgi_environ, body)
+
+
+class TestServer(TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+        self.mock_env = helpers.get_test_env()
+        self.mock_env.start()
+        self.handler = Mock(return_value={'version': '1.0', 'response': {}})
+        self.server = server.PooledWSGIServer(('127.0.0.1', 0), server.make_app(self.handler, validators=[]),
+                                              threads=2)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        if self.thread.is_alive():
+            self.server.stop(timeout=1)
+        self.mock_env.stop()
+
+    def test_request(self):
+        event = {'request': {'type': 'LaunchRequest'}}
+        self.assertEqual(post(self.port, json.dumps(event)), (200, {'version': '1.0', 'response': {}}))
+        self.handler.assert_called_once_with(event, None)
+
+    def test_bad_requests(self):
+        self.assertEqual(post(self.port, 'not json')[0], 400)
+        self.assertEqual(post(self.port, 'x' * (server.MAX_BODY_BYTES + 1))[0], 413)
+        self.assertEqual(post(self.port, None, method='GET', path='/')[0], 405)
+        self.assertEqual(post(self.port, None, method='GET', path='/ping'), (200, {'status': 'ok'}))
+        self.handler.assert_not_called()
+
+    def test_handler_error(self):
+        self.handler.side_effect = ValueError('Invalid Application ID')
+        self.assertEqual(post(self.port, '{}')[0], 500)
+
+    def test_validators(self):
+        def reject(request, event):
+            self.assertEqual(request.headers['signature-256'], 'abc')
+            raise server.InvalidRequest('Nope')
+
+        app = server.make_app(self.handler, validators=[reject])
+        start_response = Mock()
+        body = app({'REQUEST_METHOD': 'POST', 'CONTENT_LENGTH': '2', 'HTTP_SIGNATURE_256': 'abc',
+                    'wsgi.input': Mock(read=Mock(return_value=b'{}'))}, start_response)
+        self.assertEqual(start_response.call_args[0][0], '400 Bad Request')
+        self.assertEqual(json.loads(body[0]), {'error': 'Nope'})
+        self.handler.assert_not_called()
+
+    def test_stop_drains_in_flight(self):
+        finished = []
+
+        def slow(event, _):
+            time.sleep(0.3)
+            finished.append(event)
+            return {}
+
+        self.server.set_app(server.make_app(slow, validators=[]))
+        client = threading.Thread(target=post, args=(self.port, '{"slow": true}'))
+        client.start()
+        time.sleep(0.1)
+        self.assertEqual(self.server.stop(timeout=5), 0)
+        client.join()
+        self.assertEqual(finished, [{'slow': True}])
+
+    def test_verify_timestamp(self):
+        now = datetime.utcnow()
+        server.verify_timestamp(None, {'request': {'timestamp': now.strftime('%Y-%m-%dT%H:%M:%SZ')}})
+        for event in ({'request': {'timestamp': (now - timedelta(minutes=5)).strftime('%Y-%m-%dT%H:%M:%SZ')}},
+                      {'request': {'timestamp': 'yesterday'}},
+                      {'request': {}}):
+            with self.assertRaises(server.InvalidRequest):
+                server.verify_timestamp(None, event)
+
+    def test_verify_signature_unsigned(self):
+        with self.assertRaises(server.InvalidRequest):
+            server.verify_signature(make_request(), {})
+        with self.assertRaises(server.InvalidRequest):
+            server.verify_signature(make_request(signaturecertchainurl='https://example.com/echo.api/cert.pem',
+                                                 signature_256='abc'), {})
+
+    @patch('rail_uk.data.get_http_session')
+    def test_verify_signature_certificate_unavailable(self, mock_session):
+        mock_session.return_value.get.side_effect = IOError('Read timed out.')
+        app = server.make_app(self.handler, validators=[server.verify_signature])
+        self.server.set_app(app)
+
+        status, body = post(self.port, b'{}', {'SignatureCertChainUrl': 'https://s3.amazonaws.com/echo.api/cert.pem',
+                                               'Signature-256': 'abc'})
+        self.assertEqual(status, 400)
+        self.assertIn('could not be fetched', body['error'])
+        self.handler.assert_not_called()
+
+    @skipIf(find_spec('cryptography') is None, 'cryptography is not installed')
+    def test_verify_signature_invalid_certificate(self):
+        with patch('rail_uk.data.get_http_session') as mock_session:
+            mock_session.return_value.get.return_value = helpers.MockRestResponse(content=b'Not a certificate')
+            with self.assertRaises(server.InvalidRequest):
+                server.get_signing_certificate('https://s3.amazonaws.com/echo.api/invalid.pem')
+
+    def test_validators_need_cryptography(self):
+        with patch('importlib.util.find_spec', return_value=None):
+            with self.assertRaises(ApplicationError):
+                server.get_validators()
+
+    def test_is_valid_cert_url(self):
+        for url in ('https://s3.amazonaws.com/echo.api/echo-api-cert.pem',
+                    'https://s3.amazonaws.com:443/echo.api/echo-api-cert.pem',
+                    'HTTPS://s3.AmazonAWS.com/echo.api/echo-api-cert.pem',
+                    'https://s3.amazonaws.com/echo.api/../echo.api/echo-api-cert.pem'):
+            self.assertTrue(server.is_valid_cert_url(url), url)
+        for url in ('http://s3.amazonaws.com/echo.api/echo-api-cert.pem',
+                    'https://notamazon.com/echo.api/echo-api-cert.pem',
+                    'https://s3.amazonaws.com/EcHo.aPi/echo-api-cert.pem',
+                    'https://s3.amazonaws.com/invalid.path/echo-api-cert.pem',
+                    'https://s3.amazonaws.com:563/echo.api/echo-api-cert.pem'):
+            self.assertFalse(server.is_valid_cert_url(url), url)
+
+    @patch.dict('os.environ', {'SERVER_VERIFY_REQUESTS': 'false'})
+    def test_validators_disabled(self):
+        self.assertListEqual(server.get_validators(), [])
+
+
+class TestServeWorkers(TestCase):
+
+    @patch('rail_uk.warmup.initialise')
+    @patch('rail_uk.prefetch.is_enabled', return_value=False)
+    @patch('rail_uk.query_log.flush')
+    def test_start_and_stop_worker(self, mock_flush, _, mock_initialise):
+        from rail_uk import cache, data
+
+        original_pool_size = data.HTTP_POOL_SIZE
+        session = data.get_http_session()
+        try:
+            server.start_worker(threads=data.HTTP_POOL_SIZE + 4)
+            # The session made before is replaced by one with enough connections
+            self.assertIsNot(data.get_http_session(), session)
+            self.assertEqual(data.HTTP_POOL_SIZE, original_pool_size + 4)
+            self.assertEqual(cache._revalidate_mode, cache.BACKGROUND)
+            mock_initialise.assert_called_once()
+
+            server.stop_worker()
+            mock_flush.assert_called_once_with(force=True)
+        finally:
+            data.set_http_pool_size(original_pool_size)
+            cache.set_revalidate_mode(cache.DEFERRED)
+
+    def test_gunicorn_hooks(self):
+        import runpy
+
+        hooks = runpy.run_path('gunicorn.conf.py')
+        worker = Mock()
+        worker.cfg.threads = 4
+        with patch('rail_uk.server.start_worker') as mock_start, patch('rail_uk.server.stop_worker') as mock_stop:
+            hooks['post_fork'](Mock(), worker)
+            hooks['worker_exit'](Mock(), worker)
+        mock_start.assert_called_once_with(4)
+        mock_stop.assert_called_once_with()
+
+    def test_graceful_shutdown(self):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        env = dict(os.environ, SERVER_HOST='127.0.0.1', SERVER_PORT=str(port), SERVER_WORKERS='2',
+                   SERVER_THREADS='2', SERVER_VERIFY_REQUESTS='false', SKILL_ID='TEST', LOG_LEVEL='ERROR')
+        process = subprocess.Popen([sys.executable, 'server_entry.py'], env=env)
+        try:
+            for _ in range(100):
+                try:
+                    self.assertEqual(post(port, None, method='GET', path='/ping')[0], 200)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            else:
+                self.fail('Server never started')
+            process.send_signal(signal.SIGTERM)
+            self.assertEqual(process.wait(timeout=15), 0)
+        finally:
+            if process.poll() is None:
+                process.kill()
@@ -0,0 +1,23 @@
+import logging
+from unittest import TestCase
+
+from rail_uk import stations
+from rail_uk.dtos import Station
+
+
+class TestStations(TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+
+    def test_get_station_registry(self):
+        registry = stations.get_station_registry()
+
+        self.assertEqual(registry['ABW'], Station('Abbey Wood', 'ABW'))
+        self.assertIs(registry, stations.get_station_registry())
+
+    def test_get_station_with_synonyms(self):
+        self.assertEqual(stations.get_station('ACB'), Station('Acton Bridge Cheshire', 'ACB'))
+
+    def test_get_station_unknown(self):
+        self.assertIsNone(stations.get_station('XXX'))
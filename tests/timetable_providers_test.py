@@ -0,0 +1,159 @@
+from datetime import date
+from unittest import TestCase
+from unittest.mock import patch
+import logging
+import threading
+import time
+
+from rail_uk import timetable_providers
+from rail_uk.dtos import APIParameters, Station
+from rail_uk.exceptions import TransportAPIError
+from helpers import helpers
+
+DAY = date(2019, 2, 28)
+DEPARTURES = [{'aimed_departure_time': '22:50', 'operator_name': 'Train Operator Limited',
+               'destination_name': 'Train Town'}]
+
+
+class FakeProvider(timetable_providers.Provider):
+
+    def __init__(self, name, answer=DEPARTURES, delay=0, error=None):
+        super().__init__(name)
+        self.answer = answer
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    def departures(self, params, day, at):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.answer
+
+
+class TestTimetableProviders(TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+        self.mock_env = helpers.get_test_env()
+        self.mock_env.start()
+        self.params = helpers.generate_test_api_params()
+
+    def tearDown(self):
+        self.mock_env.stop()
+        timetable_providers.reset()
+
+    @patch('rail_uk.timetable_providers.EXPLORE_EVERY', 0)
+    def test_fall_back(self):
+        failing = FakeProvider('failing', error=TransportAPIError('Request to TransportAPI failed'))
+        uncovered = FakeProvider('uncovered', answer=None)
+        answering = FakeProvider('answering')
+        timetable_providers.set_providers([failing, uncovered, answering])
+
+        self.assertListEqual(timetable_providers.get_departures(self.params, DAY, '21:59'), DEPARTURES)
+        self.assertEqual((failing.calls, uncovered.calls, answering.calls), (1, 1, 1))
+
+        # The failure is remembered, so the failing provider is now asked last
+        self.assertEqual(timetable_providers.ordered_providers()[-1], failing)
+        timetable_providers.get_departures(self.params, DAY, '21:59')
+        self.assertEqual(failing.calls, 1)
+
+    def test_empty_answer(self):
+        empty = FakeProvider('empty', answer=[])
+        other = FakeProvider('other')
+        timetable_providers.set_providers([empty, other])
+
+        self.assertIsNone(timetable_providers.get_departures(self.params, DAY, '21:59'))
+        self.assertEqual(other.calls, 0)
+
+    def test_every_provider_fails(self):
+        timetable_providers.set_providers([FakeProvider('a', error=TransportAPIError('First')),
+                                           FakeProvider('b', error=TransportAPIError('Second'))])
+        with self.assertRaises(TransportAPIError):
+            timetable_providers.get_departures(self.params, DAY, '21:59')
+
+    @patch('rail_uk.timetable_providers.EXPLORE_EVERY', 0)
+    def test_ordered_by_latency(self):
+        slow = FakeProvider('slow', delay=0.05)
+        fast = FakeProvider('fast')
+        timetable_providers.set_providers([slow, fast])
+
+        for _ in range(2):
+            timetable_providers.get_departures(self.params, DAY, '21:59')
+        self.assertListEqual(timetable_providers.ordered_providers(), [fast, slow])
+        self.assertEqual(timetable_providers.get_stats()['slow']['calls'], 1)
+        self.assertEqual(timetable_providers.get_stats()['fast']['calls'], 1)
+
+    @patch('rail_uk.timetable_providers.EXPLORE_EVERY', 3)
+    def test_explores(self):
+        slow = FakeProvider('slow', delay=0.02)
+        fast = FakeProvider('fast')
+        timetable_providers.set_providers([slow, fast])
+
+        for _ in range(6):
+            timetable_providers.get_departures(self.params, DAY, '21:59')
+        # Asked first, then once more on the 3rd and 6th lookups
+        self.assertEqual(slow.calls, 3)
+
+    def test_lookups_counted_across_threads(self):
+        timetable_providers.set_providers([FakeProvider('a'), FakeProvider('b')])
+
+        def look_up():
+            for _ in range(500):
+                timetable_providers.ordered_providers()
+        threads = [threading.Thread(target=look_up) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(timetable_providers._lookups, 8 * 500)
+
+    @patch('rail_uk.timetable_providers.MODE', timetable_providers.RACE)
+    def test_race(self):
+        release = threading.Event()
+
+        class BlockedProvider(FakeProvider):
+            def departures(self, params, day, at):
+                release.wait(5)
+                return super().departures(params, day, at)
+
+        blocked = BlockedProvider('blocked', answer=[])
+        fast = FakeProvider('fast')
+        timetable_providers.set_providers([blocked, fast])
+        try:
+            self.assertListEqual(timetable_providers.get_departures(self.params, DAY, '21:59'), DEPARTURES)
+        finally:
+            release.set()
+
+        # The loser is still measured once it finishes
+        for _ in range(100):
+            if blocked.stats.calls:
+                break
+            time.sleep(0.01)
+        self.assertEqual(blocked.stats.calls, 1)
+
+    @patch.dict('os.environ', {'TIMETABLE_FILE': 'tests/mock_responses/gtfs'})
+    @patch('rail_uk.timetable._timetable', None)
+    def test_offline_provider(self):
+        provider = timetable_providers.OfflineProvider('offline')
+        self.assertTrue(provider.is_available())
+
+        departures = provider.departures(self.params, DAY, '21:59')
+        self.assertListEqual([departure['aimed_departure_time'] for departure in departures], ['22:15', '22:50'])
+        self.assertDictEqual(departures[-1], DEPARTURES[0])
+        self.assertListEqual(provider.departures(self.params, DAY, '23:00'), [])
+        uncovered = APIParameters(Station('Home Town', 'HTX'), Station('Nowhere', 'NWH'), 0)
+        self.assertIsNone(provider.departures(uncovered, DAY, '21:59'))
+
+    @patch('rail_uk.data.get_timetable')
+    def test_transport_api_provider(self, mock_timetable):
+        mock_timetable.return_value = None
+        providers = timetable_providers.parse_providers('transportapi, transportapi:http://127.0.0.1:8080')
+
+        self.assertListEqual(providers[1].departures(self.params, DAY, '21:59'), [])
+        mock_timetable.assert_called_once_with(self.params, '21:59', day=DAY, base_url='http://127.0.0.1:8080')
+        self.assertEqual([provider.name for provider in providers],
+                         ['transportapi', 'transportapi:http://127.0.0.1:8080'])
+        with self.assertRaises(ValueError):
+            timetable_providers.parse_providers('carrier-pigeon')
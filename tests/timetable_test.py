@@ -0,0 +1,104 @@
+import logging
+import os
+import shutil
+import tempfile
+from datetime import date
+from unittest import TestCase
+from unittest.mock import patch
+
+from benchmarks import gtfs, timetable_bench
+from rail_uk import timetable
+from rail_uk.timetable import ScheduledDeparture
+from helpers import helpers
+
+FEED = 'tests/mock_responses/gtfs'
+THURSDAY = date(2019, 2, 28)
+
+
+class TestTimetable(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.timetable = timetable.load(FEED)
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+        self.mock_env = helpers.get_test_env()
+        self.mock_env.start()
+
+    def tearDown(self):
+        self.mock_env.stop()
+
+    def test_load(self):
+        self.assertEqual(len(self.timetable), 7)
+        self.assertEqual(self.timetable.feed_start, date(2019, 1, 1))
+        # Platforms are indexed under their station
+        self.assertEqual(len(self.timetable.departures['HTX']), 6)
+
+    def test_load_zip(self):
+        directory = tempfile.mkdtemp()
+        try:
+            archive = shutil.make_archive(os.path.join(directory, 'feed'), 'zip', FEED)
+            self.assertEqual(len(timetable.load(archive)), 7)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_last_departure(self):
+        departure = self.timetable.last_departure('HTX', 'TTX', THURSDAY)
+        self.assertTupleEqual(departure, ScheduledDeparture('00:10', 'Train Operator Limited', 'Train Town', 'T6'))
+
+    def test_last_departure_before(self):
+        departure = self.timetable.last_departure('HTX', 'TTX', THURSDAY, before=timetable.MINUTES_PER_DAY - 1)
+        self.assertEqual(departure.trip_id, 'T7')
+
+    def test_last_departure_days_run(self):
+        # T6 is removed on Friday 1st and added on Saturday 2nd
+        self.assertEqual(self.timetable.last_departure('HTX', 'TTX', date(2019, 3, 1)).trip_id, 'T7')
+        self.assertEqual(self.timetable.last_departure('HTX', 'TTX', date(2019, 3, 2)).trip_id, 'T6')
+        self.assertEqual(self.timetable.last_departure('HTX', 'TTX', date(2019, 3, 2), before=1439).trip_id, 'T4')
+        self.assertIsNone(self.timetable.last_departure('HTX', 'TTX', date(2019, 3, 3)))
+
+    def test_last_departure_outside_feed(self):
+        self.assertIsNone(self.timetable.last_departure('HTX', 'TTX', date(2018, 12, 31)))
+        self.assertIsNone(self.timetable.last_departure('HTX', 'TTX', date(2020, 1, 1)))
+
+    def test_last_departure_calling_at(self):
+        # T7 passes through Train City but does not set down there
+        self.assertEqual(self.timetable.last_departure('HTX', 'TCX', THURSDAY).trip_id, 'T1')
+        self.assertEqual(self.timetable.last_departure('HTX', 'ELS', THURSDAY).operator, 'Midland Rail')
+        self.assertEqual(self.timetable.last_departure('TTX', 'HTX', THURSDAY).trip_id, 'T5')
+        self.assertIsNone(self.timetable.last_departure('TCX', 'HTX', THURSDAY))
+        self.assertIsNone(self.timetable.last_departure('XXX', 'HTX', THURSDAY))
+
+    def test_next_departure(self):
+        departure = self.timetable.next_departure('HTX', 'TTX', THURSDAY, after=21 * 60 + 1)
+        self.assertEqual(departure.std, '22:15')
+
+    def test_departures_from(self):
+        departures = self.timetable.departures_from('HTX', THURSDAY, after=22 * 60, before=23 * 60 + 30)
+        self.assertListEqual([departure.trip_id for departure in departures], ['T2', 'T7', 'T3'])
+
+    @patch.dict('os.environ', {'TIMETABLE_FILE': FEED})
+    @patch('rail_uk.timetable._timetable', None)
+    @patch('rail_uk.timetable.load')
+    def test_get_timetable(self, mock_load):
+        self.assertTrue(timetable.is_configured())
+        self.assertIs(timetable.get_timetable(), timetable.get_timetable())
+        mock_load.assert_called_once_with(FEED)
+
+    def test_synthetic_feed(self):
+        directory = tempfile.mkdtemp()
+        try:
+            feed = gtfs.write_feed(os.path.join(directory, 'feed.zip'), lines=5, trips_per_line=6)
+            engine, ingestion = timetable_bench.measure_ingestion(feed, memory=False)
+            self.assertEqual(ingestion['trips'], len(engine))
+
+            pairs = timetable_bench.query_pairs(engine, queries=20)
+            self.assertEqual(len(timetable_bench.measure_queries(engine, pairs)), 4)
+
+            mapped, mapping = timetable_bench.measure_mapping(engine, os.path.join(directory, 'feed.bin'))
+            self.assertGreater(mapping['file_kb'], 0)
+            self.assertEqual(len(timetable_bench.measure_queries(mapped, pairs)), 4)
+            mapped.close()
+        finally:
+            shutil.rmtree(directory)
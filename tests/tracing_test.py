@@ -0,0 +1,122 @@
+import json
+import logging
+import threading
+import timeit
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+from rail_uk import tracing
+
+# Per-call cost (in seconds) that a disabled span may add to a function call
+DISABLED_OVERHEAD_BUDGET = 1e-6
+
+
+@tracing.traced()
+def _traced_function():
+    return None
+
+
+def _plain_function():
+    return None
+
+
+class TestTracing(TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+        tracing.set_enabled(True)
+        tracing.reset_histograms()
+
+    def tearDown(self):
+        tracing.set_enabled(False)
+        tracing.start_trace()
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_trace_emits_metric_record(self, mock_stdout):
+        tracing.start_trace()
+        tracing.annotate(intent='NextTrain', cache='miss')
+        with tracing.span('make_soap_request') as span:
+            span.set(payload_bytes=2048)
+        _traced_function()
+        _traced_function()
+        tracing.finish_trace()
+
+        record = json.loads(mock_stdout.getvalue())
+        metrics = record['_aws']['CloudWatchMetrics'][0]
+        self.assertEqual(metrics['Namespace'], 'RailUK')
+        self.assertEqual(metrics['Dimensions'], [['cache', 'intent']])
+        self.assertEqual(record['intent'], 'NextTrain')
+        self.assertEqual(len(record['_traced_function']), 2)
+        self.assertIn('total', record)
+        self.assertEqual(record['spans'][0]['name'], 'make_soap_request')
+        self.assertEqual(record['spans'][0]['payload_bytes'], 2048)
+        self.assertEqual(mock_stdout.getvalue().count('\n'), 1)
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_trace_dimensions_are_strings(self, mock_stdout):
+        tracing.start_trace()
+        tracing.annotate(board_window=30)
+        tracing.finish_trace()
+
+        self.assertEqual(json.loads(mock_stdout.getvalue())['board_window'], '30')
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_continue_trace(self, mock_stdout):
+        tracing.start_trace()
+        trace = tracing.current_trace()
+
+        def work():
+            with tracing.continue_trace(trace):
+                tracing.annotate(timetable_provider='static')
+                _traced_function()
+            self.assertIsNone(tracing.current_trace())
+
+        with tracing.span('get_last_departure'):
+            worker = threading.Thread(target=work)
+            worker.start()
+            worker.join()
+            self.assertEqual(tracing.current_span().name, 'get_last_departure')
+        tracing.finish_trace()
+
+        record = json.loads(mock_stdout.getvalue())
+        self.assertEqual(record['timetable_provider'], 'static')
+        self.assertListEqual([span['name'] for span in record['spans']], ['_traced_function', 'get_last_departure'])
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_trace_updates_histograms(self, _):
+        for _ in range(3):
+            tracing.start_trace()
+            _traced_function()
+            tracing.finish_trace()
+
+        summary = tracing.histogram_summary()
+        self.assertEqual(summary['_traced_function']['count'], 3)
+        self.assertEqual(summary['total']['count'], 3)
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_disabled_trace_emits_nothing(self, mock_stdout):
+        tracing.set_enabled(False)
+        tracing.start_trace()
+        with tracing.span('make_soap_request') as span:
+            span.set(payload_bytes=2048)
+        self.assertIsNone(tracing.finish_trace())
+        self.assertEqual(mock_stdout.getvalue(), '')
+
+    def test_disabled_overhead(self):
+        tracing.set_enabled(False)
+        calls = 100000
+        traced = min(timeit.repeat(_traced_function, number=calls, repeat=5))
+        plain = min(timeit.repeat(_plain_function, number=calls, repeat=5))
+
+        self.assertLess((traced - plain) / calls, DISABLED_OVERHEAD_BUDGET)
+
+    def test_histogram_percentiles(self):
+        histogram = tracing.Histogram()
+        for value in range(1, 101):
+            histogram.record(float(value))
+
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.percentile(50), 50, delta=50 * 0.2)
+        self.assertAlmostEqual(histogram.percentile(99), 99, delta=99 * 0.2)
+        self.assertEqual(histogram.percentile(100), 100)
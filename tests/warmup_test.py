@@ -0,0 +1,52 @@
+import logging
+from unittest import TestCase
+from unittest.mock import patch
+
+from rail_uk import warmup
+
+
+class TestWarmUp(TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level='DEBUG')
+        warmup._initialised = False
+
+    def test_is_warm_up_event(self):
+        self.assertTrue(warmup.is_warm_up_event({'source': 'aws.events', 'detail-type': 'Scheduled Event'}))
+        self.assertTrue(warmup.is_warm_up_event({'source': 'serverless-plugin-warmup'}))
+        self.assertTrue(warmup.is_warm_up_event({'warmup': True}))
+
+    def test_is_not_warm_up_event(self):
+        self.assertFalse(warmup.is_warm_up_event({'session': {}, 'request': {}, 'warmup': True}))
+        self.assertFalse(warmup.is_warm_up_event({'source': 'aws.s3'}))
+        self.assertFalse(warmup.is_warm_up_event(None))
+
+    @patch('rail_uk.warmup.dynamodb')
+    @patch('rail_uk.warmup.stations')
+    @patch('rail_uk.warmup.data')
+    def test_initialise_once(self, mock_data, mock_stations, mock_dynamodb):
+        warmup.initialise(connect=False)
+        warmup.initialise(connect=False)
+
+        self.assertEqual(mock_data.get_template.call_count, 2)
+        mock_data.get_http_session.assert_called_once()
+        mock_stations.get_station_registry.assert_called_once()
+        mock_dynamodb.get_table.assert_called_once()
+        mock_data.get_http_session.return_value.head.assert_not_called()
+
+    @patch('rail_uk.warmup.dynamodb')
+    @patch('rail_uk.warmup.stations')
+    @patch('rail_uk.warmup.data')
+    def test_initialise_connect(self, mock_data, _, __):
+        mock_session = mock_data.get_http_session.return_value
+        mock_session.head.side_effect = [None, ConnectionError('Unreachable')]
+
+        warmup.initialise(connect=True)
+        self.assertEqual(mock_session.head.call_count, 2)
+
+    @patch('rail_uk.warmup.initialise')
+    def test_warm_up(self, mock_initialise):
+        response = warmup.warm_up({'warmup': True, 'connect': True})
+
+        mock_initialise.assert_called_once_with(connect=True)
+        self.assertEqual(response, {'warm': True})